@@ -0,0 +1,32 @@
+"""
+Gunicorn settings of the Procfile's web process.
+
+The application is loaded once, in the master, and the warm-up tasks (see
+utils.warmup) run there before the workers are forked, so every worker,
+including the ones that replace recycled workers, starts with the modules
+imported, the URL patterns and templates compiled and the product catalog
+built. Each worker runs the tasks again after the fork to open its own
+database connections and catch up with what changed since the master
+warmed up.
+"""
+
+preload_app = True
+
+
+def when_ready(server):
+    from django.db import connections
+    from utils.warmup import run_warmups
+
+    timings = run_warmups()
+    server.log.info("Warmed up the master: %s", ", ".join(
+        "{0} {1}".format(name, 'failed' if seconds is None else '{0:.0f} ms'.format(seconds * 1000))
+        for name, seconds in timings.items()))
+
+    # The workers inherit the master's memory; they must not share its database connections.
+    connections.close_all()
+
+
+def post_fork(server, worker):
+    from utils.warmup import run_warmups
+
+    run_warmups()
@@ -61,24 +61,41 @@ INSTALLED_APPS = [
 AUTH_USER_MODEL = 'back_office.Employee'
 
 MIDDLEWARE_CLASSES = [
+    'utils.profiling.QueryProfilingMiddleware',
+    'utils.db.routers.ReplicaStickinessMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.auth.middleware.SessionAuthenticationMiddleware',
+    'back_office.user_context.UserContextMiddleware',
     'session_security.middleware.SessionSecurityMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
 
+# Request profiling (utils.profiling). Slow requests are only written if a log file is set. Capturing the SQL forces
+# Django's debug cursor, so outside of development it's only done for a small sample of the requests.
+REQUEST_PROFILING_ENABLED = os.environ.get('REQUEST_PROFILING_ENABLED', '1') == '1'
+REQUEST_PROFILING_SQL_SAMPLE_RATE = float(os.environ.get('REQUEST_PROFILING_SQL_SAMPLE_RATE',
+                                                         1.0 if DEBUG else 0.01))
+REQUEST_PROFILING_SLOW_MS = int(os.environ.get('REQUEST_PROFILING_SLOW_MS', 1000))
+REQUEST_PROFILING_SLOW_SAMPLE_RATE = float(os.environ.get('REQUEST_PROFILING_SLOW_SAMPLE_RATE', 0.2))
+REQUEST_PROFILING_SLOW_LOG = os.environ.get('REQUEST_PROFILING_SLOW_LOG')
+REQUEST_PROFILING_METRICS_TOKEN = os.environ.get('REQUEST_PROFILING_METRICS_TOKEN')
+
 ROOT_URLCONF = 'Acriladmin.urls'
 
+template_loaders = [
+    'django.template.loaders.filesystem.Loader',
+    'django.template.loaders.app_directories.Loader',
+]
+
 TEMPLATES = [
     {
         'BACKEND': 'django.template.backends.django.DjangoTemplates',
         'DIRS': ['templates', ],
-        'APP_DIRS': True,
         'OPTIONS': {
             'context_processors': [
                 'django.template.context_processors.debug',
@@ -87,6 +104,8 @@ TEMPLATES = [
                 'django.contrib.messages.context_processors.messages',
                 'django.core.context_processors.request',
             ],
+            # Outside of development each worker keeps the compiled templates (see utils.warmup).
+            'loaders': template_loaders if DEBUG else [('django.template.loaders.cached.Loader', template_loaders)],
         },
     },
 ]
@@ -108,10 +127,77 @@ else:
         'PORT': '5432',
     }
 
+# Connections are kept open and reused by a worker's requests for DB_CONN_MAX_AGE seconds ('none' for no limit, 0
+# closes them after each request) and checked before their first query if they were idle. DB_POOL_SIZE > 0 shares a
+# pool of that many connections between the threads of each worker (for threaded gunicorn workers).
+db_conn_max_age = os.environ.get('DB_CONN_MAX_AGE', '60')
+
+default_database.update({
+    'ENGINE': 'utils.db.postgresql',
+    'CONN_MAX_AGE': None if db_conn_max_age.lower() == 'none' else int(db_conn_max_age),
+    'CONN_HEALTH_CHECKS': os.environ.get('DB_CONN_HEALTH_CHECKS', '1') == '1',
+    'CONN_HEALTH_CHECK_INTERVAL': int(os.environ.get('DB_CONN_HEALTH_CHECK_INTERVAL', 10)),
+    'POOL_SIZE': int(os.environ.get('DB_POOL_SIZE', 0)),
+})
+
 DATABASES = {
     'default': default_database,
 }
 
+# Read-only paths (listings, autocompletes, the solver, reports) read from a replica when REPLICA_DATABASE_URL is set.
+# A user that writes reads from the primary for the next REPLICA_STICKINESS_SECONDS (utils.db.routers).
+REPLICA_DATABASE_ALIAS = 'replica'
+REPLICA_STICKINESS_SECONDS = int(os.environ.get('REPLICA_STICKINESS_SECONDS', 10))
+
+if 'REPLICA_DATABASE_URL' in os.environ:
+    replica_database = dj_database_url.parse(os.environ['REPLICA_DATABASE_URL'])
+    replica_database.update({key: value for key, value in default_database.items()
+                             if key in ('ENGINE', 'CONN_MAX_AGE', 'CONN_HEALTH_CHECKS', 'CONN_HEALTH_CHECK_INTERVAL',
+                                        'POOL_SIZE')})
+    replica_database['TEST'] = {'MIRROR': 'default'}
+    DATABASES[REPLICA_DATABASE_ALIAS] = replica_database
+
+DATABASE_ROUTERS = ['utils.db.routers.ReplicaRouter']
+
+# The unfiltered admin changelists show the table's estimated size instead of counting the rows when it's above this
+# many rows.
+ADMIN_ESTIMATED_COUNT_THRESHOLD = int(os.environ.get('ADMIN_ESTIMATED_COUNT_THRESHOLD', 100000))
+
+# The archive_movements command moves the closed movements older than this many days to the archive tables.
+MOVEMENT_ARCHIVE_HORIZON_DAYS = int(os.environ.get('MOVEMENT_ARCHIVE_HORIZON_DAYS', 365))
+
+# The prune_versions command deletes the versions older than this many days, except the models with their own
+# retention in utils.versioning.VERSION_POLICIES and the latest version of each object.
+VERSION_RETENTION_DAYS = int(os.environ.get('VERSION_RETENTION_DAYS', 730))
+
+# The large versions are stored compressed (see utils.compressed_json).
+SERIALIZATION_MODULES = {
+    'compressed_json': 'utils.compressed_json',
+}
+
+# Cache
+# https://docs.djangoproject.com/en/1.9/topics/cache/
+# CACHE_BACKEND is 'locmem' (per process, the default), 'file' (shared by the processes of a host, CACHE_LOCATION is
+# a directory) or 'redis' (shared by every host, CACHE_LOCATION is e.g. redis://127.0.0.1:6379/0; requires
+# django-redis). The application's cached values are grouped in the namespaces of utils.cache.
+
+CACHE_BACKENDS = {
+    'locmem': ('django.core.cache.backends.locmem.LocMemCache', 'acriladmin'),
+    'file': ('django.core.cache.backends.filebased.FileBasedCache', os.path.join(BASE_DIR, '.cache')),
+    'redis': ('django_redis.cache.RedisCache', 'redis://127.0.0.1:6379/0'),
+}
+
+cache_backend, default_cache_location = CACHE_BACKENDS[os.environ.get('CACHE_BACKEND', 'locmem')]
+
+CACHES = {
+    'default': {
+        'BACKEND': cache_backend,
+        'LOCATION': os.environ.get('CACHE_LOCATION', default_cache_location),
+        'TIMEOUT': int(os.environ.get('CACHE_TIMEOUT', 300)),
+        'KEY_PREFIX': 'acriladmin',
+    },
+}
+
 # Password validation
 # https://docs.djangoproject.com/en/1.9/ref/settings/#auth-password-validators
 
@@ -214,7 +300,10 @@ LOGGING = {
     'handlers': {
         'db_log': {
             'level': 'DEBUG',
-            'class': 'django_db_logger.db_log_handler.DatabaseLogHandler'
+            'class': 'utils.log_handlers.QueuedDatabaseLogHandler',
+            'capacity': int(os.environ.get('DB_LOG_QUEUE_CAPACITY', 1000)),
+            'batch_size': 100,
+            'flush_interval': 2.0,
         },
     },
     'loggers': {
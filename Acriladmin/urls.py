@@ -19,22 +19,27 @@ from rest_framework import routers
 
 from back_office.admin import admin_site
 from back_office.views import AddressAutocomplete, ClientAutocomplete
+from finances import urls as finances_urls
 from finances import views as fin_views
 from finances.views import InvoiceAutocomplete
 from inventories import urls as inventories_urls
 from inventories import views as inv_views
 from inventories.views import ProductAutocomplete, MaterialAutocomplete, ConsumableAutocomplete, DurableGoodAutocomplete
+from utils.profiling import metrics_view
 
 router = routers.DefaultRouter()
 router.register(r'finances/productprice', fin_views.ProductPriceViewSet)
 router.register(r'finances/materialcost', fin_views.MaterialCostViewSet)
+router.register(r'finances/salesreport', fin_views.SalesReportViewSet, base_name='salesreport')
 router.register(r'inventories/productinventoryitem', inv_views.ProductInventoryItemViewSet)
 
 urlpatterns = [
     url(r'^$', RedirectView.as_view(url='/admin/', permanent=False)),
     url(r'^admin/', admin_site.urls),
     url(r'^api/', include(router.urls)),
+    url(r'^finances/', include(finances_urls)),
     url(r'^inventories/', include(inventories_urls)),
+    url(r'^metrics/$', metrics_view, name='metrics'),
     url(r'^select2/', include('django_select2.urls')),
     url(r'session_security/', include('session_security.urls')),
     url(r'^product-autocomplete/$', ProductAutocomplete.as_view(), name='product-autocomplete', ),
@@ -1,17 +1,22 @@
 import logging
+import re
 
 from cities_light.admin import CountryAdmin, CityAdmin, RegionAdmin
 from django.contrib import admin
 from django.contrib.admin import AdminSite
 from django.contrib.auth.admin import UserAdmin
 from django.contrib.auth.models import Group
+from django.core.exceptions import PermissionDenied
+from django.utils.encoding import force_text
 from django.views.decorators.cache import never_cache
-from reversion.admin import VersionAdmin
 
 import back_office.models as models
 from back_office.forms.employee_forms import AddOrChangeEmployeeForm
 from inventories.models import ProductEntry, ProductRemoval, PurchaseOrder, ProductTransferShipment, \
     ProductTransferReception
+from utils.admin import AdminPerformanceMixin
+from utils.cache import admin_app_list_cache, pending_items_cache
+from utils.versioning import PolicyVersionAdmin
 
 db_logger = logging.getLogger('db')
 
@@ -21,10 +26,42 @@ class CustomAdminSite(AdminSite):
     Custom Admin site. It's used to give extra content to the Index page.
     """
 
+    def register(self, model_or_iterable, admin_class=None, **options):
+        """
+        Registers the models with their admin classes extended by the
+        AdminPerformanceMixin.
+        """
+        admin_class = admin_class or admin.ModelAdmin
+
+        if not issubclass(admin_class, AdminPerformanceMixin):
+            admin_class = type(admin_class.__name__, (AdminPerformanceMixin, admin_class), {})
+
+        super(CustomAdminSite, self).register(model_or_iterable, admin_class, **options)
+
     @never_cache
     def index(self, request, extra_context=None):
         return super(CustomAdminSite, self).index(request, self.get_extra_content(request))
 
+    def get_app_list(self, request):
+        """
+        Returns the apps and models the user can access, cached per user until
+        the permissions change (see back_office.receivers).
+        """
+
+        def build_app_list():
+            app_list = super(CustomAdminSite, self).get_app_list(request)
+
+            # The names may be lazy translations, which can't be pickled.
+            for app in app_list:
+                app['name'] = force_text(app['name'])
+
+                for model in app['models']:
+                    model['name'] = force_text(model['name'])
+
+            return app_list
+
+        return admin_app_list_cache.get_or_set(request.user.pk, build_app_list)
+
     def get_extra_content(self, request):
         """
         Returns additional content for the index context.
@@ -32,7 +69,8 @@ class CustomAdminSite(AdminSite):
         """
         user = request.user
 
-        pending_items = self.get_pending_items(user)
+        pending_items = pending_items_cache.get_or_set(user.pk, lambda: {
+            name: list(items) for name, items in self.get_pending_items(user).items()})
 
         return {'pending_items': pending_items}
 
@@ -46,22 +84,25 @@ class CustomAdminSite(AdminSite):
         :return: The dictionary with the pending items.
         """
         pending_items = {'pending_purchase_orders':
-                             PurchaseOrder.get_pending_purchase_orders_for_user(user),
+                             PurchaseOrder.get_pending_purchase_orders_for_user(user).prefetch_related(
+                                 'purchasedproduct_set__product'),
                          'pending_product_entries':
-                             ProductEntry.get_pending_product_entries_for_user(user),
+                             ProductEntry.get_pending_product_entries_for_user(user).select_related(
+                                 'purchase_order', 'inventory').prefetch_related('enteredproduct_set__product'),
                          'pending_product_removals':
-                             ProductRemoval.get_pending_product_removals_for_user(user),
+                             ProductRemoval.get_pending_product_removals_for_user(user).prefetch_related(
+                                 'removedproduct_set__product'),
                          'pending_product_transfer_shipments':
                              ProductTransferShipment.get_pending_product_transfer_shipments_for_user(
-                                 user),
+                                 user).prefetch_related('transferredproduct_set__product'),
                          'pending_product_transfer_receptions':
                              ProductTransferReception.get_pending_product_transfer_receptions_for_user(
-                                 user)}
+                                 user).prefetch_related('receivedproduct_set__product')}
 
         return pending_items
 
 
-class AddressAdmin(VersionAdmin):
+class AddressAdmin(PolicyVersionAdmin):
     """
     Specifies the details for the admin app in regard
     to the Address entity.
@@ -96,7 +137,7 @@ class GroupAdmin(admin.ModelAdmin):
     inlines = [GroupInline]
 
 
-class EmployeeAdmin(VersionAdmin, UserAdmin):
+class EmployeeAdmin(PolicyVersionAdmin, UserAdmin):
     """
     Specifies the details for the admin app in regard
     to the Employee entity.
@@ -119,7 +160,7 @@ class EmployeeAdmin(VersionAdmin, UserAdmin):
         return models.Employee.objects.exclude(username='root')
 
 
-class BranchOfficeAdmin(VersionAdmin):
+class BranchOfficeAdmin(PolicyVersionAdmin):
     """
     Specifies the details for the admin app in regard
     to the OfficeBranch entity.
@@ -144,6 +185,57 @@ class BranchOfficeAdmin(VersionAdmin):
             raise
 
 
+class HistoryInline(admin.TabularInline):
+    """
+    Read-only inline of the lines of a history model.
+    """
+    extra = 0
+    max_num = 0
+    can_delete = False
+
+    def get_readonly_fields(self, request, obj=None):
+        return [field.name for field in self.model._meta.fields]
+
+    def has_add_permission(self, request):
+        return False
+
+
+class HistoryAdmin(admin.ModelAdmin):
+    """
+    Read-only admin of a history model (the movements, recent or archived, see
+    the archive_movements command). The movements can be searched by their
+    folio or ID as well as by the search fields.
+    """
+    actions = None
+    FOLIO_REGEX = re.compile(r'^[A-Za-z]?0*(\d+)$')
+
+    def get_readonly_fields(self, request, obj=None):
+        return [field.name for field in self.model._meta.fields]
+
+    def get_search_results(self, request, queryset, search_term):
+        results, use_distinct = super(HistoryAdmin, self).get_search_results(request, queryset, search_term)
+        match = self.FOLIO_REGEX.match(search_term.strip())
+
+        if match is not None:
+            results |= queryset.filter(pk=int(match.group(1)))
+
+        return results, use_distinct
+
+    def change_view(self, request, object_id, form_url='', extra_context=None):
+        if request.method == 'POST':
+            raise PermissionDenied
+
+        extra_context = dict(extra_context or {}, show_save=False, show_save_and_continue=False)
+
+        return super(HistoryAdmin, self).change_view(request, object_id, form_url, extra_context)
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_delete_permission(self, request, obj=None):
+        return False
+
+
 class CustomCountryAdmin(CountryAdmin):
     """
     Overrides the default admin for the Country entity.
@@ -185,7 +277,7 @@ admin_site = CustomAdminSite()
 admin_site.register(models.Address, AddressAdmin)
 admin_site.register(Group, GroupAdmin)
 admin_site.register(models.Employee, EmployeeAdmin)
-admin_site.register(models.Client, VersionAdmin)
+admin_site.register(models.Client, PolicyVersionAdmin)
 admin_site.register(models.BranchOffice, BranchOfficeAdmin)
 admin_site.register(models.Country, CustomCountryAdmin)
 admin_site.register(models.Region, CustomRegionAdmin)
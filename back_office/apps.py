@@ -4,3 +4,6 @@ from django.apps import AppConfig
 class BackOfficeConfig(AppConfig):
     name = 'back_office'
     verbose_name = 'Administración'
+
+    def ready(self):
+        import back_office.receivers  # noqa
@@ -0,0 +1,39 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from utils.archive import MovementArchiver
+
+
+class Command(BaseCommand):
+    """
+    Moves the closed movements older than the horizon (product entries,
+    removals, transfers and sales, with their lines) to the archive tables, so
+    the workflow tables only hold the recent history. The archived movements
+    are still listed and searched in the admin's history sections. Meant to be
+    run periodically, e.g. nightly.
+    """
+    help = 'Archives the closed movements older than the horizon.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--horizon-days', type=int, dest='horizon_days', default=None,
+                            help='Age in days of the newest movements archived; '
+                                 'MOVEMENT_ARCHIVE_HORIZON_DAYS by default.')
+        parser.add_argument('--batch-size', type=int, dest='batch_size', default=500,
+                            help='Number of movements archived per transaction.')
+        parser.add_argument('--dry-run', action='store_true', dest='dry_run', default=False,
+                            help='Only count the movements that would be archived.')
+
+    def handle(self, *args, **options):
+        archiver = MovementArchiver(options['horizon_days'], options['batch_size'])
+        mismatches = archiver.get_table_mismatches()
+
+        if mismatches:
+            raise CommandError("The archive tables don't match the movement tables: " + " ".join(mismatches))
+
+        archived = archiver.archive(options['dry_run'])
+
+        for name, count in archived.items():
+            self.stdout.write("{0}: {1}".format(name, count))
+
+        self.stdout.write(self.style.SUCCESS("{0} {1} movements older than {2}.".format(
+            "Would archive" if options['dry_run'] else "Archived", sum(archived.values()),
+            archiver.cutoff.date().isoformat())))
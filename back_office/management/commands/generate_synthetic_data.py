@@ -0,0 +1,49 @@
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+
+from utils.synthetic_data import SyntheticDataGenerator
+
+
+class Command(BaseCommand):
+    """
+    Generates a synthetic data set for benchmarks and load tests. The same
+    seed and options always produce the same data.
+    """
+    help = 'Generates branch offices, employees, products, stock, prices, sales, transfers and entries.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--prefix', default='SYN', help='Tag of the generated rows; it must not be in use.')
+        parser.add_argument('--seed', type=int, default=0, help='Seed of the random generator.')
+        parser.add_argument('--branches', type=int, default=5)
+        parser.add_argument('--employees', type=int, default=10, help='Employees per branch office.')
+        parser.add_argument('--products', type=int, default=100000)
+        parser.add_argument('--scrap-ratio', type=float, dest='scrap_ratio', default=0.15,
+                            help='Fraction of the products that are scraps.')
+        parser.add_argument('--priced-ratio', type=float, dest='priced_ratio', default=0.9,
+                            help='Fraction of the products with a price.')
+        parser.add_argument('--stock-ratio', type=float, dest='stock_ratio', default=0.3,
+                            help='Fraction of the products stocked by each inventory.')
+        parser.add_argument('--clients', type=int, default=500)
+        parser.add_argument('--sales', type=int, default=20000)
+        parser.add_argument('--transfers', type=int, default=2000)
+        parser.add_argument('--entries', type=int, default=2000)
+        parser.add_argument('--batch-size', type=int, dest='batch_size', default=2000,
+                            help='Number of rows inserted per query.')
+
+    def handle(self, *args, **options):
+        generator = SyntheticDataGenerator(prefix=options['prefix'], seed=options['seed'],
+                                           batch_size=options['batch_size'], stdout=self.stdout)
+
+        if generator.prefix_exists():
+            raise CommandError("There is already data generated with the prefix {0}.".format(options['prefix']))
+
+        counts = generator.generate(branches=options['branches'], employees_per_branch=options['employees'],
+                                    products=options['products'], scrap_ratio=options['scrap_ratio'],
+                                    priced_ratio=options['priced_ratio'], stock_ratio=options['stock_ratio'],
+                                    clients=options['clients'], sales=options['sales'],
+                                    transfers=options['transfers'], entries=options['entries'])
+
+        call_command('rebuild_sales_rollups', stdout=self.stdout)
+
+        self.stdout.write(self.style.SUCCESS("Generated {0} rows. The employees' password is '{1}'.".format(
+            sum(counts.values()), SyntheticDataGenerator.PASSWORD)))
@@ -0,0 +1,84 @@
+import json
+import os
+import subprocess
+import sys
+import tempfile
+from collections import defaultdict
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+
+class Command(BaseCommand):
+    """
+    Reports how long each module takes to import when a worker boots, from a
+    fresh interpreter that sets Django up with the current settings (see
+    utils.import_profiling): the time spent in the module's own body and the
+    cumulative time including the modules it imported first. The slowest
+    modules that only some views need are candidates for importing lazily.
+    """
+    help = 'Reports the import time of each module loaded when the project starts.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--urls', action='store_true', default=False,
+                            help='Also import the URLconf, with the views and forms, as the first request does.')
+        parser.add_argument('--sort', choices=['self', 'cumulative'], default='cumulative',
+                            help='The time to sort the modules by.')
+        parser.add_argument('--limit', type=int, default=40, help='Number of modules listed.')
+        parser.add_argument('--packages', action='store_true', default=False,
+                            help='Add up the self times by top-level package instead of listing modules.')
+
+    def handle(self, *args, **options):
+        timings = self._profile(options['urls'])
+
+        if options['packages']:
+            packages = defaultdict(lambda: {'self': 0.0, 'modules': 0})
+
+            for name, timing in timings.items():
+                package = packages[name.split('.')[0]]
+                package['self'] += timing['self']
+                package['modules'] += 1
+
+            rows = sorted(((name, package['modules'], package['self']) for name, package in packages.items()),
+                          key=lambda row: -row[2])
+            self.stdout.write("{0:<40} {1:>8} {2:>10}".format('Package', 'Modules', 'Self (ms)'))
+
+            for name, modules, self_time in rows[:options['limit']]:
+                self.stdout.write("{0:<40} {1:>8} {2:>10.1f}".format(name, modules, self_time * 1000))
+        else:
+            rows = sorted(timings.items(), key=lambda item: -item[1][options['sort']])
+            self.stdout.write("{0:<60} {1:>10} {2:>16}".format('Module', 'Self (ms)', 'Cumulative (ms)'))
+
+            for name, timing in rows[:options['limit']]:
+                self.stdout.write("{0:<60} {1:>10.1f} {2:>16.1f}".format(
+                    name, timing['self'] * 1000, timing['cumulative'] * 1000))
+
+        self.stdout.write(self.style.SUCCESS("{0} modules imported in {1:.1f} ms.".format(
+            len(timings), sum(timing['self'] for timing in timings.values()) * 1000)))
+
+    @staticmethod
+    def _profile(import_urlconf):
+        """
+        Runs utils.import_profiling in a new interpreter, since the modules of
+        this one are already imported.
+        :return: Dictionary mapping the modules to their timings.
+        """
+        output_file, output_path = tempfile.mkstemp(suffix='.json')
+        os.close(output_file)
+
+        try:
+            command = [sys.executable, '-m', 'utils.import_profiling', output_path]
+
+            if import_urlconf:
+                command.append('--urls')
+
+            env = dict(os.environ, DJANGO_SETTINGS_MODULE=os.environ.get('DJANGO_SETTINGS_MODULE',
+                                                                         'Acriladmin.settings'))
+
+            if subprocess.call(command, cwd=settings.BASE_DIR, env=env) != 0:
+                raise CommandError("The profiled interpreter failed to set Django up.")
+
+            with open(output_path) as output:
+                return json.load(output)
+        finally:
+            os.remove(output_path)
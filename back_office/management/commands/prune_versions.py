@@ -0,0 +1,29 @@
+from django.core.management.base import BaseCommand
+
+from utils.versioning import VersionPruner
+
+
+class Command(BaseCommand):
+    """
+    Deletes the versions older than the retention of their model (see
+    utils.versioning.VERSION_POLICIES), keeping the latest version of each
+    object, and the revisions left without versions. Meant to be run
+    periodically, e.g. weekly.
+    """
+    help = 'Deletes the versions older than their retention.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, dest='batch_size', default=5000,
+                            help='Number of versions deleted per transaction.')
+        parser.add_argument('--dry-run', action='store_true', dest='dry_run', default=False,
+                            help='Only count the versions that would be deleted.')
+
+    def handle(self, *args, **options):
+        pruned = VersionPruner(options['batch_size']).prune(options['dry_run'])
+
+        for label, count in pruned.items():
+            if count:
+                self.stdout.write("{0}: {1}".format(label, count))
+
+        self.stdout.write(self.style.SUCCESS("{0} {1} versions.".format(
+            "Would delete" if options['dry_run'] else "Deleted", sum(pruned.values()))))
@@ -0,0 +1,114 @@
+from django.apps import apps
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+
+
+class Command(BaseCommand):
+    """
+    Reports how the indexes of the application's tables are used, from the
+    statistics PostgreSQL collects since they were last reset: the scans of
+    every index and the sequential scans of every table. Indexes that are
+    never scanned only slow the writes down, and tables read mostly through
+    sequential scans are missing one as their history grows.
+    """
+    help = 'Reports the index and sequential scans of the application tables.'
+
+    APPS = ['back_office', 'finances', 'inventories', 'operations']
+
+    TABLES_SQL = """
+        SELECT relname, seq_scan, seq_tup_read, COALESCE(idx_scan, 0), n_live_tup
+        FROM pg_stat_user_tables
+        WHERE relname = ANY(%s)
+        ORDER BY seq_tup_read DESC
+    """
+
+    INDEXES_SQL = """
+        SELECT s.relname, s.indexrelname, s.idx_scan, pg_relation_size(s.indexrelid), i.indisunique
+        FROM pg_stat_user_indexes s
+        JOIN pg_index i ON i.indexrelid = s.indexrelid
+        WHERE s.relname = ANY(%s)
+        ORDER BY s.relname, s.idx_scan DESC
+    """
+
+    def add_arguments(self, parser):
+        parser.add_argument('app_labels', nargs='*', help='The apps to report; all of the application by default.')
+        parser.add_argument('--unused', action='store_true', default=False,
+                            help='Only list the indexes that have never been scanned.')
+        parser.add_argument('--min-rows', type=int, dest='min_rows', default=1000,
+                            help='Only flag sequential scans of tables with at least these rows.')
+        parser.add_argument('--database', default='default', help='The database to report.')
+
+    def handle(self, *args, **options):
+        connection = connections[options['database']]
+
+        if connection.vendor != 'postgresql':
+            raise CommandError("The index usage statistics are only available in PostgreSQL.")
+
+        tables = self._get_tables(options['app_labels'] or self.APPS)
+
+        with connection.cursor() as cursor:
+            cursor.execute(self.TABLES_SQL, [tables])
+            table_rows = cursor.fetchall()
+            cursor.execute(self.INDEXES_SQL, [tables])
+            index_rows = cursor.fetchall()
+
+        if not options['unused']:
+            self.stdout.write("{0:<45} {1:>12} {2:>14} {3:>12} {4:>10}".format(
+                'Table', 'Seq. scans', 'Rows read', 'Idx. scans', 'Rows'))
+
+            for table, seq_scans, rows_read, index_scans, live_rows in table_rows:
+                line = "{0:<45} {1:>12} {2:>14} {3:>12} {4:>10}".format(table, seq_scans, rows_read, index_scans,
+                                                                        live_rows)
+
+                if live_rows >= options['min_rows'] and seq_scans > index_scans:
+                    line = self.style.WARNING(line + "  mostly sequential scans")
+
+                self.stdout.write(line)
+
+            self.stdout.write("")
+
+        self.stdout.write("{0:<45} {1:<55} {2:>12} {3:>10}".format('Table', 'Index', 'Scans', 'Size'))
+        unused_size = 0
+
+        for table, index, scans, size, is_unique in index_rows:
+            # Unique indexes enforce a constraint even if no query uses them.
+            is_unused = scans == 0 and not is_unique
+
+            if options['unused'] and not is_unused:
+                continue
+
+            line = "{0:<45} {1:<55} {2:>12} {3:>10}".format(table, index, scans, self._format_size(size))
+
+            if is_unused:
+                unused_size += size
+                line = self.style.WARNING(line + "  unused")
+
+            self.stdout.write(line)
+
+        self.stdout.write("\nUnused indexes take {0}.".format(self._format_size(unused_size)))
+
+    @staticmethod
+    def _get_tables(app_labels):
+        try:
+            app_configs = [apps.get_app_config(app_label) for app_label in app_labels]
+        except LookupError as e:
+            raise CommandError(str(e))
+
+        tables = []
+
+        for app_config in app_configs:
+            for model in app_config.get_models(include_auto_created=True):
+                if not model._meta.proxy and model._meta.managed:
+                    tables.append(model._meta.db_table)
+
+        return tables
+
+    @staticmethod
+    def _format_size(size):
+        for unit in ('B', 'kB', 'MB'):
+            if size < 1024:
+                return "{0:.0f} {1}".format(size, unit)
+
+            size /= 1024
+
+        return "{0:.1f} GB".format(size)
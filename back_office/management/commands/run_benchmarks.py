@@ -0,0 +1,73 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from utils.benchmarks import BenchmarkSuite, compare_reports
+
+
+class Command(BaseCommand):
+    """
+    Runs the benchmark suite against the current database and writes a JSON
+    report that can be compared with the report of another commit.
+    """
+    help = 'Times the solver, inventory views, autocompletes, confirmations, Excel import and sale submission.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('benchmarks', nargs='*', help='The benchmarks to run; all of them by default.')
+        parser.add_argument('--repeat', type=int, default=10, help='Timed runs per benchmark.')
+        parser.add_argument('--warmup', type=int, default=2, help='Untimed runs per benchmark.')
+        parser.add_argument('--connections', action='store_true', default=False,
+                            help='Also compare a short request with new, persistent and pooled connections.')
+        parser.add_argument('--output', help='File where the JSON report is written.')
+        parser.add_argument('--compare', help='JSON report to compare the results with.')
+        parser.add_argument('--max-regression', type=float, dest='max_regression',
+                            help='Fail if a median is slower than the compared report by more than this percentage.')
+
+    def handle(self, *args, **options):
+        unknown_benchmarks = set(options['benchmarks']) - set(BenchmarkSuite.BENCHMARKS)
+
+        if unknown_benchmarks:
+            raise CommandError("Unknown benchmarks: {0}. Available: {1}.".format(
+                ", ".join(sorted(unknown_benchmarks)), ", ".join(BenchmarkSuite.BENCHMARKS)))
+
+        try:
+            suite = BenchmarkSuite(repeat=options['repeat'], warmup=options['warmup'])
+        except ValueError as e:
+            raise CommandError(str(e))
+
+        report = suite.run(options['benchmarks'])
+
+        for name, result in report['results'].items():
+            self.stdout.write("{0:<30} median {1:>9.2f} ms  p95 {2:>9.2f} ms  {3:>5} queries".format(
+                name, result['median_ms'], result['p95_ms'], result['queries']))
+
+        if options['connections']:
+            report['connections'] = suite.run_connection_benchmark()
+            self.stdout.write("\nProduct autocomplete per connection mode:")
+
+            for mode, result in report['connections'].items():
+                self.stdout.write("{0:<30} median {1:>9.2f} ms  p95 {2:>9.2f} ms".format(
+                    mode, result['median_ms'], result['p95_ms']))
+
+        if options['output']:
+            with open(options['output'], 'w') as output:
+                json.dump(report, output, indent=2)
+
+        if options['compare']:
+            with open(options['compare']) as baseline_file:
+                baseline = json.load(baseline_file)
+
+            self.stdout.write("\nCompared with {0}:".format(baseline.get('commit') or options['compare']))
+            regressions = []
+
+            for name, baseline_ms, current_ms, change, baseline_queries, current_queries in compare_reports(
+                    report, baseline):
+                self.stdout.write("{0:<30} {1:>9.2f} -> {2:>9.2f} ms ({3:+.1f}%)  {4} -> {5} queries".format(
+                    name, baseline_ms, current_ms, change, baseline_queries, current_queries))
+
+                if options['max_regression'] is not None and change > options['max_regression']:
+                    regressions.append(name)
+
+            if regressions:
+                raise CommandError("Regressions above {0}%: {1}.".format(options['max_regression'],
+                                                                        ", ".join(regressions)))
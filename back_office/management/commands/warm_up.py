@@ -0,0 +1,34 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from utils.warmup import get_warmup_task_names, run_warmups
+
+
+class Command(BaseCommand):
+    """
+    Runs the warm-up tasks that the gunicorn hooks run when the workers start
+    (see utils.warmup) and reports how long each one took, so the cost of a
+    cold worker can be measured and new tasks tried out.
+    """
+    help = 'Runs the warm-up tasks and reports their times.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('tasks', nargs='*', help='The tasks to run; all of them by default.')
+
+    def handle(self, *args, **options):
+        task_names = get_warmup_task_names()
+        unknown_tasks = set(options['tasks']) - set(task_names)
+
+        if unknown_tasks:
+            raise CommandError("Unknown warm-up tasks: {0}. The tasks are: {1}.".format(
+                ", ".join(sorted(unknown_tasks)), ", ".join(task_names)))
+
+        timings = run_warmups(options['tasks'] or None)
+
+        for name, seconds in timings.items():
+            if seconds is None:
+                self.stdout.write(self.style.ERROR("{0}: failed (see the log)".format(name)))
+            else:
+                self.stdout.write("{0}: {1:.1f} ms".format(name, seconds * 1000))
+
+        if any(seconds is None for seconds in timings.values()):
+            raise CommandError("Some warm-up tasks failed.")
@@ -124,12 +124,16 @@ class Employee(AbstractUser):
 
     def belongs_to_group(self, group):
         """
-        Determines if the Employee belongs to the given group.
+        Determines if the Employee belongs to the given group. The group names
+        are read once per instance.
         :param group: The group.
         :return: True if the user belongs to the group,
         False otherwise.
         """
-        return group in [x.name for x in self.groups.all()]
+        if not hasattr(self, '_group_names'):
+            self._group_names = set(self.groups.values_list('name', flat=True))
+
+        return group in self._group_names
 
 
 class Client(models.Model):
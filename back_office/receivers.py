@@ -0,0 +1,57 @@
+from django.contrib.auth.models import Group, Permission
+from django.db.models.signals import post_save, post_delete, m2m_changed
+from django.dispatch import receiver
+
+from back_office.models import Employee, BranchOffice
+from utils.cache import admin_app_list_cache, pending_items_cache, user_contexts_cache
+
+
+@receiver([post_save, post_delete], sender=Employee, dispatch_uid='invalidate_admin_app_list_on_employee_change')
+def invalidate_admin_app_list_on_employee_change(sender, instance, update_fields=None, **kwargs):
+    """
+    An employee may have changed its staff or superuser status. The update
+    of the last login date, saved on every login, is ignored.
+    """
+    if update_fields is None or set(update_fields) != {'last_login'}:
+        admin_app_list_cache.invalidate()
+
+
+@receiver([post_save, post_delete], sender=Group, dispatch_uid='invalidate_admin_app_list_on_group_change')
+@receiver([post_save, post_delete], sender=Permission, dispatch_uid='invalidate_admin_app_list_on_permission_change')
+def invalidate_admin_app_list_on_group_or_permission_change(sender, **kwargs):
+    admin_app_list_cache.invalidate()
+
+
+@receiver(m2m_changed, dispatch_uid='invalidate_admin_app_list_on_permissions_assignment')
+def invalidate_admin_app_list_on_permissions_assignment(sender, **kwargs):
+    """
+    Invalidates the app lists when permissions are given to or taken from an
+    employee, directly or through a group.
+    """
+    if sender in (Employee.groups.through, Employee.user_permissions.through, Group.permissions.through):
+        admin_app_list_cache.invalidate()
+
+
+@receiver([post_save, post_delete], sender=BranchOffice, dispatch_uid='invalidate_pending_items_on_branch_change')
+def invalidate_pending_items_on_branch_change(sender, **kwargs):
+    """
+    The pending items of a user depend on the branch offices it administers.
+    """
+    pending_items_cache.invalidate()
+
+
+@receiver([post_save, post_delete], sender=Employee, dispatch_uid='invalidate_user_contexts_on_employee_change')
+@receiver([post_save, post_delete], sender=BranchOffice, dispatch_uid='invalidate_user_contexts_on_branch_change')
+def invalidate_user_contexts_on_employee_or_branch_change(sender, update_fields=None, **kwargs):
+    """
+    The user contexts hold the employees' branch offices and the branches'
+    administrators (see back_office.user_context). The update of the last
+    login date is ignored.
+    """
+    if update_fields is None or set(update_fields) != {'last_login'}:
+        user_contexts_cache.invalidate()
+
+
+@receiver(m2m_changed, sender=Employee.groups.through, dispatch_uid='invalidate_user_contexts_on_groups_change')
+def invalidate_user_contexts_on_groups_change(sender, **kwargs):
+    user_contexts_cache.invalidate()
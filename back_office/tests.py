@@ -1 +1,489 @@
-# Create your tests here.
+import json
+import logging
+import os
+import tempfile
+import threading
+from collections import deque
+
+from django.contrib.auth.models import Permission
+from django.core.cache import cache
+from django.core.urlresolvers import reverse
+from django.db import connection
+from django.test import TestCase, RequestFactory, override_settings
+from django.test.utils import CaptureQueriesContext
+from django_db_logger.models import StatusLog
+
+from back_office.admin import admin_site
+from back_office.models import Employee
+from back_office.user_context import UserContext
+
+from finances.models import ProductPrice
+from inventories.models import Product, ProductInventoryItem
+from utils.admin import EstimatedCountPaginator, get_estimated_count
+from utils.log_handlers import QueuedDatabaseLogHandler
+from utils.profiling import QueryProfilingMiddleware, RequestMetrics, request_metrics
+from utils.synthetic_data import SyntheticDataGenerator
+from utils.testing import QueryBudget, QueryBudgetTestMixin, SeedFactory
+from utils.warmup import get_warmup_task_names, run_warmups
+
+
+class AdminIndexQueryBudgetTestCase(QueryBudgetTestMixin, TestCase):
+    """
+    Query budget of the admin index, which lists the user's pending
+    inventory movements and their products.
+    """
+
+    def test_index_with_pending_product_entries(self):
+        """
+        Tests that the pending movements are listed without a query per
+        movement or per product.
+        """
+        factory = SeedFactory()
+
+        def scenario(scale):
+            branch_office = factory.create_branch_office(is_staff=True, is_superuser=True)
+            inventory = branch_office.productsinventory
+
+            for products in [factory.create_products(scale) for _ in range(scale)]:
+                factory.create_product_entry(inventory, products)
+
+            self.client.login(username=branch_office.administrator.username, password=SeedFactory.PASSWORD)
+
+            return lambda: self.assertEqual(self.client.get(reverse('admin:index')).status_code, 200)
+
+        self.assertQueryBudget(QueryBudget(30), scenario, scales=(1, 5, 10))
+
+
+class AdminCacheTestCase(TestCase):
+    """
+    Test case for the cached app list and pending items of the admin site.
+    """
+
+    def setUp(self):
+        cache.clear()
+        self.factory = SeedFactory()
+
+    def test_pending_items_are_invalidated_by_new_movements(self):
+        """
+        Tests that a new pending entry is listed although the pending items
+        were cached.
+        """
+        branch_office = self.factory.create_branch_office(is_staff=True, is_superuser=True)
+        inventory = branch_office.productsinventory
+        self.client.login(username=branch_office.administrator.username, password=SeedFactory.PASSWORD)
+
+        response = self.client.get(reverse('admin:index'))
+        self.assertEqual(len(response.context['pending_items']['pending_product_entries']), 0)
+
+        product_entry = self.factory.create_product_entry(inventory, self.factory.create_products(2))
+
+        response = self.client.get(reverse('admin:index'))
+        self.assertEqual(response.context['pending_items']['pending_product_entries'], [product_entry])
+
+    def test_app_list_is_invalidated_by_permission_changes(self):
+        """
+        Tests that the app list is cached per user and rebuilt when the user
+        is given a permission.
+        """
+        branch_office = self.factory.create_branch_office(is_staff=True)
+        request = RequestFactory().get('/admin/')
+        request.user = branch_office.administrator
+
+        self.assertEqual(admin_site.get_app_list(request), [])
+
+        with self.assertNumQueries(0):
+            self.assertEqual(admin_site.get_app_list(request), [])
+
+        request.user.user_permissions.add(Permission.objects.get(codename='change_productsinventory'))
+        request.user = Employee.objects.get(pk=request.user.pk)
+
+        app_list = admin_site.get_app_list(request)
+        self.assertEqual([app['app_label'] for app in app_list], ['inventories'])
+
+
+class UserContextTestCase(TestCase):
+    """
+    Test case for the cached context of the requests' users.
+    """
+
+    def setUp(self):
+        cache.clear()
+        self.factory = SeedFactory()
+
+    def test_context_is_cached_until_the_branch_changes(self):
+        """
+        Tests that, with a shared cache backend, the context is read once per
+        user and rebuilt when the user's branch office gets a new
+        administrator.
+        """
+        with tempfile.TemporaryDirectory() as cache_location:
+            with override_settings(CACHES={'default': {
+                'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+                'LOCATION': cache_location,
+            }}):
+                branch_office = self.factory.create_branch_office()
+                administrator = branch_office.administrator
+                context = UserContext(administrator)
+
+                self.assertEqual(context.products_inventory_id, branch_office.productsinventory.pk)
+                self.assertTrue(context.is_administrator(branch_office.pk))
+                self.assertTrue(context.is_supervisor(branch_office.pk))
+
+                with self.assertNumQueries(0):
+                    self.assertTrue(UserContext(administrator).is_administrator(branch_office.pk))
+
+                branch_office.administrator = self.factory.create_branch_office().administrator
+                branch_office.save()
+
+                self.assertFalse(UserContext(administrator).is_administrator(branch_office.pk))
+
+    def test_context_isnt_cached_in_local_memory(self):
+        """
+        Tests that, with the local memory backend, whose invalidations don't
+        reach the other processes, the context is read on every request.
+        """
+        branch_office = self.factory.create_branch_office()
+        UserContext(branch_office.administrator)
+
+        with self.assertNumQueries(3):
+            self.assertTrue(UserContext(branch_office.administrator).is_administrator(branch_office.pk))
+
+
+class AdminPerformanceMixinTestCase(TestCase):
+    """
+    Test case for the AdminPerformanceMixin the admin site adds to every
+    registration.
+    """
+
+    def test_foreign_keys_in_list_display_are_selected(self):
+        """
+        Tests that the foreign keys shown in the changelist, nullable ones
+        included, are joined.
+        """
+        request = RequestFactory().get('/admin/')
+
+        self.assertEqual(admin_site._registry[ProductPrice].get_list_select_related(request),
+                         ['product', 'authorized_by'])
+
+    @override_settings(ADMIN_ESTIMATED_COUNT_THRESHOLD=1000000)
+    def test_small_changelists_are_counted_exactly(self):
+        """
+        Tests that the rows are counted when there are fewer than the threshold.
+        """
+        SeedFactory().create_products(3)
+
+        self.assertEqual(EstimatedCountPaginator(Product.objects.all(), 10).count, 3)
+
+    @override_settings(ADMIN_ESTIMATED_COUNT_THRESHOLD=0)
+    def test_filtered_changelists_are_counted_exactly(self):
+        """
+        Tests that the filtered rows are always counted, since the table's
+        estimated size says nothing about them.
+        """
+        products = SeedFactory().create_products(3)
+        queryset = Product.objects.filter(pk__in=[product.pk for product in products[:2]])
+
+        self.assertIsNone(get_estimated_count(queryset))
+        self.assertEqual(EstimatedCountPaginator(queryset, 10).count, 2)
+
+
+class SyntheticDataGeneratorTestCase(TestCase):
+    """
+    Test case for the SyntheticDataGenerator class.
+    """
+
+    def test_generate_small_data_set(self):
+        """
+        Tests that a small data set is generated with the requested sizes.
+        """
+        generator = SyntheticDataGenerator(prefix='TEST', seed=1)
+        counts = generator.generate(branches=2, employees_per_branch=2, products=50, stock_ratio=0.5, clients=3,
+                                    sales=10, transfers=4, entries=5)
+
+        self.assertTrue(generator.prefix_exists())
+        self.assertEqual(counts['product'], 50)
+        self.assertEqual(Product.objects.filter(sku__startswith='TEST-').count(), 50)
+        self.assertEqual(ProductInventoryItem.objects.filter(product__sku__startswith='TEST-').count(), 50)
+        self.assertEqual(counts['sale'], 10)
+        self.assertEqual(counts['productentry'], 5)
+        self.assertEqual(counts['producttransfershipment'], 4)
+
+
+class WarmupTestCase(TestCase):
+    """
+    Test case for the worker warm-up tasks.
+    """
+
+    def test_every_task_runs(self):
+        """
+        Tests that the project's and the apps' tasks are registered and run
+        without failing.
+        """
+        self.assertIn('product catalog', get_warmup_task_names())
+
+        timings = run_warmups()
+
+        self.assertEqual(list(timings.keys()), get_warmup_task_names())
+        self.assertNotIn(None, timings.values())
+
+
+class _RecordingLogHandler(QueuedDatabaseLogHandler):
+    """
+    QueuedDatabaseLogHandler that keeps the batches instead of storing them,
+    optionally holding the first one until it's released.
+    """
+
+    def __init__(self, hold_first_batch=False, **kwargs):
+        super(_RecordingLogHandler, self).__init__(**kwargs)
+        self.batches = []
+        self.writing = threading.Event()
+        self.release = threading.Event()
+
+        if not hold_first_batch:
+            self.release.set()
+
+    def _store(self, batch):
+        self.writing.set()
+        self.release.wait(5.0)
+        self.batches.append(list(batch))
+
+
+class QueuedDatabaseLogHandlerTestCase(TestCase):
+    """
+    Test case for the handler that writes the log records from a background
+    thread.
+    """
+
+    def _create_handler(self, **kwargs):
+        handler = _RecordingLogHandler(**kwargs)
+        self.addCleanup(handler.close)
+
+        return handler
+
+    @staticmethod
+    def _emit(handler, count, message='record'):
+        for index in range(count):
+            handler.emit(logging.LogRecord('db', logging.ERROR, __file__, 0, "{0} {1}".format(message, index),
+                                           None, None))
+
+    @staticmethod
+    def _get_messages(handler):
+        return [entry['msg'] for batch in handler.batches for entry in batch]
+
+    def test_records_are_written_in_batches(self):
+        """
+        Tests that every record is written once, in order, and in batches no
+        larger than the batch size.
+        """
+        handler = self._create_handler(batch_size=3, flush_interval=60)
+        self._emit(handler, 7)
+        handler.flush()
+
+        self.assertEqual(self._get_messages(handler), ["record {0}".format(index) for index in range(7)])
+        self.assertTrue(all(0 < len(batch) <= 3 for batch in handler.batches))
+
+    def test_records_are_dropped_and_counted_when_the_queue_is_full(self):
+        """
+        Tests that the records that don't fit the queue are dropped and that
+        their count is written along the next batch.
+        """
+        handler = self._create_handler(capacity=2, batch_size=10, flush_interval=60, hold_first_batch=True)
+        self._emit(handler, 1, 'first')
+        self.assertTrue(handler.writing.wait(5.0))
+
+        self._emit(handler, 5, 'queued')
+
+        self.assertEqual(handler.dropped_count, 3)
+
+        handler.release.set()
+        handler.flush()
+
+        messages = self._get_messages(handler)
+        self.assertEqual(messages[:3], ['first 0', 'queued 0', 'queued 1'])
+        self.assertIn("3 log records were dropped", messages[3])
+        self.assertEqual(handler.dropped_count, 0)
+
+    def test_close_flushes_the_pending_records(self):
+        """
+        Tests that closing the handler, as it's done at exit, writes the
+        queued records and stops the thread.
+        """
+        handler = self._create_handler(flush_interval=60)
+        self._emit(handler, 4)
+        worker = handler._worker
+        handler.close()
+
+        self.assertEqual(len(self._get_messages(handler)), 4)
+        self.assertFalse(worker.is_alive())
+
+    def test_worker_is_restarted_after_a_fork(self):
+        """
+        Tests that a process that didn't start the thread (a forked worker)
+        starts its own, with its own queue.
+        """
+        handler = self._create_handler(flush_interval=60)
+        self._emit(handler, 1, 'parent')
+        parent_worker, parent_queue = handler._worker, handler._queue
+
+        # As seen by a forked child: the thread and the queue belong to another process.
+        handler._pid = -1
+        self._emit(handler, 1, 'child')
+
+        self.assertIsNot(handler._worker, parent_worker)
+        self.assertIsNot(handler._queue, parent_queue)
+        self.assertEqual(handler._pid, os.getpid())
+
+        handler.flush()
+        parent_queue.put(None)
+        parent_worker.join(5.0)
+
+        self.assertEqual(sorted(self._get_messages(handler)), ['child 0', 'parent 0'])
+
+    def test_records_are_stored(self):
+        """
+        Tests that a batch, with the dropped records' warning, is stored in
+        the log table.
+        """
+        handler = QueuedDatabaseLogHandler()
+        handler.dropped_count = 2
+        handler._write([{'logger_name': 'db', 'level': logging.ERROR, 'msg': 'stored', 'trace': None}])
+
+        self.assertEqual(StatusLog.objects.filter(msg='stored').count(), 1)
+        self.assertTrue(StatusLog.objects.filter(msg__startswith='2 log records were dropped').exists())
+
+
+class RequestMetricsTestCase(TestCase):
+    """
+    Test case for the aggregation of the request metrics.
+    """
+
+    def test_snapshot(self):
+        """
+        Tests the averages, maximums and latency histogram of a view.
+        """
+        metrics = RequestMetrics()
+        metrics.record('view', 5, 2, 1.5)
+        metrics.record('view', 300, 4, 2.5)
+        metrics.record('view', 20000, 0, 0)
+
+        figures = metrics.snapshot()['views']['view']
+
+        self.assertEqual(figures['requests'], 3)
+        self.assertEqual(figures['max_ms'], 20000)
+        self.assertEqual(figures['avg_sql_count'], 2)
+        self.assertEqual(figures['max_sql_count'], 4)
+        self.assertEqual((figures['latency_histogram']['10'], figures['latency_histogram']['500'],
+                          figures['latency_histogram']['+Inf']), (1, 1, 1))
+        self.assertEqual(sum(figures['latency_histogram'].values()), 3)
+
+        metrics.reset()
+
+        self.assertEqual(metrics.snapshot()['views'], {})
+
+
+@override_settings(REQUEST_PROFILING_ENABLED=True, REQUEST_PROFILING_SQL_SAMPLE_RATE=1.0,
+                   REQUEST_PROFILING_METRICS_TOKEN='metrics-token')
+class QueryProfilingMiddlewareTestCase(TestCase):
+    """
+    Test case for the request profiling middleware and the metrics view.
+    """
+
+    def setUp(self):
+        request_metrics.reset()
+        self.addCleanup(request_metrics.reset)
+        self.branch_office = SeedFactory().create_branch_office(is_staff=True)
+
+    def test_requests_are_recorded_per_view(self):
+        """
+        Tests that the requests are recorded under their URL name, with their
+        SQL queries when they're sampled.
+        """
+        self.client.login(username=self.branch_office.administrator.username, password=SeedFactory.PASSWORD)
+        self.client.get(reverse('admin:index'))
+        self.client.get(reverse('admin:index'))
+        self.client.get('/unknown-path/')
+
+        views = request_metrics.snapshot()['views']
+
+        self.assertEqual(views['admin:index']['requests'], 2)
+        self.assertGreater(views['admin:index']['max_sql_count'], 0)
+        self.assertEqual(views['unresolved']['requests'], 1)
+
+    def test_query_log_is_kept(self):
+        """
+        Tests that the sampled requests don't clear the connection's query
+        log, so the queries counted around them include theirs, and that
+        each request only records its own queries.
+        """
+        self.client.login(username=self.branch_office.administrator.username, password=SeedFactory.PASSWORD)
+
+        with CaptureQueriesContext(connection) as context:
+            self.client.get(reverse('admin:index'))
+            self.client.get(reverse('admin:index'))
+
+        views = request_metrics.snapshot()['views']
+
+        self.assertEqual(views['admin:index']['avg_sql_count'] * 2, len(context))
+
+    def test_queries_after_a_full_log(self):
+        """
+        Tests that the request's queries are found once the bounded log is
+        full and its older entries are dropped.
+        """
+        queries_log = deque([{'sql': str(number)} for number in range(5)], maxlen=5)
+        last_query = queries_log[-1]
+        queries_log.extend([{'sql': '5'}, {'sql': '6'}])
+
+        self.assertEqual([query['sql'] for query in QueryProfilingMiddleware._get_queries_after(queries_log,
+                                                                                                last_query)],
+                         ['5', '6'])
+        self.assertEqual(len(QueryProfilingMiddleware._get_queries_after(queries_log, None)), 5)
+
+    @override_settings(REQUEST_PROFILING_SQL_SAMPLE_RATE=0)
+    def test_unsampled_requests_dont_capture_sql(self):
+        """
+        Tests that the requests that aren't sampled only measure their time
+        and don't turn the debug cursor on.
+        """
+        self.client.get(reverse('admin:login'))
+
+        self.assertEqual(request_metrics.snapshot()['views']['admin:login']['max_sql_count'], 0)
+        self.assertFalse(connection.force_debug_cursor)
+
+    def test_slow_requests_are_logged(self):
+        """
+        Tests that the sampled slow requests are written to the slow log.
+        """
+        slow_log = tempfile.NamedTemporaryFile(suffix='.jsonl', delete=False)
+        slow_log.close()
+        self.addCleanup(os.remove, slow_log.name)
+
+        with self.settings(REQUEST_PROFILING_SLOW_MS=0, REQUEST_PROFILING_SLOW_SAMPLE_RATE=1.0,
+                           REQUEST_PROFILING_SLOW_LOG=slow_log.name):
+            self.client.get(reverse('admin:login'))
+
+        with open(slow_log.name) as lines:
+            entries = [json.loads(line) for line in lines]
+
+        self.assertEqual([(entry['view'], entry['status'], entry['sql_captured']) for entry in entries],
+                         [('admin:login', 200, True)])
+
+    def test_metrics_view_access(self):
+        """
+        Tests that the metrics are only served to staff members and to the
+        clients that send the token.
+        """
+        self.assertEqual(self.client.get(reverse('metrics')).status_code, 403)
+        self.assertEqual(self.client.get(reverse('metrics'), HTTP_X_METRICS_TOKEN='wrong').status_code, 403)
+        self.assertEqual(self.client.get(reverse('metrics'), HTTP_X_METRICS_TOKEN='metrics-token').status_code, 200)
+
+        employee = SeedFactory('employee').create_employee(self.branch_office)
+        self.client.login(username=employee.username, password=SeedFactory.PASSWORD)
+
+        self.assertEqual(self.client.get(reverse('metrics')).status_code, 403)
+
+        self.client.login(username=self.branch_office.administrator.username, password=SeedFactory.PASSWORD)
+        response = self.client.get(reverse('metrics'))
+
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('views', json.loads(response.content.decode()))
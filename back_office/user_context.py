@@ -0,0 +1,165 @@
+import logging
+
+from django.db.models import Q
+from django.utils.functional import SimpleLazyObject, cached_property
+
+from back_office.models import BranchOffice
+from inventories.models import ProductsInventory, MaterialsInventory, ConsumablesInventory, DurableGoodsInventory
+from utils.cache import user_contexts_cache
+
+db_logger = logging.getLogger('db')
+
+
+class UserContext:
+    """
+    What the views and forms need to know about the user of a request: its
+    branch office, the branch's inventories, its groups and the branch offices
+    it administers or whose products inventory it supervises. The IDs and
+    names are read once per request or, when the cache backend is shared by
+    the processes, cached per user until the employees, branch offices or
+    inventories change (see back_office.receivers). The branch office and
+    inventories themselves are fetched once per request, when first used.
+    """
+
+    def __init__(self, user):
+        """
+        :param user: The request's user, which may be anonymous.
+        """
+        self.user = user
+
+        if user.is_authenticated():
+            data = user_contexts_cache.get_or_set(user.pk, lambda: UserContext.load(user))
+        else:
+            data = UserContext.get_empty_data()
+
+        self.branch_office_id = data['branch_office_id']
+        self.products_inventory_id = data['products_inventory_id']
+        self.materials_inventory_id = data['materials_inventory_id']
+        self.consumables_inventory_id = data['consumables_inventory_id']
+        self.durable_goods_inventory_id = data['durable_goods_inventory_id']
+        self.group_names = data['group_names']
+        self.administered_branch_ids = data['administered_branch_ids']
+        self.supervised_branch_ids = data['supervised_branch_ids']
+
+    @staticmethod
+    def get_empty_data():
+        return {
+            'branch_office_id': None,
+            'products_inventory_id': None,
+            'materials_inventory_id': None,
+            'consumables_inventory_id': None,
+            'durable_goods_inventory_id': None,
+            'group_names': frozenset(),
+            'administered_branch_ids': frozenset(),
+            'supervised_branch_ids': frozenset(),
+        }
+
+    @staticmethod
+    def load(user):
+        """
+        Reads the context's data of a user from the database.
+        :param user: The Employee.
+        :return: A dictionary with the data.
+        """
+        try:
+            data = UserContext.get_empty_data()
+            data['branch_office_id'] = user.branch_office_id
+
+            inventory_ids = BranchOffice.objects.filter(pk=user.branch_office_id).values(
+                'productsinventory', 'materialsinventory', 'consumablesinventory', 'durablegoodsinventory').first()
+
+            if inventory_ids is not None:
+                data['products_inventory_id'] = inventory_ids['productsinventory']
+                data['materials_inventory_id'] = inventory_ids['materialsinventory']
+                data['consumables_inventory_id'] = inventory_ids['consumablesinventory']
+                data['durable_goods_inventory_id'] = inventory_ids['durablegoodsinventory']
+
+            data['group_names'] = frozenset(user.groups.values_list('name', flat=True))
+
+            roles = BranchOffice.objects.filter(
+                Q(administrator=user) | Q(productsinventory__supervisor=user)
+            ).values_list('pk', 'administrator', 'productsinventory__supervisor')
+            data['administered_branch_ids'] = frozenset(pk for pk, administrator_id, _ in roles
+                                                        if administrator_id == user.pk)
+            data['supervised_branch_ids'] = frozenset(pk for pk, _, supervisor_id in roles if supervisor_id == user.pk)
+
+            return data
+        except Exception as e:
+            db_logger.exception(e)
+            raise
+
+    def belongs_to_group(self, group):
+        """
+        Determines if the user belongs to the given group.
+        :param group: The group's name.
+        :return: True if the user belongs to the group, False otherwise.
+        """
+        return group in self.group_names
+
+    def is_administrator(self, branch_office_id):
+        """
+        Determines if the user administers a branch office.
+        :param branch_office_id: The branch office's ID.
+        :return: True if the user administers it, False otherwise.
+        """
+        return int(branch_office_id) in self.administered_branch_ids
+
+    def is_supervisor(self, branch_office_id):
+        """
+        Determines if the user supervises the products inventory of a branch
+        office.
+        :param branch_office_id: The branch office's ID.
+        :return: True if the user supervises it, False otherwise.
+        """
+        return int(branch_office_id) in self.supervised_branch_ids
+
+    def get_managed_branch_ids(self):
+        """
+        :return: The IDs of the branch offices the user administers or
+        supervises.
+        """
+        return self.administered_branch_ids | self.supervised_branch_ids
+
+    @cached_property
+    def branch_office(self):
+        return BranchOffice.objects.get(pk=self.branch_office_id)
+
+    @cached_property
+    def products_inventory(self):
+        return ProductsInventory.objects.get(pk=self.products_inventory_id)
+
+    @cached_property
+    def materials_inventory(self):
+        return MaterialsInventory.objects.get(pk=self.materials_inventory_id)
+
+    @cached_property
+    def consumables_inventory(self):
+        return ConsumablesInventory.objects.get(pk=self.consumables_inventory_id)
+
+    @cached_property
+    def durable_goods_inventory(self):
+        return DurableGoodsInventory.objects.get(pk=self.durable_goods_inventory_id)
+
+
+def get_user_context(request):
+    """
+    Returns the UserContext of a request, building it if UserContextMiddleware
+    didn't (e.g. requests built by a RequestFactory).
+    :param request: The HTTP request.
+    :return: The UserContext.
+    """
+    if not hasattr(request, 'user_context'):
+        request.user_context = UserContext(request.user)
+
+    return request.user_context
+
+
+class UserContextMiddleware:
+    """
+    Gives every request a lazy user_context attribute, the UserContext of its
+    user, built the first time it's used. It must be placed after the
+    authentication middleware.
+    """
+
+    def process_request(self, request):
+        request.user_context = SimpleLazyObject(lambda: UserContext(request.user))
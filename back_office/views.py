@@ -1,8 +1,12 @@
-from back_office.models import Address, Client
 from dal import autocomplete
 from django.db.models import Q
+from django.utils.decorators import method_decorator
+
+from back_office.models import Address, Client
+from utils.db.routers import read_from_replica
 
 
+@method_decorator(read_from_replica(), name='dispatch')
 class AddressAutocomplete(autocomplete.Select2QuerySetView):
     """
     Select2 framework's autocomplete for the Address entity.
@@ -23,6 +27,7 @@ class AddressAutocomplete(autocomplete.Select2QuerySetView):
         return query_set
 
 
+@method_decorator(read_from_replica(), name='dispatch')
 class ClientAutocomplete(autocomplete.Select2QuerySetView):
     """
     Select2 framework's autocomplete for the Client entity.
@@ -2,14 +2,14 @@ import logging
 
 from django.contrib import admin
 from django.contrib.admin import ModelAdmin
-from django.db.models import Sum, F
-from reversion.admin import VersionAdmin
 
 import finances.models as models
-from back_office.admin import admin_site
+from back_office.admin import admin_site, HistoryAdmin, HistoryInline
 from back_office.models import EmployeeGroup
+from back_office.user_context import get_user_context
 from finances.forms.productprice_forms import AddOrChangeProductPriceForm
 from finances.forms.sale_forms import AddOrChangeSaleForm, SaleProductItemInlineForm, SaleProductItemInlineFormSet
+from utils.versioning import PolicyVersionAdmin
 
 db_logger = logging.getLogger('db')
 
@@ -31,11 +31,11 @@ class InvoiceAdmin(admin.ModelAdmin):
     """
     Contains the details for the admin app in regard to the Invoice entity.
     """
-    list_display = ('folio', 'total', 'is_closed',)
+    list_display = ('folio', 'total', 'amount_paid', 'is_closed',)
     inlines = (TransactionInline,)
 
     def get_readonly_fields(self, request, obj=None):
-        readonly_fields = ('is_closed', 'state',)
+        readonly_fields = ('amount_paid', 'is_closed', 'state',)
 
         if obj is None:
             return readonly_fields
@@ -47,7 +47,7 @@ class InvoiceAdmin(admin.ModelAdmin):
         super(InvoiceAdmin, self).save_model(request, obj, form, change)
 
 
-class ProductPriceAdmin(VersionAdmin):
+class ProductPriceAdmin(PolicyVersionAdmin):
     """
     Contains the details for the admin app in regard to the ProductPrice entity.
     """
@@ -65,7 +65,7 @@ class ProductPriceAdmin(VersionAdmin):
         obj.save()
 
 
-class MaterialCostAdmin(VersionAdmin):
+class MaterialCostAdmin(PolicyVersionAdmin):
     """
     Contains the details for the admin app in regard to the MaterialCost entity.
     """
@@ -90,24 +90,12 @@ class TransactionAdmin(admin.ModelAdmin):
 
     def save_model(self, request, obj, form, change):
         """
-        Overrides the default save function for the Transaction model. After each transaction is saved,
-        its associated invoice will be marked as closed if the amount covered by all related transactions
-        is equal or higher than the invoice's total amount.
+        Overrides the default save function for the Transaction model. Saving the transaction
+        updates its invoice's paid amount and marks it as closed if the amount covered by all
+        related transactions is equal or higher than the invoice's total amount.
         """
         try:
             obj.save()
-
-            invoice = obj.invoice
-
-            related_transactions_sum = models.Transaction.objects.filter(invoice=invoice).aggregate(
-                sum=Sum(F('amount')))['sum']
-
-            if related_transactions_sum >= invoice.total:
-                invoice.is_closed = True
-            else:
-                invoice.is_closed = False
-
-            invoice.save()
         except Exception as e:
             db_logger.exception(e)
             raise
@@ -119,7 +107,7 @@ class TransactionAdmin(admin.ModelAdmin):
         return ['invoice', 'payed_by', 'datetime', 'amount']
 
 
-class RepairCostAdmin(VersionAdmin):
+class RepairCostAdmin(PolicyVersionAdmin):
     """
     Contains the details for the admin app in regard to the RepairCost entity.
     """
@@ -236,7 +224,7 @@ class SaleAdmin(ModelAdmin):
     cancel_sales.short_description = "Cancelar las ventas elegidas"
 
     def save_model(self, request, obj, form, change):
-        obj.inventory = request.user.branch_office.productsinventory
+        obj.inventory = get_user_context(request).products_inventory
         obj.save()
 
     def save_related(self, request, form, formsets, change):
@@ -248,9 +236,25 @@ class SaleAdmin(ModelAdmin):
             obj.invoice.save()
 
 
+class SaleProductItemHistoryInline(HistoryInline):
+    model = models.SaleProductItemHistory
+
+
+class SaleHistoryAdmin(HistoryAdmin):
+    """
+    Contains the details for the admin app in regard to the sales' history.
+    """
+    list_display = ['__str__', 'client', 'inventory', 'state', 'date']
+    list_filter = ('inventory', 'type', 'state', 'date',)
+    list_select_related = ('client', 'inventory',)
+    search_fields = ('client__name',)
+    inlines = (SaleProductItemHistoryInline,)
+
+
 admin_site.register(models.Invoice, InvoiceAdmin)
 admin_site.register(models.ProductPrice, ProductPriceAdmin)
 admin_site.register(models.MaterialCost, MaterialCostAdmin)
 admin_site.register(models.Transaction, TransactionAdmin)
 admin_site.register(models.RepairCost, RepairCostAdmin)
 admin_site.register(models.Sale, SaleAdmin)
+admin_site.register(models.SaleHistory, SaleHistoryAdmin)
@@ -4,3 +4,6 @@ from django.apps import AppConfig
 class FinancesConfig(AppConfig):
     name = 'finances'
     verbose_name = 'Finanzas'
+
+    def ready(self):
+        import finances.signals  # noqa
@@ -0,0 +1,26 @@
+import django_filters
+
+from finances.models import ProductPrice, MaterialCost
+
+
+class ProductPriceFilter(django_filters.FilterSet):
+    """
+    Filters for the product prices API.
+    """
+    sku = django_filters.CharFilter(name='product__sku', lookup_expr='iexact')
+    line = django_filters.NumberFilter(name='product__line')
+
+    class Meta:
+        model = ProductPrice
+        fields = ('product', 'sku', 'line',)
+
+
+class MaterialCostFilter(django_filters.FilterSet):
+    """
+    Filters for the material costs API.
+    """
+    name = django_filters.CharFilter(name='material__name', lookup_expr='icontains')
+
+    class Meta:
+        model = MaterialCost
+        fields = ('material', 'name',)
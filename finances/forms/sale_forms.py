@@ -5,9 +5,11 @@ from django.core.exceptions import ValidationError
 from django.db import transaction
 from django.forms import ModelForm, BaseInlineFormSet
 
-from finances.models import Sale, SaleProductItem, ProductPrice, Transaction
+from back_office.user_context import get_user_context
+from finances.models import Sale, SaleProductItem, ProductPrice, Transaction, SaleRollup
 from inventories.models import Product, ProductInventoryItem
 from utils.product_helpers import ScrapsToProductsConverter
+from utils.versioning import movement_saves
 
 db_logger = logging.getLogger('db')
 
@@ -56,7 +58,7 @@ class SaleProductItemInlineForm(ModelForm):
     def clean(self):
         try:
             cleaned_data = super(SaleProductItemInlineForm, self).clean()
-            inventory = self.request.user.branch_office.productsinventory
+            inventory = get_user_context(self.request).products_inventory
             product = cleaned_data.get('product')
             quantity = cleaned_data.get('quantity')
             special_length = cleaned_data.get('special_length')
@@ -68,11 +70,11 @@ class SaleProductItemInlineForm(ModelForm):
             if product_inventory_item is None:
                 raise ValidationError({'product': 'El inventario elegido no cuenta con este producto.'})
 
-            if product_inventory_item.quantity < quantity:
+            if product_inventory_item.available < quantity:
                 raise ValidationError({
                     'product':
-                        'El inventario elegido sólo cuenta con {0}/{1} unidades de este producto.'.format(
-                            product_inventory_item.quantity,
+                        'El inventario elegido sólo cuenta con {0}/{1} unidades disponibles de este producto.'.format(
+                            max(product_inventory_item.available, 0),
                             quantity
                         )})
 
@@ -217,6 +219,7 @@ class SaleProductItemInlineForm(ModelForm):
         """
         item_charges = self.instance.quantity * sale_product_price.price
 
+        self.instance.unit_price = sale_product_price.price
         self.instance.sale.subtotal += item_charges
 
         self.instance.sale.invoice.total += self.instance.sale.total
@@ -236,8 +239,11 @@ class SaleProductItemInlineForm(ModelForm):
                 if self.instance.sale.transaction is not None:
                     self.instance.sale.transaction.save()
 
-                self._update_product_inventory_item()
-                self._update_scraps_products_inventory_items()
+                with movement_saves():
+                    self._update_product_inventory_item()
+                    self._update_scraps_products_inventory_items()
+
+                SaleRollup.record_sale_item(self.instance.sale, self.instance)
 
             super(SaleProductItemInlineForm, self)._save_m2m()
         except Exception as e:
@@ -249,7 +255,7 @@ class SaleProductItemInlineForm(ModelForm):
         The amount of product requested in the Sale is removed
         from the associated inventory.
         """
-        products_inventory = self.request.user.branch_office.productsinventory
+        products_inventory = get_user_context(self.request).products_inventory
         product_inventory_item = products_inventory.productinventoryitem_set.filter(
             product=self.original_product).first()
 
@@ -266,7 +272,7 @@ class SaleProductItemInlineForm(ModelForm):
         for scraps_product in self.scraps_products:
             inventory_item, _ = ProductInventoryItem.objects.get_or_create(
                 product=scraps_product,
-                inventory=self.request.user.branch_office.productsinventory,
+                inventory=get_user_context(self.request).products_inventory,
             )
 
             inventory_item.quantity += 1
@@ -0,0 +1,78 @@
+from collections import defaultdict
+from decimal import Decimal
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.db.models import DecimalField, ExpressionWrapper, F, Sum
+
+from finances.models import DailySaleRollup, MonthlySaleRollup, Sale, SaleHistory, SaleProductItemHistory
+
+
+class Command(BaseCommand):
+    """
+    Rebuilds the daily and monthly sales rollups from the active sales, recent
+    or archived (through the history models). The rollup tables are locked
+    against concurrent writes while they're rebuilt, so sales registered
+    meanwhile are added once the rebuild finishes.
+    """
+    help = 'Rebuilds the daily and monthly sales rollups from scratch.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, dest='batch_size', default=1000,
+                            help='Number of rollups inserted per query.')
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            cursor = connection.cursor()
+            cursor.execute("LOCK TABLE {0}, {1} IN SHARE ROW EXCLUSIVE MODE".format(
+                DailySaleRollup._meta.db_table, MonthlySaleRollup._meta.db_table))
+
+            DailySaleRollup.objects.all().delete()
+            MonthlySaleRollup.objects.all().delete()
+
+            daily_rollups = []
+            monthly_totals = defaultdict(lambda: [0, Decimal(0)])
+
+            for row in self._get_daily_rows():
+                keys = {
+                    'inventory_id': row['sale__inventory'],
+                    'product_line': row['product__line'],
+                    'product_id': row['product'],
+                    'payment_method': row['sale__payment_method'],
+                }
+
+                daily_rollups.append(DailySaleRollup(day=row['day'], quantity=row['quantity_sum'],
+                                                     revenue=row['revenue_sum'], **keys))
+
+                monthly_key = (MonthlySaleRollup.get_period_start(row['day']),) + tuple(sorted(keys.items()))
+                monthly_totals[monthly_key][0] += row['quantity_sum']
+                monthly_totals[monthly_key][1] += row['revenue_sum']
+
+            monthly_rollups = [MonthlySaleRollup(month=key[0], quantity=totals[0], revenue=totals[1], **dict(key[1:]))
+                               for key, totals in monthly_totals.items()]
+
+            DailySaleRollup.objects.bulk_create(daily_rollups, batch_size=options['batch_size'])
+            MonthlySaleRollup.objects.bulk_create(monthly_rollups, batch_size=options['batch_size'])
+
+        self.stdout.write(self.style.SUCCESS("Rebuilt {0} daily and {1} monthly rollups.".format(
+            len(daily_rollups), len(monthly_rollups))))
+
+    @staticmethod
+    def _get_daily_rows():
+        """
+        Returns the active sales' items, recent or archived, aggregated per local day, inventory,
+        product line, product and payment method.
+        :return: A values queryset.
+        """
+        line_revenue = ExpressionWrapper(F('quantity') * F('unit_price'),
+                                         output_field=DecimalField(max_digits=14, decimal_places=2))
+
+        return SaleProductItemHistory.objects.filter(sale__state=Sale.STATE_ACTIVE).extra(
+            select={'day': "DATE({0}.date AT TIME ZONE %s)".format(SaleHistory._meta.db_table)},
+            select_params=[settings.TIME_ZONE]
+        ).values(
+            'day', 'sale__inventory', 'product__line', 'product', 'sale__payment_method'
+        ).annotate(
+            quantity_sum=Sum('quantity'), revenue_sum=Sum(line_revenue)
+        ).order_by()
@@ -0,0 +1,35 @@
+from django.core.management.base import BaseCommand
+from django.db.models import Sum
+
+from finances.models import Invoice
+
+
+class Command(BaseCommand):
+    """
+    Recomputes the paid amount of the invoices from their transactions and fixes
+    the ones that drifted, e.g. because of transactions updated through raw
+    queryset updates.
+    """
+    help = 'Reconciles the stored paid amount of every invoice with the sum of its transactions.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true', dest='dry_run', default=False,
+                            help='Only report the invoices that are out of sync.')
+
+    def handle(self, *args, **options):
+        candidates = Invoice.objects.annotate(transactions_sum=Sum('transaction__amount'))
+        num_fixed = 0
+
+        for invoice in candidates.iterator():
+            transactions_sum = invoice.transactions_sum if invoice.transactions_sum is not None else 0
+
+            if transactions_sum == invoice.amount_paid:
+                continue
+
+            self.stdout.write("Invoice {0}: stored {1}, transactions {2}".format(invoice.folio, invoice.amount_paid,
+                                                                                 transactions_sum))
+
+            if not options['dry_run'] and invoice.reconcile_amount_paid():
+                num_fixed += 1
+
+        self.stdout.write(self.style.SUCCESS("{0} invoices reconciled.".format(num_fixed)))
@@ -0,0 +1,23 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.9.8 on 2026-10-19 10:12
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+from utils import migrations as utils_migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('finances', 'load_initial_data'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='invoice',
+            name='amount_paid',
+            field=models.DecimalField(decimal_places=2, default=0, editable=False, max_digits=10, verbose_name='monto pagado'),
+        ),
+        migrations.RunPython(utils_migrations.load_invoices_amount_paid, migrations.RunPython.noop),
+    ]
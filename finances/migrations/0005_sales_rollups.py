@@ -0,0 +1,69 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.9.8 on 2026-10-19 11:03
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventories', '0002_auto_20161027_0157'),
+        ('finances', '0004_invoice_amount_paid'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='saleproductitem',
+            name='unit_price',
+            field=models.DecimalField(decimal_places=2, default=0, editable=False, max_digits=10, verbose_name='precio unitario'),
+        ),
+        migrations.RunSQL(
+            "UPDATE finances_saleproductitem SET unit_price = finances_productprice.price "
+            "FROM finances_productprice "
+            "WHERE finances_productprice.product_id = finances_saleproductitem.product_id",
+            migrations.RunSQL.noop),
+        migrations.CreateModel(
+            name='DailySaleRollup',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('product_line', models.PositiveSmallIntegerField(choices=[(0, 'ACR'), (1, 'ACRILETA'), (2, 'ACRIMP'), (3, 'ACRIP'), (4, 'ADE'), (5, 'DIFUSOR'), (6, 'DOM'), (7, 'GLASLINER'), (8, 'LAM'), (9, 'OTROS'), (10, 'PERFIL'), (11, 'PLA'), (12, 'POL'), (13, 'POL_SOL'), (14, 'SILI'), (15, 'STON')], verbose_name='línea')),
+                ('payment_method', models.PositiveSmallIntegerField(choices=[(0, 'Efectivo'), (1, 'Transferencia'), (2, 'Contra entrega')], verbose_name='método de pago')),
+                ('quantity', models.IntegerField(default=0, verbose_name='cantidad')),
+                ('revenue', models.DecimalField(decimal_places=2, default=0, max_digits=14, verbose_name='ingresos')),
+                ('day', models.DateField(verbose_name='día')),
+                ('inventory', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='inventories.ProductsInventory', verbose_name='inventario')),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='inventories.Product', verbose_name='producto')),
+            ],
+            options={
+                'verbose_name': 'resumen diario de ventas',
+                'verbose_name_plural': 'resúmenes diarios de ventas',
+            },
+        ),
+        migrations.CreateModel(
+            name='MonthlySaleRollup',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('product_line', models.PositiveSmallIntegerField(choices=[(0, 'ACR'), (1, 'ACRILETA'), (2, 'ACRIMP'), (3, 'ACRIP'), (4, 'ADE'), (5, 'DIFUSOR'), (6, 'DOM'), (7, 'GLASLINER'), (8, 'LAM'), (9, 'OTROS'), (10, 'PERFIL'), (11, 'PLA'), (12, 'POL'), (13, 'POL_SOL'), (14, 'SILI'), (15, 'STON')], verbose_name='línea')),
+                ('payment_method', models.PositiveSmallIntegerField(choices=[(0, 'Efectivo'), (1, 'Transferencia'), (2, 'Contra entrega')], verbose_name='método de pago')),
+                ('quantity', models.IntegerField(default=0, verbose_name='cantidad')),
+                ('revenue', models.DecimalField(decimal_places=2, default=0, max_digits=14, verbose_name='ingresos')),
+                ('month', models.DateField(verbose_name='mes')),
+                ('inventory', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='inventories.ProductsInventory', verbose_name='inventario')),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='inventories.Product', verbose_name='producto')),
+            ],
+            options={
+                'verbose_name': 'resumen mensual de ventas',
+                'verbose_name_plural': 'resúmenes mensuales de ventas',
+            },
+        ),
+        migrations.AlterUniqueTogether(
+            name='dailysalerollup',
+            unique_together=set([('day', 'inventory', 'product_line', 'product', 'payment_method')]),
+        ),
+        migrations.AlterUniqueTogether(
+            name='monthlysalerollup',
+            unique_together=set([('month', 'inventory', 'product_line', 'product', 'payment_method')]),
+        ),
+    ]
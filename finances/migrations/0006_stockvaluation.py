@@ -0,0 +1,37 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.9.8 on 2026-10-19 12:21
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventories', '0002_auto_20161027_0157'),
+        ('finances', '0005_sales_rollups'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StockValuation',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('product_line', models.PositiveSmallIntegerField(choices=[(0, 'ACR'), (1, 'ACRILETA'), (2, 'ACRIMP'), (3, 'ACRIP'), (4, 'ADE'), (5, 'DIFUSOR'), (6, 'DOM'), (7, 'GLASLINER'), (8, 'LAM'), (9, 'OTROS'), (10, 'PERFIL'), (11, 'PLA'), (12, 'POL'), (13, 'POL_SOL'), (14, 'SILI'), (15, 'STON')], verbose_name='línea')),
+                ('quantity', models.IntegerField(default=0, verbose_name='cantidad')),
+                ('value', models.DecimalField(decimal_places=2, default=0, max_digits=14, verbose_name='valor')),
+                ('unpriced_quantity', models.IntegerField(default=0, verbose_name='cantidad sin precio')),
+                ('computed_at', models.DateTimeField(auto_now=True, verbose_name='calculado en')),
+                ('inventory', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='inventories.ProductsInventory', verbose_name='inventario')),
+            ],
+            options={
+                'verbose_name': 'valuación de inventario',
+                'verbose_name_plural': 'valuaciones de inventario',
+            },
+        ),
+        migrations.AlterUniqueTogether(
+            name='stockvaluation',
+            unique_together=set([('inventory', 'product_line')]),
+        ),
+    ]
@@ -0,0 +1,29 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.9.8 on 2026-10-19 13:10
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+from utils import migrations as utils_migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('finances', '0006_stockvaluation'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PriceListVersion',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('version', models.PositiveIntegerField(default=0, verbose_name='versión')),
+            ],
+            options={
+                'verbose_name': 'versión de la lista de precios',
+                'verbose_name_plural': 'versiones de la lista de precios',
+            },
+        ),
+        migrations.RunPython(utils_migrations.create_price_list_version, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,19 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.9.8 on 2026-10-19 17:20
+from __future__ import unicode_literals
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('finances', '0007_pricelistversion'),
+    ]
+
+    operations = [
+        migrations.AlterIndexTogether(
+            name='sale',
+            index_together=set([('inventory', 'state', 'date')]),
+        ),
+    ]
@@ -0,0 +1,68 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.9.8 on 2026-10-19 18:05
+from __future__ import unicode_literals
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+from utils import migrations as utils_migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('back_office', '0001_initial'),
+        ('inventories', '0007_movement_archive'),
+        ('finances', '0008_sale_inventory_state_date_index'),
+    ]
+
+    operations = [
+        utils_migrations.create_archive_table('finances_sale', ('inventory_id', 'invoice_id', 'date')),
+        utils_migrations.create_archive_table('finances_saleproductitem', ('sale_id', 'product_id')),
+        migrations.CreateModel(
+            name='SaleHistory',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('type', models.PositiveSmallIntegerField(choices=[(0, 'En mostrador'), (1, 'Con entrega')], verbose_name='tipo de venta')),
+                ('state', models.PositiveSmallIntegerField(choices=[(0, 'Activa'), (1, 'Cancelada')], verbose_name='estado')),
+                ('payment_method', models.PositiveSmallIntegerField(choices=[(0, 'Efectivo'), (1, 'Transferencia'), (2, 'Contra entrega')], verbose_name='método de pago')),
+                ('date', models.DateTimeField(verbose_name='fecha de venta')),
+                ('subtotal', models.DecimalField(decimal_places=2, max_digits=10, verbose_name='subtotal')),
+                ('shipping_and_handling', models.DecimalField(decimal_places=2, max_digits=10, verbose_name='manejo y envío')),
+                ('discount', models.DecimalField(decimal_places=2, max_digits=10, verbose_name='descuento')),
+                ('client', models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, related_name='+', to='back_office.Client', verbose_name='cliente')),
+                ('driver', models.ForeignKey(null=True, on_delete=django.db.models.deletion.PROTECT, related_name='+', to=settings.AUTH_USER_MODEL, verbose_name='chofer')),
+                ('inventory', models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, related_name='+', to='inventories.ProductsInventory', verbose_name='inventario')),
+                ('invoice', models.ForeignKey(on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to='finances.Invoice', verbose_name='factura')),
+                ('shipping_address', models.ForeignKey(null=True, on_delete=django.db.models.deletion.PROTECT, related_name='+', to='back_office.Address', verbose_name='dirección de envío')),
+                ('transaction', models.ForeignKey(null=True, on_delete=django.db.models.deletion.PROTECT, related_name='+', to='finances.Transaction', verbose_name='transacción')),
+            ],
+            options={
+                'verbose_name': 'histórico de venta',
+                'verbose_name_plural': 'histórico de ventas',
+                'db_table': 'finances_sale_history',
+                'managed': False,
+            },
+        ),
+        migrations.CreateModel(
+            name='SaleProductItemHistory',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('quantity', models.PositiveIntegerField(verbose_name='cantidad')),
+                ('special_length', models.DecimalField(decimal_places=2, max_digits=6, verbose_name='longitud especial (m)')),
+                ('special_width', models.DecimalField(decimal_places=2, max_digits=6, verbose_name='anchura especial (m)')),
+                ('special_thickness', models.DecimalField(decimal_places=2, max_digits=6, verbose_name='grosor especial (mm)')),
+                ('unit_price', models.DecimalField(decimal_places=2, max_digits=10, verbose_name='precio unitario')),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, related_name='+', to='inventories.Product', verbose_name='producto')),
+                ('sale', models.ForeignKey(on_delete=django.db.models.deletion.DO_NOTHING, to='finances.SaleHistory', verbose_name='venta')),
+            ],
+            options={
+                'verbose_name': 'producto de la venta',
+                'verbose_name_plural': 'productos de la venta',
+                'db_table': 'finances_saleproductitem_history',
+                'managed': False,
+            },
+        ),
+    ]
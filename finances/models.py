@@ -1,12 +1,15 @@
 import logging
+from collections import defaultdict
+from decimal import Decimal
 
 import django
 from django.contrib.auth.models import User
-from django.db import models, transaction
-from django.db.models import Sum, F, Q
+from django.db import models, transaction, IntegrityError
+from django.db.models import Sum, F, Q, Case, When, Value
 from django.utils import timezone
 
 from back_office.models import Client, Employee, Address, EmployeeGroup
+from inventories.catalog import get_product_lines
 from inventories.models import Product, Material, Product, Material, ProductsInventory, ProductInventoryItem
 from operations.models import Repair, Project
 
@@ -34,6 +37,8 @@ class Invoice(models.Model):
     file = models.FileField(blank=True, verbose_name="archivo")
     is_closed = models.BooleanField(default=False, verbose_name="cerrada")
     state = models.PositiveSmallIntegerField(choices=INVOICE_STATES, default=STATE_VALID, verbose_name='estado')
+    amount_paid = models.DecimalField(max_digits=10, decimal_places=2, default=0, editable=False,
+                                      verbose_name='monto pagado')
 
     class Meta:
         verbose_name = "factura"
@@ -42,35 +47,88 @@ class Invoice(models.Model):
     def __str__(self):
         return self.folio
 
+    @staticmethod
+    def add_to_amount_paid(invoice_pk, amount):
+        """
+        Atomically adds the given amount to the invoice's paid amount and updates
+        whether the invoice is closed, all in a single UPDATE statement.
+        :param invoice_pk: The invoice's primary key.
+        :param amount: The amount to add. It may be negative.
+        """
+        if not amount:
+            return
+
+        new_amount_paid = F('amount_paid') + amount
+
+        Invoice.objects.filter(pk=invoice_pk).update(
+            amount_paid=new_amount_paid,
+            is_closed=Case(When(total__lte=new_amount_paid, then=Value(True)),
+                           default=Value(False),
+                           output_field=models.BooleanField()))
+
     def has_been_paid(self):
         """
         Specifies if the invoice has been paid by the sum of all of the related transactions.
         :return: bool True if it has been paid, False otherwise.
         """
         try:
-            aggregate = self.transaction_set.aggregate(sum=Sum(F('amount')))['sum']
-            amount_paid = aggregate if aggregate is not None else 0
+            self._refresh_amount_paid()
+
+            return self.amount_paid >= self.total
+        except Exception as e:
+            db_logger.exception(e)
+            raise
+
+    def reconcile_amount_paid(self):
+        """
+        Recomputes the paid amount from the related transactions and stores it. The
+        invoice's row is locked while doing so, so that concurrent transaction changes
+        are applied on top of the reconciled amount.
+        :return: bool True if the stored amount was out of sync, False otherwise.
+        """
+        try:
+            with transaction.atomic():
+                locked_invoice = Invoice.objects.select_for_update().get(pk=self.pk)
+                transactions_sum = locked_invoice.transaction_set.aggregate(sum=Sum(F('amount')))['sum']
+                transactions_sum = transactions_sum if transactions_sum is not None else Decimal(0)
 
-            return amount_paid >= self.total
+                if transactions_sum == locked_invoice.amount_paid:
+                    return False
+
+                self.amount_paid = transactions_sum
+                Invoice.objects.filter(pk=self.pk).update(amount_paid=transactions_sum,
+                                                          is_closed=transactions_sum >= locked_invoice.total)
+
+                return True
         except Exception as e:
             db_logger.exception(e)
             raise
 
     def save(self, **kwargs):
         try:
-            related_transactions_sum = self.transaction_set.aggregate(sum=Sum(F('amount')))['sum']
+            if not self._state.adding:
+                self._refresh_amount_paid()
+                kwargs.setdefault('update_fields', [field.name for field in self._meta.concrete_fields
+                                                    if not field.primary_key and field.name != 'amount_paid'])
 
-            if related_transactions_sum is not None:
-                if related_transactions_sum >= self.total:
-                    self.is_closed = True
-                else:
-                    self.is_closed = False
+            if self.amount_paid or self.total:
+                self.is_closed = self.amount_paid >= self.total
 
-            super(Invoice, self).save()
+            super(Invoice, self).save(**kwargs)
         except Exception as e:
             db_logger.exception(e)
             raise
 
+    def _refresh_amount_paid(self):
+        """
+        Reloads the paid amount from the database. It's updated by delta whenever
+        a related transaction changes, so the in-memory value may be stale.
+        """
+        amount_paid = Invoice.objects.filter(pk=self.pk).values_list('amount_paid', flat=True).first()
+
+        if amount_paid is not None:
+            self.amount_paid = amount_paid
+
     def cancel(self):
         """
         Cancels the invoice, rendering it invalid.
@@ -95,6 +153,77 @@ class ProductPrice(models.Model):
     def __str__(self):
         return "Precio - {0}: ${1}".format(self.product.sku, str(self.price))
 
+    @staticmethod
+    def upsert_prices(prices):
+        """
+        Creates or updates the price of several products inside a single
+        transaction: one UPDATE for the existing prices and one INSERT for
+        the new ones.
+        :param prices: Dictionary mapping product ids to a (price, authorized_by_id) tuple.
+        :return: Dictionary mapping each product id to 'created' or 'updated'.
+        """
+        try:
+            with transaction.atomic():
+                existing_ids = set(ProductPrice.objects.select_for_update().filter(
+                    product_id__in=prices.keys()).values_list('product_id', flat=True))
+
+                if existing_ids:
+                    ProductPrice.objects.filter(product_id__in=existing_ids).update(
+                        price=Case(*[When(product_id=product_id, then=Value(prices[product_id][0]))
+                                     for product_id in existing_ids],
+                                   output_field=models.DecimalField(max_digits=10, decimal_places=2)),
+                        authorized_by=Case(*[When(product_id=product_id, then=Value(prices[product_id][1]))
+                                             for product_id in existing_ids],
+                                           output_field=models.IntegerField()))
+
+                ProductPrice.objects.bulk_create([
+                    ProductPrice(product_id=product_id, price=price, authorized_by_id=authorized_by_id)
+                    for product_id, (price, authorized_by_id) in prices.items() if product_id not in existing_ids
+                ])
+
+                StockValuation.invalidate(product_ids=list(prices.keys()))
+                PriceListVersion.bump()
+
+            return {product_id: 'updated' if product_id in existing_ids else 'created' for product_id in prices}
+        except Exception as e:
+            db_logger.exception(e)
+            raise
+
+
+class PriceListVersion(models.Model):
+    """
+    Single row counter incremented whenever a product price changes, so
+    clients can detect changes on the price list without reading it.
+    """
+    version = models.PositiveIntegerField(default=0, verbose_name='versión')
+
+    class Meta:
+        verbose_name = 'versión de la lista de precios'
+        verbose_name_plural = 'versiones de la lista de precios'
+
+    def __str__(self):
+        return str(self.version)
+
+    @staticmethod
+    def get_current():
+        """
+        Returns the price list's current version.
+        :return: An integer.
+        """
+        return PriceListVersion.objects.filter(pk=1).values_list('version', flat=True).first() or 0
+
+    @staticmethod
+    def bump():
+        """
+        Increments the price list's version.
+        """
+        try:
+            if not PriceListVersion.objects.filter(pk=1).update(version=F('version') + 1):
+                PriceListVersion.objects.get_or_create(pk=1, defaults={'version': 1})
+        except Exception as e:
+            db_logger.exception(e)
+            raise
+
 
 class MaterialCost(models.Model):
     """
@@ -113,6 +242,28 @@ class MaterialCost(models.Model):
         return str(self.cost)
 
 
+class TransactionQuerySet(models.QuerySet):
+    """
+    QuerySet for the Transaction entity. It keeps the invoices' paid amounts
+    in sync when transactions are created in bulk; the deletions, in bulk or
+    by cascade, are handled by finances.signals.
+    """
+
+    def bulk_create(self, objs, batch_size=None):
+        with transaction.atomic():
+            objs = super(TransactionQuerySet, self).bulk_create(objs, batch_size)
+
+            amounts_by_invoice = defaultdict(Decimal)
+
+            for obj in objs:
+                amounts_by_invoice[obj.invoice_id] += obj.decimal_amount
+
+            for invoice_pk, amount in amounts_by_invoice.items():
+                Invoice.add_to_amount_paid(invoice_pk, amount)
+
+        return objs
+
+
 class Transaction(models.Model):
     """
     Details a monetary transaction.
@@ -131,13 +282,73 @@ class Transaction(models.Model):
     datetime = models.DateTimeField(default=django.utils.timezone.now, verbose_name='fecha y hora')
     amount = models.DecimalField(max_digits=10, decimal_places=2, default=0, verbose_name='monto')
 
+    objects = TransactionQuerySet.as_manager()
+
     class Meta:
         verbose_name = 'transacción'
         verbose_name_plural = 'transacciones'
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super(Transaction, cls).from_db(db, field_names, values)
+        # Only the loaded values are remembered, reading a deferred field here would cost a query per instance.
+        if 'invoice_id' in instance.__dict__ and 'amount' in instance.__dict__:
+            instance._stored_payment = (instance.invoice_id, instance.decimal_amount)
+
+        return instance
+
     def __str__(self):
         return self.folio
 
+    @property
+    def decimal_amount(self):
+        """
+        Returns the transaction's amount as a Decimal with two decimal places.
+        :return: The amount.
+        """
+        return Decimal(self.amount).quantize(Decimal('0.01'))
+
+    def save(self, *args, **kwargs):
+        """
+        Saves the transaction and updates the paid amount of the related invoice
+        by the difference between the stored and the new amount. If the transaction
+        was moved to another invoice, both invoices are updated.
+        """
+        try:
+            with transaction.atomic():
+                stored_invoice_pk, stored_amount = self.get_stored_payment()
+                super(Transaction, self).save(*args, **kwargs)
+
+                if stored_invoice_pk is not None and stored_invoice_pk != self.invoice_id:
+                    Invoice.add_to_amount_paid(stored_invoice_pk, -stored_amount)
+                    Invoice.add_to_amount_paid(self.invoice_id, self.decimal_amount)
+                else:
+                    Invoice.add_to_amount_paid(self.invoice_id, self.decimal_amount - stored_amount)
+
+            self._stored_payment = (self.invoice_id, self.decimal_amount)
+        except Exception as e:
+            db_logger.exception(e)
+            raise
+
+    def get_stored_payment(self):
+        """
+        Returns the invoice and amount of the transaction as they're stored in
+        the database: the ones it was loaded or last saved with or, if they
+        were deferred, the ones read from its row.
+        :return: A (invoice pk, amount) tuple, (None, 0) if it isn't stored.
+        """
+        if self._state.adding:
+            return None, Decimal(0)
+
+        stored_payment = self.__dict__.get('_stored_payment')
+
+        if stored_payment is None:
+            stored_payment = Transaction.objects.filter(pk=self.pk).values_list('invoice', 'amount').first()
+            stored_payment = (None, Decimal(0)) if stored_payment is None else \
+                (stored_payment[0], Decimal(stored_payment[1]).quantize(Decimal('0.01')))
+
+        return stored_payment
+
 
 class RepairCost(models.Model):
     """
@@ -222,6 +433,7 @@ class Sale(models.Model):
     class Meta:
         verbose_name = 'venta'
         verbose_name_plural = 'ventas'
+        index_together = [('inventory', 'state', 'date')]
 
     def __str__(self):
         return self.folio
@@ -232,6 +444,8 @@ class Sale(models.Model):
         to its corresponding inventory. If the Sale was the only Sale for its Invoice, the Invoice is
         also cancelled.
         """
+        from utils.versioning import movement_saves
+
         try:
             if self.state == Sale.STATE_CANCELLED:
                 return
@@ -247,9 +461,13 @@ class Sale(models.Model):
                                for sale_item in self.saleproductitem_set.all()
                                if inv_item.product == sale_item.product]
 
-                for inv_item, sale_item in item_tuples:
-                    inv_item.quantity += sale_item.quantity
-                    inv_item.save()
+                with movement_saves():
+                    for inv_item, sale_item in item_tuples:
+                        inv_item.quantity += sale_item.quantity
+                        inv_item.save()
+
+                for sale_item in self.saleproductitem_set.select_related('product'):
+                    SaleRollup.record_sale_item(self, sale_item, sign=-1)
 
                 self.inventory.save()
                 self.save()
@@ -274,6 +492,8 @@ class SaleProductItem(models.Model):
     special_thickness = models.DecimalField(max_digits=6, decimal_places=2, default=0,
                                             verbose_name='grosor especial (mm)')
     sale = models.ForeignKey(Sale, on_delete=models.CASCADE, verbose_name='venta')
+    unit_price = models.DecimalField(max_digits=10, decimal_places=2, default=0, editable=False,
+                                     verbose_name='precio unitario')
 
     class Meta:
         verbose_name = 'producto de la venta'
@@ -281,3 +501,243 @@ class SaleProductItem(models.Model):
 
     def __str__(self):
         return "{0}: {1}".format(str(self.product), str(self.quantity))
+
+
+class SaleHistory(models.Model):
+    """
+    A sale, recent or archived. It reads the finances_sale_history view, the
+    union of the sales table and the archive the archive_movements command
+    moves the old sales to (see the history models of inventories.models).
+    """
+    client = models.ForeignKey(Client, on_delete=models.PROTECT, related_name='+', verbose_name='cliente')
+    type = models.PositiveSmallIntegerField(choices=Sale.SALE_TYPES, verbose_name='tipo de venta')
+    state = models.PositiveSmallIntegerField(choices=Sale.SALE_STATES, verbose_name='estado')
+    shipping_address = models.ForeignKey(Address, on_delete=models.PROTECT, null=True, related_name='+',
+                                         verbose_name='dirección de envío')
+    payment_method = models.PositiveSmallIntegerField(choices=Sale.PAYMENT_TYPES, verbose_name='método de pago')
+    invoice = models.ForeignKey(Invoice, on_delete=models.DO_NOTHING, related_name='+', verbose_name='factura')
+    transaction = models.ForeignKey(Transaction, on_delete=models.PROTECT, null=True, related_name='+',
+                                    verbose_name='transacción')
+    inventory = models.ForeignKey(ProductsInventory, on_delete=models.PROTECT, related_name='+',
+                                  verbose_name='inventario')
+    date = models.DateTimeField(verbose_name='fecha de venta')
+    subtotal = models.DecimalField(max_digits=10, decimal_places=2, verbose_name='subtotal')
+    shipping_and_handling = models.DecimalField(max_digits=10, decimal_places=2, verbose_name='manejo y envío')
+    discount = models.DecimalField(max_digits=10, decimal_places=2, verbose_name='descuento')
+    driver = models.ForeignKey(Employee, on_delete=models.PROTECT, null=True, related_name='+', verbose_name='chofer')
+
+    class Meta:
+        managed = False
+        db_table = 'finances_sale_history'
+        verbose_name = 'histórico de venta'
+        verbose_name_plural = 'histórico de ventas'
+
+    @property
+    def total(self):
+        return self.subtotal + self.shipping_and_handling - self.discount
+
+    def __str__(self):
+        return "V{0}".format(str(self.id).zfill(9))
+
+
+class SaleProductItemHistory(models.Model):
+    """
+    A line of a sale, recent or archived.
+    """
+    product = models.ForeignKey(Product, on_delete=models.PROTECT, related_name='+', verbose_name='producto')
+    quantity = models.PositiveIntegerField(verbose_name='cantidad')
+    special_length = models.DecimalField(max_digits=6, decimal_places=2, verbose_name='longitud especial (m)')
+    special_width = models.DecimalField(max_digits=6, decimal_places=2, verbose_name='anchura especial (m)')
+    special_thickness = models.DecimalField(max_digits=6, decimal_places=2, verbose_name='grosor especial (mm)')
+    sale = models.ForeignKey(SaleHistory, on_delete=models.DO_NOTHING, verbose_name='venta')
+    unit_price = models.DecimalField(max_digits=10, decimal_places=2, verbose_name='precio unitario')
+
+    class Meta:
+        managed = False
+        db_table = 'finances_saleproductitem_history'
+        verbose_name = 'producto de la venta'
+        verbose_name_plural = 'productos de la venta'
+
+    def __str__(self):
+        return "{0}: {1}".format(str(self.product), str(self.quantity))
+
+
+class SaleRollup(models.Model):
+    """
+    Pre-aggregated sales figures for a period, per branch inventory,
+    product line, product and payment method. Rollups are updated
+    incrementally when sale items are created or sales are cancelled,
+    so reports don't need to scan the transactional tables.
+    """
+    PERIOD_FIELD = None
+
+    inventory = models.ForeignKey(ProductsInventory, on_delete=models.CASCADE, verbose_name='inventario')
+    product_line = models.PositiveSmallIntegerField(choices=Product.LINE_TYPES, verbose_name='línea')
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, verbose_name='producto')
+    payment_method = models.PositiveSmallIntegerField(choices=Sale.PAYMENT_TYPES, verbose_name='método de pago')
+    quantity = models.IntegerField(default=0, verbose_name='cantidad')
+    revenue = models.DecimalField(max_digits=14, decimal_places=2, default=0, verbose_name='ingresos')
+
+    class Meta:
+        abstract = True
+
+    @staticmethod
+    def get_period_start(date):
+        """
+        Returns the first day of the period the given date belongs to.
+        :param date: The date.
+        :return: The date that identifies the period.
+        """
+        raise NotImplementedError
+
+    @staticmethod
+    def record_sale_item(sale, sale_item, sign=1):
+        """
+        Adds (or subtracts, if sign is negative) a sale item to the daily
+        and monthly rollups it belongs to.
+        :param sale: The Sale of the item.
+        :param sale_item: The SaleProductItem.
+        :param sign: 1 to add the item, -1 to subtract it.
+        """
+        try:
+            local_date = timezone.localtime(sale.date).date()
+            quantity = sign * sale_item.quantity
+            revenue = sign * sale_item.quantity * Decimal(sale_item.unit_price)
+
+            for rollup_class in (DailySaleRollup, MonthlySaleRollup):
+                rollup_class._add({
+                    rollup_class.PERIOD_FIELD: rollup_class.get_period_start(local_date),
+                    'inventory_id': sale.inventory_id,
+                    'product_line': sale_item.product.line,
+                    'product_id': sale_item.product_id,
+                    'payment_method': sale.payment_method,
+                }, quantity, revenue)
+        except Exception as e:
+            db_logger.exception(e)
+            raise
+
+    @classmethod
+    def _add(cls, keys, quantity, revenue):
+        """
+        Increments the rollup identified by the given keys, creating it if it doesn't exist.
+        :param keys: Dictionary with the values of the rollup's unique fields.
+        :param quantity: The quantity to add.
+        :param revenue: The revenue to add.
+        """
+        increments = {'quantity': F('quantity') + quantity, 'revenue': F('revenue') + revenue}
+
+        if cls.objects.filter(**keys).update(**increments):
+            return
+
+        try:
+            with transaction.atomic():
+                cls.objects.create(quantity=quantity, revenue=revenue, **keys)
+        except IntegrityError:
+            cls.objects.filter(**keys).update(**increments)
+
+
+class DailySaleRollup(SaleRollup):
+    """
+    Sales figures aggregated per day.
+    """
+    PERIOD_FIELD = 'day'
+
+    day = models.DateField(verbose_name='día')
+
+    class Meta:
+        verbose_name = 'resumen diario de ventas'
+        verbose_name_plural = 'resúmenes diarios de ventas'
+        unique_together = ('day', 'inventory', 'product_line', 'product', 'payment_method')
+
+    @staticmethod
+    def get_period_start(date):
+        return date
+
+
+class MonthlySaleRollup(SaleRollup):
+    """
+    Sales figures aggregated per month. The month is identified by its first day.
+    """
+    PERIOD_FIELD = 'month'
+
+    month = models.DateField(verbose_name='mes')
+
+    class Meta:
+        verbose_name = 'resumen mensual de ventas'
+        verbose_name_plural = 'resúmenes mensuales de ventas'
+        unique_together = ('month', 'inventory', 'product_line', 'product', 'payment_method')
+
+    @staticmethod
+    def get_period_start(date):
+        return date.replace(day=1)
+
+
+class StockValuation(models.Model):
+    """
+    Cached valuation (quantity times price) of the stock of a product line in a
+    products inventory. The rows are deleted whenever an inventory item or a
+    price of the line changes and are recomputed on demand by the
+    StockValuationEngine, so only the invalidated combinations are ever
+    recalculated.
+    """
+    inventory = models.ForeignKey(ProductsInventory, on_delete=models.CASCADE, verbose_name='inventario')
+    product_line = models.PositiveSmallIntegerField(choices=Product.LINE_TYPES, verbose_name='línea')
+    quantity = models.IntegerField(default=0, verbose_name='cantidad')
+    value = models.DecimalField(max_digits=14, decimal_places=2, default=0, verbose_name='valor')
+    unpriced_quantity = models.IntegerField(default=0, verbose_name='cantidad sin precio')
+    computed_at = models.DateTimeField(auto_now=True, verbose_name='calculado en')
+
+    class Meta:
+        verbose_name = 'valuación de inventario'
+        verbose_name_plural = 'valuaciones de inventario'
+        unique_together = ('inventory', 'product_line')
+
+    def __str__(self):
+        return "{0} - {1}: ${2}".format(self.inventory_id, self.get_product_line_display(), str(self.value))
+
+    @staticmethod
+    def lock_inventories(inventory_ids=None):
+        """
+        Locks the rows of the products inventories, in ID order, until the
+        current transaction ends. Both the invalidations and the computation
+        of the valuations take these locks, so a valuation computed from the
+        stock and prices read before a change is always deleted by the
+        change's invalidation (see StockValuationEngine._compute_missing).
+        :param inventory_ids: The inventories to lock, all of them by default.
+        """
+        inventories = ProductsInventory.objects.order_by('pk')
+
+        if inventory_ids is not None:
+            inventories = inventories.filter(pk__in=inventory_ids)
+
+        list(inventories.select_for_update().values_list('pk', flat=True))
+
+    @staticmethod
+    def invalidate(inventory_ids=None, product_ids=None):
+        """
+        Deletes the cached valuations affected by a change. Only the
+        inventories whose valuations are deleted are locked: without
+        inventory_ids, the changed products' lines are only invalidated in the
+        inventories stocking them, since no other valuation includes them.
+        :param inventory_ids: Restricts the invalidation to these inventories.
+        :param product_ids: Restricts the invalidation to the lines of these products.
+        """
+        try:
+            if inventory_ids is None and product_ids is not None:
+                inventory_ids = list(ProductsInventory.objects.filter(
+                    productinventoryitem__product__in=product_ids).distinct().values_list('pk', flat=True))
+
+            valuations = StockValuation.objects.all()
+
+            if inventory_ids is not None:
+                valuations = valuations.filter(inventory_id__in=inventory_ids)
+
+            if product_ids is not None:
+                valuations = valuations.filter(product_line__in=set(get_product_lines(product_ids).values()))
+
+            with transaction.atomic():
+                StockValuation.lock_inventories(inventory_ids)
+                valuations.delete()
+        except Exception as e:
+            db_logger.exception(e)
+            raise
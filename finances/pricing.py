@@ -0,0 +1,62 @@
+import logging
+
+from django.db.models import DecimalField, ExpressionWrapper, F, Sum
+
+from inventories.models import ReturnedProduct
+
+db_logger = logging.getLogger('db')
+
+
+class ReimbursementPricing:
+    """
+    Prices the products returned through a ProductReimbursement using
+    the current ProductPrice of each product. All the pricing is done
+    by the database by joining each ReturnedProduct with its price.
+    """
+
+    @staticmethod
+    def _get_line_amount_expression():
+        """
+        Returns the expression for the amount of a returned product line:
+        its quantity times the product's price. Lines whose product doesn't
+        have a price evaluate to NULL.
+        :return: The expression.
+        """
+        return ExpressionWrapper(F('quantity') * F('product__productprice__price'),
+                                 output_field=DecimalField(max_digits=12, decimal_places=2))
+
+    @staticmethod
+    def annotate_line_amounts(queryset):
+        """
+        Annotates a ReturnedProduct queryset with the unit price and the amount
+        of each line.
+        :param queryset: The ReturnedProduct queryset.
+        :return: The annotated queryset.
+        """
+        return queryset.annotate(unit_price=F('product__productprice__price'),
+                                 amount=ReimbursementPricing._get_line_amount_expression())
+
+    @staticmethod
+    def get_lines(reimbursement):
+        """
+        Returns the returned products of a reimbursement along with their prices.
+        :param reimbursement: The ProductReimbursement.
+        :return: A queryset of ReturnedProducts annotated with 'unit_price' and 'amount'.
+        """
+        return ReimbursementPricing.annotate_line_amounts(
+            ReturnedProduct.objects.filter(reimbursement=reimbursement).select_related('product'))
+
+    @staticmethod
+    def get_total(reimbursement):
+        """
+        Returns the total amount of the products returned through a reimbursement,
+        computed with a single aggregate query.
+        :param reimbursement: The ProductReimbursement.
+        :return: The total as a Decimal, or None if nothing was returned.
+        """
+        try:
+            return ReturnedProduct.objects.filter(reimbursement=reimbursement).aggregate(
+                total=Sum(ReimbursementPricing._get_line_amount_expression()))['total']
+        except Exception as e:
+            db_logger.exception(e)
+            raise
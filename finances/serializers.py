@@ -1,22 +1,37 @@
 from finances.models import ProductPrice, MaterialCost
 from rest_framework import serializers
 
+from utils.api import DynamicFieldsModelSerializer
 
-class ProductPriceSerializer(serializers.ModelSerializer):
+
+class ProductPriceSerializer(DynamicFieldsModelSerializer):
     """
     Class that serializes a product price.
     """
+    sku = serializers.CharField(source='product.sku', read_only=True)
 
     class Meta:
         model = ProductPrice
-        fields = ('product', 'price', 'authorized_by',)
+        fields = ('product', 'sku', 'price', 'authorized_by',)
 
 
-class MaterialCostSerializer(serializers.ModelSerializer):
+class MaterialCostSerializer(DynamicFieldsModelSerializer):
     """
     Class that serializes a material cost.
     """
+    material_name = serializers.CharField(source='material.name', read_only=True)
 
     class Meta:
         model = MaterialCost
-        fields = ('material', 'cost', 'authorized_by',)
+        fields = ('material', 'material_name', 'cost', 'authorized_by',)
+
+
+class ProductPriceBulkSerializer(serializers.Serializer):
+    """
+    Class that validates a row of a bulk price update. The product and the
+    employee are validated for the whole batch by the view, so they are
+    plain ids here.
+    """
+    product = serializers.IntegerField()
+    price = serializers.DecimalField(max_digits=10, decimal_places=2, min_value=0)
+    authorized_by = serializers.IntegerField(required=False)
@@ -0,0 +1,62 @@
+from django.db.models.signals import post_save, post_delete, pre_delete
+from django.dispatch import receiver
+
+from finances.models import ProductPrice, StockValuation, PriceListVersion, Invoice, Transaction
+from inventories.models import Product, ProductInventoryItem, ProductsInventory
+from inventories.signals import product_inventory_items_bulk_updated
+
+
+@receiver([post_save, post_delete], sender=ProductInventoryItem, dispatch_uid='invalidate_valuation_on_item_change')
+def invalidate_valuation_on_item_change(sender, instance, **kwargs):
+    """
+    Invalidates the valuation of the inventory line holding the item.
+    """
+    StockValuation.invalidate(inventory_ids=[instance.inventory_id], product_ids=[instance.product_id])
+
+
+@receiver(product_inventory_items_bulk_updated, sender=ProductInventoryItem,
+          dispatch_uid='invalidate_valuation_on_items_bulk_update')
+def invalidate_valuation_on_items_bulk_update(sender, inventory_ids, product_ids, **kwargs):
+    """
+    Invalidates the valuation of the inventory lines holding the items.
+    """
+    StockValuation.invalidate(inventory_ids=inventory_ids, product_ids=product_ids)
+
+
+@receiver([post_save, post_delete], sender=ProductPrice, dispatch_uid='invalidate_valuation_on_price_change')
+def invalidate_valuation_on_price_change(sender, instance, **kwargs):
+    """
+    Invalidates the valuation of the line of the product in every inventory
+    stocking it and bumps the price list's version.
+    """
+    StockValuation.invalidate(product_ids=[instance.product_id])
+    PriceListVersion.bump()
+
+
+@receiver(post_save, sender=Product, dispatch_uid='invalidate_valuation_on_product_change')
+def invalidate_valuation_on_product_change(sender, instance, created, **kwargs):
+    """
+    A product may have changed its line, so every line of the inventories
+    stocking it is invalidated. The price list shows the product's SKU, so
+    its version is bumped if the product has a price.
+    """
+    if not created:
+        StockValuation.invalidate(inventory_ids=list(ProductsInventory.objects.filter(
+            productinventoryitem__product=instance).values_list('pk', flat=True)))
+
+        if ProductPrice.objects.filter(product=instance).exists():
+            PriceListVersion.bump()
+
+
+@receiver(pre_delete, sender=Transaction, dispatch_uid='subtract_deleted_transaction_payment')
+def subtract_deleted_transaction_payment(sender, instance, **kwargs):
+    """
+    Subtracts the stored amount of a deleted transaction from its invoice's
+    paid amount, however it's deleted: on its own, in bulk or by cascade. It
+    runs before the row is deleted, so a deferred amount can still be read,
+    and in the deletion's database transaction.
+    """
+    invoice_pk, amount = instance.get_stored_payment()
+
+    if invoice_pk is not None:
+        Invoice.add_to_amount_paid(invoice_pk, -amount)
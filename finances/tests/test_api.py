@@ -0,0 +1,155 @@
+import json
+from decimal import Decimal
+
+from django.contrib.auth.models import Permission
+from django.core.urlresolvers import reverse
+from django.test import TestCase
+
+from finances.models import MaterialCost, ProductPrice
+from finances.serializers import ProductPriceBulkSerializer
+from inventories.models import Material, Product
+from utils.api import validate_bulk_rows
+from utils.testing import SeedFactory
+
+
+class PriceListAPITestCase(TestCase):
+    """
+    Test case for the product prices and material costs API.
+    """
+
+    def setUp(self):
+        self.factory = SeedFactory()
+        self.branch_office = self.factory.create_branch_office()
+        self.acr_products = self.factory.create_products(3, line=Product.ACR)
+        self.pol_products = self.factory.create_products(2, line=Product.POL)
+        self.factory.set_prices(self.acr_products + self.pol_products, self.branch_office.administrator)
+        self.superuser = self.factory.create_employee(self.branch_office, is_superuser=True)
+        self.client.login(username=self.superuser.username, password=SeedFactory.PASSWORD)
+
+    def _list_prices(self, **params):
+        return self.client.get(reverse('productprice-list'), params)
+
+    def test_price_filters(self):
+        """
+        Tests the product, sku and line filters of the prices.
+        """
+        def get_products(**params):
+            return {price['product'] for price in self._list_prices(**params).data['results']}
+
+        self.assertEqual(get_products(line=Product.POL), {product.pk for product in self.pol_products})
+        self.assertEqual(get_products(sku=self.acr_products[1].sku.upper()), {self.acr_products[1].pk})
+        self.assertEqual(get_products(product=self.acr_products[2].pk), {self.acr_products[2].pk})
+
+    def test_prices_pagination_and_projection(self):
+        """
+        Tests that the prices are paged by product and projected.
+        """
+        response = self._list_prices(page_size=2, fields='product,price')
+
+        self.assertEqual(response.data['results'], [
+            {'product': product.pk, 'price': '100.00'} for product in self.acr_products[:2]
+        ])
+        self.assertIsNotNone(response.data['next'])
+
+    def test_material_cost_filters(self):
+        """
+        Tests the material and name filters of the material costs.
+        """
+        materials = [Material.objects.create(name=name, description=name) for name in ('Resina', 'Pegamento')]
+        MaterialCost.objects.bulk_create([
+            MaterialCost(material=material, cost=Decimal('5.00'), authorized_by=self.branch_office.administrator)
+            for material in materials
+        ])
+
+        response = self.client.get(reverse('materialcost-list'), {'name': 'resi'})
+
+        self.assertEqual([cost['material'] for cost in response.data['results']], [materials[0].pk])
+        self.assertEqual(response.data['results'][0]['material_name'], 'Resina')
+
+
+class ProductPriceBulkAPITestCase(TestCase):
+    """
+    Test case for the bulk writes of the product prices.
+    """
+
+    def setUp(self):
+        self.factory = SeedFactory()
+        self.branch_office = self.factory.create_branch_office()
+        self.products = self.factory.create_products(3)
+        self.factory.set_prices(self.products[:1], self.branch_office.administrator, price=Decimal('1.00'))
+        self.user = self.factory.create_employee(self.branch_office)
+        self.user.user_permissions.add(*Permission.objects.filter(
+            content_type__app_label='finances', codename__in=['add_productprice', 'change_productprice']))
+        self.client.login(username=self.user.username, password=SeedFactory.PASSWORD)
+
+    def _bulk(self, rows):
+        return self.client.post(reverse('productprice-bulk'), json.dumps(rows), content_type='application/json')
+
+    def _get_prices(self):
+        return dict(ProductPrice.objects.values_list('product', 'price'))
+
+    def test_create_and_update(self):
+        """
+        Tests that the existing prices are updated, the missing ones created,
+        and that the authorizer defaults to the user.
+        """
+        response = self._bulk([
+            {'product': self.products[0].pk, 'price': '2.00'},
+            {'product': self.products[1].pk, 'price': '3.00', 'authorized_by': self.branch_office.administrator.pk},
+        ])
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([(row['product'], row['status']) for row in response.data],
+                         [(self.products[0].pk, 'updated'), (self.products[1].pk, 'created')])
+        self.assertEqual(self._get_prices(), {self.products[0].pk: Decimal('2.00'),
+                                              self.products[1].pk: Decimal('3.00')})
+        self.assertEqual(ProductPrice.objects.get(product=self.products[0]).authorized_by, self.user)
+        self.assertEqual(ProductPrice.objects.get(product=self.products[1]).authorized_by,
+                         self.branch_office.administrator)
+
+    def test_invalid_rows_write_nothing(self):
+        """
+        Tests that a batch with an invalid row isn't written at all and that
+        the errors are reported on their rows.
+        """
+        batches = [
+            ([{'product': self.products[1].pk, 'price': '2.00'}, {'product': self.products[2].pk, 'price': '-1'}],
+             [{}, {'price'}]),
+            ([{'product': self.products[1].pk, 'price': '2.00'}, {'product': self.products[1].pk, 'price': '3.00'}],
+             [{}, {'product'}]),
+            ([{'product': self.products[1].pk, 'price': '2.00'}, {'product': 0, 'price': '3.00'}],
+             [{}, {'product'}]),
+            ([{'product': self.products[1].pk, 'price': '2.00', 'authorized_by': 0}], [{'authorized_by'}]),
+        ]
+
+        for rows, expected_errors in batches:
+            response = self._bulk(rows)
+
+            self.assertEqual(response.status_code, 400, rows)
+            self.assertEqual([set(row_errors) for row_errors in response.data], expected_errors)
+            self.assertEqual(self._get_prices(), {self.products[0].pk: Decimal('1.00')})
+
+    def test_permissions(self):
+        """
+        Tests that anonymous users and users without both the add and change
+        permissions are rejected.
+        """
+        rows = [{'product': self.products[1].pk, 'price': '2.00'}]
+        self.user.user_permissions.remove(Permission.objects.get(codename='add_productprice'))
+
+        self.assertEqual(self._bulk(rows).status_code, 403)
+
+        self.client.logout()
+
+        self.assertEqual(self._bulk(rows).status_code, 403)
+        self.assertEqual(self._get_prices(), {self.products[0].pk: Decimal('1.00')})
+
+    def test_batch_size_is_limited(self):
+        """
+        Tests that batches over the limit are rejected before validating them.
+        """
+        rows, errors = validate_bulk_rows(ProductPriceBulkSerializer, [{'product': 1, 'price': '1.00'}] * 3,
+                                          'product', max_rows=2)
+
+        self.assertIsNone(rows)
+        self.assertIn('non_field_errors', errors)
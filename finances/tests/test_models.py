@@ -1,4 +1,8 @@
+from decimal import Decimal
+
 from django.test import TestCase
+
+from back_office.models import Client
 from finances.models import Invoice, Transaction
 
 
@@ -38,3 +42,76 @@ class InvoiceTestCase(TestCase):
         ])
 
         self.assertFalse(invoice.has_been_paid(), "Method should state invoice has not been paid.")
+
+    def test_invoice_amount_paid_follows_transaction_changes(self):
+        """
+        Tests that the invoice's paid amount and closed flag are updated by delta
+        when its transactions are created, edited and deleted.
+        """
+        client = Client.objects.create(name='Cliente')
+        invoice = Invoice.objects.create(folio='F-1', total=100.00)
+
+        first_transaction = Transaction.objects.create(invoice=invoice, payed_by=client, amount=60.00)
+        second_transaction = Transaction.objects.create(invoice=invoice, payed_by=client, amount=40.00)
+
+        invoice.refresh_from_db()
+        self.assertEqual(invoice.amount_paid, Decimal('100.00'))
+        self.assertTrue(invoice.is_closed, "Invoice should be closed once fully paid.")
+
+        first_transaction.amount = 50.00
+        first_transaction.save()
+
+        invoice.refresh_from_db()
+        self.assertEqual(invoice.amount_paid, Decimal('90.00'))
+        self.assertFalse(invoice.is_closed, "Invoice should be reopened when a payment is reduced.")
+
+        second_transaction.delete()
+
+        invoice.refresh_from_db()
+        self.assertEqual(invoice.amount_paid, Decimal('50.00'))
+
+    def test_invoice_reconcile_amount_paid(self):
+        """
+        Tests that reconciling an invoice restores the paid amount from its transactions.
+        """
+        client = Client.objects.create(name='Cliente')
+        invoice = Invoice.objects.create(folio='F-2', total=100.00)
+        Transaction.objects.create(invoice=invoice, payed_by=client, amount=30.00)
+        Invoice.objects.filter(pk=invoice.pk).update(amount_paid=0)
+
+        self.assertTrue(invoice.reconcile_amount_paid(), "Method should report the drifted amount.")
+        self.assertEqual(invoice.amount_paid, Decimal('30.00'))
+        self.assertFalse(invoice.reconcile_amount_paid(), "Method should report nothing to reconcile.")
+
+    def test_invoice_amount_paid_follows_bulk_deletions(self):
+        """
+        Tests that deleting transactions through a queryset, including one
+        whose amount is deferred, subtracts their stored amounts.
+        """
+        client = Client.objects.create(name='Cliente')
+        invoice = Invoice.objects.create(folio='F-3', total=100.00)
+        Transaction.objects.create(invoice=invoice, payed_by=client, amount=30.00)
+        Transaction.objects.create(invoice=invoice, payed_by=client, amount=20.00)
+        kept_transaction = Transaction.objects.create(invoice=invoice, payed_by=client, amount=10.00)
+
+        Transaction.objects.exclude(pk=kept_transaction.pk).delete()
+
+        invoice.refresh_from_db()
+        self.assertEqual(invoice.amount_paid, Decimal('10.00'))
+
+        Transaction.objects.defer('amount').get(pk=kept_transaction.pk).delete()
+
+        invoice.refresh_from_db()
+        self.assertEqual(invoice.amount_paid, Decimal('0.00'))
+
+    def test_deferred_transactions_are_loaded_without_extra_queries(self):
+        """
+        Tests that loading transactions with deferred fields doesn't read them.
+        """
+        client = Client.objects.create(name='Cliente')
+        invoice = Invoice.objects.create(folio='F-4', total=100.00)
+        Transaction.objects.bulk_create([Transaction(invoice=invoice, payed_by=client, amount=10.00)
+                                         for _ in range(3)])
+
+        with self.assertNumQueries(1):
+            list(Transaction.objects.only('pk'))
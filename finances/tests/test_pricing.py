@@ -0,0 +1,81 @@
+from decimal import Decimal
+
+from django.contrib.admin.sites import AdminSite
+from django.test import TestCase
+
+from finances.models import ProductPrice
+from finances.pricing import ReimbursementPricing
+from inventories.admin import ReturnedProductInLine
+from inventories.models import ProductReimbursement, ReturnedProduct
+from utils.testing import SeedFactory
+
+
+class ReimbursementPricingTestCase(TestCase):
+    """
+    Test case for the pricing of the reimbursements' returned products.
+    """
+
+    def setUp(self):
+        factory = SeedFactory()
+        branch_office = factory.create_branch_office()
+        self.products = factory.create_products(3)
+        self.reimbursement = ProductReimbursement.objects.create(inventory=branch_office.productsinventory)
+
+        ProductPrice.objects.bulk_create([
+            ProductPrice(product=self.products[0], price=Decimal('12.50'), authorized_by=branch_office.administrator),
+            ProductPrice(product=self.products[1], price=Decimal('3.10'), authorized_by=branch_office.administrator),
+        ])
+        # The last product doesn't have a price.
+        ReturnedProduct.objects.bulk_create([
+            ReturnedProduct(reimbursement=self.reimbursement, product=product, quantity=quantity)
+            for product, quantity in zip(self.products, (2, 5, 7))
+        ])
+
+    def _get_per_item_total(self):
+        """
+        The total as it was computed before the aggregate: a query per line.
+        """
+        total = Decimal(0)
+
+        for returned_product in ReturnedProduct.objects.filter(reimbursement=self.reimbursement):
+            product_price = ProductPrice.objects.filter(product=returned_product.product_id).first()
+
+            if product_price is not None:
+                total += product_price.price * returned_product.quantity
+
+        return total
+
+    def test_total_matches_the_per_item_sum(self):
+        """
+        Tests that the aggregate equals the sum of the priced lines, leaving
+        out the products without a price.
+        """
+        with self.assertNumQueries(1):
+            total = ReimbursementPricing.get_total(self.reimbursement)
+
+        self.assertEqual(total, self._get_per_item_total())
+        self.assertEqual(total, Decimal('40.50'))
+
+    def test_total_of_an_empty_reimbursement(self):
+        """
+        Tests that a reimbursement without returned products has no total.
+        """
+        reimbursement = ProductReimbursement.objects.create(inventory=self.reimbursement.inventory)
+
+        self.assertIsNone(ReimbursementPricing.get_total(reimbursement))
+
+    def test_line_amounts(self):
+        """
+        Tests the annotated amounts and their rendering in the admin's inline,
+        which is empty for the products without a price.
+        """
+        inline = ReturnedProductInLine(ProductReimbursement, AdminSite())
+
+        with self.assertNumQueries(1):
+            lines = {line.product_id: line for line in ReimbursementPricing.get_lines(self.reimbursement)}
+
+        self.assertEqual(lines[self.products[0].pk].unit_price, Decimal('12.50'))
+        self.assertEqual(inline.line_amount(lines[self.products[0].pk]), '$25.00')
+        self.assertEqual(inline.line_amount(lines[self.products[1].pk]), '$15.50')
+        self.assertIsNone(lines[self.products[2].pk].amount)
+        self.assertEqual(inline.line_amount(lines[self.products[2].pk]), '')
@@ -0,0 +1,210 @@
+from decimal import Decimal
+from io import StringIO
+from unittest import mock
+
+from django.core.management import call_command
+from django.core.urlresolvers import reverse
+from django.db.models import QuerySet
+from django.test import TestCase
+from django.utils import timezone
+
+from back_office.models import Client
+from finances.models import DailySaleRollup, Invoice, MonthlySaleRollup, Sale, SaleProductItem, SaleRollup
+from utils.testing import SeedFactory
+
+
+class SaleRollupTestCase(TestCase):
+    """
+    Test case for the incremental sales rollups and their rebuild.
+    """
+
+    def setUp(self):
+        self.factory = SeedFactory()
+        self.branch_office = self.factory.create_branch_office()
+        self.inventory = self.branch_office.productsinventory
+        self.products = self.factory.create_products(2)
+        self.factory.stock(self.inventory, self.products, quantity=100)
+        self.client_entity = Client.objects.create(name='Cliente')
+
+    def _create_sale(self, quantities, payment_method=Sale.PAYMENT_CASH, record=True):
+        """
+        Creates a sale of the products with the given quantities, at 10.00
+        each, and adds it to the rollups as the sale form does.
+        """
+        invoice = Invoice.objects.create(folio=self.factory._next_name('invoice'), total=0)
+        sale = Sale.objects.create(client=self.client_entity, invoice=invoice, inventory=self.inventory,
+                                   payment_method=payment_method)
+
+        for product, quantity in zip(self.products, quantities):
+            sale_item = SaleProductItem.objects.create(sale=sale, product=product, quantity=quantity,
+                                                       unit_price=Decimal('10.00'))
+
+            if record:
+                SaleRollup.record_sale_item(sale, sale_item)
+
+        return sale
+
+    @staticmethod
+    def _get_figures(rollup_class):
+        return {(rollup.product_id, rollup.payment_method): (rollup.quantity, rollup.revenue)
+                for rollup in rollup_class.objects.all()}
+
+    def test_sale_items_are_added_to_the_rollups(self):
+        """
+        Tests that the first item of a combination creates its rollups and the
+        next ones increment them.
+        """
+        self._create_sale([2, 1])
+        self._create_sale([3, 0])
+
+        expected = {
+            (self.products[0].pk, Sale.PAYMENT_CASH): (5, Decimal('50.00')),
+            (self.products[1].pk, Sale.PAYMENT_CASH): (1, Decimal('10.00')),
+        }
+        self.assertEqual(self._get_figures(DailySaleRollup), expected)
+        self.assertEqual(self._get_figures(MonthlySaleRollup), expected)
+        self.assertEqual(DailySaleRollup.objects.get(product=self.products[0]).day,
+                         timezone.localtime(timezone.now()).date())
+
+    def test_add_retries_the_update_when_the_rollup_is_created_concurrently(self):
+        """
+        Tests that when another transaction creates the rollup between the
+        UPDATE and the INSERT, the conflict is resolved by updating it.
+        """
+        keys = {'day': timezone.localtime(timezone.now()).date(), 'inventory_id': self.inventory.pk,
+                'product_line': self.products[0].line, 'product_id': self.products[0].pk,
+                'payment_method': Sale.PAYMENT_CASH}
+        original_update = QuerySet.update
+        updates = []
+
+        def racing_update(queryset, **kwargs):
+            updates.append(kwargs)
+
+            if len(updates) == 1:
+                DailySaleRollup.objects.create(quantity=1, revenue=Decimal('10.00'), **keys)
+                return 0
+
+            return original_update(queryset, **kwargs)
+
+        with mock.patch.object(QuerySet, 'update', racing_update):
+            DailySaleRollup._add(keys, 2, Decimal('20.00'))
+
+        self.assertEqual(len(updates), 2)
+        self.assertEqual(self._get_figures(DailySaleRollup),
+                         {(self.products[0].pk, Sale.PAYMENT_CASH): (3, Decimal('30.00'))})
+
+    def test_cancellation_subtracts_the_sale(self):
+        """
+        Tests that cancelling a sale takes its items out of the rollups.
+        """
+        self._create_sale([2, 1])
+        self._create_sale([4, 3]).cancel()
+
+        expected = {
+            (self.products[0].pk, Sale.PAYMENT_CASH): (2, Decimal('20.00')),
+            (self.products[1].pk, Sale.PAYMENT_CASH): (1, Decimal('10.00')),
+        }
+        self.assertEqual(self._get_figures(DailySaleRollup), expected)
+        self.assertEqual(self._get_figures(MonthlySaleRollup), expected)
+
+    def test_rebuild_matches_the_incremental_rollups(self):
+        """
+        Tests that rebuilding the rollups from the active sales gives the same
+        figures, and restores the ones that weren't recorded.
+        """
+        self._create_sale([2, 1])
+        self._create_sale([1, 1], payment_method=Sale.PAYMENT_TRANSFER)
+        self._create_sale([5, 5]).cancel()
+        expected_daily = self._get_figures(DailySaleRollup)
+        expected_monthly = self._get_figures(MonthlySaleRollup)
+
+        self._create_sale([3, 0], payment_method=Sale.PAYMENT_TRANSFER, record=False)
+        expected_daily[(self.products[0].pk, Sale.PAYMENT_TRANSFER)] = (4, Decimal('40.00'))
+        expected_monthly[(self.products[0].pk, Sale.PAYMENT_TRANSFER)] = (4, Decimal('40.00'))
+
+        call_command('rebuild_sales_rollups', stdout=StringIO())
+
+        self.assertEqual(self._get_figures(DailySaleRollup), expected_daily)
+        self.assertEqual(self._get_figures(MonthlySaleRollup), expected_monthly)
+
+
+class SalesReportViewSetTestCase(TestCase):
+    """
+    Test case for the sales report endpoint.
+    """
+
+    def setUp(self):
+        self.factory = SeedFactory()
+        self.branch_office = self.factory.create_branch_office()
+        self.other_branch_office = self.factory.create_branch_office()
+        self.products = self.factory.create_products(2)
+        self.today = timezone.localtime(timezone.now()).date()
+
+        for inventory in (self.branch_office.productsinventory, self.other_branch_office.productsinventory):
+            for product in self.products:
+                for payment_method, quantity in ((Sale.PAYMENT_CASH, 1), (Sale.PAYMENT_TRANSFER, 2)):
+                    DailySaleRollup.objects.create(day=self.today, inventory=inventory, product_line=product.line,
+                                                   product=product, payment_method=payment_method,
+                                                   quantity=quantity, revenue=Decimal(quantity * 10))
+
+        self.client.login(username=self.branch_office.administrator.username, password=SeedFactory.PASSWORD)
+
+    def _get(self, **params):
+        return self.client.get(reverse('salesreport-list'), params)
+
+    def test_grouping(self):
+        """
+        Tests that the figures are added up by period and by the requested
+        dimensions only.
+        """
+        response = self._get(group_by='product,payment_method,unknown')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data), 4)
+        self.assertEqual({(row['product'], row['payment_method']): row['quantity'] for row in response.data}, {
+            (product.pk, payment_method): quantity for product in self.products
+            for payment_method, quantity in ((Sale.PAYMENT_CASH, 1), (Sale.PAYMENT_TRANSFER, 2))
+        })
+
+        response = self._get(payment_method=Sale.PAYMENT_TRANSFER)
+
+        self.assertEqual([(row['day'], row['quantity'], row['revenue']) for row in response.data],
+                         [(self.today, 4, Decimal('40.00'))])
+
+    def test_validation(self):
+        """
+        Tests that invalid periods, dates and filters are rejected.
+        """
+        for params in ({'period': 'week'}, {'start': 'yesterday'}, {'end': '2024-02-30'}, {'product': 'abc'},
+                       {'inventory': '-1'}):
+            self.assertEqual(self._get(**params).status_code, 400, params)
+
+    def test_inventories_are_restricted_to_the_users_branch_offices(self):
+        """
+        Tests that the users only get the figures of the inventories they
+        administer or supervise, while superusers get all of them.
+        """
+        response = self._get()
+
+        self.assertEqual([row['quantity'] for row in response.data], [6])
+        self.assertEqual(self._get(inventory=self.other_branch_office.productsinventory.pk).status_code, 403)
+
+        self.client.logout()
+        self.client.login(username=self.factory.create_employee(self.branch_office).username,
+                          password=SeedFactory.PASSWORD)
+
+        self.assertEqual(self._get().data, [])
+
+        superuser = self.factory.create_employee(self.branch_office, is_superuser=True)
+        self.client.logout()
+        self.client.login(username=superuser.username, password=SeedFactory.PASSWORD)
+
+        self.assertEqual([row['quantity'] for row in self._get().data], [12])
+
+    def test_anonymous_users_are_rejected(self):
+        """
+        Tests that the endpoint requires authentication.
+        """
+        self.client.logout()
+
+        self.assertIn(self._get().status_code, (401, 403))
@@ -0,0 +1,231 @@
+import csv
+import io
+import threading
+from decimal import Decimal
+
+from django.core.urlresolvers import reverse
+from django.db import connection, transaction, OperationalError
+from django.test import TestCase, TransactionTestCase
+
+from finances.models import ProductPrice, StockValuation
+from finances.valuation import StockValuationEngine
+from finances.views import StockValuationReportView
+from inventories.models import Product, ProductInventoryItem
+from utils.testing import SeedFactory
+
+
+class StockValuationEngineTestCase(TestCase):
+    """
+    Test case for the cached valuations of the products inventories' stock.
+    """
+
+    def setUp(self):
+        self.factory = SeedFactory()
+        self.branch_office = self.factory.create_branch_office()
+        self.inventory = self.branch_office.productsinventory
+        self.other_inventory = self.factory.create_branch_office().productsinventory
+        self.acr_products = self.factory.create_products(2, line=Product.ACR)
+        self.pol_products = self.factory.create_products(1, line=Product.POL)
+        self.factory.stock(self.inventory, self.acr_products + self.pol_products, quantity=4)
+        self.factory.stock(self.other_inventory, self.acr_products, quantity=1)
+        # The POL product doesn't have a price.
+        self.factory.set_prices(self.acr_products, self.branch_office.administrator, price=Decimal('2.50'))
+
+    def _get_figures(self, inventory_ids=None):
+        return {(valuation.inventory_id, valuation.product_line): (valuation.quantity, valuation.value,
+                                                                     valuation.unpriced_quantity)
+                for valuation in StockValuationEngine.get_line_valuations(inventory_ids)}
+
+    def test_figures(self):
+        """
+        Tests the valuation of every line of the inventories, including the
+        lines without stock and the stock without a price.
+        """
+        figures = self._get_figures()
+
+        self.assertEqual(len(figures), 2 * len(Product.LINE_TYPES))
+        self.assertEqual(figures[(self.inventory.pk, Product.ACR)], (8, Decimal('20.00'), 0))
+        self.assertEqual(figures[(self.inventory.pk, Product.POL)], (4, Decimal('0.00'), 4))
+        self.assertEqual(figures[(self.inventory.pk, Product.LAM)], (0, Decimal('0.00'), 0))
+        self.assertEqual(figures[(self.other_inventory.pk, Product.ACR)], (2, Decimal('5.00'), 0))
+
+    def test_cached_valuations_are_not_computed_again(self):
+        """
+        Tests that once computed, the valuations are read without touching
+        the inventory items.
+        """
+        self._get_figures([self.inventory.pk])
+
+        with self.assertNumQueries(2):
+            self._get_figures([self.inventory.pk])
+
+    def test_item_changes_invalidate_their_line(self):
+        """
+        Tests that changing an item only invalidates its inventory's line, and
+        that the line is computed again with the new quantity.
+        """
+        self._get_figures()
+
+        item = ProductInventoryItem.objects.get(inventory=self.inventory, product=self.acr_products[0])
+        item.quantity = 10
+        item.save()
+
+        self.assertEqual(set(StockValuation.objects.filter(product_line=Product.ACR).values_list(
+            'inventory', flat=True)), {self.other_inventory.pk})
+        self.assertEqual(StockValuation.objects.count(), 2 * len(Product.LINE_TYPES) - 1)
+        self.assertEqual(self._get_figures()[(self.inventory.pk, Product.ACR)], (14, Decimal('35.00'), 0))
+
+    def test_price_changes_invalidate_the_line_in_the_inventories_stocking_it(self):
+        """
+        Tests that changing a price invalidates its product's line in every
+        inventory stocking it, and only there, and that the new price is used.
+        """
+        self._get_figures()
+
+        ProductPrice.objects.create(product=self.pol_products[0], price=Decimal('1.00'),
+                                    authorized_by=self.branch_office.administrator)
+
+        self.assertEqual(list(StockValuation.objects.filter(product_line=Product.POL).values_list(
+            'inventory', flat=True)), [self.other_inventory.pk])
+        self.assertEqual(self._get_figures()[(self.inventory.pk, Product.POL)], (4, Decimal('4.00'), 0))
+
+    def test_product_changes_invalidate_the_inventories_stocking_it(self):
+        """
+        Tests that moving a product to another line is reflected in both lines.
+        """
+        self._get_figures()
+
+        product = Product.objects.get(pk=self.pol_products[0].pk)
+        product.line = Product.LAM
+        product.save()
+
+        self.assertFalse(StockValuation.objects.filter(inventory=self.inventory).exists())
+
+        figures = self._get_figures()
+        self.assertEqual(figures[(self.inventory.pk, Product.POL)], (0, Decimal('0.00'), 0))
+        self.assertEqual(figures[(self.inventory.pk, Product.LAM)], (4, Decimal('0.00'), 4))
+
+
+class StockValuationLockingTestCase(TransactionTestCase):
+    """
+    Test case for the locks taken by the invalidations of the valuations.
+    """
+
+    def test_price_changes_dont_block_other_inventories(self):
+        """
+        Tests that while a price change is being saved, the items of an
+        inventory that doesn't stock the product can still be saved.
+        """
+        factory = SeedFactory()
+        branch_office = factory.create_branch_office()
+        priced_product, other_product = factory.create_products(2)
+        factory.stock(branch_office.productsinventory, [priced_product])
+        other_inventory = factory.create_branch_office().productsinventory
+        factory.stock(other_inventory, [other_product])
+        item = ProductInventoryItem.objects.get(inventory=other_inventory)
+        errors = []
+
+        def save_item():
+            try:
+                with transaction.atomic():
+                    connection.cursor().execute("SET LOCAL lock_timeout = '2s'")
+                    item.quantity = 20
+                    item.save()
+            except OperationalError as e:
+                errors.append(e)
+            finally:
+                connection.close()
+
+        with transaction.atomic():
+            ProductPrice.objects.create(product=priced_product, price=Decimal('1.00'),
+                                        authorized_by=branch_office.administrator)
+
+            thread = threading.Thread(target=save_item)
+            thread.start()
+            thread.join()
+
+        self.assertEqual(errors, [])
+        self.assertEqual(ProductInventoryItem.objects.get(pk=item.pk).quantity, 20)
+
+
+class StockValuationReportViewTestCase(TestCase):
+    """
+    Test case for the stock valuation downloads.
+    """
+
+    def setUp(self):
+        self.factory = SeedFactory()
+        self.branch_office = self.factory.create_branch_office()
+        self.inventory = self.branch_office.productsinventory
+        self.other_inventory = self.factory.create_branch_office().productsinventory
+        self.products = self.factory.create_products(2, line=Product.ACR)
+        self.factory.stock(self.inventory, self.products, quantity=3)
+        self.factory.set_prices(self.products, self.branch_office.administrator, price=Decimal('2.00'))
+
+    def _login(self, user):
+        self.client.logout()
+        self.client.login(username=user.username, password=SeedFactory.PASSWORD)
+
+    def _get(self, **params):
+        return self.client.get(reverse('stock_valuation'), params)
+
+    @staticmethod
+    def _read_csv(response):
+        return list(csv.reader(io.StringIO(b''.join(response.streaming_content).decode())))
+
+    def test_csv_per_product(self):
+        """
+        Tests the CSV with a row per product of the inventory.
+        """
+        self._login(self.branch_office.administrator)
+        response = self._get(inventory=self.inventory.pk)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'text/csv')
+
+        rows = self._read_csv(response)
+        self.assertEqual(rows[0], StockValuationReportView.PRODUCT_HEADERS)
+        self.assertEqual([(row[2], row[5], row[6]) for row in rows[1:]],
+                         [(product.sku, '3', '6.00') for product in self.products])
+
+    def test_csv_per_line(self):
+        """
+        Tests the CSV with the cached figures per line.
+        """
+        self._login(self.branch_office.administrator)
+        rows = self._read_csv(self._get(inventory=self.inventory.pk, detail='line'))
+
+        self.assertEqual(len(rows), 1 + len(Product.LINE_TYPES))
+        self.assertEqual(rows[1][1:5], ['ACR', '6', '12.00', '0'])
+
+    def test_xls(self):
+        """
+        Tests that the workbook is sent as an attachment.
+        """
+        self._login(self.branch_office.administrator)
+        response = self._get(inventory=self.inventory.pk, format='xls')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'application/vnd.ms-excel')
+        self.assertIn('.xls"', response['Content-Disposition'])
+        self.assertTrue(response.content)
+
+    def test_access_control(self):
+        """
+        Tests that only the inventory's administrator or supervisor and the
+        superusers can value an inventory, and only superusers all of them.
+        """
+        self.assertEqual(self._get(inventory=self.inventory.pk).status_code, 302)
+
+        self._login(self.branch_office.administrator)
+        self.assertEqual(self._get(inventory=self.other_inventory.pk).status_code, 403)
+        self.assertEqual(self._get().status_code, 403)
+        self.assertEqual(self._get(inventory='abc').status_code, 400)
+        self.assertEqual(self._get(inventory=self.inventory.pk, detail='everything').status_code, 400)
+
+        self._login(self.factory.create_employee(self.branch_office))
+        self.assertEqual(self._get(inventory=self.inventory.pk).status_code, 403)
+
+        self._login(self.factory.create_employee(self.branch_office, is_superuser=True))
+        self.assertEqual(self._get(inventory=self.other_inventory.pk).status_code, 200)
+        self.assertEqual(self._get().status_code, 200)
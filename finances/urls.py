@@ -0,0 +1,7 @@
+from django.conf.urls import url
+
+from finances import views
+
+urlpatterns = [
+    url(r'^stockvaluation/$', views.StockValuationReportView.as_view(), name='stock_valuation'),
+]
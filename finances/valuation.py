@@ -0,0 +1,149 @@
+import logging
+from collections import defaultdict
+
+from django.db import transaction
+from django.db.models import Sum, F, Q, Case, When, Value, DecimalField, IntegerField
+
+from finances.models import StockValuation
+from inventories.models import Product, ProductsInventory, ProductInventoryItem
+from utils.db.routers import replica_queryset
+
+db_logger = logging.getLogger('db')
+
+
+class StockValuationEngine:
+    """
+    Values the stock of the products inventories (quantity times the product's
+    price) grouping the figures in the database instead of walking every
+    inventory item.
+    """
+    PRICE_FIELD = 'product__productprice__price'
+
+    @staticmethod
+    def _get_value_sum():
+        return Sum(F('quantity') * F(StockValuationEngine.PRICE_FIELD),
+                   output_field=DecimalField(max_digits=14, decimal_places=2))
+
+    @staticmethod
+    def _get_unpriced_quantity_sum():
+        return Sum(Case(When(product__productprice__isnull=True, then=F('quantity')), default=Value(0),
+                        output_field=IntegerField()))
+
+    @staticmethod
+    @replica_queryset
+    def get_product_rows(inventory_ids=None):
+        """
+        Returns the valuation per inventory, line and product as a lazy
+        queryset of dictionaries, ordered so it can be streamed.
+        :param inventory_ids: Restricts the valuation to these inventories.
+        The queryset reads from the replica, if there's one.
+        :return: A values queryset with the keys inventory, inventory__name,
+        product__line, product__sku, product__description, price, quantity and value.
+        """
+        items = ProductInventoryItem.objects.all()
+
+        if inventory_ids is not None:
+            items = items.filter(inventory_id__in=inventory_ids)
+
+        return items.values(
+            'inventory', 'inventory__name', 'product__line', 'product__sku', 'product__description',
+        ).annotate(
+            price=F(StockValuationEngine.PRICE_FIELD),
+            quantity=Sum('quantity'),
+            value=StockValuationEngine._get_value_sum(),
+        ).order_by('inventory', 'product__line', 'product__sku')
+
+    @staticmethod
+    def get_line_valuations(inventory_ids=None):
+        """
+        Returns the cached valuation per inventory and product line, computing
+        first the combinations that were invalidated (or never computed) with a
+        single grouped query.
+        :param inventory_ids: Restricts the valuation to these inventories.
+        :return: A StockValuation queryset ordered by inventory and line.
+        """
+        try:
+            if inventory_ids is None:
+                inventory_ids = list(ProductsInventory.objects.values_list('pk', flat=True))
+
+            StockValuationEngine._compute_missing(inventory_ids)
+
+            return StockValuation.objects.filter(inventory_id__in=inventory_ids).select_related(
+                'inventory').order_by('inventory', 'product_line')
+        except Exception as e:
+            db_logger.exception(e)
+            raise
+
+    @staticmethod
+    def _get_missing(inventory_ids):
+        """
+        Returns the combinations of inventory and line of the given
+        inventories that aren't cached.
+        :return: A (missing, cached_inventories_per_line) tuple: a set of
+        (inventory id, line) tuples and a dictionary mapping each line to the
+        inventories it's cached for.
+        """
+        cached_inventories_per_line = defaultdict(set)
+
+        for inventory_id, line in StockValuation.objects.filter(inventory_id__in=inventory_ids).values_list(
+                'inventory', 'product_line'):
+            cached_inventories_per_line[line].add(inventory_id)
+
+        missing = {(inventory_id, line) for inventory_id in inventory_ids for line, _ in Product.LINE_TYPES
+                   if inventory_id not in cached_inventories_per_line[line]}
+
+        return missing, cached_inventories_per_line
+
+    @staticmethod
+    def _compute_missing(inventory_ids):
+        """
+        Computes and stores the valuations of the given inventories that are
+        not cached. Lines without stock are stored as zero so that a fully
+        cached inventory doesn't touch the inventory items at all.
+        The inventories are locked while their valuations are computed and
+        stored, as StockValuation.invalidate does: a change that was
+        invalidated first is committed before the items are read, and one
+        that's invalidated later deletes what's stored here.
+        :param inventory_ids: The inventories to complete.
+        """
+        missing, _ = StockValuationEngine._get_missing(inventory_ids)
+
+        if not missing:
+            return
+
+        with transaction.atomic():
+            StockValuation.lock_inventories({inventory_id for inventory_id, _ in missing})
+
+            # Another request may have stored some of them while the locks were awaited.
+            missing, cached_inventories_per_line = StockValuationEngine._get_missing(
+                {inventory_id for inventory_id, _ in missing})
+
+            if not missing:
+                return
+
+            items = ProductInventoryItem.objects.filter(
+                inventory_id__in={inventory_id for inventory_id, _ in missing})
+
+            for line, cached_inventories in cached_inventories_per_line.items():
+                if cached_inventories:
+                    items = items.exclude(Q(product__line=line) & Q(inventory_id__in=cached_inventories))
+
+            figures = {
+                (row['inventory'], row['product__line']): row
+                for row in items.values('inventory', 'product__line').annotate(
+                    total_quantity=Sum('quantity'),
+                    total_value=StockValuationEngine._get_value_sum(),
+                    total_unpriced_quantity=StockValuationEngine._get_unpriced_quantity_sum(),
+                ).order_by()
+            }
+
+            valuations = []
+
+            for inventory_id, line in missing:
+                row = figures.get((inventory_id, line), {})
+                valuations.append(StockValuation(inventory_id=inventory_id, product_line=line,
+                                                 quantity=row.get('total_quantity') or 0,
+                                                 value=row.get('total_value') or 0,
+                                                 unpriced_quantity=row.get('total_unpriced_quantity') or 0))
+
+            StockValuation.objects.bulk_create(valuations)
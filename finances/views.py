@@ -1,28 +1,308 @@
+import csv
+import io
+import logging
+from decimal import Decimal
+
 from dal import autocomplete
-from django.db.models import Q
+from django.contrib.auth.decorators import login_required
+from django.db.models import Q, Sum
+from django.http import HttpResponse, HttpResponseBadRequest, HttpResponseForbidden, StreamingHttpResponse
+from django.shortcuts import get_object_or_404
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+from django.utils.decorators import method_decorator
+from django.views.generic import View
+
+from back_office.models import Employee
+from back_office.user_context import get_user_context
+from finances.filters import ProductPriceFilter, MaterialCostFilter
+from finances.models import ProductPrice, MaterialCost, Invoice, DailySaleRollup, MonthlySaleRollup, \
+    PriceListVersion
+from finances.serializers import ProductPriceSerializer, MaterialCostSerializer, ProductPriceBulkSerializer
+from finances.valuation import StockValuationEngine
+from inventories.catalog import get_product_lines
+from inventories.models import Product, ProductsInventory
+from rest_framework import permissions, status, viewsets
+from rest_framework.decorators import list_route
+from rest_framework.exceptions import PermissionDenied, ValidationError
+from rest_framework.filters import DjangoFilterBackend
+from rest_framework.response import Response
 
-from finances.models import ProductPrice, MaterialCost, Invoice
-from finances.serializers import ProductPriceSerializer, MaterialCostSerializer
+from utils.api import PrimaryKeyCursorPagination, VersionETagListMixin, validate_bulk_rows
+from utils.db.routers import read_from_replica
 
-from rest_framework import viewsets
+db_logger = logging.getLogger('db')
 
 
-class ProductPriceViewSet(viewsets.ModelViewSet):
+@method_decorator(read_from_replica(), name='list')
+class ProductPriceViewSet(VersionETagListMixin, viewsets.ModelViewSet):
     """
     API endpoint that allows product price to be viewed or edited through a RESTful API.
+    Lists are cursor paginated, can be filtered by product, sku and line and
+    are tagged with the price list's version.
     """
-    queryset = ProductPrice.objects.all()
+    queryset = ProductPrice.objects.select_related('product')
     serializer_class = ProductPriceSerializer
+    permission_classes = (permissions.IsAuthenticated, permissions.DjangoModelPermissions,)
+    pagination_class = PrimaryKeyCursorPagination
+    filter_backends = (DjangoFilterBackend,)
+    filter_class = ProductPriceFilter
+
+    def get_list_version(self):
+        return PriceListVersion.get_current()
+
+    @list_route(methods=['post', 'patch'])
+    def bulk(self, request):
+        """
+        Creates or updates the price of several products in a single
+        transaction. The body is a list of {"product": ..., "price": ...,
+        "authorized_by": ...} objects, authorized_by defaults to the current
+        user. If any row is invalid nothing is written and the errors are
+        returned per row. Since any row may create or update a price, the
+        user needs both permissions whatever the method.
+        :param request: The HTTP request.
+        :return: A list with the status ('created' or 'updated') of each row.
+        """
+        try:
+            if not request.user.has_perms(['finances.add_productprice', 'finances.change_productprice']):
+                raise PermissionDenied()
+
+            rows, errors = validate_bulk_rows(ProductPriceBulkSerializer, request.data, 'product')
+
+            if errors:
+                return Response(errors, status=status.HTTP_400_BAD_REQUEST)
+
+            default_authorizer_id = request.user.pk
+            employee_ids = {row.get('authorized_by', default_authorizer_id) for row in rows}
+            product_ids = {row['product'] for row in rows}
+            known_employee_ids = set(Employee.objects.filter(pk__in=employee_ids).values_list('pk', flat=True))
+            unknown_product_ids = product_ids - set(get_product_lines(product_ids))
+
+            errors = []
+
+            for row in rows:
+                row_errors = {}
+
+                if row['product'] in unknown_product_ids:
+                    row_errors['product'] = ['No existe.']
+
+                if row.get('authorized_by', default_authorizer_id) not in known_employee_ids:
+                    row_errors['authorized_by'] = ['Empleado inválido.']
+
+                errors.append(row_errors)
+
+            if any(errors):
+                return Response(errors, status=status.HTTP_400_BAD_REQUEST)
+
+            statuses = ProductPrice.upsert_prices({
+                row['product']: (row['price'], row.get('authorized_by', default_authorizer_id)) for row in rows
+            })
+
+            return Response([{'product': row['product'], 'price': row['price'], 'status': statuses[row['product']]}
+                             for row in rows])
+        except Exception as e:
+            db_logger.exception(e)
+            raise
 
 
 class MaterialCostViewSet(viewsets.ModelViewSet):
     """
     API endpoint that allows material cost to be viewed or edited through a RESTful API.
+    Lists are cursor paginated and can be filtered by material and name.
     """
-    queryset = MaterialCost.objects.all()
+    queryset = MaterialCost.objects.select_related('material')
     serializer_class = MaterialCostSerializer
+    permission_classes = (permissions.IsAuthenticated, permissions.DjangoModelPermissions,)
+    pagination_class = PrimaryKeyCursorPagination
+    filter_backends = (DjangoFilterBackend,)
+    filter_class = MaterialCostFilter
+
+
+@method_decorator(read_from_replica(), name='list')
+class SalesReportViewSet(viewsets.ViewSet):
+    """
+    Read only API endpoint that serves sales figures from the pre-aggregated
+    daily or monthly sales rollups. It accepts the query parameters:
+    period ('day' or 'month'), start and end (YYYY-MM-DD), inventory,
+    product_line, product, payment_method and group_by, a comma separated
+    list of the dimensions to group the figures by. Only superusers see every
+    inventory, the other users see the ones of the branch offices they
+    administer or supervise.
+    """
+    permission_classes = (permissions.IsAuthenticated,)
+    FILTER_FIELDS = ('inventory', 'product_line', 'product', 'payment_method',)
+
+    def list(self, request):
+        period = request.query_params.get('period', 'day')
+
+        if period not in ('day', 'month'):
+            raise ValidationError({'period': 'El periodo debe ser "day" o "month".'})
+
+        rollup_class = DailySaleRollup if period == 'day' else MonthlySaleRollup
+        period_field = rollup_class.PERIOD_FIELD
+        queryset = rollup_class.objects.all()
+
+        for param, lookup in (('start', '__gte'), ('end', '__lte')):
+            value = request.query_params.get(param)
+
+            if value:
+                try:
+                    date = parse_date(value)
+                except ValueError:
+                    # Well formed but impossible dates, e.g. 2024-02-30.
+                    date = None
+
+                if date is None:
+                    raise ValidationError({param: 'Fecha inválida: {0}.'.format(value)})
+
+                queryset = queryset.filter(**{period_field + lookup: rollup_class.get_period_start(date)})
+
+        for field in self.FILTER_FIELDS:
+            value = request.query_params.get(field)
+
+            if value:
+                if not value.isdigit():
+                    raise ValidationError({field: 'Valor inválido: {0}.'.format(value)})
+
+                queryset = queryset.filter(**{field: int(value)})
+
+        if not request.user.is_superuser:
+            inventory_ids = self.get_allowed_inventory_ids(request)
+            inventory_id = request.query_params.get('inventory')
+
+            if inventory_id and int(inventory_id) not in inventory_ids:
+                raise PermissionDenied()
+
+            queryset = queryset.filter(inventory__in=inventory_ids)
+
+        group_by = [field for field in request.query_params.get('group_by', '').split(',')
+                    if field in self.FILTER_FIELDS]
+
+        rows = queryset.values(period_field, *group_by).annotate(
+            quantity=Sum('quantity'), revenue=Sum('revenue')).order_by(period_field, *group_by)
+
+        return Response(list(rows))
+
+    @staticmethod
+    def get_allowed_inventory_ids(request):
+        """
+        Returns the IDs of the products inventories of the branch offices the
+        user administers or supervises.
+        :param request: The HTTP request.
+        :return: A set of IDs.
+        """
+        user_context = get_user_context(request)
+
+        return set(ProductsInventory.objects.filter(
+            branch__in=user_context.administered_branch_ids | user_context.supervised_branch_ids
+        ).values_list('pk', flat=True))
+
+
+class _Echo:
+    """
+    File-like object whose write method returns the value instead of buffering
+    it, so csv.writer can be used to generate streamed rows.
+    """
+
+    def write(self, value):
+        return value
+
+
+class StockValuationReportView(View):
+    """
+    Downloads the valuation of the products inventories' stock as CSV or XLS.
+    It accepts the query parameters: inventory (a products inventory id, all
+    of them are valued if omitted), detail ('line' for the cached figures per
+    product line or 'product', the default, for a row per product) and
+    format ('csv', the default, or 'xls').
+    """
+    LINE_HEADERS = ['Inventario', 'Línea', 'Cantidad', 'Valor', 'Cantidad sin precio', 'Calculado en']
+    PRODUCT_HEADERS = ['Inventario', 'Línea', 'SKU', 'Descripción', 'Precio', 'Cantidad', 'Valor']
+
+    @method_decorator(login_required)
+    def dispatch(self, request, *args, **kwargs):
+        return super(StockValuationReportView, self).dispatch(request, *args, **kwargs)
+
+    def get(self, request):
+        try:
+            inventory_ids = None
+
+            if request.GET.get('inventory'):
+                if not request.GET['inventory'].isdigit():
+                    return HttpResponseBadRequest()
+
+                inventory = get_object_or_404(ProductsInventory.objects.select_related('branch'),
+                                              pk=request.GET['inventory'])
+
+                if not (request.user.is_superuser or request.user == inventory.supervisor or
+                        request.user == inventory.branch.administrator):
+                    return HttpResponseForbidden()
+
+                inventory_ids = [inventory.pk]
+            elif not request.user.is_superuser:
+                return HttpResponseForbidden()
+
+            detail = request.GET.get('detail', 'product')
+            file_format = request.GET.get('format', 'csv')
+
+            if detail not in ('line', 'product') or file_format not in ('csv', 'xls'):
+                return HttpResponseBadRequest()
+
+            if detail == 'line':
+                rows = self._get_line_rows(inventory_ids)
+            else:
+                rows = self._get_product_rows(inventory_ids)
+
+            file_name = 'valuacion_{0}_{1}.{2}'.format(detail, timezone.localtime(timezone.now()).strftime('%Y%m%d'),
+                                                       file_format)
+
+            if file_format == 'csv':
+                writer = csv.writer(_Echo())
+                response = StreamingHttpResponse((writer.writerow(row) for row in rows), content_type='text/csv')
+            else:
+                response = HttpResponse(self._render_xls(rows), content_type='application/vnd.ms-excel')
+
+            response['Content-Disposition'] = 'attachment; filename="{0}"'.format(file_name)
+
+            return response
+        except Exception as e:
+            db_logger.exception(e)
+            raise
+
+    def _get_line_rows(self, inventory_ids):
+        lines = dict(Product.LINE_TYPES)
+        yield self.LINE_HEADERS
+
+        for valuation in StockValuationEngine.get_line_valuations(inventory_ids):
+            yield [valuation.inventory.name, lines[valuation.product_line], valuation.quantity, valuation.value,
+                   valuation.unpriced_quantity, timezone.localtime(valuation.computed_at).strftime('%Y-%m-%d %H:%M')]
+
+    def _get_product_rows(self, inventory_ids):
+        lines = dict(Product.LINE_TYPES)
+        yield self.PRODUCT_HEADERS
+
+        for row in StockValuationEngine.get_product_rows(inventory_ids).iterator():
+            yield [row['inventory__name'], lines[row['product__line']], row['product__sku'],
+                   row['product__description'], row['price'], row['quantity'], row['value']]
+
+    @staticmethod
+    def _render_xls(rows):
+        """
+        Renders the rows as an XLS workbook. Unlike the CSV the workbook has to
+        be built in memory before it can be sent.
+        """
+        # pyexcel (and its xlrd/xlwt plugins) is only imported by the exports, not when the workers boot.
+        import pyexcel
+
+        sheet = pyexcel.Sheet([[float(value) if isinstance(value, Decimal) else '' if value is None else value
+                                for value in row] for row in rows])
+        stream = io.BytesIO()
+        sheet.save_to_memory('xls', stream)
+
+        return stream.getvalue()
 
 
+@method_decorator(read_from_replica(), name='dispatch')
 class InvoiceAutocomplete(autocomplete.Select2QuerySetView):
     """
     Select2 framework's autocomplete for the Invoice entity.
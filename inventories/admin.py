@@ -5,10 +5,11 @@ from django.contrib.admin import ModelAdmin
 from django.core.urlresolvers import reverse
 from django.db import transaction
 from django.utils.html import format_html
-from reversion.admin import VersionAdmin
 
 import inventories.models as models
-from back_office.admin import admin_site
+from back_office.admin import admin_site, HistoryAdmin, HistoryInline
+from back_office.user_context import get_user_context
+from finances.pricing import ReimbursementPricing
 from inventories.forms.entered_product_forms import EnteredProductInlineForm
 from inventories.forms.inventory_item_forms import TabularInLineConsumableInventoryItemForm, \
     TabularInLineMaterialInventoryItemForm, \
@@ -26,6 +27,7 @@ from inventories.forms.productreimbursement_tabularinlines_forms import AddOrCha
 from inventories.forms.productremoval_forms import AddOrChangeProductRemovalForm
 from inventories.forms.productsinventory_forms import AddOrChangeProductsInventoryForm
 from inventories.forms.removedproduct_forms import RemovedProductForm, RemovedProductFormset
+from utils.versioning import PolicyVersionAdmin
 
 db_logger = logging.getLogger('db')
 
@@ -39,7 +41,7 @@ class ProductComponentInLine(admin.TabularInline):
     model = models.ProductComponent
 
 
-class ProductAdmin(VersionAdmin):
+class ProductAdmin(PolicyVersionAdmin):
     """
     Specifies the details for the admin app in regard
     to the Product entity.
@@ -64,7 +66,7 @@ class ProductAdmin(VersionAdmin):
             models.ProductComponent.objects.filter(product=obj).delete()
 
 
-class InventoryItemAdmin(VersionAdmin):
+class InventoryItemAdmin(PolicyVersionAdmin):
     """
     Specifies the details for the admin app in regard
     to the ProductInventoryItem, MaterialInventoryItem,
@@ -81,7 +83,7 @@ class InventoryItemAdmin(VersionAdmin):
         return {}
 
 
-class ProductsInventoryAdmin(VersionAdmin):
+class ProductsInventoryAdmin(PolicyVersionAdmin):
     """
     Specifies the details for the admin app in regard
     to the inventory entities.
@@ -121,7 +123,7 @@ class MaterialInventoryItemInLine(admin.TabularInline):
     model = models.MaterialInventoryItem
 
 
-class MaterialsInventoryAdmin(VersionAdmin):
+class MaterialsInventoryAdmin(PolicyVersionAdmin):
     """
     Specifies the details for the admin app in regard
     to the inventory entities.
@@ -160,7 +162,7 @@ class ConsumableInventoryItemInLine(admin.TabularInline):
     model = models.ConsumableInventoryItem
 
 
-class ConsumablesInventoryAdmin(VersionAdmin):
+class ConsumablesInventoryAdmin(PolicyVersionAdmin):
     """
     Specifies the details for the admin app in regard
     to the inventory entities.
@@ -199,7 +201,7 @@ class DurableGoodInventoryItemInLine(admin.TabularInline):
     model = models.DurableGoodInventoryItem
 
 
-class DurableGoodsInventoryAdmin(VersionAdmin):
+class DurableGoodsInventoryAdmin(PolicyVersionAdmin):
     """
     Specifies the details for the admin app in regard
     to the inventory entities.
@@ -316,6 +318,17 @@ class ProductTransferShipmentAdmin(ModelAdmin):
         obj.source_branch = request.user.branch_office
         super(ProductTransferShipmentAdmin, self).save_model(request, obj, form, change)
 
+    def save_related(self, request, form, formsets, change):
+        """
+        Reserves the units of the shipment's products once its lines are saved.
+        The inline formset checked them and keeps them locked until the
+        change is saved, so they're still available.
+        """
+        super(ProductTransferShipmentAdmin, self).save_related(request, form, formsets, change)
+
+        if form.instance.status == models.ProductTransferShipment.STATUS_PENDING:
+            form.instance.reserve_products()
+
 
 class ReceivedProductInLine(admin.TabularInline):
     """
@@ -446,14 +459,30 @@ class ReturnedProductInLine(admin.TabularInline):
     form = AddOrChangeReturnedProductTabularInlineForm
     model = models.ReturnedProduct
 
+    def get_queryset(self, request):
+        return ReimbursementPricing.annotate_line_amounts(
+            super(ReturnedProductInLine, self).get_queryset(request))
+
     def get_extra(self, request, obj=None, **kwargs):
         return 0 if obj is not None else 3
 
     def get_readonly_fields(self, request, obj=None):
         if obj is not None:
-            return ['product', 'quantity']
+            return ['product', 'quantity', 'line_amount']
         else:
-            return []
+            return ['line_amount']
+
+    def line_amount(self, obj):
+        """
+        Returns the amount of the returned product line: its quantity times the product's price.
+        :param obj: The ReturnedProduct, annotated by ReimbursementPricing.
+        :return: The formatted amount.
+        """
+        amount = getattr(obj, 'amount', None)
+
+        return '' if amount is None else '${0:.2f}'.format(amount)
+
+    line_amount.short_description = "Importe"
 
     def get_actions(self, request):
         actions = super(ReturnedProductInLine, self).get_actions(request)
@@ -489,7 +518,7 @@ class ProductReimbursementAdmin(ModelAdmin):
         return False
 
     def save_model(self, request, obj, form, change):
-        obj.inventory = request.user.branch_office.productsinventory
+        obj.inventory = get_user_context(request).products_inventory
         super(ProductReimbursementAdmin, self).save_model(request, obj, form, change)
 
     def save_related(self, request, form, formsets, change):
@@ -498,23 +527,13 @@ class ProductReimbursementAdmin(ModelAdmin):
         between the returned products and the exchanged products.
         """
         try:
-            from finances.models import ProductPrice
-            from functools import reduce
-
             super(ProductReimbursementAdmin, self).save_related(request, form, formsets, change)
 
             reimbursement = form.instance
+            total = ReimbursementPricing.get_total(reimbursement)
 
-            returned_products = models.ReturnedProduct.objects.filter(reimbursement=reimbursement).all()
-
-            if returned_products.count() > 0:
-                product_prices = ProductPrice.objects.filter(product__in=[item.product for item in returned_products])
-
-                reimbursement.monetary_difference = reduce(lambda x, y: x + y,
-                                                           [a.price * b.quantity for a in product_prices for b in
-                                                            returned_products if
-                                                            a.product == b.product])
-
+            if total is not None:
+                reimbursement.monetary_difference = total
                 reimbursement.save()
         except Exception as e:
             db_logger.exception(e)
@@ -635,7 +654,7 @@ class ProductEntryAdmin(admin.ModelAdmin):
 
     def save_model(self, request, obj, form, change):
         obj.entered_by_user = request.user
-        obj.inventory = request.user.branch_office.productsinventory
+        obj.inventory = get_user_context(request).products_inventory
         super(ProductEntryAdmin, self).save_model(request, obj, form, change)
 
     def has_delete_permission(self, request, obj=None):
@@ -709,9 +728,20 @@ class ProductRemovalAdmin(admin.ModelAdmin):
 
     def save_model(self, request, obj, form, change):
         obj.removed_by_user = request.user
-        obj.inventory = request.user.branch_office.productsinventory
+        obj.inventory = get_user_context(request).products_inventory
         super(ProductRemovalAdmin, self).save_model(request, obj, form, change)
 
+    def save_related(self, request, form, formsets, change):
+        """
+        Reserves the units of the removal's products once its lines are saved.
+        The inline formset checked them and keeps them locked until the
+        change is saved, so they're still available.
+        """
+        super(ProductRemovalAdmin, self).save_related(request, form, formsets, change)
+
+        if form.instance.status == models.ProductRemoval.STATUS_PENDING:
+            form.instance.reserve_products()
+
     def has_delete_permission(self, request, obj=None):
         if obj and obj.status != models.ProductRemoval.STATUS_PENDING:
             return False
@@ -719,6 +749,70 @@ class ProductRemovalAdmin(admin.ModelAdmin):
             return super(ProductRemovalAdmin, self).has_delete_permission(request, obj)
 
 
+class EnteredProductHistoryInLine(HistoryInline):
+    model = models.EnteredProductHistory
+
+
+class ProductEntryHistoryAdmin(HistoryAdmin):
+    """
+    Specifies the details for the admin app in regard
+    to the product entries' history.
+    """
+    inlines = [EnteredProductHistoryInLine]
+    list_display = ('id', 'date_entered', 'inventory', 'purchase_order', 'status',)
+    list_filter = ('inventory', 'status', 'date_entered',)
+    list_select_related = ('inventory', 'purchase_order',)
+    search_fields = ('purchase_order__invoice_folio', 'purchase_order__provider__name',)
+
+
+class RemovedProductHistoryInLine(HistoryInline):
+    model = models.RemovedProductHistory
+
+
+class ProductRemovalHistoryAdmin(HistoryAdmin):
+    """
+    Specifies the details for the admin app in regard
+    to the product removals' history.
+    """
+    inlines = [RemovedProductHistoryInLine]
+    list_display = ('__str__', 'inventory', 'removed_by_user', 'cause', 'status', 'date_removed',)
+    list_filter = ('inventory', 'cause', 'status', 'date_removed',)
+    list_select_related = ('inventory', 'removed_by_user',)
+    search_fields = ('provider__name', 'removed_by_user__username',)
+
+
+class TransferredProductHistoryInLine(HistoryInline):
+    model = models.TransferredProductHistory
+
+
+class ProductTransferShipmentHistoryAdmin(HistoryAdmin):
+    """
+    Specifies the details for the admin app in regard
+    to the product transfer shipments' history.
+    """
+    inlines = [TransferredProductHistoryInLine]
+    list_display = ('__str__', 'source_branch', 'target_branch', 'status', 'date_shipped',)
+    list_filter = ('source_branch', 'target_branch', 'status', 'date_shipped',)
+    list_select_related = ('source_branch', 'target_branch',)
+    search_fields = ('source_branch__name', 'target_branch__name', 'shipped_by_user__username',)
+
+
+class ReceivedProductHistoryInLine(HistoryInline):
+    model = models.ReceivedProductHistory
+
+
+class ProductTransferReceptionHistoryAdmin(HistoryAdmin):
+    """
+    Specifies the details for the admin app in regard
+    to the product transfer receptions' history.
+    """
+    inlines = [ReceivedProductHistoryInLine]
+    list_display = ('__str__', 'product_transfer_shipment', 'received_by_user', 'status', 'date_received',)
+    list_filter = ('status', 'date_received',)
+    list_select_related = ('product_transfer_shipment', 'received_by_user',)
+    search_fields = ('received_by_user__username',)
+
+
 admin_site.register(models.Product, ProductAdmin)
 admin_site.register(models.ProductInventoryItem, InventoryItemAdmin)
 admin_site.register(models.ProductsInventory, ProductsInventoryAdmin)
@@ -728,3 +822,7 @@ admin_site.register(models.ProductReimbursement, ProductReimbursementAdmin)
 admin_site.register(models.PurchaseOrder, PurchaseOrderAdmin)
 admin_site.register(models.ProductEntry, ProductEntryAdmin)
 admin_site.register(models.ProductRemoval, ProductRemovalAdmin)
+admin_site.register(models.ProductEntryHistory, ProductEntryHistoryAdmin)
+admin_site.register(models.ProductRemovalHistory, ProductRemovalHistoryAdmin)
+admin_site.register(models.ProductTransferShipmentHistory, ProductTransferShipmentHistoryAdmin)
+admin_site.register(models.ProductTransferReceptionHistory, ProductTransferReceptionHistoryAdmin)
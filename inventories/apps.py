@@ -4,3 +4,7 @@ from django.apps import AppConfig
 class InventoriesConfig(AppConfig):
     name = 'inventories'
     verbose_name = 'Inventarios'
+
+    def ready(self):
+        import inventories.receivers  # noqa
+        import inventories.warmup  # noqa
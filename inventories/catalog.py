@@ -0,0 +1,251 @@
+import bisect
+import logging
+import threading
+import time
+from array import array
+from collections import namedtuple
+from decimal import Decimal, ROUND_CEILING
+
+from inventories.models import Product
+from utils.cache import product_catalog_cache
+
+db_logger = logging.getLogger('db')
+
+CatalogProduct = namedtuple('CatalogProduct', ['id', 'sku', 'description', 'line', 'length', 'width', 'thickness',
+                                               'is_composite', 'is_scrap'])
+
+_HUNDREDTHS = Decimal('0.01')
+
+
+def _to_hundredths(value):
+    return int((Decimal(value) * 100).to_integral_value(rounding=ROUND_CEILING))
+
+
+class ProductCatalog:
+    """
+    Read-only snapshot of the products' identifying data (SKU, description,
+    line, dimensions and flags), kept by each process in parallel arrays
+    ordered by ID instead of model instances: the dimensions are stored as
+    integer hundredths, so they're exact, and the lookups by ID are binary
+    searches. It also indexes the SKUs and, per line, the products by width
+    (line_index and line_widths, in the same order).
+    Use get_product_catalog() to get the current one.
+    """
+    COMPOSITE = 1
+    SCRAP = 2
+
+    def __init__(self, rows, version=None):
+        """
+        :param rows: Tuples of (id, sku, description, line, length, width,
+        thickness, is_composite, is_scrap), ordered by ID.
+        :param version: The product_catalog_cache version it was built at.
+        """
+        self.version = version
+        self.built_at = time.time()
+        self.ids = array('l')
+        self.lines = array('B')
+        self.lengths = array('l')
+        self.widths = array('l')
+        self.thicknesses = array('l')
+        self.flags = array('B')
+        skus = []
+        descriptions = []
+
+        for product_id, sku, description, line, length, width, thickness, is_composite, is_scrap in rows:
+            self.ids.append(product_id)
+            skus.append(sku)
+            descriptions.append(description)
+            self.lines.append(line)
+            self.lengths.append(_to_hundredths(length))
+            self.widths.append(_to_hundredths(width))
+            self.thicknesses.append(_to_hundredths(thickness))
+            self.flags.append((self.COMPOSITE if is_composite else 0) | (self.SCRAP if is_scrap else 0))
+
+        self.skus = tuple(skus)
+        self.descriptions = tuple(descriptions)
+        self.sku_index = {sku: row for row, sku in enumerate(self.skus)}
+        self.line_index = {}
+        self.line_widths = {}
+
+        for row in sorted(range(len(self.ids)), key=lambda row: self.widths[row]):
+            self.line_index.setdefault(self.lines[row], array('l')).append(row)
+            self.line_widths.setdefault(self.lines[row], array('l')).append(self.widths[row])
+
+    @staticmethod
+    def load(version=None):
+        """
+        Builds the catalog from the database with a single query.
+        :param version: The product_catalog_cache version it's built at.
+        :return: The ProductCatalog.
+        """
+        try:
+            return ProductCatalog(Product.objects.order_by('pk').values_list(
+                'pk', 'sku', 'description', 'line', 'length', 'width', 'thickness', 'is_composite', 'is_scrap'
+            ).iterator(), version)
+        except Exception as e:
+            db_logger.exception(e)
+            raise
+
+    def __len__(self):
+        return len(self.ids)
+
+    def __contains__(self, product_id):
+        return self._get_row(product_id) is not None
+
+    def _get_row(self, product_id):
+        row = bisect.bisect_left(self.ids, product_id)
+
+        if row < len(self.ids) and self.ids[row] == product_id:
+            return row
+
+        return None
+
+    def _get_product(self, row):
+        return CatalogProduct(self.ids[row], self.skus[row], self.descriptions[row], self.lines[row],
+                              Decimal(self.lengths[row]) * _HUNDREDTHS, Decimal(self.widths[row]) * _HUNDREDTHS,
+                              Decimal(self.thicknesses[row]) * _HUNDREDTHS, bool(self.flags[row] & self.COMPOSITE),
+                              bool(self.flags[row] & self.SCRAP))
+
+    @staticmethod
+    def to_catalog_product(product):
+        """
+        :param product: The Product.
+        :return: The CatalogProduct the catalog holds for the product's
+        current data.
+        """
+        return CatalogProduct(product.pk, product.sku, product.description, product.line,
+                              Decimal(_to_hundredths(product.length)) * _HUNDREDTHS,
+                              Decimal(_to_hundredths(product.width)) * _HUNDREDTHS,
+                              Decimal(_to_hundredths(product.thickness)) * _HUNDREDTHS, bool(product.is_composite),
+                              bool(product.is_scrap))
+
+    def get(self, product_id):
+        """
+        :param product_id: The product's ID.
+        :return: The product's CatalogProduct, or None if it doesn't exist.
+        """
+        row = self._get_row(product_id)
+
+        return None if row is None else self._get_product(row)
+
+    def get_by_sku(self, sku):
+        """
+        :param sku: The product's SKU.
+        :return: The product's CatalogProduct, or None if it doesn't exist.
+        """
+        row = self.sku_index.get(sku)
+
+        return None if row is None else self._get_product(row)
+
+    def get_id(self, sku):
+        """
+        :param sku: The product's SKU.
+        :return: The product's ID, or None if it doesn't exist.
+        """
+        row = self.sku_index.get(sku)
+
+        return None if row is None else self.ids[row]
+
+    def get_line(self, product_id):
+        """
+        :param product_id: The product's ID.
+        :return: The product's line, or None if it doesn't exist.
+        """
+        row = self._get_row(product_id)
+
+        return None if row is None else self.lines[row]
+
+    def get_ids_by_line(self, line, min_width=None, min_length=None):
+        """
+        Returns the IDs of the products of a line, optionally only the ones
+        that fit a surface.
+        :param line: The line.
+        :param min_width: Minimum width of the products, in meters.
+        :param min_length: Minimum length of the products, in meters.
+        :return: List of IDs, ordered by width.
+        """
+        rows = self.line_index.get(line, ())
+
+        if min_width is not None and rows:
+            rows = rows[bisect.bisect_left(self.line_widths[line], _to_hundredths(min_width)):]
+
+        if min_length is not None:
+            min_length = _to_hundredths(min_length)
+            rows = [row for row in rows if self.lengths[row] >= min_length]
+
+        return [self.ids[row] for row in rows]
+
+
+_catalog = None
+_catalog_lock = threading.Lock()
+
+
+def get_product_catalog():
+    """
+    Returns the process' ProductCatalog, rebuilding it when the products
+    changed since it was built (see inventories.receivers) or, since the
+    local memory cache doesn't share the invalidations between processes,
+    when it's older than the cache's timeout.
+    :return: The ProductCatalog.
+    """
+    global _catalog
+
+    version = product_catalog_cache.get_version()
+    catalog = _catalog
+    max_age = product_catalog_cache.cache.default_timeout
+
+    if catalog is None or catalog.version != version or \
+            (max_age is not None and time.time() - catalog.built_at > max_age):
+        with _catalog_lock:
+            if _catalog is catalog:
+                _catalog = ProductCatalog.load(version)
+
+            catalog = _catalog
+
+    return catalog
+
+
+def _lookup(values, get_value, field, value_field):
+    """
+    Looks values up in the catalog, and the ones it's missing in the database:
+    the products created without signals (e.g. with bulk_create) only reach
+    the catalog when it's rebuilt, which finding one of them triggers.
+    :return: Dictionary mapping the values found to the looked up data.
+    """
+    catalog = get_product_catalog()
+    found = {}
+    missing = []
+
+    for value in values:
+        data = get_value(catalog, value)
+
+        if data is None:
+            missing.append(value)
+        else:
+            found[value] = data
+
+    if missing:
+        missing_found = dict(Product.objects.filter(**{field + '__in': missing}).values_list(field, value_field))
+
+        if missing_found:
+            product_catalog_cache.invalidate()
+            found.update(missing_found)
+
+    return found
+
+
+def get_product_ids(skus):
+    """
+    :param skus: The products' SKUs.
+    :return: Dictionary mapping the SKUs of the existing products to their IDs.
+    """
+    return _lookup(set(skus), ProductCatalog.get_id, 'sku', 'pk')
+
+
+def get_product_lines(product_ids):
+    """
+    :param product_ids: The products' IDs.
+    :return: Dictionary mapping the IDs of the existing products to their
+    lines.
+    """
+    return _lookup(set(product_ids), ProductCatalog.get_line, 'pk', 'line')
@@ -0,0 +1,15 @@
+import django_filters
+
+from inventories.models import ProductInventoryItem
+
+
+class ProductInventoryItemFilter(django_filters.FilterSet):
+    """
+    Filters for the products inventory items API.
+    """
+    sku = django_filters.CharFilter(name='product__sku', lookup_expr='iexact')
+    line = django_filters.NumberFilter(name='product__line')
+
+    class Meta:
+        model = ProductInventoryItem
+        fields = ('inventory', 'product', 'sku', 'line',)
@@ -1,19 +1,18 @@
-import logging
-
 from dal import autocomplete
 from django.forms import BaseInlineFormSet
 from django.forms import ModelForm
 
 from back_office.models import BranchOffice
+from back_office.user_context import get_user_context
+from inventories.forms.reservation_forms import AvailableStockFormsetMixin
 from inventories.models import ProductTransferShipment, TransferredProduct
 
-db_logger = logging.getLogger('db')
-
 
-class TransferredProductInlineFormset(BaseInlineFormSet):
+class TransferredProductInlineFormset(AvailableStockFormsetMixin, BaseInlineFormSet):
     """
     Formset used in the TransferredProductInlineAdmin. It's used to pass
-    the request to each TransferredProductInlineForm.
+    the request to each TransferredProductInlineForm and to check the
+    available units of the source inventory.
     """
 
     def __init__(self, data=None, files=None, instance=None,
@@ -48,32 +47,6 @@ class TransferredProductInlineForm(ModelForm):
         self.request = kwargs.pop('request', None)
         super(TransferredProductInlineForm, self).__init__(*args, **kwargs)
 
-    def clean(self):
-        try:
-            cleaned_data = super(TransferredProductInlineForm, self).clean()
-            product = cleaned_data.get('product')
-            quantity = cleaned_data.get('quantity')
-            source_inventory = self.request.user.branch_office.productsinventory
-            are_fields_readonly = not product or not quantity
-
-            if any(self.errors) or are_fields_readonly:
-                return cleaned_data
-
-            product_inventory_item = source_inventory.productinventoryitem_set.filter(product=product).first()
-
-            if not product_inventory_item:
-                self.add_error('product',
-                               'El inventario {0} no cuenta con este producto.'.format(str(source_inventory)))
-            elif product_inventory_item.quantity < quantity:
-                self.add_error('quantity', 'El inventario {0} sólo cuenta con {1} unidades de este producto.'.format(
-                    str(source_inventory), product_inventory_item.quantity
-                ))
-
-            return cleaned_data
-        except Exception as e:
-            db_logger.exception(e)
-            raise
-
 
 class AddOrChangeProductTransferShipmentForm(ModelForm):
     """
@@ -88,4 +61,5 @@ class AddOrChangeProductTransferShipmentForm(ModelForm):
         self.request = kwargs.pop('request')
         super(AddOrChangeProductTransferShipmentForm, self).__init__(*args, **kwargs)
         if 'target_branch' in self.fields:
-            self.fields['target_branch'].queryset = BranchOffice.objects.exclude(pk=self.request.user.branch_office.pk)
+            self.fields['target_branch'].queryset = BranchOffice.objects.exclude(
+                pk=get_user_context(self.request).branch_office_id)
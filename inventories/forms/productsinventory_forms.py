@@ -1,14 +1,14 @@
 import logging
 
-import pyexcel
 from django import forms
 from django.core.exceptions import ValidationError
-from django.db.models import Q
 from django.forms import ModelForm
 from django.forms.utils import ErrorList
 
-from inventories.models import ProductsInventory, ProductInventoryItem, Product
+from inventories.catalog import get_product_ids
+from inventories.models import ProductsInventory, ProductInventoryItem
 from inventories.validators import validate_file_extension
+from utils.versioning import movement_saves
 
 db_logger = logging.getLogger('db')
 
@@ -92,6 +92,9 @@ class AddOrChangeProductsInventoryForm(ModelForm):
         """
         valid_extensions = ['.xls', '.xlsx']
 
+        # pyexcel (and its xlrd/xlwt plugins) is only imported by the uploads, not when the workers boot.
+        import pyexcel
+
         validate_file_extension(file, valid_extensions)
 
         file_extension = file.name.split(".")[1]
@@ -111,25 +114,29 @@ class AddOrChangeProductsInventoryForm(ModelForm):
                 return inventory
 
             non_existing_products = []
+            product_ids = get_product_ids(self.excel_data_dict['SKU'])
+            items = {item.product_id: item for item in ProductInventoryItem.objects.filter(
+                inventory=inventory, product_id__in=product_ids.values())}
 
             for i, product_sku in enumerate(self.excel_data_dict['SKU']):
                 quantity = self.excel_data_dict['Cantidad'][i]
-                new_item = ProductInventoryItem.objects.filter(Q(product__sku=product_sku) &
-                                                               Q(inventory=inventory)).first()
 
-                if new_item is None:
-                    product = Product.objects.filter(sku=product_sku).first()
+                if product_sku not in product_ids:
+                    non_existing_products.append(product_sku)
+                    continue
 
-                    if product is None:
-                        non_existing_products.append(product_sku)
-                        continue
+                new_item = items.get(product_ids[product_sku])
 
+                if new_item is None:
                     new_item = ProductInventoryItem()
-                    new_item.product = product
+                    new_item.product_id = product_ids[product_sku]
                     new_item.inventory = inventory
+                    items[new_item.product_id] = new_item
 
                 new_item.quantity += quantity
-                new_item.save()
+
+                with movement_saves():
+                    new_item.save()
 
             return inventory
         except Exception as e:
@@ -1,18 +1,16 @@
-import logging
-
 from dal import autocomplete
 from django.forms import BaseInlineFormSet
 from django.forms import ModelForm
 
+from inventories.forms.reservation_forms import AvailableStockFormsetMixin
 from inventories.models import RemovedProduct
 
-db_logger = logging.getLogger('db')
-
 
-class RemovedProductFormset(BaseInlineFormSet):
+class RemovedProductFormset(AvailableStockFormsetMixin, BaseInlineFormSet):
     """
     Formset used in the ProductRemoval many to one relationship. It's used to pass
-    the request to each RemovedProductForm.
+    the request to each RemovedProductForm and to check the available units of
+    the inventory.
     """
 
     def __init__(self, data=None, files=None, instance=None,
@@ -46,27 +44,3 @@ class RemovedProductForm(ModelForm):
                                                      'data-minimum-input-length': 1,
                                                  })
         }
-
-    def clean(self):
-        try:
-            request = self.request
-            cleaned_data = super(RemovedProductForm, self).clean()
-            product = cleaned_data.get('product')
-            quantity = cleaned_data.get('quantity')
-            inventory = request.user.branch_office.productsinventory
-
-            product_inventory_item = inventory.productinventoryitem_set.filter(product=product).first()
-
-            if product_inventory_item is None:
-                self.add_error('product', "{0} no cuenta con el producto {1}. Hay que agregarlo al inventario.".format(
-                    str(inventory), str(product)
-                ))
-            elif product_inventory_item.quantity < quantity:
-                self.add_error('quantity', "{0} sólo cuenta con {} unidades de este producto.".format(
-                    str(inventory), str(quantity)
-                ))
-
-            return cleaned_data
-        except Exception as e:
-            db_logger.exception(e)
-            raise
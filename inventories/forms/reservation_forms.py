@@ -0,0 +1,69 @@
+import logging
+from collections import defaultdict
+
+from django.db import transaction
+
+from back_office.user_context import get_user_context
+from inventories.models import ProductInventoryItem, ProductReservation
+
+db_logger = logging.getLogger('db')
+
+
+class AvailableStockFormsetMixin:
+    """
+    Mixin for the formsets of the lines of a pending shipment or removal.
+    It checks that the user's inventory has enough available (not reserved)
+    units of every product with a single query for the whole formset,
+    counting together the lines of the same product.
+
+    Within a transaction (the admin saves a change form in one) the items
+    are locked until it ends, so the movement's reserve_products can't find
+    the units promised to another movement after the check.
+    """
+
+    def get_movement_inventory(self):
+        """
+        :return: The ProductsInventory the units are taken from, the user's
+        one, which the admins save the movements with.
+        """
+        return get_user_context(self.request).products_inventory
+
+    def clean(self):
+        try:
+            super(AvailableStockFormsetMixin, self).clean()
+
+            if any(self.errors) or (self.instance.pk is not None and
+                                    self.instance.status != self.instance.STATUS_PENDING):
+                return
+
+            forms = [form for form in self.forms if form.cleaned_data.get('product') and
+                     form.cleaned_data.get('quantity') and not self._should_delete_form(form)]
+            quantities = defaultdict(int)
+
+            for form in forms:
+                quantities[form.cleaned_data['product'].pk] += form.cleaned_data['quantity']
+
+            if not quantities:
+                return
+
+            inventory = self.get_movement_inventory()
+
+            if transaction.get_connection().in_atomic_block:
+                list(ProductInventoryItem.objects.select_for_update().filter(
+                    inventory=inventory, product_id__in=quantities.keys()).values_list('pk', flat=True))
+
+            available_quantities = ProductReservation.get_available_quantities(inventory, quantities.keys(),
+                                                                               self.instance)
+
+            for form in forms:
+                product = form.cleaned_data['product']
+
+                if product.pk not in available_quantities:
+                    form.add_error('product', 'El inventario {0} no cuenta con este producto.'.format(str(inventory)))
+                elif available_quantities[product.pk] < quantities[product.pk]:
+                    form.add_error('quantity', 'El inventario {0} sólo cuenta con {1} unidades disponibles de este '
+                                               'producto.'.format(str(inventory),
+                                                                  max(available_quantities[product.pk], 0)))
+        except Exception as e:
+            db_logger.exception(e)
+            raise
@@ -0,0 +1,20 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.9.8 on 2026-10-19 13:02
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventories', '0002_auto_20161027_0157'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='productsinventory',
+            name='version',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='versión'),
+        ),
+    ]
@@ -0,0 +1,49 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.9.8 on 2026-10-19 13:41
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventories', '0003_productsinventory_version'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='productinventoryitem',
+            name='change_seq',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='secuencia de cambio'),
+        ),
+        migrations.RunSQL(
+            "UPDATE inventories_productsinventory SET version = version + 1; "
+            "UPDATE inventories_productinventoryitem SET change_seq = inventories_productsinventory.version "
+            "FROM inventories_productsinventory "
+            "WHERE inventories_productsinventory.id = inventories_productinventoryitem.inventory_id",
+            migrations.RunSQL.noop),
+        migrations.AlterIndexTogether(
+            name='productinventoryitem',
+            index_together=set([('inventory', 'change_seq')]),
+        ),
+        migrations.CreateModel(
+            name='DeletedProductInventoryItem',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('item_id', models.PositiveIntegerField(verbose_name='elemento')),
+                ('product_id', models.PositiveIntegerField(verbose_name='producto')),
+                ('change_seq', models.PositiveIntegerField(verbose_name='secuencia de cambio')),
+                ('inventory', models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.DO_NOTHING, to='inventories.ProductsInventory', verbose_name='inventario')),
+            ],
+            options={
+                'verbose_name': 'elemento de inventario de productos eliminado',
+                'verbose_name_plural': 'elementos de inventario de productos eliminados',
+            },
+        ),
+        migrations.AlterIndexTogether(
+            name='deletedproductinventoryitem',
+            index_together=set([('inventory', 'change_seq')]),
+        ),
+    ]
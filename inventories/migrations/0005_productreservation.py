@@ -0,0 +1,40 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.9.8 on 2026-10-19 16:05
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+from utils import migrations as utils_migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventories', '0004_productinventoryitem_change_seq'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='productinventoryitem',
+            name='reserved',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='cantidad reservada'),
+        ),
+        migrations.CreateModel(
+            name='ProductReservation',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('quantity', models.PositiveIntegerField(verbose_name='cantidad')),
+                ('date_reserved', models.DateTimeField(default=django.utils.timezone.now, verbose_name='fecha de reservación')),
+                ('item', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='inventories.ProductInventoryItem', verbose_name='elemento de inventario')),
+                ('product_removal', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, to='inventories.ProductRemoval', verbose_name='merma de producto')),
+                ('product_transfer_shipment', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, to='inventories.ProductTransferShipment', verbose_name='envío de transferencia de productos')),
+            ],
+            options={
+                'verbose_name': 'reservación de producto',
+                'verbose_name_plural': 'reservaciones de producto',
+            },
+        ),
+        migrations.RunPython(utils_migrations.reserve_pending_movements, migrations.RunPython.noop),
+    ]
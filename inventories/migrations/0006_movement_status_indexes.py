@@ -0,0 +1,50 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.9.8 on 2026-10-19 17:20
+from __future__ import unicode_literals
+
+from django.db import migrations
+
+# Partial indexes of the pending movements (status 2) by the column the pending items of each user are joined on.
+# They stay as small as the pending workload however long the movements' history grows.
+PENDING_INDEXES = [
+    ('inventories_purchaseorder', 'branch_office_id'),
+    ('inventories_productentry', 'inventory_id'),
+    ('inventories_productremoval', 'inventory_id'),
+    ('inventories_producttransfershipment', 'source_branch_id'),
+    ('inventories_producttransferreception', 'product_transfer_shipment_id'),
+]
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventories', '0005_productreservation'),
+    ]
+
+    operations = [
+        migrations.AlterIndexTogether(
+            name='purchaseorder',
+            index_together=set([('branch_office', 'status')]),
+        ),
+        migrations.AlterIndexTogether(
+            name='productentry',
+            index_together=set([('inventory', 'status'), ('purchase_order', 'status')]),
+        ),
+        migrations.AlterIndexTogether(
+            name='productremoval',
+            index_together=set([('inventory', 'status')]),
+        ),
+        migrations.AlterIndexTogether(
+            name='producttransfershipment',
+            index_together=set([('source_branch', 'status'), ('target_branch', 'status')]),
+        ),
+        migrations.AlterIndexTogether(
+            name='producttransferreception',
+            index_together=set([('product_transfer_shipment', 'status')]),
+        ),
+    ] + [
+        migrations.RunSQL(
+            "CREATE INDEX {0}_pending_idx ON {0} ({1}) WHERE status = 2".format(table, column),
+            "DROP INDEX IF EXISTS {0}_pending_idx".format(table))
+        for table, column in PENDING_INDEXES
+    ]
@@ -0,0 +1,174 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.9.8 on 2026-10-19 18:05
+from __future__ import unicode_literals
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+from utils import migrations as utils_migrations
+
+# The movement tables with an archive, and the columns their history is filtered or joined by.
+ARCHIVED_TABLES = [
+    ('inventories_productentry', ('purchase_order_id', 'inventory_id', 'date_entered')),
+    ('inventories_enteredproduct', ('product_entry_id', 'product_id')),
+    ('inventories_productremoval', ('inventory_id', 'product_transfer_reception_id', 'date_removed')),
+    ('inventories_removedproduct', ('product_removal_id', 'product_id')),
+    ('inventories_producttransfershipment', ('source_branch_id', 'target_branch_id', 'date_shipped')),
+    ('inventories_transferredproduct', ('product_transfer_shipment_id', 'product_id')),
+    ('inventories_producttransferreception', ('product_transfer_shipment_id', 'date_received')),
+    ('inventories_receivedproduct', ('product_transfer_reception_id', 'product_id')),
+]
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('back_office', '0001_initial'),
+        ('inventories', '0006_movement_status_indexes'),
+    ]
+
+    operations = [
+        utils_migrations.create_archive_table(table, indexed_columns) for table, indexed_columns in ARCHIVED_TABLES
+    ] + [
+        migrations.CreateModel(
+            name='ProductEntryHistory',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('status', models.PositiveSmallIntegerField(choices=[(0, 'Confirmado'), (1, 'Cancelado'), (2, 'Pendiente')], verbose_name='estado')),
+                ('date_entered', models.DateTimeField(verbose_name='fecha de envío')),
+                ('date_confirmed', models.DateTimeField(null=True, verbose_name='fecha de confirmación')),
+                ('confirmed_by_user', models.ForeignKey(null=True, on_delete=django.db.models.deletion.PROTECT, related_name='+', to=settings.AUTH_USER_MODEL, verbose_name='confirmado por')),
+                ('entered_by_user', models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, related_name='+', to=settings.AUTH_USER_MODEL, verbose_name='Ingresado por')),
+                ('inventory', models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, related_name='+', to='inventories.ProductsInventory', verbose_name='inventario')),
+                ('purchase_order', models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, related_name='+', to='inventories.PurchaseOrder', verbose_name='orden de compra')),
+            ],
+            options={
+                'verbose_name': 'histórico de ingreso de productos',
+                'verbose_name_plural': 'histórico de ingresos de productos',
+                'db_table': 'inventories_productentry_history',
+                'managed': False,
+            },
+        ),
+        migrations.CreateModel(
+            name='EnteredProductHistory',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('quantity', models.PositiveSmallIntegerField(verbose_name='cantidad')),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, related_name='+', to='inventories.Product', verbose_name='producto')),
+                ('product_entry', models.ForeignKey(on_delete=django.db.models.deletion.DO_NOTHING, to='inventories.ProductEntryHistory', verbose_name='ingreso')),
+            ],
+            options={
+                'verbose_name': 'producto ingresado',
+                'verbose_name_plural': 'productos ingresados',
+                'db_table': 'inventories_enteredproduct_history',
+                'managed': False,
+            },
+        ),
+        migrations.CreateModel(
+            name='ProductTransferShipmentHistory',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date_shipped', models.DateTimeField(verbose_name='fecha de envío')),
+                ('date_confirmed', models.DateTimeField(null=True, verbose_name='fecha de confirmación')),
+                ('status', models.PositiveSmallIntegerField(choices=[(0, 'Confirmado'), (1, 'Cancelado'), (2, 'Pendiente'), (3, 'Recibido'), (4, 'Rechazado')], verbose_name='estado')),
+                ('confirmed_by_user', models.ForeignKey(null=True, on_delete=django.db.models.deletion.PROTECT, related_name='+', to=settings.AUTH_USER_MODEL, verbose_name='confirmado por')),
+                ('shipped_by_user', models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, related_name='+', to=settings.AUTH_USER_MODEL, verbose_name='enviado por')),
+                ('source_branch', models.ForeignKey(on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to='back_office.BranchOffice', verbose_name='sucursal de origen')),
+                ('target_branch', models.ForeignKey(on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to='back_office.BranchOffice', verbose_name='sucursal de destino')),
+            ],
+            options={
+                'verbose_name': 'histórico de transferencia de productos',
+                'verbose_name_plural': 'histórico de transferencias de productos',
+                'db_table': 'inventories_producttransfershipment_history',
+                'managed': False,
+            },
+        ),
+        migrations.CreateModel(
+            name='TransferredProductHistory',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('quantity', models.PositiveSmallIntegerField(verbose_name='cantidad')),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, related_name='+', to='inventories.Product', verbose_name='producto')),
+                ('product_transfer_shipment', models.ForeignKey(on_delete=django.db.models.deletion.DO_NOTHING, to='inventories.ProductTransferShipmentHistory', verbose_name='envío')),
+            ],
+            options={
+                'verbose_name': 'producto transferido',
+                'verbose_name_plural': 'productos transferidos',
+                'db_table': 'inventories_transferredproduct_history',
+                'managed': False,
+            },
+        ),
+        migrations.CreateModel(
+            name='ProductTransferReceptionHistory',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date_received', models.DateTimeField(verbose_name='fecha de recepción')),
+                ('date_confirmed', models.DateTimeField(null=True, verbose_name='fecha de confirmación')),
+                ('status', models.PositiveSmallIntegerField(choices=[(0, 'Confirmada'), (1, 'Cancelada'), (2, 'Pendiente')], verbose_name='estado')),
+                ('confirmed_by_user', models.ForeignKey(null=True, on_delete=django.db.models.deletion.PROTECT, related_name='+', to=settings.AUTH_USER_MODEL, verbose_name='confirmado por')),
+                ('product_transfer_shipment', models.ForeignKey(on_delete=django.db.models.deletion.DO_NOTHING, to='inventories.ProductTransferShipmentHistory', verbose_name='transferencia')),
+                ('received_by_user', models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, related_name='+', to=settings.AUTH_USER_MODEL, verbose_name='recibido por')),
+            ],
+            options={
+                'verbose_name': 'histórico de recepción de transferencia',
+                'verbose_name_plural': 'histórico de recepciones de transferencias',
+                'db_table': 'inventories_producttransferreception_history',
+                'managed': False,
+            },
+        ),
+        migrations.CreateModel(
+            name='ReceivedProductHistory',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('received_quantity', models.PositiveSmallIntegerField(verbose_name='cantidad recibida')),
+                ('accepted_quantity', models.PositiveSmallIntegerField(verbose_name='cantidad aceptada')),
+                ('rejection_reason', models.PositiveSmallIntegerField(choices=[(0, 'La cantidad recibida no concuerda con la esperada.'), (1, 'El material recibido no concuerda con el esperado.'), (1, 'El material se encuentra en mal estado.')], null=True, verbose_name='motivo de rechazo')),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, related_name='+', to='inventories.Product', verbose_name='producto')),
+                ('product_transfer_reception', models.ForeignKey(on_delete=django.db.models.deletion.DO_NOTHING, to='inventories.ProductTransferReceptionHistory', verbose_name='recepción')),
+            ],
+            options={
+                'verbose_name': 'producto recibido',
+                'verbose_name_plural': 'productos recibidos',
+                'db_table': 'inventories_receivedproduct_history',
+                'managed': False,
+            },
+        ),
+        migrations.CreateModel(
+            name='ProductRemovalHistory',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('cause', models.PositiveSmallIntegerField(choices=[(0, 'Interna'), (1, 'Proveedor'), (2, 'Transferencia')], verbose_name='causa')),
+                ('status', models.PositiveSmallIntegerField(choices=[(0, 'Confirmada'), (1, 'Cancelada'), (2, 'Pendiente')], verbose_name='estado')),
+                ('date_removed', models.DateTimeField(verbose_name='fecha')),
+                ('date_confirmed', models.DateTimeField(null=True, verbose_name='fecha de confirmación')),
+                ('confirmed_by_user', models.ForeignKey(null=True, on_delete=django.db.models.deletion.PROTECT, related_name='+', to=settings.AUTH_USER_MODEL, verbose_name='confirmado por')),
+                ('inventory', models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, related_name='+', to='inventories.ProductsInventory', verbose_name='inventario')),
+                ('product_transfer_reception', models.ForeignKey(null=True, on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to='inventories.ProductTransferReceptionHistory', verbose_name='recepción de transferencia de producto')),
+                ('provider', models.ForeignKey(null=True, on_delete=django.db.models.deletion.PROTECT, related_name='+', to='back_office.Provider', verbose_name='proveedor')),
+                ('removed_by_user', models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, related_name='+', to=settings.AUTH_USER_MODEL, verbose_name='Creada por')),
+            ],
+            options={
+                'verbose_name': 'histórico de salida de productos',
+                'verbose_name_plural': 'histórico de salidas de productos',
+                'db_table': 'inventories_productremoval_history',
+                'managed': False,
+            },
+        ),
+        migrations.CreateModel(
+            name='RemovedProductHistory',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('quantity', models.PositiveSmallIntegerField(verbose_name='cantidad')),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, related_name='+', to='inventories.Product', verbose_name='producto')),
+                ('product_removal', models.ForeignKey(on_delete=django.db.models.deletion.DO_NOTHING, to='inventories.ProductRemovalHistory', verbose_name='salida')),
+            ],
+            options={
+                'verbose_name': 'producto de la salida',
+                'verbose_name_plural': 'productos de la salida',
+                'db_table': 'inventories_removedproduct_history',
+                'managed': False,
+            },
+        ),
+    ]
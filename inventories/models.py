@@ -1,16 +1,17 @@
 import logging
 import sys
-from functools import reduce
+from collections import defaultdict, OrderedDict
 
 from django.contrib.auth.models import User
 from django.core.exceptions import ValidationError
 from django.core.urlresolvers import reverse
-from django.db import models, transaction
+from django.db import models, transaction, connection
 from django.db.models import Q
-from django.db.models import Sum
+from django.db.models import Sum, Case, When, Value, IntegerField, F
 from django.utils import timezone
 
 from back_office.models import Employee, Client, BranchOffice, EmployeeGroup, Provider
+from inventories.signals import product_inventory_items_bulk_updated
 
 db_logger = logging.getLogger('db')
 
@@ -232,6 +233,7 @@ class ProductsInventory(models.Model):
     last_updater = models.ForeignKey(Employee, on_delete=models.PROTECT,
                                      verbose_name='autor de la última actualización',
                                      limit_choices_to=~Q(username='root'))
+    version = models.PositiveIntegerField(default=0, editable=False, verbose_name='versión')
 
     class Meta:
         verbose_name = 'inventario de productos'
@@ -240,6 +242,61 @@ class ProductsInventory(models.Model):
     def __str__(self):
         return self.name
 
+    def save(self, **kwargs):
+        try:
+            if not self._state.adding:
+                # The version is only changed by bump_versions, the in-memory value may be stale.
+                kwargs.setdefault('update_fields', [field.name for field in self._meta.concrete_fields
+                                                    if not field.primary_key and field.name != 'version'])
+
+            super(ProductsInventory, self).save(**kwargs)
+        except Exception as e:
+            db_logger.exception(e)
+            raise
+
+    @staticmethod
+    def bump_versions(inventory_ids):
+        """
+        Increments the version of the given inventories. The version changes
+        whenever one of the inventory's items (or the products they refer to)
+        changes, so clients can detect changes without reading the items. The
+        updated rows stay locked until the transaction ends, so the returned
+        versions grow in commit order and can be used as a change sequence.
+        :param inventory_ids: An iterable of inventory ids.
+        :return: Dictionary mapping each inventory id to its new version.
+        """
+        try:
+            inventory_ids = list(inventory_ids)
+
+            if not inventory_ids:
+                return {}
+
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    "UPDATE {0} SET version = version + 1 WHERE id = ANY(%s) RETURNING id, version".format(
+                        ProductsInventory._meta.db_table), [inventory_ids])
+
+                return dict(cursor.fetchall())
+        except Exception as e:
+            db_logger.exception(e)
+            raise
+
+    @staticmethod
+    def get_versions_signature(inventory_id=None):
+        """
+        Returns a value that changes whenever the items of the given inventory
+        (or of any inventory, if none is given) change.
+        :param inventory_id: The inventory's id.
+        :return: A string.
+        """
+        if inventory_id is not None:
+            version = ProductsInventory.objects.filter(pk=inventory_id).values_list('version', flat=True).first()
+            return "{0}.{1}".format(inventory_id, version)
+
+        signature = ProductsInventory.objects.aggregate(versions=Sum('version'), count=models.Count('pk'),
+                                                        last=models.Max('pk'))
+        return "{versions}.{count}.{last}".format(**signature)
+
 
 class ProductInventoryItem(models.Model):
     """
@@ -248,14 +305,187 @@ class ProductInventoryItem(models.Model):
     product = models.ForeignKey(Product, on_delete=models.CASCADE, verbose_name='producto')
     quantity = models.PositiveIntegerField(default=0, verbose_name='cantidad')
     inventory = models.ForeignKey(ProductsInventory, on_delete=models.CASCADE, verbose_name='inventario')
+    change_seq = models.PositiveIntegerField(default=0, editable=False, verbose_name='secuencia de cambio')
+    reserved = models.PositiveIntegerField(default=0, editable=False, verbose_name='cantidad reservada')
 
     class Meta:
         verbose_name = 'elemento de inventario de productos'
         verbose_name_plural = 'elementos de inventario de productos'
+        index_together = [('inventory', 'change_seq')]
 
     def __str__(self):
         return "{0}: {1}".format(self.product, self.quantity)
 
+    @property
+    def available(self):
+        """
+        The units that aren't reserved by pending shipments or removals.
+        :return: An integer, negative if more units were reserved than there are.
+        """
+        return self.quantity - self.reserved
+
+    def save(self, **kwargs):
+        """
+        Saves the item stamping it with the inventory's new version, which
+        makes it part of the inventory's change feed. Every quantity change
+        (movements, sales, reimbursements and the API) goes through here.
+        """
+        try:
+            if not self._state.adding:
+                # The reserved units are only changed by ProductReservation, the in-memory value may be stale.
+                kwargs.setdefault('update_fields', [field.name for field in self._meta.concrete_fields
+                                                    if not field.primary_key and field.name != 'reserved'])
+
+            with transaction.atomic():
+                versions = ProductsInventory.bump_versions([self.inventory_id])
+                self.change_seq = versions.get(self.inventory_id, self.change_seq)
+                super(ProductInventoryItem, self).save(**kwargs)
+        except Exception as e:
+            db_logger.exception(e)
+            raise
+
+    @staticmethod
+    def get_changes(inventory_id, since, limit):
+        """
+        Returns the items of an inventory changed or deleted after the given
+        change sequence. Items stamped with the same sequence (a bulk update)
+        are never split between two pages.
+        :param inventory_id: The inventory's id.
+        :param since: The client's cursor, the last change sequence it received.
+        :param limit: The approximate maximum number of changed items to return.
+        :return: A dictionary with the changed items, the deleted items' ids,
+        the new cursor and whether there are more changes after it.
+        """
+        try:
+            items = ProductInventoryItem.objects.filter(inventory_id=inventory_id,
+                                                        change_seq__gt=since).order_by('change_seq', 'pk')
+            deletions = DeletedProductInventoryItem.objects.filter(inventory_id=inventory_id,
+                                                                   change_seq__gt=since).order_by('change_seq')
+            changed = list(items[:limit + 1])
+            has_more = len(changed) > limit
+
+            if has_more:
+                last_seq = changed[limit - 1].change_seq
+                changed = list(items.filter(change_seq__lte=last_seq))
+                deletions = deletions.filter(change_seq__lte=last_seq)
+
+            deleted = list(deletions.values_list('item_id', 'change_seq'))
+            cursor = max([since] + [item.change_seq for item in changed] + [seq for _, seq in deleted])
+
+            return {
+                'items': changed,
+                'deleted': [item_id for item_id, _ in deleted],
+                'cursor': cursor,
+                'has_more': has_more,
+            }
+        except Exception as e:
+            db_logger.exception(e)
+            raise
+
+    @staticmethod
+    def add_quantities(inventory, quantities):
+        """
+        Adds (or subtracts, if negative) quantities to several products of an
+        inventory with a constant number of queries: the existing items are
+        updated with a single UPDATE and the missing ones are created with a
+        single INSERT, so a movement costs the same regardless of its lines.
+        :param inventory: The ProductsInventory.
+        :param quantities: Dictionary mapping product ids to the quantity to add.
+        :return: Dictionary mapping each product id to an (old_quantity, new_quantity) tuple.
+        """
+        try:
+            if not quantities:
+                return {}
+
+            with transaction.atomic():
+                # The inventory is locked before the items, in the same order save() does.
+                version = ProductsInventory.bump_versions([inventory.pk])[inventory.pk]
+                old_quantities = dict(ProductInventoryItem.objects.select_for_update().filter(
+                    inventory=inventory, product_id__in=quantities.keys()).values_list('product_id', 'quantity'))
+
+                if old_quantities:
+                    ProductInventoryItem.objects.filter(
+                        inventory=inventory, product_id__in=old_quantities.keys()
+                    ).update(
+                        quantity=F('quantity') + Case(*[When(product_id=product_id, then=Value(quantities[product_id]))
+                                                        for product_id in old_quantities],
+                                                      output_field=IntegerField()),
+                        change_seq=version)
+
+                ProductInventoryItem.objects.bulk_create([
+                    ProductInventoryItem(inventory=inventory, product_id=product_id, quantity=quantity,
+                                         change_seq=version)
+                    for product_id, quantity in quantities.items() if product_id not in old_quantities
+                ])
+
+                product_inventory_items_bulk_updated.send(sender=ProductInventoryItem, inventory_ids={inventory.pk},
+                                                          product_ids=set(quantities.keys()))
+
+                return {product_id: (old_quantities.get(product_id, 0), old_quantities.get(product_id, 0) + quantity)
+                        for product_id, quantity in quantities.items()}
+        except Exception as e:
+            db_logger.exception(e)
+            raise
+
+    @staticmethod
+    def set_quantities(quantities):
+        """
+        Sets the quantity of several items with a single UPDATE inside a
+        transaction. Either every item is updated or none is.
+        :param quantities: Dictionary mapping item ids to their new quantity.
+        :return: The set of the ids that don't exist; nothing is updated if it's not empty.
+        """
+        try:
+            with transaction.atomic():
+                items = list(ProductInventoryItem.objects.filter(pk__in=quantities.keys()).values_list(
+                    'pk', 'inventory_id', 'product_id'))
+                missing_ids = set(quantities.keys()) - {pk for pk, _, _ in items}
+
+                if missing_ids or not items:
+                    return missing_ids
+
+                # The inventories are locked before the items, in the same order save() does.
+                versions = ProductsInventory.bump_versions({inventory_id for _, inventory_id, _ in items})
+
+                ProductInventoryItem.objects.filter(pk__in=quantities.keys()).update(
+                    quantity=Case(*[When(pk=pk, then=Value(quantity)) for pk, quantity in quantities.items()],
+                                  output_field=IntegerField()),
+                    change_seq=Case(*[When(inventory_id=inventory_id, then=Value(version))
+                                      for inventory_id, version in versions.items()],
+                                    output_field=IntegerField()))
+
+                product_inventory_items_bulk_updated.send(
+                    sender=ProductInventoryItem,
+                    inventory_ids={inventory_id for _, inventory_id, _ in items},
+                    product_ids={product_id for _, _, product_id in items})
+
+                return missing_ids
+        except Exception as e:
+            db_logger.exception(e)
+            raise
+
+
+class DeletedProductInventoryItem(models.Model):
+    """
+    Record of a deleted products inventory item, so the deletion is part of
+    the inventory's change feed. The inventory has no database constraint
+    because the records are written while a cascading deletion of the
+    inventory may be running.
+    """
+    item_id = models.PositiveIntegerField(verbose_name='elemento')
+    product_id = models.PositiveIntegerField(verbose_name='producto')
+    inventory = models.ForeignKey(ProductsInventory, on_delete=models.DO_NOTHING, db_constraint=False,
+                                  verbose_name='inventario')
+    change_seq = models.PositiveIntegerField(verbose_name='secuencia de cambio')
+
+    class Meta:
+        verbose_name = 'elemento de inventario de productos eliminado'
+        verbose_name_plural = 'elementos de inventario de productos eliminados'
+        index_together = [('inventory', 'change_seq')]
+
+    def __str__(self):
+        return str(self.item_id)
+
 
 class MaterialsInventory(models.Model):
     """An inventory of various materials."""
@@ -459,6 +689,7 @@ class ProductTransferShipment(models.Model):
     class Meta:
         verbose_name = 'envío de transferencia de productos'
         verbose_name_plural = 'envíos de transferencia de productos'
+        index_together = [('source_branch', 'status'), ('target_branch', 'status')]
 
     @staticmethod
     def get_pending_product_transfer_shipments_for_user(user: Employee):
@@ -487,29 +718,34 @@ class ProductTransferShipment(models.Model):
         try:
             with transaction.atomic():
                 self.status = ProductTransferShipment.STATUS_CONFIRMED
-            self.date_confirmed = timezone.now()
-            self.save()
+                self.date_confirmed = timezone.now()
+                self.save()
 
-            self.ajax_message_for_confirmation = "Se confirmó el envío {0}.\n".format(str(self))
+                self.ajax_message_for_confirmation = "Se confirmó el envío {0}.\n".format(str(self))
 
-            for transferred_product in self.transferredproduct_set.all():
-                inventory_item = self.source_branch.productsinventory.productinventoryitem_set.filter(
-                    product=transferred_product.product).first()
+                inventory = self.source_branch.productsinventory
+                transferred_products = list(self.transferredproduct_set.select_related('product'))
+                products = OrderedDict((transferred.product_id, transferred.product)
+                                       for transferred in transferred_products)
+                stocked_product_ids = set(inventory.productinventoryitem_set.filter(
+                    product_id__in=products.keys()).values_list('product_id', flat=True))
 
-                if not inventory_item:
-                    raise ValueError('{0} no existe en el inventario {1}.'.format(str(
-                        transferred_product.product),
-                        str(self.source_branch.productsinventory)))
+                for product_id, product in products.items():
+                    if product_id not in stocked_product_ids:
+                        raise ValueError('{0} no existe en el inventario {1}.'.format(str(product), str(inventory)))
 
-                old_quantity = inventory_item.quantity
+                quantities = defaultdict(int)
 
-                inventory_item.quantity -= transferred_product.quantity
-                inventory_item.save()
+                for transferred_product in transferred_products:
+                    quantities[transferred_product.product_id] -= transferred_product.quantity
 
-                new_quantity = inventory_item.quantity
+                changes = ProductInventoryItem.add_quantities(inventory, quantities)
+                # The reserved units became the shipped ones. Released after the inventory and its items are locked.
+                ProductReservation.release(self)
 
-                self.ajax_message_for_confirmation += "{0} [{1}] -> [{2}]\n".format(str(inventory_item.product),
-                                                                                    old_quantity, new_quantity)
+                for product_id, product in products.items():
+                    self.ajax_message_for_confirmation += "{0} [{1}] -> [{2}]\n".format(str(product),
+                                                                                        *changes[product_id])
         except Exception as e:
             db_logger.exception(e)
             raise
@@ -529,13 +765,16 @@ class ProductTransferShipment(models.Model):
 
     def cancel(self):
         """
-        Cancels this product transfer shipment. Sets its status to CANCELLED
-        and no products are removed from the inventory.
+        Cancels this product transfer shipment. Sets its status to CANCELLED,
+        no products are removed from the inventory and their reservations are
+        released.
         """
         try:
-            self.status = ProductRemoval.STATUS_CANCELLED
-            self.date_confirmed = timezone.now()
-            self.save()
+            with transaction.atomic():
+                self.status = ProductRemoval.STATUS_CANCELLED
+                self.date_confirmed = timezone.now()
+                self.save()
+                ProductReservation.release(self)
 
             self.ajax_message_for_cancellation = "Se canceló el envío {0}.".format(str(self))
         except Exception as e:
@@ -555,6 +794,18 @@ class ProductTransferShipment(models.Model):
 
         return {'url': url, 'model': model, 'pk': pk, 'action': action}
 
+    def reserve_products(self):
+        """
+        Reserves the units of the transferred products in the source branch's
+        inventory, replacing the shipment's previous reservations.
+        """
+        quantities = defaultdict(int)
+
+        for product_id, quantity in self.transferredproduct_set.values_list('product_id', 'quantity'):
+            quantities[product_id] += quantity
+
+        ProductReservation.reserve(self, self.source_branch.productsinventory, quantities)
+
     def get_total_confirmed_and_received_products_by_target_branch(self):
         """
         Returns the total amount of transferred products accepted by the target branch through
@@ -562,19 +813,17 @@ class ProductTransferShipment(models.Model):
         :return: An integer with the total amount.
         """
         return self.get_total_received_products_by_target_branch_with_filter(
-            {'status': ProductTransferShipment.STATUS_CONFIRMED})
+            Q(status=ProductTransferReception.STATUS_CONFIRMED))
 
     def get_total_received_products_by_target_branch_with_filter(self, query_filter):
         """
         Returns the total amount of transferred products accepted by the target branch through
-        one or several ProductTransferReceptions.
-        :param query_filter: The filter for the ProductTransferReceptions queryset.
+        one or several ProductTransferReceptions, with a single query regardless of their number.
+        :param query_filter: The filter (a Q object) for the ProductTransferReceptions queryset.
         :return: An integer with the total amount.
         """
-        return reduce(lambda a, b: a + b, [
-            reception.total_accepted_received_products
-            for reception in
-            self.producttransferreception_set.filter(query_filter)], 0)
+        return self.producttransferreception_set.filter(query_filter).aggregate(
+            sum=Sum('receivedproduct__accepted_quantity'))['sum'] or 0
 
 
 class TransferredProduct(models.Model):
@@ -641,6 +890,7 @@ class ProductTransferReception(models.Model):
     class Meta:
         verbose_name = 'recepción de transferencia de producto'
         verbose_name_plural = 'recepciones de transferencias de productos'
+        index_together = [('product_transfer_shipment', 'status')]
 
     @staticmethod
     def get_pending_product_transfer_receptions_for_user(user: Employee):
@@ -669,74 +919,64 @@ class ProductTransferReception(models.Model):
         products are added as ProductRemovals.
         """
         try:
-            product_removal = None
-
             with transaction.atomic():
                 self.status = ProductTransferReception.STATUS_CONFIRMED
-            self.date_confirmed = timezone.now()
-            self.save()
+                self.date_confirmed = timezone.now()
+                self.save()
 
-            self.ajax_message_for_confirmation = "Se confirmó la recepción {0}.\n".format(str(self))
+                self.ajax_message_for_confirmation = "Se confirmó la recepción {0}.\n".format(str(self))
 
-            for received_product in self.receivedproduct_set.all():
                 inventory = self.product_transfer_shipment.target_branch.productsinventory
-                inventory_item = inventory.productinventoryitem_set.filter(product=received_product.product).first()
-
-                if not inventory_item:
-                    inventory_item = ProductInventoryItem()
-                    inventory_item.product = received_product.product
-                    inventory_item.quantity = received_product.accepted_quantity
-                    old_quantity = 0
-                    new_quantity = inventory_item.quantity
-                else:
-                    old_quantity = inventory_item.quantity
-                    inventory_item.quantity += received_product.accepted_quantity
-                    new_quantity = inventory_item.quantity
-
-                inventory_item.save()
-
-                self.ajax_message_for_confirmation += "{0} [{1}] -> [{2}]\n".format(str(received_product.product),
-                                                                                    old_quantity, new_quantity)
-
-                if received_product.received_quantity != received_product.accepted_quantity:
-                    useless_product_quantity = received_product.received_quantity - received_product.accepted_quantity
-
-                    if product_removal is None:
-                        product_removal = ProductRemoval()
-                        product_removal.cause = ProductRemoval.CAUSE_TRANSFER
-                        product_removal.product_transfer_reception = self
-                        product_removal.inventory = inventory
-                        product_removal.removed_by_user = self.received_by_user
-                        product_removal.confirmed_by_user = self.confirmed_by_user
-                        product_removal.status = ProductRemoval.STATUS_CONFIRMED
-                        product_removal.save()
-
-                    removed_product = RemovedProduct()
-                    removed_product.product = received_product.product
-                    removed_product.quantity = useless_product_quantity
-                    removed_product.product_removal = product_removal
-                    removed_product.save()
-
-                    product_removal.removedproduct_set.add(removed_product)
-
-            if product_removal:
-                self.ajax_message_for_confirmation += "Se generó la merma {0}.\n".format(product_removal)
-
-                for removed_product in product_removal.removedproduct_set.all():
-                    self.ajax_message_for_confirmation += "{0}: {1}\n".format(str(removed_product),
-                                                                              removed_product.quantity)
-
-            total_products_transferred = self.product_transfer_shipment.total_transferred_products
-            total_products_received = \
-                self.product_transfer_shipment.get_total_confirmed_and_received_products_by_target_branch()
-
-            if total_products_received == total_products_transferred:
-                self.product_transfer_shipment.status = ProductTransferShipment.STATUS_RECEIVED
-                self.product_transfer_shipment.save()
-            elif total_products_received > total_products_transferred:
-                raise ValueError("El total de productos recibidos para esta transferencia de productos es {0}, cuando "
-                                 "la cantidad enviada es {1}.".format(total_products_received,
-                                                                      total_products_transferred))
+                received_products = list(self.receivedproduct_set.select_related('product'))
+                products = OrderedDict((received.product_id, received.product) for received in received_products)
+                quantities = defaultdict(int)
+
+                for received_product in received_products:
+                    quantities[received_product.product_id] += received_product.accepted_quantity
+
+                changes = ProductInventoryItem.add_quantities(inventory, quantities)
+
+                for product_id, product in products.items():
+                    self.ajax_message_for_confirmation += "{0} [{1}] -> [{2}]\n".format(str(product),
+                                                                                        *changes[product_id])
+
+                rejected_products = [received for received in received_products
+                                     if received.received_quantity != received.accepted_quantity]
+
+                if rejected_products:
+                    product_removal = ProductRemoval()
+                    product_removal.cause = ProductRemoval.CAUSE_TRANSFER
+                    product_removal.product_transfer_reception = self
+                    product_removal.inventory = inventory
+                    product_removal.removed_by_user = self.received_by_user
+                    product_removal.confirmed_by_user = self.confirmed_by_user
+                    product_removal.status = ProductRemoval.STATUS_CONFIRMED
+                    product_removal.save()
+
+                    RemovedProduct.objects.bulk_create([
+                        RemovedProduct(product=received.product, product_removal=product_removal,
+                                       quantity=received.received_quantity - received.accepted_quantity)
+                        for received in rejected_products
+                    ])
+
+                    self.ajax_message_for_confirmation += "Se generó la merma {0}.\n".format(product_removal)
+
+                    for received_product in rejected_products:
+                        self.ajax_message_for_confirmation += "{0}: {1}\n".format(
+                            str(received_product.product),
+                            received_product.received_quantity - received_product.accepted_quantity)
+
+                total_products_transferred = self.product_transfer_shipment.total_transferred_products
+                total_products_received = \
+                    self.product_transfer_shipment.get_total_confirmed_and_received_products_by_target_branch()
+
+                if total_products_received == total_products_transferred:
+                    self.product_transfer_shipment.status = ProductTransferShipment.STATUS_RECEIVED
+                    self.product_transfer_shipment.save()
+                elif total_products_received > total_products_transferred:
+                    raise ValueError("El total de productos recibidos para esta transferencia de productos es {0}, "
+                                     "cuando la cantidad enviada es {1}.".format(total_products_received,
+                                                                                 total_products_transferred))
         except Exception as e:
             db_logger.exception(e)
             raise
@@ -887,6 +1127,8 @@ class ReturnedProduct(models.Model):
             })
 
     def save(self, **kwargs):
+        from utils.versioning import movement_saves
+
         try:
             if self.pk is not None:
                 super(ReturnedProduct, self).save(**kwargs)
@@ -905,7 +1147,7 @@ class ReturnedProduct(models.Model):
 
             inventory_item.quantity += self.quantity
 
-            with transaction.atomic():
+            with transaction.atomic(), movement_saves():
                 inventory_item.save()
                 super(ReturnedProduct, self).save(**kwargs)
         except Exception as e:
@@ -962,6 +1204,7 @@ class PurchaseOrder(models.Model):
     class Meta:
         verbose_name = 'orden de compra'
         verbose_name_plural = 'órdenes de compra'
+        index_together = [('branch_office', 'status')]
 
     def __init__(self, *args, **kwargs):
         self.ajax_message_for_confirmation = ""
@@ -985,14 +1228,12 @@ class PurchaseOrder(models.Model):
     def get_total_entered_products_with_filter(self, query_filter):
         """
         Returns the total amount of entered products received through
-        one or several ProductEntries.
-        :param query_filter: The filter for the ProductEntry queryset.
+        one or several ProductEntries, with a single query regardless of their number.
+        :param query_filter: The filter (a Q object) for the ProductEntry queryset.
         :return: An integer with the total amount.
         """
-        return reduce(lambda a, b: a + b, [
-            entry.total_entered_products
-            for entry in
-            self.productentry_set.filter(query_filter)], 0)
+        return self.productentry_set.filter(query_filter).aggregate(
+            sum=Sum('enteredproduct__quantity'))['sum'] or 0
 
     def get_absolute_url(self):
         """
@@ -1113,6 +1354,7 @@ class ProductEntry(models.Model):
     class Meta:
         verbose_name = 'ingreso de producto'
         verbose_name_plural = 'ingresos de producto'
+        index_together = [('inventory', 'status'), ('purchase_order', 'status')]
 
     def __init__(self, *args, **kwargs):
         self.ajax_message_for_confirmation = ""
@@ -1136,7 +1378,7 @@ class ProductEntry(models.Model):
     def confirm(self):
         """
         Confirms this product entry. Sets the status as CONFIRMED and
-        removes and adds the products to the inventory.
+        adds the entered products to the inventory.
         """
         try:
             with transaction.atomic():
@@ -1147,26 +1389,18 @@ class ProductEntry(models.Model):
                 self.ajax_message_for_confirmation = "Se confirmó un ingreso para la orden {0}.\n".format(
                     str(self.purchase_order))
 
-                for entered_product in self.enteredproduct_set.all():
-                    inventory_item = self.inventory.productinventoryitem_set.filter(
-                        product=entered_product.product).first()
-
-                    if inventory_item is None:
-                        inventory_item = ProductInventoryItem()
-                        inventory_item.product = entered_product.product
-                        inventory_item.quantity = entered_product.quantity
+                entered_products = list(self.enteredproduct_set.select_related('product'))
+                products = OrderedDict((entered.product_id, entered.product) for entered in entered_products)
+                quantities = defaultdict(int)
 
-                        old_quantity = 0
-                    else:
-                        old_quantity = inventory_item.quantity
-                        inventory_item.quantity += entered_product.quantity
+                for entered_product in entered_products:
+                    quantities[entered_product.product_id] += entered_product.quantity
 
-                    new_quantity = inventory_item.quantity
+                changes = ProductInventoryItem.add_quantities(self.inventory, quantities)
 
-                    self.ajax_message_for_confirmation += "{0} [{1}] -> [{2}]\n".format(str(entered_product.product),
-                                                                                        old_quantity, new_quantity)
-
-                    inventory_item.save()
+                for product_id, product in products.items():
+                    self.ajax_message_for_confirmation += "{0} [{1}] -> [{2}]\n".format(str(product),
+                                                                                        *changes[product_id])
 
                 if self.purchase_order.total_entered_products >= self.purchase_order.total_purchased_products:
                     self.purchase_order.status = PurchaseOrder.STATUS_COMPLETE
@@ -1294,6 +1528,7 @@ class ProductRemoval(models.Model):
     class Meta:
         verbose_name = 'merma de producto'
         verbose_name_plural = 'mermas de producto'
+        index_together = [('inventory', 'status')]
 
     def __init__(self, *args, **kwargs):
         self.ajax_message_for_confirmation = ""
@@ -1321,6 +1556,18 @@ class ProductRemoval(models.Model):
         """
         return reverse('admin:inventories_productremoval_change', args=[str(self.id)])
 
+    def reserve_products(self):
+        """
+        Reserves the units of the removed products in the inventory, replacing
+        the removal's previous reservations.
+        """
+        quantities = defaultdict(int)
+
+        for product_id, quantity in self.removedproduct_set.values_list('product_id', 'quantity'):
+            quantities[product_id] += quantity
+
+        ProductReservation.reserve(self, self.inventory, quantities)
+
     def confirm(self):
         """
         Confirms this product removal. It sets its status to CONFIRMED
@@ -1329,84 +1576,419 @@ class ProductRemoval(models.Model):
         try:
             with transaction.atomic():
                 self.status = ProductRemoval.STATUS_CONFIRMED
-            self.date_confirmed = timezone.now()
-            self.save()
+                self.date_confirmed = timezone.now()
+                self.save()
+
+                self.ajax_message_for_confirmation = "Se confirmó la merma {0}.\n".format(str(self))
+
+                removed_products = list(self.removedproduct_set.select_related('product'))
+                stocked_product_ids = set(self.inventory.productinventoryitem_set.filter(
+                    product_id__in=[removed.product_id for removed in removed_products]).values_list(
+                    'product_id', flat=True))
+                products = OrderedDict((removed.product_id, removed.product) for removed in removed_products
+                                       if removed.product_id in stocked_product_ids)
+                quantities = defaultdict(int)
+
+                for removed_product in removed_products:
+                    if removed_product.product_id in stocked_product_ids:
+                        quantities[removed_product.product_id] -= removed_product.quantity
+
+                changes = ProductInventoryItem.add_quantities(self.inventory, quantities)
+                # The reserved units became the removed ones. Released after the inventory and its items are locked.
+                ProductReservation.release(self)
+
+                for product_id, product in products.items():
+                    self.ajax_message_for_confirmation += "{0} [{1}] -> [{2}]\n".format(str(product),
+                                                                                        *changes[product_id])
+        except Exception as e:
+            db_logger.exception(e)
+            raise
+
+    def get_confirm_params_for_ajax_request(self):
+        """
+        Returns a dictionary with the parameters necessary for the 'confirmOrCancelInventoryMovement'
+        AJAX call.
+        :return: A dictionary with the parameters.
+        """
+        url = reverse('productmovconfirmorcancel')
+        model = self.__class__.__name__
+        pk = self.pk
+        action = 'confirm'
+
+        return {'url': url, 'model': model, 'pk': pk, 'action': action}
+
+    def cancel(self):
+        """
+        Cancels this product removal. Sets its status to CANCELLED and releases
+        its reservations.
+        """
+        try:
+            with transaction.atomic():
+                self.status = ProductRemoval.STATUS_CANCELLED
+                self.date_confirmed = timezone.now()
+                self.save()
+                ProductReservation.release(self)
+        except Exception as e:
+            db_logger.exception(e)
+            raise
+
+    def get_cancel_params_for_ajax_request(self):
+        """
+        Returns a dictionary with the parameters necessary for the 'confirmOrCancelInventoryMovement'
+        AJAX call.
+        :return: A dictionary with the parameters.
+        """
+        url = reverse('productmovconfirmorcancel')
+        model = self.__class__.__name__
+        pk = self.pk
+        action = 'cancel'
+
+        return {'url': url, 'model': model, 'pk': pk, 'action': action}
+
+
+class RemovedProduct(models.Model):
+    """
+    The quantity of a Product that has been removed from an inventory
+    through a Product Removal.
+    """
+
+    product = models.ForeignKey(Product, on_delete=models.PROTECT, verbose_name='producto')
+    quantity = models.PositiveSmallIntegerField(default=1, verbose_name='cantidad')
+    product_removal = models.ForeignKey(ProductRemoval, on_delete=models.CASCADE, verbose_name='salida')
+
+    class Meta:
+        verbose_name = 'producto retirado'
+        verbose_name_plural = 'productos retirados'
+
+    def __str__(self):
+        return str(self.product)
+
+
+class ProductReservation(models.Model):
+    """
+    Units of an inventory item promised to a pending shipment or removal.
+    They are added to the item's reserved units, so the available units
+    (quantity - reserved) are known without summing the reservations, and
+    the units can't be promised twice. Confirming the movement turns its
+    reservations into the inventory movement; cancelling or deleting it
+    releases them.
+    """
+    item = models.ForeignKey(ProductInventoryItem, on_delete=models.CASCADE, verbose_name='elemento de inventario')
+    quantity = models.PositiveIntegerField(verbose_name='cantidad')
+    product_transfer_shipment = models.ForeignKey(ProductTransferShipment, on_delete=models.CASCADE, null=True,
+                                                  blank=True, verbose_name='envío de transferencia de productos')
+    product_removal = models.ForeignKey(ProductRemoval, on_delete=models.CASCADE, null=True, blank=True,
+                                        verbose_name='merma de producto')
+    date_reserved = models.DateTimeField(default=timezone.now, verbose_name='fecha de reservación')
 
-            self.ajax_message_for_confirmation = "Se confirmó la merma {0}.\n".format(str(self))
+    class Meta:
+        verbose_name = 'reservación de producto'
+        verbose_name_plural = 'reservaciones de producto'
+
+    def __str__(self):
+        return "{0}: {1}".format(self.item.product, self.quantity)
+
+    @staticmethod
+    def _get_movement_filter(movement):
+        if isinstance(movement, ProductTransferShipment):
+            return {'product_transfer_shipment': movement}
 
-            for removed_product in self.removedproduct_set.all():
-                inventory_item = self.inventory.productinventoryitem_set.filter(product=removed_product.product)
+        return {'product_removal': movement}
 
-                if inventory_item:
-                    old_quantity = inventory_item.quantity
+    @staticmethod
+    def get_available_quantities(inventory, product_ids, movement=None):
+        """
+        Returns the available units of several products of an inventory with
+        a single query.
+        :param inventory: The ProductsInventory.
+        :param product_ids: The ids of the products.
+        :param movement: The ProductTransferShipment or ProductRemoval asking,
+        whose own reservations are counted as available.
+        :return: Dictionary mapping the id of each stocked product to its
+        available units; the products the inventory doesn't hold are missing.
+        """
+        try:
+            items = ProductInventoryItem.objects.filter(inventory=inventory, product_id__in=product_ids)
 
-                    inventory_item.quantity -= removed_product.quantity
-                    inventory_item.save()
+            if movement is None or movement.pk is None:
+                return {product_id: quantity - reserved
+                        for product_id, quantity, reserved in items.values_list('product_id', 'quantity', 'reserved')}
 
-                    new_quantity = inventory_item.quantity
+            own_reservation = {'productreservation__' + field: value
+                               for field, value in ProductReservation._get_movement_filter(movement).items()}
+            items = items.annotate(own_reserved=Sum(Case(When(then=F('productreservation__quantity'),
+                                                              **own_reservation),
+                                                         default=Value(0), output_field=IntegerField())))
 
-                    self.ajax_message_for_confirmation += "{0} [{1}] -> [{2}]\n".format(str(removed_product.product),
-                                                                                        old_quantity,
-                                                                                        new_quantity)
+            return {product_id: quantity - reserved + own_reserved for product_id, quantity, reserved, own_reserved
+                    in items.values_list('product_id', 'quantity', 'reserved', 'own_reserved')}
         except Exception as e:
             db_logger.exception(e)
             raise
 
+    @staticmethod
+    def reserve(movement, inventory, quantities):
+        """
+        Replaces the reservations of a pending movement. The items are locked,
+        checked and updated with a constant number of queries.
+        :param movement: The ProductTransferShipment or ProductRemoval.
+        :param inventory: The ProductsInventory the units are taken from.
+        :param quantities: Dictionary mapping product ids to the units to reserve.
+        :raise ValueError: If a product isn't stocked or hasn't enough available
+        units; nothing is reserved then.
+        """
+        try:
+            with transaction.atomic():
+                ProductReservation.release(movement)
+
+                if not quantities:
+                    return
+
+                items = {item.product_id: item for item in ProductInventoryItem.objects.select_for_update().filter(
+                    inventory=inventory, product_id__in=quantities.keys()).select_related('product')}
+                shortages = []
+
+                for product_id, quantity in quantities.items():
+                    item = items.get(product_id)
+
+                    if item is None:
+                        shortages.append('{0} no cuenta con el producto {1}.'.format(
+                            str(inventory), str(Product.objects.get(pk=product_id))))
+                    elif item.available < quantity:
+                        shortages.append('{0} sólo cuenta con {1} unidades disponibles de {2}.'.format(
+                            str(inventory), max(item.available, 0), str(item.product)))
+
+                if shortages:
+                    raise ValueError(" ".join(shortages))
+
+                ProductReservation.objects.bulk_create([
+                    ProductReservation(item=items[product_id], quantity=quantity,
+                                       **ProductReservation._get_movement_filter(movement))
+                    for product_id, quantity in quantities.items()
+                ])
+                ProductInventoryItem.objects.filter(pk__in=[item.pk for item in items.values()]).update(
+                    reserved=F('reserved') + Case(*[When(pk=items[product_id].pk, then=Value(quantity))
+                                                    for product_id, quantity in quantities.items()],
+                                                  output_field=IntegerField()))
+        except Exception as e:
+            db_logger.exception(e)
+            raise
 
-def get_confirm_params_for_ajax_request(self):
+    @staticmethod
+    def release(movement):
+        """
+        Deletes the reservations of a movement and gives their units back to
+        the available ones.
+        :param movement: The ProductTransferShipment or ProductRemoval.
+        :return: Dictionary mapping the ids of the items to the released units.
+        """
+        try:
+            with transaction.atomic():
+                reservations = ProductReservation.objects.select_for_update().filter(
+                    **ProductReservation._get_movement_filter(movement))
+                released = defaultdict(int)
+
+                for item_id, quantity in reservations.values_list('item_id', 'quantity'):
+                    released[item_id] += quantity
+
+                if released:
+                    ProductInventoryItem.objects.filter(pk__in=released.keys()).update(
+                        reserved=F('reserved') - Case(*[When(pk=item_id, then=Value(quantity))
+                                                        for item_id, quantity in released.items()],
+                                                      output_field=IntegerField()))
+                    reservations.delete()
+
+                return dict(released)
+        except Exception as e:
+            db_logger.exception(e)
+            raise
+
+
+# History of the closed movements. The archive_movements command moves the closed movements older than
+# MOVEMENT_ARCHIVE_HORIZON_DAYS (with their lines) from the workflow tables to <table>_archive tables with the same
+# columns, so the workflows and the changelists only scan the recent movements. These unmanaged models read the
+# <table>_history views, the union of both tables, so the history admin and the reports see every movement. The
+# columns of an archived model's table are changed with utils.migrations.alter_archived_table, which changes its archive
+# table and view too.
+
+class ProductEntryHistory(models.Model):
     """
-    Returns a dictionary with the parameters necessary for the 'confirmOrCancelInventoryMovement'
-    AJAX call.
-    :return: A dictionary with the parameters.
+    A product entry, recent or archived.
     """
-    url = reverse('productmovconfirmorcancel')
-    model = self.__class__.__name__
-    pk = self.pk
-    action = 'confirm'
+    purchase_order = models.ForeignKey(PurchaseOrder, on_delete=models.PROTECT, related_name='+',
+                                       verbose_name='orden de compra')
+    inventory = models.ForeignKey(ProductsInventory, on_delete=models.PROTECT, related_name='+',
+                                  verbose_name='inventario')
+    status = models.PositiveSmallIntegerField(choices=ProductEntry.STATUS_TYPES, verbose_name='estado')
+    entered_by_user = models.ForeignKey(Employee, on_delete=models.PROTECT, related_name='+',
+                                        verbose_name='Ingresado por')
+    confirmed_by_user = models.ForeignKey(Employee, on_delete=models.PROTECT, null=True, related_name='+',
+                                          verbose_name='confirmado por')
+    date_entered = models.DateTimeField(verbose_name='fecha de envío')
+    date_confirmed = models.DateTimeField(null=True, verbose_name='fecha de confirmación')
 
-    return {'url': url, 'model': model, 'pk': pk, 'action': action}
+    class Meta:
+        managed = False
+        db_table = 'inventories_productentry_history'
+        verbose_name = 'histórico de ingreso de productos'
+        verbose_name_plural = 'histórico de ingresos de productos'
 
+    def __str__(self):
+        return "Ingreso para orden de compra {0}".format(str(self.purchase_order))
 
-def cancel(self):
+
+class EnteredProductHistory(models.Model):
     """
-    Cancels this product removal. Sets its status to CANCELLED.
+    A line of a product entry, recent or archived.
     """
-    try:
-        self.status = ProductRemoval.STATUS_CANCELLED
-        self.date_confirmed = timezone.now()
-        self.save()
-    except Exception as e:
-        db_logger.exception(e)
-        raise
+    product = models.ForeignKey(Product, on_delete=models.PROTECT, related_name='+', verbose_name='producto')
+    quantity = models.PositiveSmallIntegerField(verbose_name='cantidad')
+    product_entry = models.ForeignKey(ProductEntryHistory, on_delete=models.DO_NOTHING, verbose_name='ingreso')
+
+    class Meta:
+        managed = False
+        db_table = 'inventories_enteredproduct_history'
+        verbose_name = 'producto ingresado'
+        verbose_name_plural = 'productos ingresados'
+
+    def __str__(self):
+        return str(self.product)
 
 
-def get_cancel_params_for_ajax_request(self):
+class ProductRemovalHistory(models.Model):
     """
-    Returns a dictionary with the parameters necessary for the 'confirmOrCancelInventoryMovement'
-    AJAX call.
-    :return: A dictionary with the parameters.
+    A product removal, recent or archived.
     """
-    url = reverse('productmovconfirmorcancel')
-    model = self.__class__.__name__
-    pk = self.pk
-    action = 'cancel'
+    cause = models.PositiveSmallIntegerField(choices=ProductRemoval.CAUSE_TYPES, verbose_name='causa')
+    provider = models.ForeignKey(Provider, on_delete=models.PROTECT, null=True, related_name='+',
+                                 verbose_name='proveedor')
+    product_transfer_reception = models.ForeignKey('ProductTransferReceptionHistory', on_delete=models.DO_NOTHING,
+                                                   null=True, related_name='+',
+                                                   verbose_name='recepción de transferencia de producto')
+    inventory = models.ForeignKey(ProductsInventory, on_delete=models.PROTECT, related_name='+',
+                                  verbose_name='inventario')
+    status = models.PositiveSmallIntegerField(choices=ProductRemoval.STATUS_TYPES, verbose_name='estado')
+    removed_by_user = models.ForeignKey(Employee, on_delete=models.PROTECT, related_name='+',
+                                        verbose_name='Creada por')
+    confirmed_by_user = models.ForeignKey(Employee, on_delete=models.PROTECT, null=True, related_name='+',
+                                          verbose_name='confirmado por')
+    date_removed = models.DateTimeField(verbose_name='fecha')
+    date_confirmed = models.DateTimeField(null=True, verbose_name='fecha de confirmación')
 
-    return {'url': url, 'model': model, 'pk': pk, 'action': action}
+    class Meta:
+        managed = False
+        db_table = 'inventories_productremoval_history'
+        verbose_name = 'histórico de salida de productos'
+        verbose_name_plural = 'histórico de salidas de productos'
 
+    def __str__(self):
+        return "M{0}".format(str(self.pk).zfill(9))
 
-class RemovedProduct(models.Model):
+
+class RemovedProductHistory(models.Model):
     """
-    The quantity of a Product that has been removed from an inventory
-    through a Product Removal.
+    A line of a product removal, recent or archived.
     """
+    product = models.ForeignKey(Product, on_delete=models.PROTECT, related_name='+', verbose_name='producto')
+    quantity = models.PositiveSmallIntegerField(verbose_name='cantidad')
+    product_removal = models.ForeignKey(ProductRemovalHistory, on_delete=models.DO_NOTHING, verbose_name='salida')
 
-    product = models.ForeignKey(Product, on_delete=models.PROTECT, verbose_name='producto')
-    quantity = models.PositiveSmallIntegerField(default=1, verbose_name='cantidad')
-    product_removal = models.ForeignKey(ProductRemoval, on_delete=models.CASCADE, verbose_name='salida')
+    class Meta:
+        managed = False
+        db_table = 'inventories_removedproduct_history'
+        verbose_name = 'producto de la salida'
+        verbose_name_plural = 'productos de la salida'
+
+    def __str__(self):
+        return str(self.product)
+
+
+class ProductTransferShipmentHistory(models.Model):
+    """
+    A product transfer shipment, recent or archived.
+    """
+    source_branch = models.ForeignKey(BranchOffice, on_delete=models.DO_NOTHING, related_name='+',
+                                      verbose_name='sucursal de origen')
+    target_branch = models.ForeignKey(BranchOffice, on_delete=models.DO_NOTHING, related_name='+',
+                                      verbose_name='sucursal de destino')
+    shipped_by_user = models.ForeignKey(Employee, on_delete=models.PROTECT, related_name='+',
+                                        verbose_name='enviado por')
+    confirmed_by_user = models.ForeignKey(Employee, on_delete=models.PROTECT, null=True, related_name='+',
+                                          verbose_name='confirmado por')
+    date_shipped = models.DateTimeField(verbose_name='fecha de envío')
+    date_confirmed = models.DateTimeField(null=True, verbose_name='fecha de confirmación')
+    status = models.PositiveSmallIntegerField(choices=ProductTransferShipment.STATUS_TYPES, verbose_name='estado')
 
     class Meta:
-        verbose_name = 'producto retirado'
-        verbose_name_plural = 'productos retirados'
+        managed = False
+        db_table = 'inventories_producttransfershipment_history'
+        verbose_name = 'histórico de transferencia de productos'
+        verbose_name_plural = 'histórico de transferencias de productos'
+
+    def __str__(self):
+        return "E{0}".format(str(self.id).zfill(9))
+
+
+class TransferredProductHistory(models.Model):
+    """
+    A line of a product transfer shipment, recent or archived.
+    """
+    product = models.ForeignKey(Product, on_delete=models.PROTECT, related_name='+', verbose_name='producto')
+    quantity = models.PositiveSmallIntegerField(verbose_name='cantidad')
+    product_transfer_shipment = models.ForeignKey(ProductTransferShipmentHistory, on_delete=models.DO_NOTHING,
+                                                  verbose_name='envío')
+
+    class Meta:
+        managed = False
+        db_table = 'inventories_transferredproduct_history'
+        verbose_name = 'producto transferido'
+        verbose_name_plural = 'productos transferidos'
+
+    def __str__(self):
+        return str(self.product)
+
+
+class ProductTransferReceptionHistory(models.Model):
+    """
+    A product transfer reception, recent or archived.
+    """
+    product_transfer_shipment = models.ForeignKey(ProductTransferShipmentHistory, on_delete=models.DO_NOTHING,
+                                                  verbose_name='transferencia')
+    received_by_user = models.ForeignKey(Employee, on_delete=models.PROTECT, related_name='+',
+                                         verbose_name='recibido por')
+    confirmed_by_user = models.ForeignKey(Employee, on_delete=models.PROTECT, null=True, related_name='+',
+                                          verbose_name='confirmado por')
+    date_received = models.DateTimeField(verbose_name='fecha de recepción')
+    date_confirmed = models.DateTimeField(null=True, verbose_name='fecha de confirmación')
+    status = models.PositiveSmallIntegerField(choices=ProductTransferReception.STATUS_TYPES, verbose_name='estado')
+
+    class Meta:
+        managed = False
+        db_table = 'inventories_producttransferreception_history'
+        verbose_name = 'histórico de recepción de transferencia'
+        verbose_name_plural = 'histórico de recepciones de transferencias'
+
+    def __str__(self):
+        return "R{0}".format(str(self.id).zfill(9))
+
+
+class ReceivedProductHistory(models.Model):
+    """
+    A line of a product transfer reception, recent or archived.
+    """
+    product = models.ForeignKey(Product, on_delete=models.PROTECT, related_name='+', verbose_name='producto')
+    received_quantity = models.PositiveSmallIntegerField(verbose_name='cantidad recibida')
+    accepted_quantity = models.PositiveSmallIntegerField(verbose_name='cantidad aceptada')
+    product_transfer_reception = models.ForeignKey(ProductTransferReceptionHistory, on_delete=models.DO_NOTHING,
+                                                   verbose_name='recepción')
+    rejection_reason = models.PositiveSmallIntegerField(null=True, choices=ReceivedProduct.REJECTION_REASONS,
+                                                        verbose_name='motivo de rechazo')
+
+    class Meta:
+        managed = False
+        db_table = 'inventories_receivedproduct_history'
+        verbose_name = 'producto recibido'
+        verbose_name_plural = 'productos recibidos'
 
     def __str__(self):
         return str(self.product)
@@ -0,0 +1,107 @@
+from django.db.models import F
+from django.db.models.signals import post_save, post_delete, pre_delete
+from django.dispatch import receiver
+
+from inventories.catalog import get_product_catalog, ProductCatalog
+from inventories.models import Product, ProductsInventory, MaterialsInventory, ConsumablesInventory, \
+    DurableGoodsInventory, ProductInventoryItem, DeletedProductInventoryItem, \
+    PurchaseOrder, PurchasedProduct, ProductEntry, EnteredProduct, ProductRemoval, RemovedProduct, \
+    ProductTransferShipment, TransferredProduct, ProductTransferReception, ReceivedProduct, ProductReservation
+from utils.cache import pending_items_cache, solver_results_cache, inventory_pages_cache, user_contexts_cache, \
+    product_catalog_cache
+
+PENDING_ITEMS_MODELS = {PurchaseOrder, PurchasedProduct, ProductEntry, EnteredProduct, ProductRemoval, RemovedProduct,
+                        ProductTransferShipment, TransferredProduct, ProductTransferReception, ReceivedProduct,
+                        ProductsInventory, Product}
+
+
+@receiver(post_delete, sender=ProductInventoryItem, dispatch_uid='bump_inventory_version_on_item_delete')
+def bump_inventory_version_on_item_delete(sender, instance, **kwargs):
+    """
+    Bumps the version of the inventory that held the deleted item and records
+    the deletion in the inventory's change feed.
+    """
+    versions = ProductsInventory.bump_versions([instance.inventory_id])
+
+    if instance.inventory_id in versions:
+        DeletedProductInventoryItem.objects.create(item_id=instance.pk, product_id=instance.product_id,
+                                                   inventory_id=instance.inventory_id,
+                                                   change_seq=versions[instance.inventory_id])
+
+
+@receiver(post_save, sender=Product, dispatch_uid='bump_inventory_versions_on_product_change')
+def bump_inventory_versions_on_product_change(sender, instance, created, **kwargs):
+    """
+    The inventory items are listed along their product's data, so the
+    inventories stocking a changed product are bumped.
+    """
+    if not created:
+        ProductsInventory.objects.filter(productinventoryitem__product=instance).update(version=F('version') + 1)
+
+
+@receiver(post_save, sender=Product, dispatch_uid='invalidate_product_catalog_on_product_change')
+def invalidate_product_catalog_on_product_change(sender, instance, created, **kwargs):
+    """
+    Makes every process rebuild its product catalog (see inventories.catalog)
+    when a product is created or its catalog data changed. The products saved
+    without changes to it (e.g. the scraps the sales save again) don't.
+    """
+    if created or get_product_catalog().get(instance.pk) != ProductCatalog.to_catalog_product(instance):
+        product_catalog_cache.invalidate()
+
+
+@receiver(post_delete, sender=Product, dispatch_uid='invalidate_product_catalog_on_product_delete')
+def invalidate_product_catalog_on_product_delete(sender, **kwargs):
+    """
+    Makes every process rebuild its product catalog (see inventories.catalog).
+    """
+    product_catalog_cache.invalidate()
+
+
+@receiver([post_save, post_delete], dispatch_uid='invalidate_pending_items_on_movement_change')
+def invalidate_pending_items_on_movement_change(sender, **kwargs):
+    """
+    The pending items of the admin index list the inventory movements, their
+    lines and products, and depend on who supervises each inventory, so any
+    change to them invalidates the pending items of every user.
+    """
+    if sender in PENDING_ITEMS_MODELS:
+        pending_items_cache.invalidate()
+
+
+@receiver([post_save, post_delete], sender=ProductsInventory,
+          dispatch_uid='invalidate_branch_caches_on_inventory_change')
+def invalidate_branch_caches_on_inventory_change(sender, instance, **kwargs):
+    """
+    The solver results and inventory pages of a branch office are keyed by
+    its inventory's version, which changes with the stock; the rest of the
+    inventory's data is covered by invalidating the branch.
+    """
+    solver_results_cache.invalidate(branch=instance.branch_id)
+    inventory_pages_cache.invalidate(branch=instance.branch_id)
+
+
+@receiver(pre_delete, sender=ProductTransferShipment, dispatch_uid='release_reservations_on_shipment_delete')
+@receiver(pre_delete, sender=ProductRemoval, dispatch_uid='release_reservations_on_removal_delete')
+def release_reservations_on_movement_delete(sender, instance, **kwargs):
+    """
+    Gives the units reserved by a deleted pending movement back to the
+    available ones before its reservations are deleted with it.
+    """
+    ProductReservation.release(instance)
+
+
+@receiver([post_save, post_delete], sender=ProductsInventory,
+          dispatch_uid='invalidate_user_contexts_on_products_inventory_change')
+@receiver([post_save, post_delete], sender=MaterialsInventory,
+          dispatch_uid='invalidate_user_contexts_on_materials_inventory_change')
+@receiver([post_save, post_delete], sender=ConsumablesInventory,
+          dispatch_uid='invalidate_user_contexts_on_consumables_inventory_change')
+@receiver([post_save, post_delete], sender=DurableGoodsInventory,
+          dispatch_uid='invalidate_user_contexts_on_durable_goods_inventory_change')
+def invalidate_user_contexts_on_inventory_change(sender, **kwargs):
+    """
+    The user contexts hold the inventories of the branch offices and who
+    supervises them (see back_office.user_context).
+    """
+    user_contexts_cache.invalidate()
@@ -1,13 +1,33 @@
 from rest_framework import serializers
 
 from inventories.models import ProductInventoryItem
+from utils.api import DynamicFieldsModelSerializer
 
 
-class ProductInventoryItemSerializer(serializers.ModelSerializer):
+class ProductInventoryItemSerializer(DynamicFieldsModelSerializer):
     """
     Class that serializes a product inventory item.
     """
+    sku = serializers.CharField(source='product.sku', read_only=True)
 
     class Meta:
         model = ProductInventoryItem
-        fields = ('product', 'quantity', 'inventory',)
+        fields = ('id', 'product', 'sku', 'quantity', 'inventory', 'change_seq',)
+
+
+class ProductInventoryItemQuantitySerializer(serializers.Serializer):
+    """
+    Class that validates a row of a bulk quantity update.
+    """
+    id = serializers.IntegerField()
+    quantity = serializers.IntegerField(min_value=0)
+
+
+class ProductInventoryItemChangeSerializer(serializers.ModelSerializer):
+    """
+    Class that serializes a product inventory item for the change feed.
+    """
+
+    class Meta:
+        model = ProductInventoryItem
+        fields = ('id', 'product', 'quantity', 'change_seq',)
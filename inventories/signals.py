@@ -0,0 +1,5 @@
+from django.dispatch import Signal
+
+# Sent after ProductInventoryItem quantities are changed with a single UPDATE,
+# which bypasses the post_save signal of every item.
+product_inventory_items_bulk_updated = Signal(providing_args=['inventory_ids', 'product_ids'])
@@ -1,18 +1,11 @@
 import logging
 from decimal import Decimal
 
-from django.template.loader_tags import register
-
 from inventories.models import ProductInventoryItem
 
 db_logger = logging.getLogger('db')
 
 
-@register.filter
-def subtract(value, arg):
-    return value - arg
-
-
 class Surface:
     """
     Represents the surface of an object.
@@ -93,7 +86,7 @@ class ProductCutOptimizer:
                 product__line__in=self.product_lines,
                 quantity__gte=1,
                 inventory=self.inventory
-            )
+            ).select_related('product')
 
             if self.available_inventory_items.count() == 0:
                 return [], self.quantity
@@ -12,7 +12,7 @@ $(document).ready(function () {
     var inputArray = $("input")
 
     inputArray.on("change", function () {
-        $(this).css("border", "2px solid red");
+        $(this).css("border", "2px solid red").addClass("modified");
     });
 
     var csrftoken = getCookie('csrftoken');
@@ -45,17 +45,54 @@ $(document).ready(function () {
                     alert("No se pudo actualizar el inventario. Error: " + errorThrown);
                 },
                 success: function () {
-                    input.css("border", "2px solid green");
-                    setTimeout(function () {
-                        input.css("border", "");
-                    }, 200);
+                    markAsSaved(input);
                 }
             });
 
         }
-    })
+    });
+
+    $("#saveAllButton").on("click", function () {
+        var modifiedInputs = table.$("input.modified");
+        var rows = [];
+
+        modifiedInputs.each(function () {
+            var input = $(this);
+
+            rows.push({
+                id: parseInt(input.parent().siblings("input[name=item_id]").val()),
+                quantity: parseInt(input.val())
+            });
+        });
+
+        if (rows.length === 0) {
+            return;
+        }
+
+        $.ajax({
+            url: PRODUCT_INV_ITEM_API_URL + "bulk/",
+            method: "PATCH",
+            contentType: "application/json",
+            data: JSON.stringify(rows),
+            error: function (jqXHR, textStatus, errorThrown) {
+                alert("No se pudo actualizar el inventario. Error: " + errorThrown);
+            },
+            success: function () {
+                modifiedInputs.each(function () {
+                    markAsSaved($(this));
+                });
+            }
+        });
+    });
 });
 
+function markAsSaved(input) {
+    input.removeClass("modified").css("border", "2px solid green");
+    setTimeout(function () {
+        input.css("border", "");
+    }, 200);
+}
+
 function getCookie(name) {
     var cookieValue = null;
     if (document.cookie && document.cookie !== '') {
@@ -0,0 +1,311 @@
+import json
+
+from django.contrib.auth.models import Permission
+from django.core.urlresolvers import reverse
+from django.test import TestCase
+
+from inventories.models import Product, ProductInventoryItem
+from utils.testing import SeedFactory
+
+
+class ProductInventoryItemAPITestCase(TestCase):
+    """
+    Test case for the products inventory items API.
+    """
+
+    def setUp(self):
+        self.factory = SeedFactory()
+        self.branch_office = self.factory.create_branch_office()
+        self.inventory = self.branch_office.productsinventory
+        self.other_inventory = self.factory.create_branch_office().productsinventory
+        self.acr_products = self.factory.create_products(4, line=Product.ACR)
+        self.pol_products = self.factory.create_products(3, line=Product.POL)
+        self.factory.stock(self.inventory, self.acr_products + self.pol_products)
+        self.factory.stock(self.other_inventory, self.acr_products)
+        self.superuser = self.factory.create_employee(self.branch_office, is_superuser=True)
+        self.client.login(username=self.superuser.username, password=SeedFactory.PASSWORD)
+
+    def _list(self, **params):
+        return self.client.get(reverse('productinventoryitem-list'), params)
+
+    def test_cursor_pagination(self):
+        """
+        Tests that walking the cursors returns every item once, in primary key
+        order, and that the page size is bounded.
+        """
+        item_ids = list(ProductInventoryItem.objects.order_by('pk').values_list('pk', flat=True))
+        response = self._list(page_size=3)
+        pages = []
+
+        while True:
+            self.assertEqual(response.status_code, 200)
+            pages.append([item['id'] for item in response.data['results']])
+
+            if response.data['next'] is None:
+                break
+
+            response = self.client.get(response.data['next'])
+
+        self.assertEqual([len(page) for page in pages], [3, 3, 3, 2])
+        self.assertEqual([item_id for page in pages for item_id in page], item_ids)
+
+        for page_size in ('0', 'abc', '100000'):
+            self.assertEqual(len(self._list(page_size=page_size).data['results']), len(item_ids), page_size)
+
+    def test_pages_stay_stable_while_items_are_added(self):
+        """
+        Tests that items created while a client pages don't shift the pages
+        it still has to read.
+        """
+        response = self._list(page_size=5)
+        first_page = [item['id'] for item in response.data['results']]
+        new_products = self.factory.create_products(2)
+        self.factory.stock(self.inventory, new_products)
+        second_page = [item['id'] for item in self.client.get(response.data['next']).data['results']]
+
+        self.assertFalse(set(first_page) & set(second_page))
+        self.assertLess(max(first_page), min(second_page))
+
+    def test_fields_projection(self):
+        """
+        Tests that the fields parameter limits the rendered fields and that
+        unknown fields are ignored.
+        """
+        response = self._list(fields='id,quantity,unknown')
+
+        self.assertEqual({tuple(sorted(item)) for item in response.data['results']}, {('id', 'quantity')})
+        self.assertEqual(set(self._list().data['results'][0]),
+                         {'id', 'product', 'sku', 'quantity', 'inventory', 'change_seq'})
+
+    def test_filters(self):
+        """
+        Tests the inventory, product, sku and line filters.
+        """
+        def get_ids(**params):
+            return {item['id'] for item in self._list(**params).data['results']}
+
+        items = ProductInventoryItem.objects.all()
+
+        self.assertEqual(get_ids(inventory=self.other_inventory.pk),
+                         set(items.filter(inventory=self.other_inventory).values_list('pk', flat=True)))
+        self.assertEqual(get_ids(product=self.acr_products[0].pk),
+                         set(items.filter(product=self.acr_products[0]).values_list('pk', flat=True)))
+        self.assertEqual(get_ids(sku=self.pol_products[0].sku.upper()),
+                         set(items.filter(product=self.pol_products[0]).values_list('pk', flat=True)))
+        self.assertEqual(get_ids(inventory=self.inventory.pk, line=Product.POL),
+                         set(items.filter(inventory=self.inventory, product__line=Product.POL).values_list(
+                             'pk', flat=True)))
+
+
+class ProductInventoryItemBulkAPITestCase(TestCase):
+    """
+    Test case for the bulk quantity updates of the products inventory items.
+    """
+
+    def setUp(self):
+        self.factory = SeedFactory()
+        self.branch_office = self.factory.create_branch_office()
+        self.inventory = self.branch_office.productsinventory
+        self.other_inventory = self.factory.create_branch_office().productsinventory
+        products = self.factory.create_products(3)
+        self.factory.stock(self.inventory, products, quantity=5)
+        self.factory.stock(self.other_inventory, products, quantity=5)
+        self.items = list(ProductInventoryItem.objects.filter(inventory=self.inventory).order_by('pk'))
+        self.other_item = ProductInventoryItem.objects.filter(inventory=self.other_inventory).first()
+        self.administrator = self.branch_office.administrator
+        self.administrator.user_permissions.add(Permission.objects.get(codename='change_productinventoryitem'))
+        self.client.login(username=self.administrator.username, password=SeedFactory.PASSWORD)
+
+    def _bulk(self, rows):
+        return self.client.patch(reverse('productinventoryitem-bulk'), json.dumps(rows),
+                                 content_type='application/json')
+
+    def _get_quantities(self):
+        return dict(ProductInventoryItem.objects.values_list('pk', 'quantity'))
+
+    def test_update(self):
+        """
+        Tests that every row is updated and reported.
+        """
+        response = self._bulk([{'id': item.pk, 'quantity': index} for index, item in enumerate(self.items)])
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual({row['status'] for row in response.data}, {'updated'})
+
+        quantities = self._get_quantities()
+        self.assertEqual([quantities[item.pk] for item in self.items], [0, 1, 2])
+        self.assertEqual(quantities[self.other_item.pk], 5)
+
+    def test_invalid_rows_update_nothing(self):
+        """
+        Tests that a batch with an invalid, repeated or unknown row isn't
+        applied at all and that the errors are reported on their rows.
+        """
+        quantities = self._get_quantities()
+        batches = [
+            [{'id': self.items[0].pk, 'quantity': 1}, {'id': self.items[1].pk, 'quantity': -1}],
+            [{'id': self.items[0].pk, 'quantity': 1}, {'id': self.items[0].pk, 'quantity': 2}],
+            [{'id': self.items[0].pk, 'quantity': 1}, {'id': 0, 'quantity': 2}],
+        ]
+
+        for rows in batches:
+            response = self._bulk(rows)
+
+            self.assertEqual(response.status_code, 400, rows)
+            self.assertEqual(response.data[0], {})
+            self.assertTrue(response.data[1])
+            self.assertEqual(self._get_quantities(), quantities)
+
+    def test_items_of_other_inventories_are_rejected(self):
+        """
+        Tests that only superusers can update the items of the inventories of
+        the branch offices they don't administer or supervise.
+        """
+        quantities = self._get_quantities()
+        rows = [{'id': self.items[0].pk, 'quantity': 1}, {'id': self.other_item.pk, 'quantity': 1}]
+        response = self._bulk(rows)
+
+        self.assertEqual(response.status_code, 403)
+        self.assertEqual(response.data[0], {})
+        self.assertIn('id', response.data[1])
+        self.assertEqual(self._get_quantities(), quantities)
+
+        self.client.logout()
+        self.client.login(username=self.factory.create_employee(self.branch_office, is_superuser=True).username,
+                          password=SeedFactory.PASSWORD)
+
+        self.assertEqual(self._bulk(rows).status_code, 200)
+
+    def test_permissions(self):
+        """
+        Tests that anonymous users and users without the change permission
+        are rejected.
+        """
+        rows = [{'id': self.items[0].pk, 'quantity': 1}]
+        self.administrator.user_permissions.clear()
+
+        self.assertEqual(self._bulk(rows).status_code, 403)
+
+        self.client.logout()
+
+        self.assertEqual(self._bulk(rows).status_code, 403)
+        self.assertEqual(ProductInventoryItem.objects.get(pk=self.items[0].pk).quantity, 5)
+
+
+class SetQuantitiesTestCase(TestCase):
+    """
+    Test case for ProductInventoryItem.set_quantities.
+    """
+
+    def test_set_quantities(self):
+        """
+        Tests that the quantities and change sequences are set at once, and
+        that nothing is set if an item doesn't exist.
+        """
+        factory = SeedFactory()
+        inventory = factory.create_branch_office().productsinventory
+        factory.stock(inventory, factory.create_products(2), quantity=5)
+        items = list(ProductInventoryItem.objects.filter(inventory=inventory).order_by('pk'))
+
+        self.assertEqual(ProductInventoryItem.set_quantities({items[0].pk: 1, 0: 2}), {0})
+        self.assertEqual(set(ProductInventoryItem.objects.values_list('quantity', flat=True)), {5})
+
+        self.assertEqual(ProductInventoryItem.set_quantities({items[0].pk: 1, items[1].pk: 2}), set())
+
+        inventory.refresh_from_db()
+        self.assertEqual(list(ProductInventoryItem.objects.order_by('pk').values_list('quantity', 'change_seq')),
+                         [(1, inventory.version), (2, inventory.version)])
+
+
+class ProductInventoryItemChangesAPITestCase(TestCase):
+    """
+    Test case for the change feed of the products inventories.
+    """
+
+    def setUp(self):
+        self.factory = SeedFactory()
+        self.branch_office = self.factory.create_branch_office()
+        self.inventory = self.branch_office.productsinventory
+        self.factory.stock(self.inventory, self.factory.create_products(5))
+        self.items = list(ProductInventoryItem.objects.filter(inventory=self.inventory).order_by('pk'))
+
+        # Each item gets its own change sequence, then the last three share one and the second one is deleted.
+        for item in self.items:
+            item.save()
+
+        ProductInventoryItem.set_quantities({item.pk: 1 for item in self.items[2:]})
+        self.items[1].delete()
+
+        self.client.login(username=self.branch_office.administrator.username, password=SeedFactory.PASSWORD)
+
+    def _get_changes(self, **params):
+        params.setdefault('inventory', self.inventory.pk)
+
+        return self.client.get(reverse('productinventoryitem-changes'), params)
+
+    def _walk(self, since=0, limit=2):
+        pages = []
+
+        while True:
+            response = self._get_changes(since=since, limit=limit)
+            self.assertEqual(response.status_code, 200)
+            pages.append(response.data)
+            self.assertGreaterEqual(response.data['cursor'], since)
+            since = response.data['cursor']
+
+            if not response.data['has_more']:
+                return pages
+
+    def test_cursor_paging(self):
+        """
+        Tests that walking the feed from 0 returns every item once and the
+        deleted item, and that the final cursor only returns later changes.
+        """
+        pages = self._walk()
+        item_ids = [item['id'] for page in pages for item in page['items']]
+
+        self.assertEqual(sorted(item_ids), [self.items[0].pk] + [item.pk for item in self.items[2:]])
+        self.assertEqual([item_id for page in pages for item_id in page['deleted']], [self.items[1].pk])
+
+        cursor = pages[-1]['cursor']
+        self.assertEqual(self._get_changes(since=cursor).data['items'], [])
+
+        self.items[0].quantity = 7
+        self.items[0].save()
+        response = self._get_changes(since=cursor)
+
+        self.assertEqual([(item['id'], item['quantity']) for item in response.data['items']],
+                         [(self.items[0].pk, 7)])
+        self.assertGreater(response.data['cursor'], cursor)
+
+    def test_a_change_sequence_is_never_split(self):
+        """
+        Tests that the items updated together are returned in the same page,
+        even when they exceed the limit.
+        """
+        shared_seq = ProductInventoryItem.objects.get(pk=self.items[2].pk).change_seq
+
+        for page in self._walk(limit=1):
+            shared_items = [item for item in page['items'] if item['change_seq'] == shared_seq]
+            self.assertIn(len(shared_items), (0, 3))
+
+    def test_access_control(self):
+        """
+        Tests that the feed requires an inventory the user administers or
+        supervises, unless it's a superuser.
+        """
+        other_inventory = self.factory.create_branch_office().productsinventory
+
+        self.assertEqual(self._get_changes(inventory=other_inventory.pk).status_code, 403)
+        self.assertEqual(self._get_changes(inventory=0).status_code, 404)
+        self.assertEqual(self._get_changes(inventory='').status_code, 400)
+
+        self.client.logout()
+        self.client.login(username=self.factory.create_employee(self.branch_office, is_superuser=True).username,
+                          password=SeedFactory.PASSWORD)
+
+        self.assertEqual(self._get_changes(inventory=other_inventory.pk).status_code, 200)
+
+        self.client.logout()
+
+        self.assertEqual(self._get_changes().status_code, 403)
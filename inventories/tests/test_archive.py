@@ -0,0 +1,56 @@
+from datetime import timedelta
+
+from django.test import TestCase
+from django.utils import timezone
+
+from inventories.models import ProductRemoval, ProductRemovalHistory, RemovedProduct, RemovedProductHistory
+from utils.archive import MovementArchiver
+from utils.testing import SeedFactory
+
+
+class MovementArchiverTestCase(TestCase):
+    """
+    Test case for the archival of the closed movements.
+    """
+
+    def setUp(self):
+        factory = SeedFactory()
+        self.branch = factory.create_branch_office()
+        self.products = factory.create_products(2)
+
+    def _create_removal(self, status, days_ago):
+        removal = ProductRemoval.objects.create(inventory=self.branch.productsinventory, status=status,
+                                                removed_by_user=self.branch.administrator,
+                                                date_removed=timezone.now() - timedelta(days=days_ago))
+        RemovedProduct.objects.bulk_create([RemovedProduct(product_removal=removal, product=product, quantity=1)
+                                            for product in self.products])
+
+        return removal
+
+    def test_only_old_closed_movements_are_archived(self):
+        """
+        Tests that the closed removals older than the horizon leave the
+        workflow tables with their lines and are still read by the history
+        models, while the recent and the pending ones stay.
+        """
+        archived_removal = self._create_removal(ProductRemoval.STATUS_CONFIRMED, 400)
+        recent_removal = self._create_removal(ProductRemoval.STATUS_CONFIRMED, 10)
+        pending_removal = self._create_removal(ProductRemoval.STATUS_PENDING, 400)
+
+        self.assertEqual(MovementArchiver(horizon_days=365).archive(dry_run=True)['product removals'], 1)
+
+        archived = MovementArchiver(horizon_days=365, batch_size=1).archive()
+
+        self.assertEqual(archived['product removals'], 1)
+        self.assertEqual(set(ProductRemoval.objects.values_list('pk', flat=True)),
+                         {recent_removal.pk, pending_removal.pk})
+        self.assertFalse(RemovedProduct.objects.filter(product_removal=archived_removal.pk).exists())
+        self.assertEqual(ProductRemovalHistory.objects.count(), 3)
+        self.assertEqual(RemovedProductHistory.objects.filter(product_removal=archived_removal.pk).count(), 2)
+
+    def test_archive_tables_match_the_movement_tables(self):
+        """
+        Tests that every archived table has the same columns as its archive
+        table and its history view.
+        """
+        self.assertEqual(MovementArchiver().get_table_mismatches(), [])
@@ -0,0 +1,71 @@
+from decimal import Decimal
+
+from django.test import TestCase
+
+from inventories.catalog import get_product_catalog, get_product_ids
+from inventories.models import Product
+from utils.cache import product_catalog_cache
+from utils.testing import SeedFactory
+
+
+class ProductCatalogTestCase(TestCase):
+    """
+    Test case for the process' product catalog.
+    """
+
+    def setUp(self):
+        self.products = SeedFactory('catalog').create_products(3, line=Product.ACR)
+
+    def test_lookups(self):
+        """
+        Tests the lookups by ID, SKU and line against the products' data.
+        """
+        for product in self.products:
+            product.save()
+
+        catalog = get_product_catalog()
+        product = self.products[0]
+        catalog_product = catalog.get(product.pk)
+
+        self.assertEqual(catalog_product.sku, product.sku)
+        self.assertEqual(catalog_product.width, Decimal('1.22'))
+        self.assertEqual(catalog.get_by_sku(product.sku).id, product.pk)
+        self.assertIsNone(catalog.get(max(p.pk for p in self.products) + 1))
+        self.assertEqual(set(catalog.get_ids_by_line(Product.ACR, min_width='1.22', min_length='2.44')) &
+                         {p.pk for p in self.products}, {p.pk for p in self.products})
+        self.assertFalse(set(catalog.get_ids_by_line(Product.ACR, min_width='1.23')) &
+                         {p.pk for p in self.products})
+
+    def test_changes_rebuild_the_catalog(self):
+        """
+        Tests that saving a product rebuilds the catalog and that the
+        products created without signals are still found by SKU.
+        """
+        self.assertEqual(set(get_product_ids([p.sku for p in self.products])),
+                         {p.sku for p in self.products})
+
+        product = self.products[0]
+        product.sku = 'catalog-renamed'
+        product.save()
+
+        self.assertEqual(get_product_catalog().get_id('catalog-renamed'), product.pk)
+
+    def test_unchanged_products_keep_the_catalog(self):
+        """
+        Tests that saving a product without changing its catalog data, as the
+        sales do with the scraps, doesn't invalidate the catalog, while
+        changing its dimensions does.
+        """
+        product = Product.objects.get(pk=self.products[0].pk)
+        # The products were created without signals, the catalog is rebuilt to hold them.
+        product_catalog_cache.invalidate()
+        get_product_catalog()
+        version = product_catalog_cache.get_version()
+
+        product.save()
+        self.assertEqual(product_catalog_cache.get_version(), version)
+
+        product.width = Decimal('1.10')
+        product.save()
+        self.assertNotEqual(product_catalog_cache.get_version(), version)
+        self.assertEqual(get_product_catalog().get(product.pk).width, Decimal('1.10'))
@@ -0,0 +1,119 @@
+from django.core.urlresolvers import reverse
+from django.test import TestCase
+
+from inventories.models import ProductsInventory, ProductInventoryItem, Product
+from utils.testing import SeedFactory
+
+
+class InventoryETagTestCase(TestCase):
+    """
+    Test case for the ETags of the products inventory page and the items API.
+    """
+
+    def setUp(self):
+        self.factory = SeedFactory()
+        self.branch_office = self.factory.create_branch_office()
+        self.inventory = self.branch_office.productsinventory
+        self.other_inventory = self.factory.create_branch_office().productsinventory
+        self.factory.stock(self.inventory, self.factory.create_products(3))
+        self.item = ProductInventoryItem.objects.filter(inventory=self.inventory).first()
+        superuser = self.factory.create_employee(self.branch_office, is_superuser=True)
+        self.client.login(username=superuser.username, password=SeedFactory.PASSWORD)
+
+    def _change_quantity(self):
+        self.item.quantity += 1
+        self.item.save()
+
+    def _assert_etag_follows_changes(self, url, params=None):
+        response = self.client.get(url, params)
+        etag = response['ETag']
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.client.get(url, params, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        self.assertEqual(self.client.get(url, params, HTTP_IF_NONE_MATCH='"other"').status_code, 200)
+
+        self._change_quantity()
+        response = self.client.get(url, params, HTTP_IF_NONE_MATCH=etag)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_bump_versions(self):
+        """
+        Tests that bumping returns the new versions of the given inventories
+        only.
+        """
+        versions = ProductsInventory.bump_versions([self.inventory.pk])
+
+        self.assertEqual(versions, {self.inventory.pk: self.inventory.version + 1})
+        self.assertEqual(ProductsInventory.bump_versions([]), {})
+        self.assertEqual(ProductsInventory.objects.get(pk=self.other_inventory.pk).version,
+                         self.other_inventory.version)
+
+    def test_item_changes_bump_the_version(self):
+        """
+        Tests that saving an item bumps its inventory's version.
+        """
+        self._change_quantity()
+
+        self.assertEqual(ProductsInventory.objects.get(pk=self.inventory.pk).version, self.inventory.version + 1)
+
+    def test_inventory_page(self):
+        """
+        Tests the ETag of the products inventory page.
+        """
+        self._assert_etag_follows_changes(reverse('products_inventory', args=[self.inventory.pk]))
+
+    def test_items_api(self):
+        """
+        Tests the ETag of the items API, for one inventory and for all of them.
+        """
+        self._assert_etag_follows_changes(reverse('productinventoryitem-list'), {'inventory': self.inventory.pk})
+        self._assert_etag_follows_changes(reverse('productinventoryitem-list'))
+
+    def test_query_string_is_part_of_the_etag(self):
+        """
+        Tests that different lists of the same inventory don't share ETags.
+        """
+        url = reverse('productinventoryitem-list')
+        etag = self.client.get(url, {'inventory': self.inventory.pk})['ETag']
+
+        self.assertEqual(self.client.get(url, {'inventory': self.inventory.pk, 'page_size': 1},
+                                         HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_product_changes_make_the_etags_stale(self):
+        """
+        Tests that the page and the items, which show the products' SKUs, get
+        new ETags when a stocked product is renamed.
+        """
+        page_url = reverse('products_inventory', args=[self.inventory.pk])
+        items_url = reverse('productinventoryitem-list')
+        page_etag = self.client.get(page_url)['ETag']
+        items_etag = self.client.get(items_url, {'inventory': self.inventory.pk})['ETag']
+
+        product = Product.objects.get(pk=self.item.product_id)
+        product.sku = 'etag-renamed'
+        product.save()
+
+        response = self.client.get(page_url, HTTP_IF_NONE_MATCH=page_etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, 'etag-renamed')
+
+        response = self.client.get(items_url, {'inventory': self.inventory.pk}, HTTP_IF_NONE_MATCH=items_etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, 'etag-renamed')
+
+    def test_other_inventories_keep_the_etag(self):
+        """
+        Tests that changing another inventory's items doesn't make the page
+        of this one stale.
+        """
+        url = reverse('products_inventory', args=[self.inventory.pk])
+        etag = self.client.get(url)['ETag']
+        self.factory.stock(self.other_inventory, self.factory.create_products(1))
+
+        other_item = ProductInventoryItem.objects.get(inventory=self.other_inventory)
+        other_item.quantity += 1
+        other_item.save()
+
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
@@ -0,0 +1,166 @@
+from django.core.urlresolvers import reverse
+from django.test import TestCase
+
+from inventories.models import Product, ProductEntry, ProductInventoryItem, EnteredProduct
+from utils.testing import QueryBudget, QueryBudgetTestMixin, SeedFactory
+
+
+class InventoryViewsQueryBudgetTestCase(QueryBudgetTestMixin, TestCase):
+    """
+    Query budgets of the inventory views. None of them may execute more
+    queries because the inventory holds more products.
+    """
+
+    def setUp(self):
+        self.factory = SeedFactory()
+
+    def _login_to_new_branch_office(self):
+        branch_office = self.factory.create_branch_office()
+        self.client.login(username=branch_office.administrator.username, password=SeedFactory.PASSWORD)
+
+        return branch_office
+
+    def test_products_inventory_view(self):
+        """
+        Tests that the products inventory page queries its items at once.
+        """
+
+        def scenario(scale):
+            inventory = self._login_to_new_branch_office().productsinventory
+            self.factory.stock(inventory, self.factory.create_products(scale))
+
+            def action():
+                response = self.client.get(reverse('products_inventory', args=[inventory.pk]))
+                self.assertEqual(response.status_code, 200)
+                self.assertEqual(len(response.context['inventory_items']), scale)
+
+            return action
+
+        self.assertQueryBudget(QueryBudget(15), scenario)
+
+    def test_solver_result_view(self):
+        """
+        Tests that the solver walks the candidate inventory items without a
+        query per product.
+        """
+
+        def scenario(scale):
+            inventory = self._login_to_new_branch_office().productsinventory
+            products = self.factory.create_products(scale, line=Product.ACR)
+            product_ids = {product.pk for product in products}
+            self.factory.stock(inventory, products)
+            params = {'width': '0.50', 'length': '0.50', 'quantity': 10000, 'product_lines': [Product.ACR]}
+
+            def action():
+                response = self.client.get(reverse('solver_result'), params)
+                self.assertEqual(response.status_code, 200)
+
+                result_ids = {result.product_item.product_id for result in response.context['products']}
+                self.assertTrue(result_ids)
+                self.assertLessEqual(result_ids, product_ids)
+
+            return action
+
+        self.assertQueryBudget(QueryBudget(12), scenario)
+
+    def test_product_entry_confirmation_view(self):
+        """
+        Tests that confirming a product entry through the AJAX view costs the
+        same for any number of lines.
+        """
+        confirmed_entries = []
+
+        def scenario(scale):
+            inventory = self._login_to_new_branch_office().productsinventory
+            products = self.factory.create_products(scale)
+            self.factory.stock(inventory, products[:scale // 2])
+            product_entry = self.factory.create_product_entry(inventory, products)
+
+            def action():
+                response = self.client.post(reverse('productmovconfirmorcancel'), {
+                    'model': 'ProductEntry', 'pk': product_entry.pk, 'action': 'confirm'})
+                self.assertTrue(response.json()['success'], response.json()['message'])
+
+            confirmed_entries.append((product_entry, inventory, products))
+
+            return action
+
+        self.assertQueryBudget(QueryBudget(30), scenario)
+
+        for product_entry, inventory, products in confirmed_entries:
+            scale = len(products)
+            quantities = dict(ProductInventoryItem.objects.filter(inventory=inventory).values_list('product_id',
+                                                                                                   'quantity'))
+
+            self.assertEqual(ProductEntry.objects.get(pk=product_entry.pk).status, ProductEntry.STATUS_CONFIRMED)
+            self.assertEqual(quantities, {product.pk: 11 if index < scale // 2 else 1
+                                          for index, product in enumerate(products)})
+
+
+class ProductEntryConfirmQueryBudgetTestCase(QueryBudgetTestMixin, TestCase):
+    """
+    Query budget of ProductEntry.confirm.
+    """
+
+    def setUp(self):
+        self.factory = SeedFactory()
+
+    def test_confirm(self):
+        """
+        Tests that confirming an entry adds its products to the inventory with
+        a constant number of queries, whether the items exist or not.
+        """
+        confirmed_entries = []
+
+        def scenario(scale):
+            inventory = self.factory.create_branch_office().productsinventory
+            products = self.factory.create_products(scale)
+            self.factory.stock(inventory, products[:scale // 2], quantity=5)
+            product_entry = ProductEntry.objects.get(
+                pk=self.factory.create_product_entry(inventory, products, quantity=3).pk)
+            confirmed_entries.append((product_entry, inventory, products))
+
+            return product_entry.confirm
+
+        self.assertQueryBudget(QueryBudget(20), scenario)
+
+        for product_entry, inventory, products in confirmed_entries:
+            scale = len(products)
+            quantities = dict(ProductInventoryItem.objects.filter(inventory=inventory).values_list('product_id',
+                                                                                                   'quantity'))
+
+            self.assertEqual(product_entry.status, ProductEntry.STATUS_CONFIRMED)
+            self.assertEqual(quantities, {product.pk: 8 if index < scale // 2 else 3
+                                          for index, product in enumerate(products)})
+
+
+class PurchaseOrderProgressQueryBudgetTestCase(QueryBudgetTestMixin, TestCase):
+    """
+    Query budget of the progress of a purchase order, checked on every entry
+    confirmation and entry form validation.
+    """
+
+    def test_total_entered_products(self):
+        """
+        Tests that the entered products are summed with one query, whatever
+        the number of entries of the purchase order.
+        """
+        factory = SeedFactory()
+
+        def scenario(scale):
+            inventory = factory.create_branch_office().productsinventory
+            products = factory.create_products(2)
+            purchase_order = factory.create_product_entry(inventory, products, quantity=2).purchase_order
+            ProductEntry.objects.filter(purchase_order=purchase_order).update(status=ProductEntry.STATUS_CONFIRMED)
+
+            for _ in range(scale - 1):
+                product_entry = ProductEntry.objects.create(purchase_order=purchase_order, inventory=inventory,
+                                                            entered_by_user=inventory.supervisor,
+                                                            status=ProductEntry.STATUS_CONFIRMED)
+                EnteredProduct.objects.bulk_create([
+                    EnteredProduct(product_entry=product_entry, product=product, quantity=2) for product in products
+                ])
+
+            return lambda: self.assertEqual(purchase_order.total_entered_products, 4 * scale)
+
+        self.assertQueryBudget(QueryBudget(1), scenario)
@@ -0,0 +1,217 @@
+from django.core.urlresolvers import reverse
+from django.forms import inlineformset_factory
+from django.test import TestCase, RequestFactory
+
+from finances.forms.sale_forms import SaleProductItemInlineForm
+from inventories.forms.product_transfer_shipment_forms import TransferredProductInlineForm, \
+    TransferredProductInlineFormset
+from inventories.forms.removedproduct_forms import RemovedProductFormset
+from inventories.models import ProductInventoryItem, ProductReservation, ProductTransferShipment, \
+    TransferredProduct, ProductRemoval
+from utils.testing import SeedFactory
+
+
+class ProductReservationTestCase(TestCase):
+    """
+    Test case for the reservations of the pending shipments.
+    """
+
+    def setUp(self):
+        factory = self.factory = SeedFactory()
+        self.source = factory.create_branch_office()
+        self.target = factory.create_branch_office()
+        self.inventory = self.source.productsinventory
+        self.products = factory.create_products(2)
+        factory.stock(self.inventory, self.products, quantity=10)
+
+    def _create_shipment(self, quantity):
+        shipment = ProductTransferShipment.objects.create(source_branch=self.source, target_branch=self.target,
+                                                          shipped_by_user=self.source.administrator)
+        TransferredProduct.objects.bulk_create([
+            TransferredProduct(product_transfer_shipment=shipment, product=product, quantity=quantity)
+            for product in self.products
+        ])
+
+        return shipment
+
+    def _get_items(self):
+        return {item.product_id: item for item in ProductInventoryItem.objects.filter(inventory=self.inventory)}
+
+    def test_units_cant_be_reserved_twice(self):
+        """
+        Tests that the reserved units are no longer available to another
+        shipment, while the shipment that reserved them can still use them.
+        """
+        first_shipment = self._create_shipment(7)
+        first_shipment.reserve_products()
+
+        self.assertEqual({item.available for item in self._get_items().values()}, {3})
+
+        second_shipment = self._create_shipment(4)
+
+        with self.assertRaises(ValueError):
+            second_shipment.reserve_products()
+
+        product_ids = [product.pk for product in self.products]
+        self.assertEqual(set(ProductReservation.get_available_quantities(
+            self.inventory, product_ids, second_shipment).values()), {3})
+        self.assertEqual(set(ProductReservation.get_available_quantities(
+            self.inventory, product_ids, first_shipment).values()), {10})
+
+    def test_confirmation_turns_the_reservations_into_the_shipment(self):
+        """
+        Tests that confirming a shipment takes its units from the inventory
+        and deletes its reservations.
+        """
+        shipment = self._create_shipment(7)
+        shipment.reserve_products()
+        shipment.confirm()
+
+        self.assertEqual({(item.quantity, item.reserved) for item in self._get_items().values()}, {(3, 0)})
+        self.assertFalse(ProductReservation.objects.exists())
+
+    def test_cancellation_and_deletion_release_the_reservations(self):
+        """
+        Tests that the units of cancelled or deleted shipments are available
+        again.
+        """
+        cancelled_shipment = self._create_shipment(3)
+        cancelled_shipment.reserve_products()
+        deleted_shipment = self._create_shipment(4)
+        deleted_shipment.reserve_products()
+
+        cancelled_shipment.cancel()
+        deleted_shipment.delete()
+
+        self.assertEqual({(item.quantity, item.reserved) for item in self._get_items().values()}, {(10, 0)})
+        self.assertFalse(ProductReservation.objects.exists())
+
+
+class ReservedUnitsFormsTestCase(TestCase):
+    """
+    Test case for the forms that check the available units: the reserved
+    ones can't be sold, shipped or removed.
+    """
+
+    def setUp(self):
+        factory = self.factory = SeedFactory()
+        self.source = factory.create_branch_office()
+        self.target = factory.create_branch_office()
+        self.inventory = self.source.productsinventory
+        self.product = factory.create_products(1)[0]
+        factory.stock(self.inventory, [self.product], quantity=10)
+        factory.set_prices([self.product], self.source.administrator)
+
+        self.request = RequestFactory().get('/admin/')
+        self.request.user = self.source.administrator
+
+        self.reserving_shipment = ProductTransferShipment.objects.create(
+            source_branch=self.source, target_branch=self.target, shipped_by_user=self.source.administrator)
+        TransferredProduct.objects.create(product_transfer_shipment=self.reserving_shipment, product=self.product,
+                                          quantity=7)
+        self.reserving_shipment.reserve_products()
+
+    def _get_shipment_formset(self, shipment, quantity):
+        formset_class = inlineformset_factory(ProductTransferShipment, TransferredProduct,
+                                              form=TransferredProductInlineForm,
+                                              formset=TransferredProductInlineFormset, fields=('product', 'quantity'))
+        prefix = formset_class.get_default_prefix()
+
+        return formset_class({
+            prefix + '-TOTAL_FORMS': 1,
+            prefix + '-INITIAL_FORMS': 0,
+            prefix + '-0-product': self.product.pk,
+            prefix + '-0-quantity': quantity,
+        }, instance=shipment, request=self.request)
+
+    def test_sale_form_counts_the_reserved_units(self):
+        """
+        Tests that a sale line can't take the units reserved by a pending
+        shipment.
+        """
+        data = {'product': self.product.pk, 'special_length': 0, 'special_width': 0, 'special_thickness': 0}
+
+        form = SaleProductItemInlineForm(dict(data, quantity=4), request=self.request)
+        self.assertFalse(form.is_valid())
+        self.assertEqual(form.errors['product'],
+                         ['El inventario elegido sólo cuenta con 3/4 unidades disponibles de este producto.'])
+
+        form = SaleProductItemInlineForm(dict(data, quantity=3), request=self.request)
+        form.is_valid()
+        self.assertNotIn('product', form.errors)
+
+    def test_shipment_formset_counts_the_reserved_units(self):
+        """
+        Tests that a shipment can't reserve the units of another one, so
+        reserve_products doesn't fail after the formset is valid, while the
+        reserving shipment keeps its own units.
+        """
+        new_shipment = ProductTransferShipment(source_branch=self.source, target_branch=self.target,
+                                               shipped_by_user=self.source.administrator)
+
+        self.assertFalse(self._get_shipment_formset(new_shipment, 4).is_valid())
+        self.assertTrue(self._get_shipment_formset(new_shipment, 3).is_valid())
+        self.assertTrue(self._get_shipment_formset(self.reserving_shipment, 10).is_valid())
+
+    def _post_movement(self, model_name, formset_class, quantity, **data):
+        prefix = formset_class.get_default_prefix()
+        data.update({
+            prefix + '-TOTAL_FORMS': 1,
+            prefix + '-INITIAL_FORMS': 0,
+            prefix + '-MIN_NUM_FORMS': 0,
+            prefix + '-MAX_NUM_FORMS': 1000,
+            prefix + '-0-product': self.product.pk,
+            prefix + '-0-quantity': quantity,
+            '_save': 'Guardar',
+        })
+
+        return self.client.post(reverse('admin:inventories_{0}_add'.format(model_name)), data)
+
+    def _post_shipment(self, quantity):
+        return self._post_movement('producttransfershipment', TransferredProductInlineFormset, quantity,
+                                   target_branch=self.target.pk, date_shipped_0='2026-10-19',
+                                   date_shipped_1='10:00:00')
+
+    def _post_removal(self, quantity):
+        return self._post_movement('productremoval', RemovedProductFormset, quantity,
+                                   cause=ProductRemoval.CAUSE_INTERNAL)
+
+    def _login_as_superuser(self):
+        superuser = self.factory.create_employee(self.source, is_superuser=True, is_staff=True)
+        self.client.login(username=superuser.username, password=SeedFactory.PASSWORD)
+
+    def test_admin_rejects_shipments_of_reserved_units(self):
+        """
+        Tests that the admin shows the form again, without saving anything,
+        for a shipment of units another one reserved, and reserves the units
+        of a valid shipment.
+        """
+        self._login_as_superuser()
+
+        response = self._post_shipment(4)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, 'sólo cuenta con 3 unidades disponibles')
+        self.assertEqual(ProductTransferShipment.objects.count(), 1)
+        self.assertEqual(ProductInventoryItem.objects.get(inventory=self.inventory).reserved, 7)
+
+        self.assertEqual(self._post_shipment(3).status_code, 302)
+        self.assertEqual(ProductTransferShipment.objects.count(), 2)
+        self.assertEqual(ProductInventoryItem.objects.get(inventory=self.inventory).available, 0)
+
+    def test_admin_rejects_removals_of_reserved_units(self):
+        """
+        Tests that a removal of units a shipment reserved isn't saved, and
+        that a valid one reserves its units.
+        """
+        self._login_as_superuser()
+
+        response = self._post_removal(4)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, 'sólo cuenta con 3 unidades disponibles')
+        self.assertFalse(ProductRemoval.objects.exists())
+
+        self.assertEqual(self._post_removal(3).status_code, 302)
+        self.assertEqual(ProductReservation.objects.get(product_removal__isnull=False).quantity, 3)
+        self.assertEqual(ProductInventoryItem.objects.get(inventory=self.inventory).available, 0)
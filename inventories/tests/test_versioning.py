@@ -0,0 +1,92 @@
+from django.core import serializers
+from django.core.urlresolvers import reverse
+from django.test import TestCase
+from reversion.models import Version
+
+from inventories.models import ProductInventoryItem, Product
+from utils import compressed_json
+from utils.testing import SeedFactory
+from utils.versioning import buffer_saved_objects, save_revision, movement_saves
+
+
+class VersionPolicyTestCase(TestCase):
+    """
+    Test case for the versioning policies of the admin's models.
+    """
+
+    def setUp(self):
+        factory = self.factory = SeedFactory()
+        self.branch = factory.create_branch_office()
+        self.products = factory.create_products(1)
+        factory.stock(self.branch.productsinventory, self.products)
+        self.item = ProductInventoryItem.objects.get(inventory=self.branch.productsinventory)
+
+    @staticmethod
+    def _save(*objects):
+        with buffer_saved_objects() as saved_objects:
+            for obj in objects:
+                obj.save()
+
+        return save_revision(saved_objects)
+
+    def test_movement_quantity_changes_are_skipped(self):
+        """
+        Tests that a movement saving an inventory item whose quantity is the
+        only change doesn't write a version, while the first save does.
+        """
+        self.assertIsNotNone(self._save(self.item))
+
+        self.item.quantity += 5
+
+        with movement_saves():
+            self.assertIsNone(self._save(self.item))
+
+        self.assertEqual(Version.objects.get_for_object(self.item).count(), 1)
+
+    def test_edited_quantity_changes_are_versioned(self):
+        """
+        Tests that a quantity edited outside a movement writes a version, even
+        if a movement saved the item in the same revision too.
+        """
+        self.assertIsNotNone(self._save(self.item))
+
+        with buffer_saved_objects() as saved_objects:
+            with movement_saves():
+                self.item.quantity += 5
+                self.item.save()
+
+            self.item.quantity += 1
+            self.item.save()
+
+        self.assertIsNotNone(save_revision(saved_objects))
+        self.assertEqual(Version.objects.get_for_object(self.item).count(), 2)
+
+    def test_admin_quantity_edits_are_versioned(self):
+        """
+        Tests that the quantities edited in the inventory item's admin are
+        versioned.
+        """
+        superuser = self.factory.create_employee(self.branch, is_superuser=True, is_staff=True)
+        self.client.login(username=superuser.username, password=SeedFactory.PASSWORD)
+        url = reverse('admin:inventories_productinventoryitem_change', args=[self.item.pk])
+
+        for quantity in (7, 3):
+            response = self.client.post(url, {'product': self.item.product_id, 'quantity': quantity,
+                                              'inventory': self.item.inventory_id, '_save': 'Guardar'})
+            self.assertEqual(response.status_code, 302)
+
+        self.assertEqual(ProductInventoryItem.objects.get(pk=self.item.pk).quantity, 3)
+        self.assertEqual(Version.objects.get_for_object(self.item).count(), 2)
+
+    def test_compressed_versions_round_trip(self):
+        """
+        Tests that the compressed serialization format reads back the object
+        it wrote.
+        """
+        product = self.products[0]
+        data = serializers.serialize(compressed_json.FORMAT, [product])
+        restored = list(serializers.deserialize(compressed_json.FORMAT, data))[0].object
+
+        self.assertIsInstance(restored, Product)
+        self.assertEqual(restored.sku, product.sku)
+        self.assertEqual(restored.length, product.length)
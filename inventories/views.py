@@ -12,16 +12,27 @@ from django.http import HttpResponseForbidden
 from django.http import JsonResponse
 from django.shortcuts import render, get_object_or_404
 from django.utils.decorators import method_decorator
+from django.views.decorators.cache import cache_control
+from django.views.decorators.http import condition
 from django.views.generic import ListView
 from django.views.generic import View
-from rest_framework import viewsets
+from rest_framework import permissions, status, viewsets
+from rest_framework.decorators import list_route
+from rest_framework.filters import DjangoFilterBackend
+from rest_framework.response import Response
 
 from back_office.models import BranchOffice
+from back_office.user_context import get_user_context
+from inventories.filters import ProductInventoryItemFilter
 from inventories.forms.solver_forms import SolverForm
 from inventories.models import ProductsInventory, MaterialsInventory, ConsumablesInventory, DurableGoodsInventory, \
     Product, Material, Consumable, DurableGood, ProductInventoryItem, string_to_model_class
-from inventories.serializers import ProductInventoryItemSerializer
+from inventories.serializers import ProductInventoryItemSerializer, ProductInventoryItemQuantitySerializer, \
+    ProductInventoryItemChangeSerializer
 from inventories.solver import Surface, ProductCutOptimizer
+from utils.api import PrimaryKeyCursorPagination, VersionETagListMixin, validate_bulk_rows, get_unknown_keys_errors
+from utils.cache import solver_results_cache, inventory_pages_cache
+from utils.db.routers import read_from_replica
 
 db_logger = logging.getLogger('db')
 
@@ -42,6 +53,7 @@ class ProductSolverView(View):
         return render(request, self.template_name, {'form': form})
 
 
+@method_decorator(read_from_replica(), name='dispatch')
 class ProductSolverResultView(View):
     form_class = SolverForm
     template_name = 'inventories/solver_result.html'
@@ -55,7 +67,7 @@ class ProductSolverResultView(View):
             form = self.form_class(request.GET)
 
             if form.is_valid():
-                inventory = request.user.branch_office.productsinventory
+                inventory = get_user_context(request).products_inventory
 
                 solver = ProductCutOptimizer(
                     inventory=inventory,
@@ -65,7 +77,11 @@ class ProductSolverResultView(View):
                     quantity=form.cleaned_data['quantity']
                 )
 
-                products, remaining = solver.get_candidate_products_for_surface()
+                # The inventory's version changes with its stock and its products, which invalidates the results.
+                products, remaining = solver_results_cache.get_or_set(
+                    (inventory.pk, inventory.version, form.cleaned_data['width'], form.cleaned_data['length'],
+                     form.cleaned_data['quantity'], sorted(form.cleaned_data['product_lines'])),
+                    solver.get_candidate_products_for_surface, branch=inventory.branch_id)
 
                 return render(request, self.template_name, {
                     'products': products,
@@ -84,6 +100,15 @@ class ProductSolverResultView(View):
             raise
 
 
+def _get_products_inventory_etag(request, pk):
+    """
+    The inventory page changes with the inventory's version and the user,
+    whose name and permissions are part of the page.
+    """
+    return "{0}-{1}".format(ProductsInventory.get_versions_signature(int(pk)), request.user.pk)
+
+
+@method_decorator(read_from_replica(), name='dispatch')
 class ProductInventoryView(ListView):
     """
     Class view that generates the HTTP responses for all product inventories
@@ -103,80 +128,95 @@ class ProductInventoryView(ListView):
         self.primary_key = kwargs['pk']
         self.user = request.user
 
-        branch_office = get_object_or_404(BranchOffice, pk=self.primary_key)
+        user_context = get_user_context(request)
 
-        is_admin = request.user == branch_office.administrator
-        is_supervisor = request.user == branch_office.productsinventory.supervisor
-        is_superuser = request.user.is_superuser
+        # The branch offices the user administers or supervises exist, the others are checked.
+        if not (user_context.is_administrator(self.primary_key) or user_context.is_supervisor(self.primary_key)):
+            get_object_or_404(BranchOffice, pk=self.primary_key)
 
-        can_visualize_data = is_admin or is_supervisor or is_superuser
+            if not request.user.is_superuser:
+                return HttpResponseForbidden()
 
-        if can_visualize_data:
-            return super(ProductInventoryView, self).dispatch(request, *args, **kwargs)
-        else:
-            return HttpResponseForbidden()
+        return super(ProductInventoryView, self).dispatch(request, *args, **kwargs)
+
+    @method_decorator(cache_control(private=True, no_cache=True))
+    @method_decorator(condition(etag_func=_get_products_inventory_etag))
+    def get(self, request, *args, **kwargs):
+        return super(ProductInventoryView, self).get(request, *args, **kwargs)
 
     def get_queryset(self):
         products_inventory = ProductsInventory.objects.filter(pk=self.primary_key).first()
 
         if products_inventory:
             self.inventory_name = products_inventory.name
-            inventory_items = products_inventory.productinventoryitem_set.all()
-            queryset = []
-
-            for item in inventory_items:
-                queryset.append([
-                    {
-                        "attribute": item.id,
-                        "name": "item_id",
-                        "type": "hidden"
-                    },
-                    {
-                        "attribute": item.product.id,
-                        "name": "product_id",
-                        "type": "hidden"
-                    },
-                    {
-                        "attribute": item.product.sku,
-                        "name": "product_sku",
-                        "type": "label"
-                    },
-                    {
-                        "attribute": item.product.description,
-                        "name": "product_description",
-                        "type": "label"
-                    },
-                    {
-                        "attribute": item.product.search_description,
-                        "name": "search_description",
-                        "type": "label"
-                    },
-                    {
-                        "attribute": item.product.engraving,
-                        "name": "product_engraving",
-                        "type": "label"
-                    },
-                    {
-                        "attribute": item.product.color,
-                        "name": "product_color",
-                        "type": "label"
-                    },
-                    {
-                        "attribute": item.quantity,
-                        "name": "item_quantity",
-                        "type": "input"
-                    },
-                    {
-                        "attribute": item.inventory.id,
-                        "name": "inventory_id",
-                        "type": "hidden"
-                    }
-                ])
 
-            return queryset
+            return inventory_pages_cache.get_or_set(
+                (products_inventory.pk, products_inventory.version),
+                lambda: self.get_inventory_rows(products_inventory), branch=products_inventory.branch_id)
         else:
             return []
 
+    @staticmethod
+    def get_inventory_rows(products_inventory):
+        """
+        Returns the rows of the inventory's table.
+        :param products_inventory: The ProductsInventory.
+        :return: A list with a list of cells per inventory item.
+        """
+        inventory_items = products_inventory.productinventoryitem_set.select_related('product')
+        queryset = []
+
+        for item in inventory_items:
+            queryset.append([
+                {
+                    "attribute": item.id,
+                    "name": "item_id",
+                    "type": "hidden"
+                },
+                {
+                    "attribute": item.product.id,
+                    "name": "product_id",
+                    "type": "hidden"
+                },
+                {
+                    "attribute": item.product.sku,
+                    "name": "product_sku",
+                    "type": "label"
+                },
+                {
+                    "attribute": item.product.description,
+                    "name": "product_description",
+                    "type": "label"
+                },
+                {
+                    "attribute": item.product.search_description,
+                    "name": "search_description",
+                    "type": "label"
+                },
+                {
+                    "attribute": item.product.engraving,
+                    "name": "product_engraving",
+                    "type": "label"
+                },
+                {
+                    "attribute": item.product.color,
+                    "name": "product_color",
+                    "type": "label"
+                },
+                {
+                    "attribute": item.quantity,
+                    "name": "item_quantity",
+                    "type": "input"
+                },
+                {
+                    "attribute": item.inventory_id,
+                    "name": "inventory_id",
+                    "type": "hidden"
+                }
+            ])
+
+        return queryset
+
     def get_context_data(self, **kwargs):
         context = super(ProductInventoryView, self).get_context_data(**kwargs)
         context['title'] = self.inventory_name
@@ -191,6 +231,7 @@ class ProductInventoryView(ListView):
         return context
 
 
+@method_decorator(read_from_replica(), name='dispatch')
 class MaterialInventoryView(ListView):
     """
     Class view that generates the HTTP responses for all material inventories
@@ -241,6 +282,7 @@ class MaterialInventoryView(ListView):
         return context
 
 
+@method_decorator(read_from_replica(), name='dispatch')
 class ConsumableInventoryView(ListView):
     """
     Class view that generates the HTTP responses for all consumable inventories
@@ -292,6 +334,7 @@ class ConsumableInventoryView(ListView):
         return context
 
 
+@method_decorator(read_from_replica(), name='dispatch')
 class DurableGoodInventoryView(ListView):
     """
     Class view that generates the HTTP responses for all durable goods inventories
@@ -343,6 +386,7 @@ class DurableGoodInventoryView(ListView):
         return context
 
 
+@method_decorator(read_from_replica(), name='dispatch')
 class ProductAutocomplete(autocomplete.Select2QuerySetView):
     """
     Select2 framework's autocomplete for the Product entity.
@@ -366,6 +410,7 @@ class ProductAutocomplete(autocomplete.Select2QuerySetView):
         return query_set
 
 
+@method_decorator(read_from_replica(), name='dispatch')
 class MaterialAutocomplete(autocomplete.Select2QuerySetView):
     """
     Select2 framework's autocomplete for the Material entity.
@@ -385,6 +430,7 @@ class MaterialAutocomplete(autocomplete.Select2QuerySetView):
         return query_set
 
 
+@method_decorator(read_from_replica(), name='dispatch')
 class ConsumableAutocomplete(autocomplete.Select2QuerySetView):
     """
     Select2 framework's autocomplete for the Consumable entity.
@@ -404,6 +450,7 @@ class ConsumableAutocomplete(autocomplete.Select2QuerySetView):
         return query_set
 
 
+@method_decorator(read_from_replica(), name='dispatch')
 class DurableGoodAutocomplete(autocomplete.Select2QuerySetView):
     """
     Select2 framework's autocomplete for the DurableGood entity.
@@ -423,13 +470,105 @@ class DurableGoodAutocomplete(autocomplete.Select2QuerySetView):
         return query_set
 
 
-class ProductInventoryItemViewSet(viewsets.ModelViewSet):
+@method_decorator(read_from_replica(), name='list')
+class ProductInventoryItemViewSet(VersionETagListMixin, viewsets.ModelViewSet):
     """
     API endpoint that allows a products inventory's item to be viewed or
     edited through a RESTful API.
+    Lists are cursor paginated, can be filtered by inventory, product,
+    sku and line and are tagged with the inventories' version.
     """
-    queryset = ProductInventoryItem.objects.all()
+    queryset = ProductInventoryItem.objects.select_related('product')
     serializer_class = ProductInventoryItemSerializer
+    permission_classes = (permissions.IsAuthenticated, permissions.DjangoModelPermissions,)
+    pagination_class = PrimaryKeyCursorPagination
+    filter_backends = (DjangoFilterBackend,)
+    filter_class = ProductInventoryItemFilter
+    MAX_CHANGES = 1000
+
+    def get_list_version(self):
+        inventory_id = self.request.query_params.get('inventory', '')
+
+        return ProductsInventory.get_versions_signature(int(inventory_id) if inventory_id.isdigit() else None)
+
+    @list_route(methods=['get'])
+    @read_from_replica()
+    def changes(self, request):
+        """
+        Change feed of an inventory. Returns the items changed and the ids of
+        the items deleted after the since cursor (0 to get the whole
+        inventory), along the cursor to send on the next call. The query
+        parameters are inventory (required), since and limit. Unless the user
+        is a superuser, the inventory must be one of the branch offices it
+        administers or supervises.
+        :param request: The HTTP request.
+        :return: The changes and the new cursor.
+        """
+        try:
+            params = request.query_params
+
+            if not params.get('inventory', '').isdigit():
+                return Response({'inventory': ['Este parámetro es requerido.']}, status=status.HTTP_400_BAD_REQUEST)
+
+            branch_id = ProductsInventory.objects.filter(pk=int(params['inventory'])).values_list(
+                'branch', flat=True).first()
+
+            if branch_id is None:
+                return Response(status=status.HTTP_404_NOT_FOUND)
+
+            if not (request.user.is_superuser or branch_id in get_user_context(request).get_managed_branch_ids()):
+                return Response(status=status.HTTP_403_FORBIDDEN)
+
+            since = int(params['since']) if params.get('since', '').isdigit() else 0
+            limit = min(int(params['limit']), self.MAX_CHANGES) if params.get('limit', '').isdigit() else \
+                self.MAX_CHANGES
+            changes = ProductInventoryItem.get_changes(int(params['inventory']), since, max(limit, 1))
+
+            return Response({
+                'items': ProductInventoryItemChangeSerializer(changes['items'], many=True).data,
+                'deleted': changes['deleted'],
+                'cursor': changes['cursor'],
+                'has_more': changes['has_more'],
+            })
+        except Exception as e:
+            db_logger.exception(e)
+            raise
+
+    @list_route(methods=['patch'])
+    def bulk(self, request):
+        """
+        Updates the quantity of several items in a single transaction. The
+        body is a list of {"id": ..., "quantity": ...} objects; if any of them
+        is invalid nothing is updated and the errors are returned per row.
+        Unless the user is a superuser, the items must belong to the
+        inventories of the branch offices it administers or supervises.
+        :param request: The HTTP request.
+        :return: A list with the status of each row.
+        """
+        try:
+            rows, errors = validate_bulk_rows(ProductInventoryItemQuantitySerializer, request.data, 'id')
+
+            if errors:
+                return Response(errors, status=status.HTTP_400_BAD_REQUEST)
+
+            if not request.user.is_superuser:
+                forbidden_ids = set(ProductInventoryItem.objects.filter(pk__in=[row['id'] for row in rows]).exclude(
+                    inventory__branch__in=get_user_context(request).get_managed_branch_ids()
+                ).values_list('pk', flat=True))
+
+                if forbidden_ids:
+                    return Response([{'id': ['No tiene permiso sobre el inventario.']} if row['id'] in forbidden_ids
+                                     else {} for row in rows], status=status.HTTP_403_FORBIDDEN)
+
+            missing_ids = ProductInventoryItem.set_quantities({row['id']: row['quantity'] for row in rows})
+
+            if missing_ids:
+                return Response(get_unknown_keys_errors(rows, 'id', missing_ids), status=status.HTTP_400_BAD_REQUEST)
+
+            return Response([{'id': row['id'], 'quantity': row['quantity'], 'status': 'updated'} for row in rows])
+        except Exception as e:
+            db_logger.exception(e)
+            raise
 
 
 class ProductMovementConfirmOrCancelView(View):
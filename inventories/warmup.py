@@ -0,0 +1,11 @@
+from inventories.catalog import get_product_catalog
+from utils.warmup import register_warmup
+
+
+@register_warmup('product catalog')
+def warm_up_product_catalog():
+    """
+    Builds the process' product catalog, or rebuilds it if the products
+    changed since the process was forked.
+    """
+    get_product_catalog()
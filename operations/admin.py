@@ -1,11 +1,11 @@
 from django.contrib import admin
-from reversion.admin import VersionAdmin
 
 import operations.models as models
 from back_office.admin import admin_site
 from operations.forms.project_forms import AddOrChangeProjectForm
 from operations.forms.project_materials_inline_forms import ProjectMaterialsInLineForm
 from operations.forms.project_products_inline_forms import ProjectProductsInLineForm
+from utils.versioning import PolicyVersionAdmin
 
 
 class ProjectProductsInLine(admin.TabularInline):
@@ -30,7 +30,7 @@ class ProjectMaterialsInLine(admin.TabularInline):
     verbose_name_plural = 'materiales utilizados'
 
 
-class ProjectAdmin(VersionAdmin):
+class ProjectAdmin(PolicyVersionAdmin):
     """
     Specifies the details for the admin app in regard
     to the ProjectAdmin entity.
@@ -74,7 +74,7 @@ class ProjectEstimationMaterialsInLine(admin.TabularInline):
     verbose_name_plural = 'materiales estimados'
 
 
-class ProjectEstimationAdmin(VersionAdmin):
+class ProjectEstimationAdmin(PolicyVersionAdmin):
     """
     Specifies the details for the admin app in regard
     to the ProjectEstimation entity.
@@ -0,0 +1,150 @@
+from django.conf import settings
+from django.contrib.admin import RelatedFieldListFilter, AllValuesFieldListFilter
+from django.contrib.admin.utils import get_fields_from_path
+from django.core.exceptions import FieldDoesNotExist
+from django.core.paginator import Paginator
+from django.db import connections, models
+from django.utils.encoding import force_text
+
+from utils.cache import admin_filter_choices_cache
+
+
+def get_estimated_count(queryset):
+    """
+    Returns the number of rows of an unfiltered queryset's table from the
+    statistics PostgreSQL keeps for the planner (pg_class.reltuples), without
+    scanning it. The estimates of filtered querysets can be off by orders of
+    magnitude, so they aren't estimated.
+    :param queryset: The queryset.
+    :return: The estimated count, or None if the queryset is filtered, sliced
+    or distinct, the table was never analyzed or the database isn't
+    PostgreSQL.
+    """
+    connection = connections[queryset.db]
+    query = queryset.query
+
+    if connection.vendor != 'postgresql' or query.where or query.distinct or query.low_mark or \
+            query.high_mark is not None:
+        return None
+
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT reltuples FROM pg_class WHERE oid = %s::regclass",
+                       [connection.ops.quote_name(queryset.model._meta.db_table)])
+        row = cursor.fetchone()
+
+    if row is None or row[0] < 0:
+        return None
+
+    return int(row[0])
+
+
+class EstimatedCountPaginator(Paginator):
+    """
+    Paginator that takes the count of an unfiltered changelist from the table
+    statistics when they estimate ADMIN_ESTIMATED_COUNT_THRESHOLD rows or more;
+    above that the exact count doesn't matter to the user and costs a scan of
+    the whole table. The filtered changelists are always counted exactly.
+    """
+
+    def _get_count(self):
+        if self._count is None:
+            estimated_count = get_estimated_count(self.object_list)
+
+            if estimated_count is not None and estimated_count >= settings.ADMIN_ESTIMATED_COUNT_THRESHOLD:
+                self._count = estimated_count
+            else:
+                self._count = self.object_list.count()
+
+        return self._count
+
+    count = property(_get_count)
+
+
+class CachedRelatedFieldListFilter(RelatedFieldListFilter):
+    """
+    Related field filter whose choices (every row of the related model) are
+    cached for a few minutes instead of read on every changelist page.
+    """
+
+    def field_choices(self, field, request, model_admin):
+        return admin_filter_choices_cache.get_or_set(
+            ('related', field.model._meta.label, field.name),
+            lambda: [(pk, force_text(label)) for pk, label in super(
+                CachedRelatedFieldListFilter, self).field_choices(field, request, model_admin)])
+
+
+class CachedAllValuesFieldListFilter(AllValuesFieldListFilter):
+    """
+    Filter by the distinct values of a field, which are cached for a few
+    minutes instead of read (a scan of the table) on every changelist page.
+    """
+
+    def __init__(self, field, request, params, model, model_admin, field_path):
+        super(CachedAllValuesFieldListFilter, self).__init__(field, request, params, model, model_admin, field_path)
+
+        lookup_choices = self.lookup_choices
+        self.lookup_choices = admin_filter_choices_cache.get_or_set(
+            ('values', model._meta.label, type(model_admin).__name__, field_path), lambda: list(lookup_choices))
+
+
+class AdminPerformanceMixin:
+    """
+    Makes the changelists of large tables cheaper: the rows of the unfiltered
+    changelists are counted from the table statistics above
+    ADMIN_ESTIMATED_COUNT_THRESHOLD and the unfiltered total isn't counted
+    along with the filtered one, the choices of the related and distinct
+    values filters are cached, and the foreign keys shown in list_display are
+    joined (with list_select_related) instead of read row by row. The
+    CustomAdminSite adds it to every registration.
+    """
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+
+    def get_list_filter(self, request):
+        list_filter = []
+
+        for list_filter_item in super(AdminPerformanceMixin, self).get_list_filter(request):
+            if isinstance(list_filter_item, str):
+                list_filter_item = self._get_cached_list_filter(list_filter_item)
+
+            list_filter.append(list_filter_item)
+
+        return list_filter
+
+    def _get_cached_list_filter(self, field_path):
+        """
+        Returns the list_filter item of a field with the cached version of the
+        filter Django would choose for it; the filters that don't query the
+        database are left as they are.
+        """
+        field = get_fields_from_path(self.model, field_path)[-1]
+
+        if field.remote_field is not None:
+            return field_path, CachedRelatedFieldListFilter
+
+        if field.choices or isinstance(field, (models.BooleanField, models.NullBooleanField, models.DateField)):
+            return field_path
+
+        return field_path, CachedAllValuesFieldListFilter
+
+    def get_list_select_related(self, request):
+        list_select_related = super(AdminPerformanceMixin, self).get_list_select_related(request)
+
+        if list_select_related is not False:
+            return list_select_related
+
+        related_fields = []
+
+        for field_name in self.get_list_display(request):
+            if not isinstance(field_name, str):
+                continue
+
+            try:
+                field = self.model._meta.get_field(field_name)
+            except FieldDoesNotExist:
+                continue
+
+            if (field.many_to_one or field.one_to_one) and field.concrete:
+                related_fields.append(field_name)
+
+        return related_fields or False
@@ -0,0 +1,122 @@
+import hashlib
+
+from django.utils.http import quote_etag, parse_etags
+from rest_framework import serializers, status
+from rest_framework.pagination import CursorPagination
+from rest_framework.response import Response
+
+
+class PrimaryKeyCursorPagination(CursorPagination):
+    """
+    Cursor pagination ordered by primary key, so pages stay stable while rows
+    are edited and never require an OFFSET scan. The page size may be reduced
+    (or raised up to max_page_size) with the page_size query parameter.
+    """
+    ordering = 'pk'
+    page_size = 100
+    page_size_query_param = 'page_size'
+    max_page_size = 500
+
+    def get_page_size(self, request):
+        try:
+            page_size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+
+        if page_size <= 0:
+            return self.page_size
+
+        return min(page_size, self.max_page_size)
+
+
+class DynamicFieldsModelSerializer(serializers.ModelSerializer):
+    """
+    Model serializer that only renders the fields listed in the request's
+    fields query parameter (a comma separated list), when present.
+    """
+    FIELDS_QUERY_PARAM = 'fields'
+
+    def __init__(self, *args, **kwargs):
+        super(DynamicFieldsModelSerializer, self).__init__(*args, **kwargs)
+
+        request = self.context.get('request')
+
+        if request is None or request.method != 'GET':
+            return
+
+        requested_fields = request.query_params.get(self.FIELDS_QUERY_PARAM)
+
+        if requested_fields:
+            allowed = set(requested_fields.split(','))
+
+            for field_name in set(self.fields) - allowed:
+                self.fields.pop(field_name)
+
+
+class VersionETagListMixin:
+    """
+    Viewset mixin that tags list responses with an ETag built from
+    get_list_version() and the request's query string, and answers
+    304 Not Modified when the client already has it. An unchanged list then
+    costs the version lookup instead of the list query.
+    """
+
+    def get_list_version(self):
+        """
+        Returns a value that changes whenever the listed data changes.
+        """
+        raise NotImplementedError
+
+    def list(self, request, *args, **kwargs):
+        etag = quote_etag("{0}-{1}".format(self.get_list_version(),
+                                           hashlib.md5(request.get_full_path().encode()).hexdigest()))
+        if_none_match = request.META.get('HTTP_IF_NONE_MATCH')
+
+        if if_none_match and (if_none_match.strip() == '*' or etag in map(quote_etag, parse_etags(if_none_match))):
+            response = Response(status=status.HTTP_304_NOT_MODIFIED)
+        else:
+            response = super(VersionETagListMixin, self).list(request, *args, **kwargs)
+
+        response['ETag'] = etag
+
+        return response
+
+
+def validate_bulk_rows(serializer_class, data, key_field, max_rows=1000):
+    """
+    Validates the rows of a bulk write request as a whole.
+    :param serializer_class: The serializer that validates each row.
+    :param data: The request's data, a list of rows.
+    :param key_field: The field that identifies each row; it can't be repeated.
+    :param max_rows: The maximum number of rows accepted in a single request.
+    :return: A (rows, errors) tuple. errors is None if the batch is valid,
+    otherwise it's the error response body: a list with one dict per row.
+    """
+    if isinstance(data, list) and len(data) > max_rows:
+        return None, {'non_field_errors': ['Se permiten a lo más {0} registros por petición.'.format(max_rows)]}
+
+    serializer = serializer_class(data=data, many=True)
+
+    if not serializer.is_valid():
+        return None, serializer.errors
+
+    rows = serializer.validated_data
+    seen_keys = set()
+    errors = []
+
+    for row in rows:
+        if row[key_field] in seen_keys:
+            errors.append({key_field: ['Registro repetido.']})
+        else:
+            errors.append({})
+
+        seen_keys.add(row[key_field])
+
+    return rows, errors if any(errors) else None
+
+
+def get_unknown_keys_errors(rows, key_field, unknown_keys):
+    """
+    Builds the per-row error response body for the rows whose key doesn't exist.
+    """
+    return [{key_field: ['No existe.']} if row[key_field] in unknown_keys else {} for row in rows]
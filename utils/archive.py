@@ -0,0 +1,174 @@
+import logging
+from collections import OrderedDict
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.utils import timezone
+
+from finances.models import Sale, SaleProductItem
+from inventories.models import ProductEntry, EnteredProduct, ProductRemoval, RemovedProduct, \
+    ProductTransferShipment, TransferredProduct, ProductTransferReception, ReceivedProduct, PurchaseOrder
+
+db_logger = logging.getLogger('db')
+
+
+class MovementArchiver:
+    """
+    Moves the closed movements older than the horizon, together with their
+    lines, from the workflow tables to their archive tables (see
+    utils.migrations.create_archive_table), where the history models still
+    read them. A movement is only archived when nothing in the workflow tables
+    needs it anymore: the entries of open purchase orders, the transfers with
+    pending receptions or removals and the sales of invoices with recent sales
+    are kept.
+    """
+
+    def __init__(self, horizon_days=None, batch_size=500):
+        """
+        :param horizon_days: Age in days of the newest movements archived,
+        MOVEMENT_ARCHIVE_HORIZON_DAYS by default.
+        :param batch_size: Number of movements moved per transaction.
+        """
+        if horizon_days is None:
+            horizon_days = settings.MOVEMENT_ARCHIVE_HORIZON_DAYS
+
+        self.cutoff = timezone.now() - timedelta(days=horizon_days)
+        self.batch_size = batch_size
+
+    def get_movements(self):
+        """
+        Returns the kinds of movements that are archived, each with the
+        queryset of its archivable movements and the tables moved along with
+        them as (model, lookup of the movement's ID) tuples. The removals go
+        before the transfers, so the receptions they reference can be archived
+        in the same run.
+        :return: An ordered dictionary.
+        """
+        return OrderedDict([
+            ('product entries', (
+                ProductEntry.objects.filter(
+                    status__in=[ProductEntry.STATUS_CONFIRMED, ProductEntry.STATUS_CANCELLED],
+                    date_entered__lt=self.cutoff,
+                    purchase_order__status__in=[PurchaseOrder.STATUS_COMPLETE, PurchaseOrder.STATUS_CANCELLED]),
+                [(EnteredProduct, 'product_entry')])),
+            ('product removals', (
+                ProductRemoval.objects.filter(
+                    status__in=[ProductRemoval.STATUS_CONFIRMED, ProductRemoval.STATUS_CANCELLED],
+                    date_removed__lt=self.cutoff),
+                [(RemovedProduct, 'product_removal')])),
+            ('product transfers', (
+                ProductTransferShipment.objects.filter(
+                    status__in=[ProductTransferShipment.STATUS_CANCELLED, ProductTransferShipment.STATUS_RECEIVED,
+                                ProductTransferShipment.STATUS_REJECTED],
+                    date_shipped__lt=self.cutoff
+                ).exclude(
+                    producttransferreception__status=ProductTransferReception.STATUS_PENDING
+                ).exclude(
+                    producttransferreception__productremoval__isnull=False),
+                [(TransferredProduct, 'product_transfer_shipment'),
+                 (ProductTransferReception, 'product_transfer_shipment'),
+                 (ReceivedProduct, 'product_transfer_reception__product_transfer_shipment')])),
+            ('sales', (
+                Sale.objects.filter(date__lt=self.cutoff).exclude(
+                    invoice__sale__date__gte=self.cutoff).exclude(productreimbursement__isnull=False),
+                [(SaleProductItem, 'sale')])),
+        ])
+
+    def get_table_mismatches(self):
+        """
+        Compares the columns of every archived table with the columns of its
+        archive table and its history view, which must stay the same (see
+        utils.migrations.alter_archived_table).
+        :return: A list with a description of each difference, empty if the
+        tables match.
+        """
+        try:
+            models = []
+
+            for queryset, related_tables in self.get_movements().values():
+                models += [queryset.model] + [model for model, _ in related_tables]
+
+            mismatches = []
+
+            with connection.cursor() as cursor:
+                for model in models:
+                    table = model._meta.db_table
+                    columns = [column.name for column in connection.introspection.get_table_description(cursor, table)]
+
+                    for copy in (table + '_archive', table + '_history'):
+                        copy_columns = [column.name for column in
+                                        connection.introspection.get_table_description(cursor, copy)]
+
+                        if set(copy_columns) != set(columns):
+                            mismatches.append("{0} has the columns {1}, {2} has {3}.".format(
+                                table, ", ".join(sorted(columns)), copy, ", ".join(sorted(copy_columns))))
+
+            return mismatches
+        except Exception as e:
+            db_logger.exception(e)
+            raise
+
+    def archive(self, dry_run=False):
+        """
+        Archives the archivable movements, a batch per transaction.
+        :param dry_run: Only counts the movements that would be archived.
+        :return: Ordered dictionary mapping the kinds of movements to the
+        number of movements archived.
+        """
+        try:
+            archived = OrderedDict()
+
+            for name, (queryset, related_tables) in self.get_movements().items():
+                if dry_run:
+                    archived[name] = queryset.count()
+                    continue
+
+                archived[name] = 0
+
+                while True:
+                    count = self._archive_batch(queryset, related_tables)
+                    archived[name] += count
+
+                    if count < self.batch_size:
+                        break
+
+            return archived
+        except Exception as e:
+            db_logger.exception(e)
+            raise
+
+    def _archive_batch(self, queryset, related_tables):
+        """
+        Moves a batch of movements and their related rows to the archive
+        tables, parents first, and deletes them from the workflow tables,
+        children first, without signals: the movements are closed, so their
+        effects on the inventories and the rollups stay as they are.
+        :return: The number of movements archived.
+        """
+        with transaction.atomic():
+            movement_ids = list(queryset.select_for_update().order_by('pk').values_list(
+                'pk', flat=True)[:self.batch_size])
+
+            if not movement_ids:
+                return 0
+
+            tables = [(queryset.model, movement_ids)]
+
+            for model, lookup in related_tables:
+                ids = list(model.objects.filter(**{lookup + '__in': movement_ids}).values_list('pk', flat=True))
+
+                if ids:
+                    tables.append((model, ids))
+
+            cursor = connection.cursor()
+
+            for model, ids in tables:
+                columns = ", ".join(connection.ops.quote_name(field.column) for field in model._meta.concrete_fields)
+                cursor.execute("INSERT INTO {0}_archive ({1}) SELECT {1} FROM {0} WHERE id = ANY(%s)".format(
+                    model._meta.db_table, columns), [ids])
+
+            for model, ids in reversed(tables):
+                cursor.execute("DELETE FROM {0} WHERE id = ANY(%s)".format(model._meta.db_table), [ids])
+
+            return len(movement_ids)
@@ -0,0 +1,296 @@
+import io
+import platform
+import statistics
+import subprocess
+import time
+from collections import OrderedDict
+
+import django
+import pyexcel
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.urlresolvers import reverse
+from django.db import connection, transaction, close_old_connections
+from django.db.models import Count
+from django.test import Client as TestClient
+from django.test.utils import CaptureQueriesContext, override_settings
+from django.utils import timezone
+
+from back_office.models import Client, Provider
+from finances.models import Invoice, ProductPrice, Sale
+from inventories.models import Product, ProductsInventory, ProductInventoryItem, PurchaseOrder, PurchasedProduct, \
+    ProductEntry, EnteredProduct
+
+
+class BenchmarkSuite:
+    """
+    Times the application's hot paths against the current database, usually
+    filled by the generate_synthetic_data command. Each benchmark method
+    prepares its data, untimed, and returns the callable to time. Every run
+    happens inside a transaction that is rolled back, so the benchmarks that
+    write leave the data set as it was and the runs stay comparable.
+    """
+    BENCHMARKS = ['solver', 'products_inventory_view', 'product_inventory_items_api', 'product_autocomplete',
+                  'client_autocomplete', 'product_entry_confirmation', 'excel_import', 'sale_submission']
+    ENTRY_LINES = 50
+    IMPORT_ROWS = 500
+    SALE_LINES = 3
+    CONNECTION_MODES = OrderedDict([
+        ('connection_per_request', {'CONN_MAX_AGE': 0, 'POOL_SIZE': 0}),
+        ('persistent_connection', {'CONN_MAX_AGE': 600, 'POOL_SIZE': 0}),
+        ('pooled_connection', {'CONN_MAX_AGE': 0, 'POOL_SIZE': 2}),
+    ])
+
+    def __init__(self, repeat=10, warmup=2):
+        self.repeat = repeat
+        self.warmup = warmup
+        self.inventory = ProductsInventory.objects.annotate(item_count=Count('productinventoryitem')).order_by(
+            '-item_count', 'pk').select_related('supervisor', 'branch').first()
+
+        if self.inventory is None:
+            raise ValueError("No hay inventarios de productos. Genere datos con generate_synthetic_data primero.")
+
+        self.user = self.inventory.supervisor
+        self.client = None
+
+    def run(self, names=None):
+        """
+        Runs the benchmarks and returns the report.
+        :param names: The benchmarks to run, all of them by default.
+        :return: A dictionary that can be serialized as JSON.
+        """
+        results = OrderedDict()
+
+        with override_settings(ALLOWED_HOSTS=['testserver']):
+            self.client = TestClient()
+            self.client.force_login(self.user)
+
+            for name in names or self.BENCHMARKS:
+                results[name] = self._run_benchmark(getattr(self, 'benchmark_' + name))
+
+        return OrderedDict([
+            ('commit', self._get_commit()),
+            ('generated_at', timezone.now().isoformat()),
+            ('environment', OrderedDict([('python', platform.python_version()), ('django', django.get_version()),
+                                         ('database', connection.vendor)])),
+            ('dataset', self._get_dataset_sizes()),
+            ('repeat', self.repeat),
+            ('results', results),
+        ])
+
+    def _run_benchmark(self, benchmark):
+        timings = []
+        query_counts = []
+
+        for iteration in range(self.warmup + self.repeat):
+            with transaction.atomic():
+                action = benchmark()
+
+                with CaptureQueriesContext(connection) as context:
+                    started_at = time.perf_counter()
+                    action()
+                    elapsed_ms = (time.perf_counter() - started_at) * 1000
+
+                transaction.set_rollback(True)
+
+            if iteration >= self.warmup:
+                timings.append(elapsed_ms)
+                query_counts.append(len(context))
+
+        result = self._summarize(timings)
+        result['queries'] = int(statistics.median(query_counts))
+
+        return result
+
+    @staticmethod
+    def _summarize(timings):
+        timings = sorted(timings)
+
+        return OrderedDict([
+            ('median_ms', round(statistics.median(timings), 2)),
+            ('mean_ms', round(statistics.mean(timings), 2)),
+            ('min_ms', round(timings[0], 2)),
+            ('p95_ms', round(timings[min(len(timings) - 1, int(len(timings) * 0.95))], 2)),
+            ('max_ms', round(timings[-1], 2)),
+        ])
+
+    def run_connection_benchmark(self):
+        """
+        Times a short request, the product autocomplete, opening a connection
+        per request, reusing a persistent connection and taking it from a
+        pool, to measure the connection overhead each request saves.
+        :return: A dictionary with the timings per connection mode.
+        """
+        url = reverse('product-autocomplete')
+        original_settings = {key: connection.settings_dict.get(key) for key in ('CONN_MAX_AGE', 'POOL_SIZE')}
+        results = OrderedDict()
+
+        with override_settings(ALLOWED_HOSTS=['testserver']):
+            client = TestClient()
+            client.force_login(self.user)
+
+            try:
+                for mode, mode_settings in self.CONNECTION_MODES.items():
+                    connection.close()
+                    connection.settings_dict.update(mode_settings)
+                    timings = []
+
+                    for iteration in range(self.warmup + self.repeat):
+                        started_at = time.perf_counter()
+                        # The test client doesn't release the connections like the WSGI handler does.
+                        close_old_connections()
+                        client.get(url, {'q': 'ACR'})
+                        close_old_connections()
+                        elapsed_ms = (time.perf_counter() - started_at) * 1000
+
+                        if iteration >= self.warmup:
+                            timings.append(elapsed_ms)
+
+                    results[mode] = self._summarize(timings)
+            finally:
+                connection.close()
+                connection.settings_dict.update(original_settings)
+
+        return results
+
+    @staticmethod
+    def _get_commit():
+        try:
+            return subprocess.check_output(['git', 'rev-parse', 'HEAD'], stderr=subprocess.DEVNULL).decode().strip()
+        except (OSError, subprocess.CalledProcessError):
+            return None
+
+    @staticmethod
+    def _get_dataset_sizes():
+        return OrderedDict((model._meta.model_name, model.objects.count()) for model in (
+            Product, ProductInventoryItem, ProductPrice, Sale, ProductEntry, ProductsInventory))
+
+    def _get(self, url, data=None, expected_status=200):
+        def action():
+            response = self.client.get(url, data)
+
+            if response.status_code != expected_status:
+                raise AssertionError("GET {0} answered {1}.".format(url, response.status_code))
+
+        return action
+
+    def _post(self, url, data, expected_status):
+        def action():
+            response = self.client.post(url, data)
+
+            if response.status_code != expected_status:
+                raise AssertionError("POST {0} answered {1}.".format(url, response.status_code))
+
+            return response
+
+        return action
+
+    def _get_stocked_products(self, count):
+        return list(Product.objects.filter(productinventoryitem__inventory=self.inventory,
+                                           productinventoryitem__quantity__gte=10,
+                                           productprice__isnull=False).order_by('pk')[:count])
+
+    def benchmark_solver(self):
+        return self._get(reverse('solver_result'), {
+            'width': '0.50', 'length': '0.50', 'quantity': 100,
+            'product_lines': [line for line, _ in Product.LINE_TYPES]})
+
+    def benchmark_products_inventory_view(self):
+        return self._get(reverse('products_inventory', args=[self.inventory.pk]))
+
+    def benchmark_product_inventory_items_api(self):
+        return self._get(reverse('productinventoryitem-list'), {'inventory': self.inventory.pk})
+
+    def benchmark_product_autocomplete(self):
+        return self._get(reverse('product-autocomplete'), {'q': 'ACR, CRISTAL'})
+
+    def benchmark_client_autocomplete(self):
+        return self._get(reverse('client-autocomplete'), {'q': 'Cliente 1'})
+
+    def benchmark_product_entry_confirmation(self):
+        """
+        Confirms a pending entry of ENTRY_LINES products through the AJAX view.
+        """
+        products = list(Product.objects.order_by('pk')[:self.ENTRY_LINES])
+        purchase_order = PurchaseOrder.objects.create(provider=Provider.objects.order_by('pk').first(),
+                                                      invoice_folio='benchmark', branch_office=self.inventory.branch,
+                                                      purchased_by_user=self.user)
+        PurchasedProduct.objects.bulk_create([PurchasedProduct(purchase_order=purchase_order, product=product,
+                                                               quantity=5) for product in products])
+        product_entry = ProductEntry.objects.create(purchase_order=purchase_order, inventory=self.inventory,
+                                                    entered_by_user=self.user)
+        EnteredProduct.objects.bulk_create([EnteredProduct(product_entry=product_entry, product=product, quantity=5)
+                                            for product in products])
+
+        return self._post(reverse('productmovconfirmorcancel'), {
+            'model': 'ProductEntry', 'pk': product_entry.pk, 'action': 'confirm'}, 200)
+
+    def benchmark_excel_import(self):
+        """
+        Uploads an Excel file with IMPORT_ROWS products to the inventory
+        through its admin change form.
+        """
+        rows = [['SKU', 'Cantidad']] + [[sku, 1] for sku in Product.objects.order_by('-pk').values_list(
+            'sku', flat=True)[:self.IMPORT_ROWS]]
+        excel_file = io.BytesIO()
+        pyexcel.Sheet(rows).save_to_memory('xls', excel_file)
+
+        return self._post(reverse('admin:inventories_productsinventory_change', args=[self.inventory.pk]), {
+            'name': self.inventory.name,
+            'supervisor': self.inventory.supervisor_id,
+            'branch': self.inventory.branch_id,
+            'excel_file': SimpleUploadedFile('benchmark.xls', excel_file.getvalue()),
+        }, 302)
+
+    def benchmark_sale_submission(self):
+        """
+        Registers a counter sale of SALE_LINES stocked products through the
+        sale admin.
+        """
+        invoice = Invoice.objects.create(folio='benchmark')
+        data = {
+            'client': Client.objects.values_list('pk', flat=True).first(),
+            'invoice': invoice.pk,
+            'type': Sale.TYPE_COUNTER,
+            'payment_method': Sale.PAYMENT_CASH,
+            'shipping_and_handling': 0,
+            'discount': 0,
+            'saleproductitem_set-TOTAL_FORMS': self.SALE_LINES,
+            'saleproductitem_set-INITIAL_FORMS': 0,
+            'saleproductitem_set-MIN_NUM_FORMS': 0,
+            'saleproductitem_set-MAX_NUM_FORMS': 1000,
+        }
+
+        for index, product in enumerate(self._get_stocked_products(self.SALE_LINES)):
+            data.update({
+                'saleproductitem_set-{0}-product'.format(index): product.pk,
+                'saleproductitem_set-{0}-quantity'.format(index): 1,
+                'saleproductitem_set-{0}-special_length'.format(index): 0,
+                'saleproductitem_set-{0}-special_width'.format(index): 0,
+                'saleproductitem_set-{0}-special_thickness'.format(index): 0,
+            })
+
+        return self._post(reverse('admin:finances_sale_add'), data, 302)
+
+
+def compare_reports(report, baseline):
+    """
+    Compares the medians and query counts of two benchmark reports.
+    :param report: The current report.
+    :param baseline: The report to compare against.
+    :return: A list of (name, baseline_ms, current_ms, change_percentage,
+    baseline_queries, current_queries) tuples, for the benchmarks in both.
+    """
+    comparison = []
+
+    for name, result in report['results'].items():
+        baseline_result = baseline.get('results', {}).get(name)
+
+        if baseline_result is None:
+            continue
+
+        change = (result['median_ms'] - baseline_result['median_ms']) / baseline_result['median_ms'] * 100 \
+            if baseline_result['median_ms'] else 0.0
+        comparison.append((name, baseline_result['median_ms'], result['median_ms'], round(change, 1),
+                           baseline_result['queries'], result['queries']))
+
+    return comparison
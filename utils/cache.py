@@ -0,0 +1,140 @@
+import hashlib
+import time
+
+from django.core.cache import caches
+from django.core.cache.backends.base import DEFAULT_TIMEOUT
+from django.core.cache.backends.locmem import LocMemCache
+
+_MISSING = object()
+
+
+class CacheNamespace:
+    """
+    A group of cached values that are invalidated together. Every key embeds
+    the namespace's version and, for keys scoped to a branch office, the
+    branch's version, so invalidating only increments a version: the old
+    entries are never read again and expire on their own. The versions are
+    stored in the cache itself, so the invalidations reach every process that
+    shares the backend (all of them with the file or Redis backends, only the
+    current one with the local memory backend, where the timeout bounds how
+    stale the other processes can be).
+    """
+
+    def __init__(self, name, timeout=DEFAULT_TIMEOUT, alias='default', shared_only=False):
+        """
+        :param name: The namespace's name, unique among the namespaces.
+        :param timeout: Seconds the values are kept, the backend's TIMEOUT by
+        default.
+        :param alias: The cache in CACHES to use.
+        :param shared_only: Whether the values are only cached when every
+        process shares the backend, for the values that must never be stale.
+        With the local memory backend they're computed on every call.
+        """
+        self.name = name
+        self.timeout = timeout
+        self.alias = alias
+        self.shared_only = shared_only
+
+    @property
+    def cache(self):
+        return caches[self.alias]
+
+    @property
+    def is_shared(self):
+        """
+        :return: True if the invalidations reach the other processes, i.e. the
+        backend isn't the local memory one.
+        """
+        return not isinstance(self.cache, LocMemCache)
+
+    def _get_version_key(self, branch=None):
+        return "version:{0}:{1}".format(self.name, 'all' if branch is None else branch)
+
+    def _get_versions(self, branch=None):
+        version_keys = [self._get_version_key()]
+
+        if branch is not None:
+            version_keys.append(self._get_version_key(branch))
+
+        versions = self.cache.get_many(version_keys)
+
+        for version_key in version_keys:
+            if version_key not in versions:
+                # Starting from the current time instead of 1 keeps an evicted version from reusing stale entries.
+                self.cache.add(version_key, int(time.time() * 1000), None)
+                versions[version_key] = self.cache.get(version_key)
+
+        return [versions[version_key] for version_key in version_keys]
+
+    def get_version(self, branch=None):
+        """
+        Returns the namespace's current version, which changes on every
+        invalidation, for the values kept outside the cache (e.g. in the
+        process' memory).
+        :param branch: The id of the branch office, if any.
+        :return: The version, as a string.
+        """
+        return ".".join(str(version) for version in self._get_versions(branch))
+
+    def make_key(self, key, branch=None):
+        """
+        Returns the cache key of a value of the namespace.
+        :param key: The value's key within the namespace, anything with a
+        stable str().
+        :param branch: The id of the branch office the value belongs to, if any.
+        :return: The cache key.
+        """
+        digest = hashlib.md5(str(key).encode()).hexdigest()
+
+        return "{0}:{1}:{2}:{3}".format(self.name, 'all' if branch is None else branch, self.get_version(branch),
+                                        digest)
+
+    def get_or_set(self, key, compute, branch=None, timeout=DEFAULT_TIMEOUT):
+        """
+        Returns the cached value, computing and caching it on a miss.
+        :param key: The value's key within the namespace.
+        :param compute: Callable without arguments that returns the value,
+        which must be picklable.
+        :param branch: The id of the branch office the value belongs to, if any.
+        :param timeout: Seconds to keep the value, the namespace's timeout by
+        default.
+        :return: The value.
+        """
+        if self.shared_only and not self.is_shared:
+            return compute()
+
+        cache_key = self.make_key(key, branch)
+        value = self.cache.get(cache_key, _MISSING)
+
+        if value is _MISSING:
+            value = compute()
+            self.cache.set(cache_key, value, self.timeout if timeout is DEFAULT_TIMEOUT else timeout)
+
+        return value
+
+    def invalidate(self, branch=None):
+        """
+        Invalidates every value of a branch office or, without a branch, every
+        value of the namespace.
+        :param branch: The id of the branch office.
+        """
+        version_key = self._get_version_key(branch)
+
+        try:
+            self.cache.incr(version_key)
+        except ValueError:
+            # The version expired or was evicted, a new one invalidates the entries just the same.
+            self.cache.set(version_key, int(time.time() * 1000), None)
+
+
+# The namespaces of the application's cached read paths.
+admin_app_list_cache = CacheNamespace('admin_app_list')
+pending_items_cache = CacheNamespace('pending_items', timeout=60)
+solver_results_cache = CacheNamespace('solver_results')
+inventory_pages_cache = CacheNamespace('inventory_pages')
+# The user contexts decide the permissions and the inventory the movements are made in, so a process can't use one
+# another process invalidated.
+user_contexts_cache = CacheNamespace('user_contexts', shared_only=True)
+admin_filter_choices_cache = CacheNamespace('admin_filter_choices', timeout=300)
+# Only its version is used, to tell the processes to rebuild their product catalog (see inventories.catalog).
+product_catalog_cache = CacheNamespace('product_catalog')
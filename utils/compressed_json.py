@@ -0,0 +1,52 @@
+"""
+Serialization format (registered as 'compressed_json' in
+SERIALIZATION_MODULES) that stores Django's JSON zlib-compressed and base64
+encoded, so it still fits a text column. The versions of large objects are
+stored in it (see utils.versioning) and read back transparently by
+django-reversion through serializers.deserialize.
+"""
+import base64
+import zlib
+
+from django.core.serializers import json
+from django.core.serializers.base import DeserializationError
+from django.utils import six
+
+FORMAT = 'compressed_json'
+
+
+def compress(data):
+    """
+    :param data: The JSON text.
+    :return: The compressed text.
+    """
+    return base64.b64encode(zlib.compress(data.encode('utf-8'))).decode('ascii')
+
+
+def decompress(data):
+    """
+    :param data: The compressed text.
+    :return: The JSON text.
+    """
+    if isinstance(data, six.text_type):
+        data = data.encode('ascii')
+
+    return zlib.decompress(base64.b64decode(data)).decode('utf-8')
+
+
+class Serializer(json.Serializer):
+
+    def getvalue(self):
+        return compress(super(Serializer, self).getvalue())
+
+
+def Deserializer(stream_or_string, **options):
+    if not isinstance(stream_or_string, (bytes, six.string_types)):
+        stream_or_string = stream_or_string.read()
+
+    try:
+        data = decompress(stream_or_string)
+    except (zlib.error, ValueError) as e:
+        raise DeserializationError(e)
+
+    return json.Deserializer(data, **options)
@@ -0,0 +1,113 @@
+import os
+import threading
+import time
+
+from django.db.backends.postgresql import base
+from psycopg2 import pool
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+    """
+    PostgreSQL backend that adds, on top of Django's persistent connections
+    (CONN_MAX_AGE), these settings of the DATABASES entry:
+
+    CONN_HEALTH_CHECKS: a persistent connection that has been idle between
+    requests for CONN_HEALTH_CHECK_INTERVAL seconds or more is tested before
+    its first query and replaced if it's dead (e.g. after a database restart),
+    instead of failing the request.
+
+    POOL_SIZE: if greater than zero, the connections are taken from and
+    returned to a pool of up to POOL_SIZE connections shared by the threads of
+    the process, instead of being opened and closed. It's meant for threaded
+    workers; a sync worker only needs CONN_MAX_AGE. When the pool is exhausted
+    a regular connection is opened.
+    """
+    _pools = {}
+    _pools_lock = threading.Lock()
+
+    def __init__(self, *args, **kwargs):
+        super(DatabaseWrapper, self).__init__(*args, **kwargs)
+        self.health_check_pending = False
+        self.released_at = None
+        self.is_pooled = False
+
+    def _get_pool(self, conn_params):
+        """
+        Returns this process's pool for the database, creating it on first use.
+        The pools are per process because connections can't be shared after a
+        fork.
+        """
+        key = (self.alias, os.getpid())
+
+        with self._pools_lock:
+            connection_pool = self._pools.get(key)
+
+            if connection_pool is None:
+                connection_pool = self._pools[key] = pool.ThreadedConnectionPool(
+                    0, self.settings_dict['POOL_SIZE'], **conn_params)
+
+            return connection_pool
+
+    def get_new_connection(self, conn_params):
+        self.is_pooled = False
+        self.released_at = None
+        self.health_check_pending = False
+
+        if not self.settings_dict.get('POOL_SIZE'):
+            return super(DatabaseWrapper, self).get_new_connection(conn_params)
+
+        try:
+            connection = self._get_pool(conn_params).getconn()
+        except pool.PoolError:
+            return super(DatabaseWrapper, self).get_new_connection(conn_params)
+
+        if connection.closed:
+            self._get_pool(conn_params).putconn(connection, close=True)
+            return super(DatabaseWrapper, self).get_new_connection(conn_params)
+
+        self.is_pooled = True
+        # Same as the parent, which can't be reused because it opens the connection itself.
+        self.isolation_level = self.settings_dict['OPTIONS'].get('isolation_level', connection.isolation_level)
+
+        if self.isolation_level != connection.isolation_level:
+            connection.set_session(isolation_level=self.isolation_level)
+
+        return connection
+
+    def _close(self):
+        if self.connection is None or not self.is_pooled:
+            return super(DatabaseWrapper, self)._close()
+
+        with self.wrap_database_errors:
+            # Connections left in a transaction or broken are rolled back or discarded by the pool.
+            self._get_pool(self.get_connection_params()).putconn(self.connection, close=self.errors_occurred)
+            self.is_pooled = False
+
+    def close_if_unusable_or_obsolete(self):
+        """
+        Runs at the start and the end of each request. A connection that is
+        kept is scheduled for a health check if it was idle long enough.
+        """
+        super(DatabaseWrapper, self).close_if_unusable_or_obsolete()
+
+        if self.connection is None or not self.settings_dict.get('CONN_HEALTH_CHECKS'):
+            return
+
+        now = time.time()
+
+        if self.released_at is not None and now - self.released_at >= self.settings_dict.get(
+                'CONN_HEALTH_CHECK_INTERVAL', 0):
+            self.health_check_pending = True
+
+        self.released_at = now
+
+    def ensure_connection(self):
+        if self.health_check_pending and self.connection is not None and not self.in_atomic_block:
+            self.health_check_pending = False
+
+            if not self.is_usable():
+                # Discarded instead of returned to the pool.
+                self.errors_occurred = True
+                self.close()
+
+        super(DatabaseWrapper, self).ensure_connection()
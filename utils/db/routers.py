@@ -0,0 +1,121 @@
+import threading
+import time
+from contextlib import contextmanager
+from functools import wraps
+
+from django.conf import settings
+
+_state = threading.local()
+
+# Writes to these apps are bookkeeping of every request, not the user's data.
+IGNORED_WRITE_APPS = {'sessions', 'django_db_logger'}
+
+
+def is_replica_configured():
+    return getattr(settings, 'REPLICA_DATABASE_ALIAS', None) in settings.DATABASES
+
+
+def is_pinned_to_primary():
+    return getattr(_state, 'pinned', False)
+
+
+def get_read_alias():
+    """
+    Returns the alias reads that may go to the replica should use: the
+    replica, unless it isn't configured or the current user wrote recently.
+    """
+    if is_replica_configured() and not is_pinned_to_primary():
+        return settings.REPLICA_DATABASE_ALIAS
+
+    return 'default'
+
+
+@contextmanager
+def read_from_replica():
+    """
+    Sends the reads executed inside the block to the replica. It can be used
+    as a decorator too: @read_from_replica(), or
+    @method_decorator(read_from_replica(), name='dispatch') on a view class.
+    The reads of lazy querysets evaluated after the block (e.g. streamed
+    responses) go to the primary; use replica_queryset for those.
+    """
+    _state.replica_depth = getattr(_state, 'replica_depth', 0) + 1
+
+    try:
+        yield
+    finally:
+        _state.replica_depth -= 1
+
+
+def replica_queryset(function):
+    """
+    Decorator for functions that return a read-only queryset. The queryset is
+    bound to the replica when it's created, so it keeps reading from it
+    wherever it's evaluated.
+    """
+
+    @wraps(function)
+    def wrapper(*args, **kwargs):
+        return function(*args, **kwargs).using(get_read_alias())
+
+    return wrapper
+
+
+class ReplicaRouter:
+    """
+    Sends the reads executed by read_from_replica blocks to the replica
+    (REPLICA_DATABASE_ALIAS) and everything else to the primary. A thread that
+    writes is pinned to the primary for the rest of the request, and
+    ReplicaStickinessMiddleware keeps the user there for a while afterwards,
+    so users always read their own writes despite the replication lag.
+    """
+
+    def db_for_read(self, model, **hints):
+        if getattr(_state, 'replica_depth', 0) and not is_pinned_to_primary() and is_replica_configured():
+            return settings.REPLICA_DATABASE_ALIAS
+
+        return None
+
+    def db_for_write(self, model, **hints):
+        if model._meta.app_label not in IGNORED_WRITE_APPS:
+            _state.pinned = True
+            _state.wrote = True
+
+        return 'default'
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Both databases hold the same data.
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db != getattr(settings, 'REPLICA_DATABASE_ALIAS', None)
+
+
+class ReplicaStickinessMiddleware:
+    """
+    Pins the requests of a user that wrote to the database (or sent an unsafe
+    request) in the last REPLICA_STICKINESS_SECONDS to the primary, through a
+    cookie. It must be placed before the session middleware.
+    """
+    COOKIE_NAME = 'replica_pin'
+
+    def process_request(self, request):
+        _state.replica_depth = 0
+        _state.wrote = False
+
+        try:
+            _state.pinned = float(request.COOKIES.get(self.COOKIE_NAME, 0)) > time.time()
+        except ValueError:
+            _state.pinned = False
+
+    def process_response(self, request, response):
+        wrote = getattr(_state, 'wrote', False) or request.method not in ('GET', 'HEAD', 'OPTIONS', 'TRACE')
+
+        if wrote and is_replica_configured():
+            stickiness = getattr(settings, 'REPLICA_STICKINESS_SECONDS', 10)
+            response.set_cookie(self.COOKIE_NAME, str(time.time() + stickiness), max_age=stickiness, httponly=True)
+
+        _state.pinned = False
+        _state.wrote = False
+
+        return response
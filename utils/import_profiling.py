@@ -0,0 +1,122 @@
+"""
+Measures how long each module takes to import. It only uses the standard
+library, so it can be installed before anything else is imported; run it as
+a script (see the end of the module) to profile a fresh process that
+sets Django up, as the profile_imports command does.
+"""
+import importlib
+import json
+import os
+import sys
+import time
+
+
+class _TimedLoader:
+    """
+    Wraps a module's loader to time the execution of its body.
+    """
+
+    def __init__(self, loader, profiler):
+        self.loader = loader
+        self.profiler = profiler
+
+    def __getattr__(self, name):
+        return getattr(self.loader, name)
+
+    def create_module(self, spec):
+        create_module = getattr(self.loader, 'create_module', None)
+
+        return create_module(spec) if create_module is not None else None
+
+    def exec_module(self, module):
+        self.profiler.start(module.__name__)
+
+        try:
+            self.loader.exec_module(module)
+        finally:
+            self.profiler.stop(module.__name__)
+
+
+class ImportProfiler:
+    """
+    Import hook (a finder placed first in sys.meta_path) that records the
+    time spent importing each module: its self time, running its own body,
+    and its cumulative time, which includes the modules it imports that
+    weren't imported yet.
+    """
+
+    def __init__(self):
+        self.timings = {}
+        self._stack = []
+
+    def install(self):
+        sys.meta_path.insert(0, self)
+
+    def uninstall(self):
+        sys.meta_path.remove(self)
+
+    def find_spec(self, fullname, path=None, target=None):
+        for finder in sys.meta_path:
+            if finder is self or not hasattr(finder, 'find_spec'):
+                continue
+
+            spec = finder.find_spec(fullname, path, target)
+
+            if spec is not None:
+                if spec.loader is not None and hasattr(spec.loader, 'exec_module'):
+                    spec.loader = _TimedLoader(spec.loader, self)
+
+                return spec
+
+        return None
+
+    def start(self, name):
+        # Each frame is [name, start time, time spent in the nested imports].
+        self._stack.append([name, time.perf_counter(), 0.0])
+
+    def stop(self, name):
+        name, started_at, nested = self._stack.pop()
+        cumulative = time.perf_counter() - started_at
+        self.timings[name] = {'self': cumulative - nested, 'cumulative': cumulative}
+
+        if self._stack:
+            self._stack[-1][2] += cumulative
+
+    def get_timings(self):
+        """
+        :return: Dictionary mapping the modules imported while the profiler
+        was installed to their 'self' and 'cumulative' times in seconds.
+        """
+        return dict(self.timings)
+
+
+def profile_django_setup(import_urlconf=False):
+    """
+    Profiles the imports of setting Django up (the settings, the apps and
+    their models, the admin and the receivers) in the current process.
+    :param import_urlconf: Also imports the URLconf, with its views and forms.
+    :return: The profiler's timings.
+    """
+    profiler = ImportProfiler()
+    profiler.install()
+
+    try:
+        import django
+        django.setup()
+
+        if import_urlconf:
+            from django.conf import settings
+            importlib.import_module(settings.ROOT_URLCONF)
+    finally:
+        profiler.uninstall()
+
+    return profiler.get_timings()
+
+
+if __name__ == '__main__':
+    # Usage: python -m utils.import_profiling <output file> [--urls]; the timings are written to the file as JSON.
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'Acriladmin.settings')
+    timings = profile_django_setup('--urls' in sys.argv[2:])
+
+    with open(sys.argv[1], 'w') as output:
+        json.dump(timings, output)
@@ -0,0 +1,150 @@
+import atexit
+import logging
+import os
+import queue
+import sys
+import threading
+import traceback
+
+
+class QueuedDatabaseLogHandler(logging.Handler):
+    """
+    Log handler that stores the records in django-db-logger's StatusLog table
+    without touching the database in the logging thread: records are put in a
+    bounded in-memory queue and a background thread inserts them in batches.
+    When the queue is full the records are dropped and counted, and the count
+    is logged as soon as the queue drains, so an error storm can't saturate
+    the database or slow the requests down. The pending records are flushed
+    when the process exits.
+    """
+
+    def __init__(self, capacity=1000, batch_size=100, flush_interval=2.0, level=logging.NOTSET):
+        super(QueuedDatabaseLogHandler, self).__init__(level)
+        self.capacity = capacity
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.dropped_count = 0
+        self.failed_count = 0
+        self._counters_lock = threading.Lock()
+        self._start_lock = threading.Lock()
+        self._queue = None
+        self._worker = None
+        self._pid = None
+        atexit.register(self.close)
+
+    def emit(self, record):
+        try:
+            entry = {
+                'logger_name': record.name,
+                'level': record.levelno,
+                'msg': record.getMessage(),
+                'trace': ''.join(traceback.format_exception(*record.exc_info)) if record.exc_info else None,
+            }
+
+            self._ensure_worker()
+            self._queue.put_nowait(entry)
+        except queue.Full:
+            with self._counters_lock:
+                self.dropped_count += 1
+        except Exception:
+            self.handleError(record)
+
+    def _ensure_worker(self):
+        """
+        Starts the background thread. It's done lazily and again after a fork
+        (gunicorn's workers are forked from the master), because threads don't
+        survive a fork.
+        """
+        if self._pid == os.getpid() and self._worker is not None:
+            return
+
+        with self._start_lock:
+            if self._pid == os.getpid() and self._worker is not None:
+                return
+
+            self._queue = queue.Queue(maxsize=self.capacity)
+            self._worker = threading.Thread(target=self._run, name='db-log-writer', daemon=True)
+            self._pid = os.getpid()
+            self._worker.start()
+
+    def _run(self):
+        stop = False
+
+        while not stop:
+            batch = []
+
+            try:
+                entry = self._queue.get(timeout=self.flush_interval)
+
+                if entry is None:
+                    stop = True
+                else:
+                    batch.append(entry)
+            except queue.Empty:
+                pass
+
+            while not stop and len(batch) < self.batch_size:
+                try:
+                    entry = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+
+                if entry is None:
+                    stop = True
+                else:
+                    batch.append(entry)
+
+            self._write(batch)
+
+    def _write(self, batch):
+        from django.db import connection
+
+        with self._counters_lock:
+            dropped_count, self.dropped_count = self.dropped_count, 0
+
+        if dropped_count:
+            batch.append({
+                'logger_name': __name__,
+                'level': logging.WARNING,
+                'msg': "{0} log records were dropped because the log queue was full.".format(dropped_count),
+                'trace': None,
+            })
+
+        if not batch:
+            return
+
+        try:
+            self._store(batch)
+        except Exception:
+            with self._counters_lock:
+                self.failed_count += len(batch)
+
+            sys.stderr.write("Could not write {0} log records to the database:\n{1}".format(
+                len(batch), traceback.format_exc()))
+            # The connection may be unusable; the next batch opens a new one.
+            connection.close()
+
+    @staticmethod
+    def _store(batch):
+        from django_db_logger.models import StatusLog
+
+        StatusLog.objects.bulk_create([StatusLog(**entry) for entry in batch])
+
+    def flush(self):
+        """
+        Writes the queued records and waits until they are stored. The worker
+        is stopped and the next record starts a new one.
+        """
+        with self._start_lock:
+            if self._worker is not None and self._pid == os.getpid():
+                try:
+                    self._queue.put(None, timeout=5.0)
+                except queue.Full:
+                    pass
+
+                self._worker.join(5.0)
+                self._worker = None
+
+    def close(self):
+        self.flush()
+        super(QueuedDatabaseLogHandler, self).close()
@@ -1,10 +1,32 @@
 import csv
+import hashlib
 import os
+from collections import defaultdict
 from decimal import Decimal
 
 from django.conf import settings
-
-from inventories.models import Product
+from django.db import migrations
+
+# The values of Product's lines by the names used in product_inventory.csv. They're copied rather than read from
+# inventories.models so loading the migrations doesn't import the application's models.
+PRODUCT_LINES = {
+    'ACR': 0,
+    'ACRILETA': 1,
+    'ACRIMP': 2,
+    'ACRIP': 3,
+    'ADE': 4,
+    'DIFUSOR': 5,
+    'DOM': 6,
+    'GLASLINER': 7,
+    'LAM': 8,
+    'OTROS': 9,
+    'PERFIL': 10,
+    'PLA': 11,
+    'POL': 12,
+    'POL SOL': 13,
+    'SILI': 14,
+    'STON': 15,
+}
 
 
 def load_employee_groups(apps, schema_editor):
@@ -130,39 +152,9 @@ def _get_index_for_product_line(product_line):
     :param product_line: The line for which the index is needed.
     :return: The line's index.
     """
-    if product_line == "ACR":
-        return Product.ACR
-    elif product_line == "ACRILETA":
-        return Product.ACRILETA
-    elif product_line == "ACRIMP":
-        return Product.ACRIMP
-    elif product_line == "ACRIP":
-        return Product.ACRIP
-    elif product_line == "ADE":
-        return Product.ADE
-    elif product_line == "DIFUSOR":
-        return Product.DIFUSOR
-    elif product_line == "DOM":
-        return Product.DOM
-    elif product_line == "GLASLINER":
-        return Product.GLASLINER
-    elif product_line == "LAM":
-        return Product.LAM
-    elif product_line == "OTROS":
-        return Product.OTROS
-    elif product_line == "PERFIL":
-        return Product.PERFIL
-    elif product_line == "PLA":
-        return Product.PLA
-    elif product_line == "POL":
-        return Product.POL
-    elif product_line == "POL SOL":
-        return Product.POL_SOL
-    elif product_line == "SILI":
-        return Product.SILI
-    elif product_line == "STON":
-        return Product.STON
-    else:
+    try:
+        return PRODUCT_LINES[product_line]
+    except KeyError:
         raise NotImplementedError(product_line)
 
 
@@ -216,3 +208,165 @@ def load_employee_groups_relationships(apps, schema_editor):
             for employee in employees:
                 employee.groups.add(group)
                 employee.save()
+
+
+def load_invoices_amount_paid(apps, schema_editor):
+    """
+    Fills each invoice's paid amount with the sum of its related transactions.
+    """
+    from django.db.models import Sum
+
+    invoice_class = apps.get_model("finances", "Invoice")
+
+    del schema_editor
+
+    for invoice in invoice_class.objects.annotate(transactions_sum=Sum('transaction__amount')):
+        if invoice.transactions_sum is not None:
+            invoice_class.objects.filter(pk=invoice.pk).update(amount_paid=invoice.transactions_sum)
+
+
+def create_price_list_version(apps, schema_editor):
+    """
+    Creates the single row that holds the price list's version.
+    """
+    price_list_version_class = apps.get_model("finances", "PriceListVersion")
+
+    del schema_editor
+
+    price_list_version_class.objects.get_or_create(pk=1)
+
+
+def reserve_pending_movements(apps, schema_editor):
+    """
+    Reserves the units of the product transfer shipments and product removals
+    that were already pending, as if they had just been saved.
+    """
+    from django.db.models import F
+
+    product_inventory_item_class = apps.get_model("inventories", "ProductInventoryItem")
+    product_reservation_class = apps.get_model("inventories", "ProductReservation")
+    transferred_product_class = apps.get_model("inventories", "TransferredProduct")
+    removed_product_class = apps.get_model("inventories", "RemovedProduct")
+    status_pending = 2
+
+    del schema_editor
+
+    quantities = defaultdict(int)
+
+    for shipment_id, inventory_id, product_id, quantity in transferred_product_class.objects.filter(
+            product_transfer_shipment__status=status_pending).values_list(
+            'product_transfer_shipment_id', 'product_transfer_shipment__source_branch__productsinventory',
+            'product_id', 'quantity'):
+        quantities[('product_transfer_shipment_id', shipment_id, inventory_id, product_id)] += quantity
+
+    for removal_id, inventory_id, product_id, quantity in removed_product_class.objects.filter(
+            product_removal__status=status_pending).values_list(
+            'product_removal_id', 'product_removal__inventory_id', 'product_id', 'quantity'):
+        quantities[('product_removal_id', removal_id, inventory_id, product_id)] += quantity
+
+    items = {(inventory_id, product_id): item_id for item_id, inventory_id, product_id in
+             product_inventory_item_class.objects.filter(product_id__in={key[3] for key in quantities}).values_list(
+                 'pk', 'inventory_id', 'product_id')}
+
+    for (movement_field, movement_id, inventory_id, product_id), quantity in quantities.items():
+        item_id = items.get((inventory_id, product_id))
+
+        if item_id is not None:
+            product_reservation_class.objects.create(item_id=item_id, quantity=quantity,
+                                                     **{movement_field: movement_id})
+            product_inventory_item_class.objects.filter(pk=item_id).update(reserved=F('reserved') + quantity)
+
+
+def _get_history_view_operation(table, create):
+    """
+    Returns the forwards or backwards function of a RunPython operation that
+    creates (or drops) the <table>_history view, which names the table's
+    current columns so the archive table must have them all.
+    """
+
+    def create_view(apps, schema_editor):
+        del apps
+
+        with schema_editor.connection.cursor() as cursor:
+            columns = ", ".join(schema_editor.quote_name(column.name) for column in
+                                schema_editor.connection.introspection.get_table_description(cursor, table))
+
+        schema_editor.execute(
+            "CREATE VIEW {0}_history AS SELECT {1} FROM {0} UNION ALL SELECT {1} FROM {0}_archive".format(table,
+                                                                                                    columns))
+
+    def drop_view(apps, schema_editor):
+        del apps
+
+        schema_editor.execute("DROP VIEW IF EXISTS {0}_history".format(table))
+
+    return create_view if create else drop_view
+
+
+def create_archive_table(table, indexed_columns=()):
+    """
+    Returns the operation that creates the archive table of a movement table
+    (<table>_archive, with the same columns and no foreign keys, so the
+    referenced rows stay deletable as before) and the <table>_history view, the
+    union of both tables the history models read. The view lists the columns,
+    so PostgreSQL refuses to drop or change the type of a column of either
+    table while it exists: change them with alter_archived_table.
+    :param table: The movement table.
+    :param indexed_columns: The columns the history is filtered or joined by.
+    :return: A RunPython operation.
+    """
+    sql = [
+        "CREATE TABLE {0}_archive (LIKE {0})".format(table),
+        "ALTER TABLE {0}_archive ADD PRIMARY KEY (id)".format(table),
+    ] + [
+        "CREATE INDEX {0}_archive_{1} ON {0}_archive ({2})".format(
+            table, hashlib.md5(column.encode()).hexdigest()[:8], column)
+        for column in indexed_columns
+    ]
+    create_view = _get_history_view_operation(table, create=True)
+    drop_view = _get_history_view_operation(table, create=False)
+
+    def create_archive(apps, schema_editor):
+        for statement in sql:
+            schema_editor.execute(statement)
+
+        create_view(apps, schema_editor)
+
+    def drop_archive(apps, schema_editor):
+        drop_view(apps, schema_editor)
+        schema_editor.execute("DROP TABLE IF EXISTS {0}_archive".format(table))
+
+    return migrations.RunPython(create_archive, drop_archive)
+
+
+def alter_archived_table(table, operations, archive_sql, reverse_archive_sql=None):
+    """
+    Returns the operations of a migration that changes the columns of a
+    movement table with an archive: the <table>_history view is dropped, the
+    table is changed by the given operations and its archive by the given SQL,
+    and the view is created again with the new columns. For example, to add a
+    field to Sale:
+
+        operations = utils_migrations.alter_archived_table(
+            'finances_sale',
+            [migrations.AddField('sale', 'note', models.TextField(blank=True, default=''))],
+            "ALTER TABLE finances_sale_archive ADD COLUMN note text NOT NULL DEFAULT ''",
+            "ALTER TABLE finances_sale_archive DROP COLUMN note")
+
+    The history model of the table must get the field too.
+    MovementArchiver.get_table_mismatches lists the tables whose archive or
+    view don't match them.
+    :param table: The movement table.
+    :param operations: The migration operations that change the table.
+    :param archive_sql: The SQL statement(s) that change <table>_archive.
+    :param reverse_archive_sql: The SQL statement(s) that undo them; the
+    migration is irreversible without them.
+    :return: A list of operations.
+    """
+    create_view = _get_history_view_operation(table, create=True)
+    drop_view = _get_history_view_operation(table, create=False)
+
+    return [migrations.RunPython(drop_view, create_view)] + list(operations) + [
+        migrations.RunSQL(archive_sql, reverse_archive_sql),
+        migrations.RunPython(create_view, drop_view),
+    ]
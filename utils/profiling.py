@@ -0,0 +1,223 @@
+import json
+import os
+import random
+import re
+import threading
+import time
+from collections import Counter
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+from django.http import JsonResponse, HttpResponseForbidden
+from django.utils import timezone
+
+LATENCY_BUCKETS_MS = (10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000)
+
+_LITERALS_REGEX = re.compile(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b")
+
+
+def normalize_sql(sql):
+    """
+    Replaces the literals of a query with placeholders, so the queries of an
+    N+1 pattern (same statement, different ids) are counted as duplicates.
+    :param sql: The executed SQL.
+    :return: The SQL without literals.
+    """
+    return _LITERALS_REGEX.sub('?', sql)
+
+
+class RequestMetrics:
+    """
+    In-process aggregation of the profiled requests per URL name: request
+    count, latency histogram and SQL totals. Each gunicorn worker keeps its
+    own figures.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._views = {}
+        self.started_at = timezone.now()
+
+    def record(self, view_name, total_ms, sql_count, sql_ms):
+        with self._lock:
+            figures = self._views.get(view_name)
+
+            if figures is None:
+                figures = self._views[view_name] = {
+                    'requests': 0, 'total_ms': 0.0, 'max_ms': 0.0, 'sql_count': 0, 'sql_ms': 0.0,
+                    'max_sql_count': 0, 'buckets': [0] * (len(LATENCY_BUCKETS_MS) + 1),
+                }
+
+            figures['requests'] += 1
+            figures['total_ms'] += total_ms
+            figures['max_ms'] = max(figures['max_ms'], total_ms)
+            figures['sql_count'] += sql_count
+            figures['sql_ms'] += sql_ms
+            figures['max_sql_count'] = max(figures['max_sql_count'], sql_count)
+            figures['buckets'][self._get_bucket_index(total_ms)] += 1
+
+    @staticmethod
+    def _get_bucket_index(total_ms):
+        for index, upper_bound in enumerate(LATENCY_BUCKETS_MS):
+            if total_ms <= upper_bound:
+                return index
+
+        return len(LATENCY_BUCKETS_MS)
+
+    def snapshot(self):
+        """
+        Returns a copy of the aggregated figures, with the averages computed.
+        :return: A dictionary.
+        """
+        with self._lock:
+            views = {}
+
+            for view_name, figures in self._views.items():
+                views[view_name] = {
+                    'requests': figures['requests'],
+                    'avg_ms': round(figures['total_ms'] / figures['requests'], 2),
+                    'max_ms': round(figures['max_ms'], 2),
+                    'avg_sql_count': round(figures['sql_count'] / figures['requests'], 2),
+                    'max_sql_count': figures['max_sql_count'],
+                    'avg_sql_ms': round(figures['sql_ms'] / figures['requests'], 2),
+                    'latency_histogram': dict(zip([str(bound) for bound in LATENCY_BUCKETS_MS] + ['+Inf'],
+                                                  figures['buckets'])),
+                }
+
+        return {'pid': os.getpid(), 'since': self.started_at.isoformat(), 'views': views}
+
+    def reset(self):
+        with self._lock:
+            self._views = {}
+            self.started_at = timezone.now()
+
+
+request_metrics = RequestMetrics()
+
+
+class QueryProfilingMiddleware:
+    """
+    Records the duration, SQL query count, SQL time and most duplicated
+    queries of each request, tagged with the resolved URL name, into
+    request_metrics. Requests slower than REQUEST_PROFILING_SLOW_MS are
+    sampled (REQUEST_PROFILING_SLOW_SAMPLE_RATE) as JSON lines into
+    REQUEST_PROFILING_SLOW_LOG.
+
+    The SQL is captured with Django's debug cursor only for a fraction of the
+    requests (REQUEST_PROFILING_SQL_SAMPLE_RATE), the rest only measure the
+    total time.
+    """
+    _slow_log_lock = threading.Lock()
+
+    def __init__(self):
+        if not getattr(settings, 'REQUEST_PROFILING_ENABLED', False):
+            raise MiddlewareNotUsed()
+
+        self.sql_sample_rate = getattr(settings, 'REQUEST_PROFILING_SQL_SAMPLE_RATE', 0.01)
+        self.slow_ms = getattr(settings, 'REQUEST_PROFILING_SLOW_MS', 1000)
+        self.slow_sample_rate = getattr(settings, 'REQUEST_PROFILING_SLOW_SAMPLE_RATE', 1.0)
+        self.slow_log = getattr(settings, 'REQUEST_PROFILING_SLOW_LOG', None)
+
+    def process_request(self, request):
+        request._profiling_started_at = time.time()
+        request._profiling_sql = random.random() < self.sql_sample_rate
+
+        if request._profiling_sql:
+            # The log is never cleared, since the tests and the benchmarks count the queries from it too: the
+            # request's queries are the ones logged after the last one logged before it.
+            request._profiling_debug_cursors = {}
+            request._profiling_last_queries = {}
+
+            for connection in connections.all():
+                request._profiling_debug_cursors[connection.alias] = connection.force_debug_cursor
+                request._profiling_last_queries[connection.alias] = \
+                    connection.queries_log[-1] if connection.queries_log else None
+                connection.force_debug_cursor = True
+
+    def process_response(self, request, response):
+        started_at = getattr(request, '_profiling_started_at', None)
+
+        if started_at is None:
+            return response
+
+        total_ms = (time.time() - started_at) * 1000
+        queries = []
+
+        if request._profiling_sql:
+            for connection in connections.all():
+                queries.extend(self._get_queries_after(connection.queries_log,
+                                                       request._profiling_last_queries.get(connection.alias)))
+                connection.force_debug_cursor = request._profiling_debug_cursors.get(connection.alias, False)
+
+        resolver_match = getattr(request, 'resolver_match', None)
+        view_name = resolver_match.view_name if resolver_match and resolver_match.view_name else 'unresolved'
+        sql_ms = sum(float(query['time']) for query in queries) * 1000
+
+        request_metrics.record(view_name, total_ms, len(queries), sql_ms)
+
+        if self.slow_log and total_ms >= self.slow_ms and random.random() < self.slow_sample_rate:
+            self._write_slow_request(request, response, view_name, total_ms, queries, sql_ms)
+
+        return response
+
+    @staticmethod
+    def _get_queries_after(queries_log, last_query):
+        """
+        Returns the queries logged after another one. The log is bounded, so
+        the position of a query changes once it's full, but not its entry.
+        :param queries_log: The connection's queries_log.
+        :param last_query: The entry of the last query logged before, None if
+        the log was empty.
+        :return: List of the entries, oldest first.
+        """
+        queries = []
+
+        for query in reversed(queries_log):
+            if query is last_query:
+                break
+
+            queries.append(query)
+
+        queries.reverse()
+
+        return queries
+
+    def _write_slow_request(self, request, response, view_name, total_ms, queries, sql_ms):
+        duplicates = Counter(normalize_sql(query['sql']) for query in queries)
+        entry = {
+            'at': timezone.now().isoformat(),
+            'pid': os.getpid(),
+            'view': view_name,
+            'method': request.method,
+            'path': request.path,
+            'status': response.status_code,
+            'total_ms': round(total_ms, 2),
+            'sql_captured': request._profiling_sql,
+            'sql_count': len(queries),
+            'sql_ms': round(sql_ms, 2),
+            'top_duplicates': [{'sql': sql, 'count': count} for sql, count in duplicates.most_common(5)
+                               if count > 1],
+        }
+
+        try:
+            with self._slow_log_lock:
+                with open(self.slow_log, 'a') as slow_log:
+                    slow_log.write(json.dumps(entry) + '\n')
+        except OSError:
+            pass
+
+
+def metrics_view(request):
+    """
+    Serves the current worker's request metrics as JSON to active staff
+    members or to clients that send the REQUEST_PROFILING_METRICS_TOKEN in
+    the X-Metrics-Token header.
+    """
+    token = getattr(settings, 'REQUEST_PROFILING_METRICS_TOKEN', None)
+    has_token = token and request.META.get('HTTP_X_METRICS_TOKEN') == token
+
+    if not (has_token or (request.user.is_active and request.user.is_staff)):
+        return HttpResponseForbidden()
+
+    return JsonResponse(request_metrics.snapshot())
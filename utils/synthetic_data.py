@@ -0,0 +1,289 @@
+import random
+from collections import OrderedDict
+from decimal import Decimal
+
+from django.contrib.auth.hashers import make_password
+from django.db import connection, transaction
+from django.utils import timezone
+
+from back_office.models import BranchOffice, Employee, Client, Provider
+from finances.models import ProductPrice, PriceListVersion, Invoice, Transaction, Sale, SaleProductItem
+from inventories.models import Product, ProductsInventory, ProductInventoryItem, PurchaseOrder, PurchasedProduct, \
+    ProductEntry, EnteredProduct, ProductTransferShipment, TransferredProduct, ProductTransferReception, \
+    ReceivedProduct
+
+
+class SyntheticDataGenerator:
+    """
+    Fills the database with a realistic, reproducible (seeded) data set at a
+    configurable scale: branch offices with their employees and products
+    inventories, products and scraps with prices, stock, sales, product
+    transfers and product entries. Every generated row is bulk inserted and
+    tagged with the prefix, so several data sets can coexist.
+    """
+    PASSWORD = 'synthetic'
+
+    COLORS = ['CRISTAL', 'BLANCO', 'NEGRO', 'ROJO', 'AZUL', 'VERDE', 'AMARILLO', 'HUMO', 'BRONCE', 'OPALINO']
+    FINISHES = ['LISO', 'GRABADO', 'ESPEJO', 'SATINADO', 'MATE']
+    SIZES = [(Decimal('1.22'), Decimal('2.44')), (Decimal('1.22'), Decimal('1.83')), (Decimal('2.05'), Decimal('3.05')),
+             (Decimal('1.00'), Decimal('2.00')), (Decimal('0.60'), Decimal('1.00'))]
+    THICKNESSES = [Decimal(thickness) for thickness in ('1.5', '2', '3', '4.5', '6', '9', '12')]
+
+    def __init__(self, prefix='SYN', seed=0, batch_size=2000, stdout=None):
+        self.prefix = prefix
+        self.random = random.Random(seed)
+        self.batch_size = batch_size
+        self.stdout = stdout
+        self.counts = OrderedDict()
+
+    def _log(self, message):
+        if self.stdout is not None:
+            self.stdout.write(message)
+
+    def _bulk_create(self, model, objects):
+        model.objects.bulk_create(objects, batch_size=self.batch_size)
+        self.counts[model._meta.model_name] = self.counts.get(model._meta.model_name, 0) + len(objects)
+        self._log("{0}: {1}".format(model._meta.verbose_name_plural, len(objects)))
+
+    def prefix_exists(self):
+        return Product.objects.filter(sku__startswith=self.prefix + '-').exists()
+
+    def generate(self, branches=5, employees_per_branch=10, products=100000, scrap_ratio=0.15, priced_ratio=0.9,
+                 stock_ratio=0.3, clients=500, sales=20000, transfers=2000, entries=2000):
+        """
+        Generates the whole data set in a single transaction.
+        :return: An ordered dictionary with the number of rows created per model.
+        """
+        with transaction.atomic():
+            branch_offices = self._create_branch_offices(branches, employees_per_branch)
+            inventories = list(ProductsInventory.objects.filter(branch__in=branch_offices).order_by('pk'))
+            administrators = [branch_office.administrator for branch_office in branch_offices]
+            product_ids = self._create_products(products, scrap_ratio)
+            prices = self._create_prices(product_ids, priced_ratio, administrators)
+            self._create_stock(inventories, product_ids, stock_ratio)
+            self._create_sales(inventories, self._create_clients(clients), prices, sales)
+            self._create_entries(inventories, product_ids, entries)
+            self._create_transfers(branch_offices, product_ids, transfers)
+            PriceListVersion.bump()
+
+        return self.counts
+
+    def _create_branch_offices(self, count, employees_per_branch):
+        self._bulk_create(BranchOffice, [BranchOffice(name="{0} Sucursal {1}".format(self.prefix, number))
+                                         for number in range(1, count + 1)])
+        branch_offices = list(BranchOffice.objects.filter(name__startswith=self.prefix + ' Sucursal ').order_by('pk'))
+        password = make_password(self.PASSWORD)
+        employees = []
+
+        for branch_office in branch_offices:
+            for number in range(employees_per_branch):
+                username = "{0}-{1}-{2}".format(self.prefix, branch_office.pk, number).lower()
+                # The first employee of each branch administers it and can use the whole admin site.
+                employees.append(Employee(username=username, password=password, first_name=username,
+                                          last_name=self.prefix, email="{0}@example.com".format(username),
+                                          branch_office=branch_office, is_staff=number == 0,
+                                          is_superuser=number == 0))
+
+        self._bulk_create(Employee, employees)
+        administrators = {employee.branch_office_id: employee for employee in Employee.objects.filter(
+            username__in=["{0}-{1}-0".format(self.prefix, branch_office.pk).lower()
+                          for branch_office in branch_offices])}
+
+        for branch_office in branch_offices:
+            branch_office.administrator = administrators[branch_office.pk]
+            branch_office.save()
+
+        self._bulk_create(ProductsInventory, [
+            ProductsInventory(name="{0} Inventario {1}".format(self.prefix, branch_office.pk), branch=branch_office,
+                              supervisor=branch_office.administrator, last_updater=branch_office.administrator)
+            for branch_office in branch_offices
+        ])
+
+        return branch_offices
+
+    def _create_products(self, count, scrap_ratio):
+        lines = [line for line, _ in Product.LINE_TYPES]
+        products = []
+
+        for number in range(1, count + 1):
+            line = self.random.choice(lines)
+            line_name = dict(Product.LINE_TYPES)[line]
+            color = self.random.choice(self.COLORS)
+            thickness = self.random.choice(self.THICKNESSES)
+            is_scrap = self.random.random() < scrap_ratio
+
+            if is_scrap:
+                width = Decimal(self.random.randint(10, 120)) / 100
+                length = Decimal(self.random.randint(10, 240)) / 100
+            else:
+                width, length = self.random.choice(self.SIZES)
+
+            description = "{0} {1} {2:.2f}X{3:.2f} {4}MM{5}".format(line_name, color, width, length, thickness,
+                                                                      " PED" if is_scrap else "")
+            products.append(Product(sku="{0}-{1:07d}{2}".format(self.prefix, number, "_PED" if is_scrap else ""),
+                                    description=description, search_description=description, line=line,
+                                    engraving=self.random.choice(self.FINISHES), color=color, width=width,
+                                    length=length, thickness=thickness, is_scrap=is_scrap))
+
+        self._bulk_create(Product, products)
+
+        return list(Product.objects.filter(sku__startswith=self.prefix + '-').order_by('pk').values_list(
+            'pk', flat=True))
+
+    def _create_prices(self, product_ids, priced_ratio, administrators):
+        prices = OrderedDict((product_id, Decimal(self.random.randint(5000, 500000)) / 100)
+                             for product_id in product_ids if self.random.random() < priced_ratio)
+
+        self._bulk_create(ProductPrice, [ProductPrice(product_id=product_id, price=price,
+                                                      authorized_by=self.random.choice(administrators))
+                                         for product_id, price in prices.items()])
+
+        return prices
+
+    def _create_stock(self, inventories, product_ids, stock_ratio):
+        items = []
+
+        for inventory in inventories:
+            for product_id in self.random.sample(product_ids, int(len(product_ids) * stock_ratio)):
+                items.append(ProductInventoryItem(inventory=inventory, product_id=product_id,
+                                                  quantity=self.random.randint(0, 60)))
+
+        self._bulk_create(ProductInventoryItem, items)
+
+    def _create_clients(self, count):
+        self._bulk_create(Client, [Client(name="{0} Cliente {1}".format(self.prefix, number))
+                                   for number in range(1, count + 1)])
+
+        return list(Client.objects.filter(name__startswith=self.prefix + ' Cliente ').values_list('pk', flat=True))
+
+    def _create_sales(self, inventories, client_ids, prices, count):
+        """
+        Creates the sales with one invoice each and, unless paid on delivery,
+        their transaction. The sales are spread over the last year and the
+        sales rollups must be rebuilt afterwards.
+        """
+        priced_product_ids = list(prices.keys())
+        invoices, transactions, sales, sale_lines = [], [], [], {}
+
+        for number in range(1, count + 1):
+            folio = "{0}-F{1:07d}".format(self.prefix, number)
+            lines = [(product_id, self.random.randint(1, 10))
+                     for product_id in self.random.sample(priced_product_ids, self.random.randint(1, 4))]
+            subtotal = sum(prices[product_id] * quantity for product_id, quantity in lines)
+            payment_method = self.random.choice([payment for payment, _ in Sale.PAYMENT_TYPES])
+            is_paid = payment_method != Sale.PAYMENT_ON_DELIVERY
+            client_id = self.random.choice(client_ids)
+
+            invoices.append(Invoice(folio=folio, total=subtotal, is_closed=is_paid,
+                                    amount_paid=subtotal if is_paid else 0))
+
+            if is_paid:
+                transactions.append(Transaction(invoice_id=folio, payed_by_id=client_id, amount=subtotal))
+
+            sales.append(Sale(client_id=client_id, invoice_id=folio, inventory=self.random.choice(inventories),
+                              payment_method=payment_method, subtotal=subtotal,
+                              type=Sale.TYPE_SHIPPING if payment_method == Sale.PAYMENT_ON_DELIVERY else
+                              Sale.TYPE_COUNTER))
+            sale_lines[folio] = lines
+
+        self._bulk_create(Invoice, invoices)
+        self._bulk_create(Transaction, transactions)
+        transaction_ids = dict(Transaction.objects.filter(invoice__folio__startswith=self.prefix + '-F').values_list(
+            'invoice_id', 'pk'))
+
+        for sale in sales:
+            sale.transaction_id = transaction_ids.get(sale.invoice_id)
+
+        self._bulk_create(Sale, sales)
+        sale_ids = Sale.objects.filter(invoice__folio__startswith=self.prefix + '-F').values_list('invoice_id', 'pk')
+        self._bulk_create(SaleProductItem, [
+            SaleProductItem(sale_id=sale_id, product_id=product_id, quantity=quantity, unit_price=prices[product_id])
+            for folio, sale_id in sale_ids for product_id, quantity in sale_lines[folio]
+        ])
+
+        # Sale.date is set on insert; the history is spread over the last year afterwards.
+        with connection.cursor() as cursor:
+            cursor.execute("UPDATE {0} SET date = %s - random() * interval '365 days' WHERE invoice_id LIKE %s".format(
+                Sale._meta.db_table), [timezone.now(), self.prefix + '-F%'])
+
+    def _create_entries(self, inventories, product_ids, count):
+        """
+        Creates purchase orders and an entry for each one. Most of them are
+        confirmed; the rest are pending.
+        """
+        providers = [Provider(name="{0} Proveedor {1}".format(self.prefix, number)) for number in range(1, 21)]
+        self._bulk_create(Provider, providers)
+        provider_ids = list(Provider.objects.filter(name__startswith=self.prefix + ' Proveedor ').values_list(
+            'pk', flat=True))
+        orders, order_lines = [], {}
+
+        for number in range(1, count + 1):
+            inventory = self.random.choice(inventories)
+            folio = "{0}-OC{1:07d}".format(self.prefix, number)
+            is_pending = self.random.random() < 0.1
+            orders.append(PurchaseOrder(provider_id=self.random.choice(provider_ids), invoice_folio=folio,
+                                        branch_office_id=inventory.branch_id,
+                                        purchased_by_user_id=inventory.supervisor_id,
+                                        status=PurchaseOrder.STATUS_PENDING if is_pending else
+                                        PurchaseOrder.STATUS_COMPLETE))
+            order_lines[folio] = (inventory, is_pending, [(product_id, self.random.randint(1, 50)) for product_id in
+                                                          self.random.sample(product_ids, self.random.randint(1, 10))])
+
+        self._bulk_create(PurchaseOrder, orders)
+        order_ids = list(PurchaseOrder.objects.filter(invoice_folio__startswith=self.prefix + '-OC').values_list(
+            'invoice_folio', 'pk'))
+
+        self._bulk_create(PurchasedProduct, [
+            PurchasedProduct(purchase_order_id=order_id, product_id=product_id, quantity=quantity)
+            for folio, order_id in order_ids for product_id, quantity in order_lines[folio][2]
+        ])
+        self._bulk_create(ProductEntry, [
+            ProductEntry(purchase_order_id=order_id, inventory=order_lines[folio][0],
+                         entered_by_user_id=order_lines[folio][0].supervisor_id,
+                         status=ProductEntry.STATUS_PENDING if order_lines[folio][1] else ProductEntry.STATUS_CONFIRMED)
+            for folio, order_id in order_ids
+        ])
+
+        order_folios = dict((order_id, folio) for folio, order_id in order_ids)
+        self._bulk_create(EnteredProduct, [
+            EnteredProduct(product_entry_id=entry_id, product_id=product_id, quantity=quantity)
+            for entry_id, order_id in ProductEntry.objects.filter(
+                purchase_order__invoice_folio__startswith=self.prefix + '-OC').values_list('pk', 'purchase_order')
+            for product_id, quantity in order_lines[order_folios[order_id]][2]
+        ])
+
+    def _create_transfers(self, branch_offices, product_ids, count):
+        """
+        Creates product transfers between the branch offices. Most of them are
+        received in full; the rest are pending.
+        """
+        if len(branch_offices) < 2:
+            return
+
+        transferred_products, received_products = [], []
+
+        for _ in range(count):
+            source_branch, target_branch = self.random.sample(branch_offices, 2)
+            is_pending = self.random.random() < 0.1
+            shipment = ProductTransferShipment.objects.create(
+                source_branch=source_branch, target_branch=target_branch, shipped_by_user=source_branch.administrator,
+                status=ProductTransferShipment.STATUS_PENDING if is_pending else
+                ProductTransferShipment.STATUS_RECEIVED)
+            lines = [(product_id, self.random.randint(1, 20))
+                     for product_id in self.random.sample(product_ids, self.random.randint(1, 5))]
+
+            transferred_products.extend(TransferredProduct(product_transfer_shipment=shipment, product_id=product_id,
+                                                           quantity=quantity) for product_id, quantity in lines)
+
+            if not is_pending:
+                reception = ProductTransferReception.objects.create(
+                    product_transfer_shipment=shipment, received_by_user=target_branch.administrator,
+                    confirmed_by_user=target_branch.administrator, status=ProductTransferReception.STATUS_CONFIRMED,
+                    date_confirmed=timezone.now())
+                received_products.extend(ReceivedProduct(product_transfer_reception=reception, product_id=product_id,
+                                                         received_quantity=quantity, accepted_quantity=quantity)
+                                         for product_id, quantity in lines)
+
+        self.counts['producttransfershipment'] = count
+        self._bulk_create(TransferredProduct, transferred_products)
+        self._bulk_create(ReceivedProduct, received_products)
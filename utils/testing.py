@@ -0,0 +1,165 @@
+import itertools
+from collections import Counter
+from decimal import Decimal
+
+from django.core.cache import caches
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
+from back_office.models import BranchOffice, Employee, Provider
+from finances.models import ProductPrice
+from inventories.models import Product, ProductsInventory, ProductInventoryItem, PurchaseOrder, PurchasedProduct, \
+    ProductEntry, EnteredProduct
+from utils.profiling import normalize_sql
+
+
+class QueryBudget:
+    """
+    The maximum number of SQL queries a view or method may execute: a fixed
+    base plus, optionally, a number of queries per item. Most hot paths must
+    have per_item = 0, meaning their query count can't depend on the amount
+    of data they handle.
+    """
+
+    def __init__(self, base, per_item=0):
+        self.base = base
+        self.per_item = per_item
+
+    def get_allowed(self, item_count):
+        return self.base + self.per_item * item_count
+
+    def __str__(self):
+        if self.per_item:
+            return "{0} + {1}/item".format(self.base, self.per_item)
+
+        return str(self.base)
+
+
+class QueryBudgetTestMixin:
+    """
+    TestCase mixin that runs a scenario at several data scales and fails when
+    the queries exceed the budget or, for constant budgets, when the query
+    count changes with the scale (the signature of an N+1 query). The caches
+    are cleared before each scale, so the budgets measure the uncached path.
+    """
+    SCALES = (1, 10, 30)
+
+    def assertQueryBudget(self, budget, scenario, scales=None):
+        """
+        :param budget: The QueryBudget.
+        :param scenario: Callable that receives a scale, seeds the data for it
+        and returns the callable to measure.
+        :param scales: The scales to run, SCALES by default.
+        :return: Dictionary mapping each scale to the queries executed.
+        """
+        query_counts = {}
+
+        for scale in scales or self.SCALES:
+            action = scenario(scale)
+
+            for cache in caches.all():
+                cache.clear()
+
+            with CaptureQueriesContext(connection) as context:
+                action()
+
+            query_counts[scale] = len(context)
+
+            if query_counts[scale] > budget.get_allowed(scale):
+                self.fail("{0} queries for {1} items, the budget is {2}.\n{3}".format(
+                    query_counts[scale], scale, budget, self._describe_queries(context.captured_queries)))
+
+        if not budget.per_item and len(set(query_counts.values())) > 1:
+            self.fail("The query count grows with the data: {0}.".format(
+                ", ".join("{0} items -> {1}".format(scale, count) for scale, count in sorted(query_counts.items()))))
+
+        return query_counts
+
+    @staticmethod
+    def _describe_queries(captured_queries):
+        statements = Counter(normalize_sql(query['sql']) for query in captured_queries)
+
+        return "\n".join("{0} x {1}".format(count, sql) for sql, count in statements.most_common())
+
+
+class SeedFactory:
+    """
+    Creates the minimal graph of branch offices, employees, products and
+    inventory movements needed by the tests, at any scale. Products, prices
+    and movement lines are bulk created so seeding large scales stays cheap.
+    """
+    PASSWORD = 'seed-password'
+
+    def __init__(self, prefix='seed'):
+        self.prefix = prefix
+        self._sequence = itertools.count(1)
+
+    def _next_name(self, kind):
+        return "{0}-{1}-{2}".format(self.prefix, kind, next(self._sequence))
+
+    def create_employee(self, branch_office, **kwargs):
+        username = self._next_name('employee')
+
+        return Employee.objects.create_user(username, email="{0}@example.com".format(username),
+                                            password=self.PASSWORD, first_name=username, last_name='Seed',
+                                            branch_office=branch_office, **kwargs)
+
+    def create_branch_office(self, **employee_kwargs):
+        """
+        Creates a branch office with its administrator (who also supervises
+        its products inventory) and its products inventory.
+        :return: The BranchOffice.
+        """
+        branch_office = BranchOffice.objects.create(name=self._next_name('branch'))
+        administrator = self.create_employee(branch_office, **employee_kwargs)
+        branch_office.administrator = administrator
+        branch_office.save()
+
+        ProductsInventory.objects.create(name=self._next_name('inventory'), branch=branch_office,
+                                         supervisor=administrator, last_updater=administrator)
+
+        return branch_office
+
+    def create_products(self, count, **kwargs):
+        skus = [self._next_name('sku') for _ in range(count)]
+        kwargs.setdefault('width', Decimal('1.22'))
+        kwargs.setdefault('length', Decimal('2.44'))
+
+        Product.objects.bulk_create([Product(sku=sku, description=sku, search_description=sku, **kwargs)
+                                     for sku in skus])
+
+        return list(Product.objects.filter(sku__in=skus).order_by('pk'))
+
+    @staticmethod
+    def stock(inventory, products, quantity=10):
+        ProductInventoryItem.objects.bulk_create([
+            ProductInventoryItem(inventory=inventory, product=product, quantity=quantity) for product in products
+        ])
+
+    @staticmethod
+    def set_prices(products, authorized_by, price=Decimal('100.00')):
+        ProductPrice.objects.bulk_create([
+            ProductPrice(product=product, price=price, authorized_by=authorized_by) for product in products
+        ])
+
+    def create_product_entry(self, inventory, products, quantity=1):
+        """
+        Creates a purchase order of the given products and a pending entry of
+        all of them into the inventory.
+        :return: The ProductEntry.
+        """
+        user = inventory.supervisor
+        provider = Provider.objects.create(name=self._next_name('provider'))
+        purchase_order = PurchaseOrder.objects.create(provider=provider, invoice_folio=self._next_name('invoice'),
+                                                      branch_office=inventory.branch, purchased_by_user=user)
+        PurchasedProduct.objects.bulk_create([
+            PurchasedProduct(purchase_order=purchase_order, product=product, quantity=quantity) for product in products
+        ])
+
+        product_entry = ProductEntry.objects.create(purchase_order=purchase_order, inventory=inventory,
+                                                    entered_by_user=user)
+        EnteredProduct.objects.bulk_create([
+            EnteredProduct(product_entry=product_entry, product=product, quantity=quantity) for product in products
+        ])
+
+        return product_entry
@@ -0,0 +1,359 @@
+import json
+import logging
+from collections import OrderedDict
+from contextlib import contextmanager
+from datetime import timedelta
+from threading import local
+
+import reversion
+from django.conf import settings
+from django.contrib.contenttypes.models import ContentType
+from django.core import serializers
+from django.core.exceptions import ObjectDoesNotExist
+from django.db import connections, models, router, transaction
+from django.db.models import Max
+from django.db.models.signals import post_save
+from django.dispatch import receiver
+from django.utils import timezone
+from django.utils.encoding import force_text
+from reversion.admin import VersionAdmin
+from reversion.models import Revision, Version
+
+from utils import compressed_json
+
+db_logger = logging.getLogger('db')
+
+
+class VersionPolicy:
+    """
+    How the versions of a model are written and kept.
+    """
+
+    def __init__(self, ignore=(), movement_ignore=(), follow=None, skip_unchanged=True, compress_over=1024,
+                 keep_days=None, keep_latest=1):
+        """
+        :param ignore: Fields whose changes alone don't make a new version
+        (they're still stored in the versions that are written).
+        :param movement_ignore: Fields also ignored when the object was saved
+        inside movement_saves(), by an inventory movement or an import that
+        records the change on its own.
+        :param follow: Relations versioned along with the model, the ones of
+        the admin's inlines by default; () to only version what's saved.
+        :param skip_unchanged: Doesn't write a version when nothing but the
+        ignored fields changed since the last one.
+        :param compress_over: Serialized length above which the version is
+        stored compressed, None to never compress.
+        :param keep_days: Age in days of the oldest versions kept by the
+        prune_versions command, VERSION_RETENTION_DAYS by default.
+        :param keep_latest: Number of versions of each object that are kept
+        regardless of their age, so deleted objects can still be recovered.
+        """
+        self.ignore = frozenset(ignore)
+        self.movement_ignore = frozenset(movement_ignore)
+        self.follow = follow
+        self.skip_unchanged = skip_unchanged
+        self.compress_over = compress_over
+        self.keep_days = keep_days
+        self.keep_latest = keep_latest
+
+    def get_ignore(self, by_movement):
+        return self.ignore | self.movement_ignore if by_movement else self.ignore
+
+    def get_keep_days(self):
+        return settings.VERSION_RETENTION_DAYS if self.keep_days is None else self.keep_days
+
+
+DEFAULT_VERSION_POLICY = VersionPolicy()
+
+VERSION_POLICIES = {
+    # The reserved units and the change sequence are bookkeeping of the reservations and the inventory sync. The
+    # quantities changed by the movements (sales, cancellations, reimbursements and imports) are recorded by them, but
+    # the quantities edited by hand in the admin are versioned.
+    'inventories.ProductInventoryItem': VersionPolicy(ignore=('reserved', 'change_seq'), movement_ignore=('quantity',),
+                                                      keep_days=90),
+    'inventories.ProductsInventory': VersionPolicy(ignore=('last_update', 'version')),
+    # Following the items would serialize every item of the inventory on each save; the items edited in the inline
+    # are versioned on their own, in the same revision.
+    'inventories.MaterialsInventory': VersionPolicy(ignore=('last_update',), follow=()),
+    'inventories.ConsumablesInventory': VersionPolicy(ignore=('last_update',), follow=()),
+    'inventories.DurableGoodsInventory': VersionPolicy(ignore=('last_update',), follow=()),
+}
+
+
+def get_version_policy(model):
+    return VERSION_POLICIES.get(model._meta.label, DEFAULT_VERSION_POLICY)
+
+
+# Serialized fields and followed relations of the models registered through PolicyVersionAdmin, by label.
+_registered_models = {}
+
+
+class _Local(local):
+
+    def __init__(self):
+        self.buffers = []
+        self.movement_depth = 0
+
+
+_local = _Local()
+
+
+@receiver(post_save)
+def buffer_saved_object(sender, instance, using, **kwargs):
+    """
+    Adds the objects of the versioned models saved during a revision to its
+    buffer (see PolicyVersionAdmin.create_revision), noting whether every save
+    of the object was made by a movement.
+    """
+    if _local.buffers and sender._meta.label in _registered_models:
+        buffer = _local.buffers[-1]
+        key = (sender, force_text(instance.pk))
+        by_movement = _local.movement_depth > 0 and buffer.get(key, (None, None, True))[2]
+        buffer[key] = (instance, using, by_movement)
+
+
+@contextmanager
+def movement_saves():
+    """
+    Marks the objects saved inside as changed by an inventory movement or an
+    import rather than edited by the user, so their policy's movement_ignore
+    fields don't make a new version.
+    """
+    _local.movement_depth += 1
+
+    try:
+        yield
+    finally:
+        _local.movement_depth -= 1
+
+
+@contextmanager
+def buffer_saved_objects():
+    buffer = OrderedDict()
+    _local.buffers.append(buffer)
+
+    try:
+        yield buffer
+    finally:
+        _local.buffers.pop()
+
+
+def _follow_relations(obj):
+    for follow_name in _registered_models[obj._meta.label][1]:
+        try:
+            follow_obj = getattr(obj, follow_name)
+        except ObjectDoesNotExist:
+            continue
+
+        if isinstance(follow_obj, models.Model):
+            yield follow_obj
+        elif follow_obj is not None:
+            for follow_instance in follow_obj.all():
+                yield follow_instance
+
+
+def _get_comparable_fields(serialized_data, data_format, ignore):
+    if data_format == compressed_json.FORMAT:
+        serialized_data = compressed_json.decompress(serialized_data)
+    elif data_format != 'json':
+        return None
+
+    return {name: value for name, value in json.loads(serialized_data)[0]['fields'].items() if name not in ignore}
+
+
+def save_revision(saved_objects, user=None, comment='', date_created=None):
+    """
+    Writes the versions of the saved objects, and of the objects they follow,
+    as a single revision, with one INSERT for all the versions. The saved
+    objects whose fields, apart from their policy's ignored ones, are the same
+    as in their last version are left out, and no revision is written if
+    none of them is left.
+    :param saved_objects: Dictionary mapping (model, pk) to (object, database
+    alias, whether it was saved by a movement), as filled by
+    buffer_saved_objects.
+    :param user: The revision's user.
+    :param comment: The revision's comment.
+    :param date_created: The revision's date, now by default.
+    :return: The revision, or None if there was nothing to write.
+    """
+    try:
+        entries = OrderedDict()
+        followed = set()
+
+        def add(obj, db, explicit, by_movement=False):
+            key = (obj._meta.model, force_text(obj.pk))
+
+            if not explicit:
+                followed.add(key)
+
+            if key in entries:
+                return
+
+            entries[key] = (obj, db, explicit, by_movement)
+
+            for follow_obj in _follow_relations(obj):
+                if follow_obj._meta.label in _registered_models:
+                    add(follow_obj, db, False)
+
+        for obj, db, by_movement in list(saved_objects.values()):
+            add(obj, db, True, by_movement)
+
+        versions = OrderedDict()
+        comparable = {}
+
+        for (model, object_id), (obj, db, explicit, by_movement) in entries.items():
+            policy = get_version_policy(model)
+            serialized_data = serializers.serialize('json', (obj,), fields=_registered_models[model._meta.label][0])
+            data_format = 'json'
+
+            if explicit and policy.skip_unchanged and (model, object_id) not in followed:
+                ignore = policy.get_ignore(by_movement)
+                comparable[(model, object_id)] = (ignore, _get_comparable_fields(serialized_data, data_format, ignore))
+
+            if policy.compress_over is not None and len(serialized_data) > policy.compress_over:
+                serialized_data = compressed_json.compress(serialized_data)
+                data_format = compressed_json.FORMAT
+
+            versions[(model, object_id)] = Version(
+                content_type=ContentType.objects.get_for_model(model), object_id=object_id, db=db,
+                format=data_format, serialized_data=serialized_data, object_repr=force_text(obj))
+
+        for model in {model for model, _ in comparable}:
+            object_ids = [object_id for comparable_model, object_id in comparable if comparable_model == model]
+            latest_ids = Version.objects.filter(
+                content_type=ContentType.objects.get_for_model(model), object_id__in=object_ids
+            ).order_by().values('object_id').annotate(latest_id=Max('pk')).values_list('latest_id', flat=True)
+
+            for version in Version.objects.filter(pk__in=list(latest_ids)).only('object_id', 'format',
+                                                                               'serialized_data'):
+                ignore, fields = comparable[(model, version.object_id)]
+
+                if _get_comparable_fields(version.serialized_data, version.format, ignore) == fields:
+                    del versions[(model, version.object_id)]
+
+        # The followed objects are only written along with a changed object.
+        if not any(entries[key][2] for key in versions):
+            return None
+
+        revision = Revision.objects.create(date_created=date_created or timezone.now(), user=user, comment=comment)
+
+        for version in versions.values():
+            version.revision = revision
+
+        Version.objects.bulk_create(versions.values())
+
+        return revision
+    except Exception as e:
+        db_logger.exception(e)
+        raise
+
+
+class PolicyVersionAdmin(VersionAdmin):
+    """
+    VersionAdmin that registers its models with their VersionPolicy and
+    writes the revision of each change at the end of the request, in one
+    batch, instead of a version per saved object.
+    """
+
+    def reversion_register(self, model, **kwargs):
+        policy = get_version_policy(model)
+
+        if policy.follow is not None:
+            kwargs['follow'] = policy.follow
+
+        super(PolicyVersionAdmin, self).reversion_register(model, **kwargs)
+
+        opts = model._meta.concrete_model._meta
+        fields = kwargs.get('fields') or tuple(field.name for field in opts.local_fields + opts.local_many_to_many)
+        _registered_models[model._meta.label] = (fields, tuple(kwargs.get('follow', ())))
+
+    @contextmanager
+    def create_revision(self, request):
+        # The revision is managed manually so reversion doesn't write the versions one by one; it still provides the
+        # transaction and keeps the comment set by log_addition and log_change.
+        with reversion.create_revision(manage_manually=True):
+            reversion.set_user(request.user)
+
+            with buffer_saved_objects() as saved_objects:
+                yield
+
+            save_revision(saved_objects, reversion.get_user(), reversion.get_comment(), reversion.get_date_created())
+
+
+class VersionPruner:
+    """
+    Deletes the versions older than their model's retention, except the
+    latest ones of each object, and the revisions left empty.
+    """
+
+    def __init__(self, batch_size=5000):
+        """
+        :param batch_size: Number of versions deleted per transaction.
+        """
+        self.batch_size = batch_size
+
+    def prune(self, dry_run=False):
+        """
+        Prunes the versions of every versioned model.
+        :param dry_run: Only counts the versions that would be deleted.
+        :return: Ordered dictionary mapping the models' labels to the number
+        of versions deleted.
+        """
+        try:
+            pruned = OrderedDict()
+
+            for model in sorted(reversion.get_registered_models(), key=lambda model: model._meta.label):
+                policy = get_version_policy(model)
+                cutoff = timezone.now() - timedelta(days=policy.get_keep_days())
+                content_type = ContentType.objects.get_for_model(model)
+                pruned[model._meta.label] = 0
+
+                while True:
+                    count = self._prune_batch(content_type, cutoff, policy.keep_latest, dry_run)
+                    pruned[model._meta.label] += count
+
+                    if dry_run or count < self.batch_size:
+                        break
+
+            if not dry_run:
+                self._delete_empty_revisions()
+
+            return pruned
+        except Exception as e:
+            db_logger.exception(e)
+            raise
+
+    def _prune_batch(self, content_type, cutoff, keep_latest, dry_run):
+        """
+        Deletes a batch of prunable versions of a model.
+        :return: The number of versions deleted, or the number of prunable
+        versions on a dry run.
+        """
+        using = router.db_for_write(Version)
+        select = """
+            SELECT ranked.id FROM (
+                SELECT version.id, revision.date_created,
+                       row_number() OVER (PARTITION BY version.object_id ORDER BY version.id DESC) AS rank
+                FROM {0} version INNER JOIN {1} revision ON revision.id = version.revision_id
+                WHERE version.content_type_id = %s) ranked
+            WHERE ranked.rank > %s AND ranked.date_created < %s
+        """.format(Version._meta.db_table, Revision._meta.db_table)
+        params = [content_type.pk, keep_latest, cutoff]
+
+        with transaction.atomic(using=using):
+            cursor = connections[using].cursor()
+
+            if dry_run:
+                cursor.execute("SELECT count(*) FROM ({0}) prunable".format(select), params)
+                return cursor.fetchone()[0]
+
+            cursor.execute("DELETE FROM {0} WHERE id IN ({1} LIMIT %s)".format(Version._meta.db_table, select),
+                           params + [self.batch_size])
+
+            return cursor.rowcount
+
+    def _delete_empty_revisions(self):
+        using = router.db_for_write(Revision)
+        cursor = connections[using].cursor()
+        cursor.execute("DELETE FROM {0} WHERE NOT EXISTS (SELECT 1 FROM {1} WHERE {1}.revision_id = {0}.id)".format(
+            Revision._meta.db_table, Version._meta.db_table))
@@ -0,0 +1,114 @@
+import logging
+import time
+from collections import OrderedDict
+
+from django.core.urlresolvers import get_resolver, RegexURLResolver
+from django.db import connections
+from django.template.loader import get_template
+
+db_logger = logging.getLogger('db')
+
+# The warm-up tasks by name, in registration order. The apps add theirs with register_warmup from the modules their
+# AppConfig.ready imports.
+_warmup_tasks = OrderedDict()
+
+# The templates rendered by most requests: the admin's pages, with the templates they extend, and the inventory
+# views. The compiled templates are kept by the cached template loader, which is used outside of development.
+WARMUP_TEMPLATES = [
+    'admin/base.html',
+    'admin/base_site.html',
+    'admin/index.html',
+    'admin/index_pending_content.html',
+    'admin/change_list.html',
+    'admin/change_form.html',
+    'admin/delete_confirmation.html',
+    'admin/login.html',
+    'reversion/change_list.html',
+    'reversion/object_history.html',
+    'inventories/inventory.html',
+    'inventories/solver.html',
+    'inventories/solver_result.html',
+]
+
+
+def register_warmup(name):
+    """
+    Decorator that adds a function without arguments to the warm-up tasks,
+    which run_warmups runs when a worker starts (see Acriladmin/gunicorn.py)
+    or through the warm_up command. The tasks must be idempotent and cheap
+    when there's nothing left to warm.
+    :param name: The task's name, unique among the tasks.
+    """
+    def decorator(function):
+        _warmup_tasks[name] = function
+        return function
+
+    return decorator
+
+
+def get_warmup_task_names():
+    return list(_warmup_tasks.keys())
+
+
+def run_warmups(names=None):
+    """
+    Runs the warm-up tasks in registration order. A task that fails is logged
+    and doesn't stop the others: the worker still serves, only more slowly.
+    :param names: The names of the tasks to run, all of them by default.
+    :return: Ordered dictionary mapping the tasks' names to the seconds they
+    took, or to None if they failed.
+    """
+    timings = OrderedDict()
+
+    for name, task in _warmup_tasks.items():
+        if names is not None and name not in names:
+            continue
+
+        started_at = time.perf_counter()
+
+        try:
+            task()
+            timings[name] = time.perf_counter() - started_at
+        except Exception as e:
+            db_logger.exception(e)
+            timings[name] = None
+
+    return timings
+
+
+def _populate_resolver(resolver):
+    # Reading the reverse dictionary compiles the patterns; the namespaced resolvers are populated on their own.
+    resolver.reverse_dict
+
+    for pattern in resolver.url_patterns:
+        if isinstance(pattern, RegexURLResolver):
+            _populate_resolver(pattern)
+
+
+@register_warmup('urls')
+def warm_up_urls():
+    """
+    Imports the URLconf, with the views and the admin's URLs, and compiles
+    every URL pattern.
+    """
+    _populate_resolver(get_resolver())
+
+
+@register_warmup('templates')
+def warm_up_templates():
+    """
+    Loads and compiles the templates rendered by most requests, with their
+    template tag libraries.
+    """
+    for template_name in WARMUP_TEMPLATES:
+        get_template(template_name)
+
+
+@register_warmup('database')
+def warm_up_database():
+    """
+    Opens the connections to the databases, which the requests reuse for
+    CONN_MAX_AGE seconds.
+    """
+    for connection in connections.all():
+        connection.ensure_connection()